@@ -0,0 +1,318 @@
+"""
+请求准入控制
+
+负载高时按端点类别限制每个工作进程同时处理的请求数，避免目录统计、大目录列表等慢请求占满所有请求处理线程，
+导致登录等轻量请求也无法得到处理：
+- 每个类别（传输、列表、统计、登录）有独立的并发上限和有界等待队列；队列已满时立即拒绝，
+  排队超过等待时限时也拒绝，返回 503 并带 Retry-After
+- 请求占用的名额在响应体发送完毕（close）时才释放，下载和打包下载在整个传输期间都计入并发数
+- 名额释放时直接交给排队最久的请求（先到先得），不会被新到的请求插队
+- 未配置的类别按每个工作进程的请求处理线程数推算限制（derive_limits），每一类的 concurrency + queue
+  都小于线程数，单个用户的并行上传（Dropzone 5个、断点续传4个分片）不会被拒绝
+
+统计接口另有单飞（single-flight）+ 过期后先返回旧值再后台刷新（stale-while-revalidate）的缓存：
+同一时刻多个相同的统计请求只计算一次，结果过期后先返回上一次成功的结果，同时在后台重新计算。
+"""
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict
+
+# 请求占用的准入名额在environ中的键
+GATE_ENVIRON_KEY = 'fileserver.admission.gate'
+
+CLASSES = ('transfers', 'listings', 'stats', 'auth')
+
+
+def derive_limits(threads: int) -> Dict[str, Dict[str, Any]]:
+    """
+    按每个工作进程的请求处理线程数推算各类别的默认限制
+
+    保留约四分之一的线程给其他类别，传输类别可以使用其余的线程；线程数少于4时不做限制。
+
+    Args:
+        threads (int): 每个工作进程的请求处理线程数（server.threads）
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {类别名: {'concurrency': ..., 'queue': ..., 'timeout': ...}}，
+        8个线程时传输类别为并发5、队列1，其他类别为并发2、队列2（登录队列4）
+    """
+    if threads < 4:
+        return {}
+    quarter = threads // 4
+    return {
+        'transfers': {'concurrency': threads - quarter - 1, 'queue': 1, 'timeout': 10},
+        'listings': {'concurrency': quarter, 'queue': quarter, 'timeout': 5},
+        'stats': {'concurrency': quarter, 'queue': quarter, 'timeout': 5},
+        'auth': {'concurrency': quarter, 'queue': threads // 2, 'timeout': 5}
+    }
+
+
+class Overloaded(Exception):
+    """请求被准入控制拒绝，附带HTTP状态码和建议的重试间隔（秒）"""
+
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 5):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """排队中的请求：名额由释放者直接转交"""
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionGate:
+    """单个端点类别的并发上限和有界等待队列"""
+
+    def __init__(self, name: str, concurrency: int, queue: int = 0, timeout: float = 5, retry_after: int = 5):
+        """
+        Args:
+            name (str): 类别名
+            concurrency (int): 同时处理的请求数上限
+            queue (int): 等待名额的请求数上限，0表示名额用完时立即拒绝
+            timeout (float): 排队的最长等待时间（秒）
+            retry_after (int): 拒绝时建议客户端的重试间隔（秒）
+        """
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, queue)
+        self.timeout = max(0.0, timeout)
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取一个名额，名额用完时排队等待
+
+        Raises:
+            Overloaded: 等待队列已满或排队超时
+        """
+        with self._lock:
+            if self.active < self.concurrency and not self._waiters:
+                self.active += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded('服务器繁忙，请稍后重试', 503, self.retry_after)
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        waiter.event.wait(self.timeout)
+        with self._lock:
+            # 超时和转交可能同时发生，以持锁时的状态为准
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+            self.rejected += 1
+        raise Overloaded('服务器繁忙，请稍后重试', 503, self.retry_after)
+
+    def release(self):
+        """释放名额：有请求在排队时直接转交给最早排队的请求"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self.active -= 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """当前的处理中、排队中和累计拒绝的请求数"""
+        with self._lock:
+            return {
+                'active': self.active,
+                'queued': len(self._waiters),
+                'rejected': self.rejected,
+                'concurrency': self.concurrency,
+                'queue': self.max_queue
+            }
+
+
+class AdmissionController:
+    """按端点类别管理准入名额（每个工作进程一份）"""
+
+    def __init__(self, limits: Dict[str, Dict[str, Any]], retry_after: int = 5):
+        """
+        Args:
+            limits: {类别名: {'concurrency': 并发上限, 'queue': 队列长度, 'timeout': 等待时限（秒）}}，
+                    未配置或并发上限不大于0的类别不限制
+            retry_after (int): 拒绝时建议客户端的重试间隔（秒）
+        """
+        self.gates = {}
+        for name in CLASSES:
+            limit = limits.get(name) or {}
+            if limit.get('concurrency', 0) > 0:
+                self.gates[name] = AdmissionGate(name, limit['concurrency'], limit.get('queue', 0),
+                                                 limit.get('timeout', 5), retry_after)
+
+    def admit(self, environ: dict, name: str):
+        """
+        为请求获取类别名额，名额记录在environ中，由 AdmissionMiddleware 在响应结束时释放
+
+        Raises:
+            Overloaded: 等待队列已满或排队超时
+        """
+        gate = self.gates.get(name)
+        if gate is None or GATE_ENVIRON_KEY in environ:
+            return
+        gate.acquire()
+        environ[GATE_ENVIRON_KEY] = gate
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: gate.get_status() for name, gate in self.gates.items()}
+
+
+class _ReleasingIterable:
+    """包装响应体，close() 时释放准入名额"""
+
+    def __init__(self, iterable, release: Callable[[], None]):
+        self.iterable = iterable
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.release()
+
+
+class AdmissionMiddleware:
+    """
+    在响应结束时释放准入名额的WSGI中间件（应位于最外层）
+
+    与 metrics.MetricsMiddleware 相同，自己计数已发送字节数的响应体（如 FileBody）不包装，
+    而是在其 on_close 回调之后释放名额，使服务器仍然可以使用sendfile。
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        released = []
+
+        def release():
+            gate = environ.get(GATE_ENVIRON_KEY)
+            if gate is not None and not released:
+                released.append(True)
+                gate.release()
+
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+        except BaseException:
+            release()
+            raise
+        if GATE_ENVIRON_KEY not in environ:
+            return app_iter
+        if hasattr(app_iter, 'bytes_sent') and hasattr(app_iter, 'on_close'):
+            previous = app_iter.on_close
+
+            def on_close(bytes_sent: int):
+                try:
+                    if previous is not None:
+                        previous(bytes_sent)
+                finally:
+                    release()
+
+            app_iter.on_close = on_close
+            return app_iter
+        return _ReleasingIterable(app_iter, release)
+
+
+class _Flight:
+    """一次进行中的计算，其他请求等待同一个结果"""
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Entry:
+    __slots__ = ('value', 'stamp', 'flight')
+
+    def __init__(self):
+        self.value = None
+        self.stamp = None
+        self.flight = None
+
+
+class StaleWhileRevalidateCache:
+    """
+    单飞 + stale-while-revalidate 缓存
+
+    - 结果在 ttl 秒内直接返回
+    - 过期但未超过 max_stale 秒时返回旧结果，同时启动后台线程重新计算（同一个键同时只有一个刷新）
+    - 没有可用结果时第一个请求计算，同时到来的相同请求等待同一次计算的结果
+    - 重新计算失败时保留旧结果，下一次请求再重试
+    """
+
+    def __init__(self, ttl: float = 5, max_stale: float = 300):
+        self.ttl = max(0.0, ttl)
+        self.max_stale = max(0.0, max_stale)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        获取键对应的结果
+
+        Args:
+            key (str): 缓存键
+            compute: 计算结果的函数，后台刷新时在其他线程中调用
+
+        Raises:
+            Exception: 没有可用的旧结果且计算失败时抛出计算的异常
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            if entry.stamp is not None:
+                age = time.monotonic() - entry.stamp
+                if age < self.ttl:
+                    return entry.value
+                if age < self.ttl + self.max_stale:
+                    if entry.flight is None:
+                        entry.flight = _Flight()
+                        threading.Thread(target=self._run, args=(entry, entry.flight, compute),
+                                         name='stats-refresh', daemon=True).start()
+                    return entry.value
+            flight = entry.flight
+            owner = flight is None
+            if owner:
+                flight = entry.flight = _Flight()
+        if owner:
+            self._run(entry, flight, compute)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _run(self, entry: _Entry, flight: _Flight, compute: Callable[[], Any]):
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            if entry.stamp is not None:
+                print(f"统计信息刷新失败，继续使用上一次的结果: {e}")
+        with self._lock:
+            if flight.error is None:
+                entry.value = flight.value
+                entry.stamp = time.monotonic()
+            entry.flight = None
+        flight.done.set()
@@ -0,0 +1,570 @@
+"""
+asyncio 服务引擎
+
+与 server.py 中的线程池引擎二选一（配置 server.engine = "asyncio"），路由和应用本身不变：
+- 连接的读写都在事件循环中完成，空闲或慢速的连接只占用少量内存，不占用线程
+- 不超过 64KB 的请求体在事件循环中接收完毕后才把请求交给有界线程池（server.threads 个线程）中的WSGI应用处理，
+  慢速客户端的登录、表单等小请求不占用线程
+- 较大的请求体不暂存：应用读取 wsgi.input 时才由事件循环从连接接收，数据直接写到上传的目标位置，
+  按应用的处理速度背压；应用在读取前拒绝（超出大小或配额、未登录）时不接收请求体，
+  带 Expect: 100-continue 的客户端也不会发送请求体
+- 响应体同样分批从线程池中取出后由事件循环写出，按客户端的接收速度背压
+- /download 返回的文件响应体（FileBody）直接用 loop.sendfile 发送，不经过线程池；
+  启用带宽限速时按数据块申请额度后再发送
+"""
+import os
+import sys
+import signal
+import asyncio
+import logging
+import resource
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Tuple
+from urllib.parse import unquote_to_bytes
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import http_date
+
+from file_transfer import FileBody
+
+MAX_HEADER_SIZE = 64 * 1024
+READ_SIZE = 64 * 1024
+# 不超过该大小的请求体在交给应用之前接收完毕，更大的在应用读取时接收
+PREFETCH_BODY_SIZE = 64 * 1024
+# 应用没有读完请求体时，剩余数据不超过该大小则读取丢弃以复用连接，否则关闭连接
+DISCARD_BODY_SIZE = 64 * 1024
+# 每次从线程池中取出的响应数据量上限
+RESPONSE_BATCH_SIZE = 64 * 1024
+# 发送缓冲区高水位，超过后等待客户端接收
+WRITE_BUFFER_LIMIT = 64 * 1024
+
+STATUS_REASONS = {
+    400: 'Bad Request',
+    408: 'Request Timeout',
+    413: 'Request Entity Too Large',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+    505: 'HTTP Version Not Supported',
+}
+
+logger = logging.getLogger('werkzeug')
+
+
+class BadRequest(Exception):
+    """请求格式错误，直接以给定状态码响应并关闭连接"""
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class RequestBody:
+    """
+    请求体（wsgi.input）：数据由事件循环从连接接收，应用在线程池中读取
+
+    prefetch() 在交给应用之前接收小的请求体；其余数据在应用调用 read()/readline() 时才接收，
+    应用线程等待事件循环的接收结果（每次最多 READ_SIZE 字节）。分块编码的请求体边接收边解码。
+    """
+
+    def __init__(self, connection: 'Connection', length: Optional[int], expect_continue: bool):
+        """
+        Args:
+            connection: 所属连接
+            length: Content-Length，分块编码时为None
+            expect_continue (bool): 客户端等待 100 Continue 后才发送请求体
+        """
+        self.connection = connection
+        self.loop = connection.loop
+        self.remaining = length
+        self.chunked = length is None
+        self.chunk_remaining = 0
+        self.expect_continue = expect_continue
+        self.max_length = connection.engine.max_content_length
+        self.received = 0
+        self.done = length == 0
+        # 接收出错（断开、超时、格式错误）后连接不能复用
+        self.broken = False
+        self.buffer = b''
+
+    async def _receive(self) -> bytes:
+        """从连接接收下一段请求体数据，请求体结束时返回 b''"""
+        if self.done:
+            return b''
+        reader, timeout = self.connection.reader, self.connection.timeout
+        if self.expect_continue:
+            self.expect_continue = False
+            self.connection.writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        try:
+            if not self.chunked:
+                data = await asyncio.wait_for(reader.read(min(READ_SIZE, self.remaining)), timeout)
+                if not data:
+                    raise ConnectionError('客户端连接已断开')
+                self.remaining -= len(data)
+                self.done = self.remaining == 0
+            else:
+                if self.chunk_remaining == 0:
+                    line = await asyncio.wait_for(reader.readuntil(b'\r\n'), timeout)
+                    try:
+                        size = int(line.split(b';', 1)[0].strip(), 16)
+                    except ValueError:
+                        raise ConnectionError('分块编码格式错误')
+                    if size == 0:
+                        # 丢弃trailer
+                        while await asyncio.wait_for(reader.readuntil(b'\r\n'), timeout) != b'\r\n':
+                            pass
+                        self.done = True
+                        return b''
+                    if self.max_length and self.received + size > self.max_length:
+                        self.broken = True
+                        raise RequestEntityTooLarge()
+                    self.chunk_remaining = size
+                data = await asyncio.wait_for(reader.read(min(READ_SIZE, self.chunk_remaining)), timeout)
+                if not data:
+                    raise ConnectionError('客户端连接已断开')
+                self.chunk_remaining -= len(data)
+                if self.chunk_remaining == 0 and \
+                        await asyncio.wait_for(reader.readexactly(2), timeout) != b'\r\n':
+                    raise ConnectionError('分块编码格式错误')
+        except (OSError, EOFError, asyncio.TimeoutError, asyncio.LimitOverrunError) as e:
+            self.broken = True
+            raise ConnectionError(f'接收请求体失败: {e}') from e
+        self.received += len(data)
+        return data
+
+    async def prefetch(self, limit: int):
+        """请求体不超过limit且客户端不等待 100 Continue 时在事件循环中接收完毕"""
+        if self.chunked or self.expect_continue or self.remaining > limit:
+            return
+        chunks = []
+        while not self.done:
+            chunks.append(await self._receive())
+        self.buffer = b''.join(chunks)
+
+    def can_discard(self, limit: int) -> bool:
+        """剩余的请求体是否可以读取丢弃（长度已知、不超过limit且客户端已经在发送）"""
+        if self.done:
+            return not self.broken
+        return not self.broken and not self.chunked and not self.expect_continue and self.remaining <= limit
+
+    async def discard(self, limit: int) -> bool:
+        """应用没有读完请求体时丢弃剩余数据，返回连接是否可以继续使用"""
+        if not self.can_discard(limit):
+            return False
+        try:
+            while not self.done:
+                await self._receive()
+        except ConnectionError:
+            return False
+        return True
+
+    def _fill(self) -> bool:
+        """（应用线程中）接收下一段数据放入缓冲区，请求体已结束时返回False"""
+        if self.done:
+            return False
+        data = asyncio.run_coroutine_threadsafe(self._receive(), self.loop).result()
+        self.buffer += data
+        return bool(data)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            data, self.buffer = self.buffer, b''
+            return data
+        if not self.buffer:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        while True:
+            end = self.buffer.find(b'\n') + 1
+            if end or (0 <= size <= len(self.buffer)) or not self._fill():
+                break
+        if not end:
+            end = len(self.buffer)
+        if size is not None and 0 <= size < end:
+            end = size
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def readlines(self, hint: int = -1) -> List[bytes]:
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        pass
+
+
+class WSGIResponse:
+    """在线程池中执行WSGI应用，分批取出响应数据"""
+
+    def __init__(self, app, environ: dict):
+        self.app = app
+        self.environ = environ
+        self.status = None
+        self.headers = None
+        self.app_iter = None
+        self._iterator = None
+        self._pending = []
+
+    def _start_response(self, status, headers, exc_info=None):
+        # 响应头在应用返回后才发送，出错时允许应用重新设置状态和响应头
+        self.status = status
+        self.headers = headers
+        return self._pending.append
+
+    def start(self) -> List[bytes]:
+        """调用应用，返回第一批响应数据"""
+        self.app_iter = self.app(self.environ, self._start_response)
+        if isinstance(self.app_iter, FileBody):
+            # 文件响应体由事件循环直接sendfile，不在线程池中读取
+            return self._pending
+        self._iterator = iter(self.app_iter)
+        return self._pending + self.next_batch()
+
+    def next_batch(self) -> List[bytes]:
+        """取出下一批响应数据，返回空列表表示结束"""
+        chunks = []
+        size = 0
+        for data in self._iterator:
+            if not data:
+                # 空数据块不累积，保证首包（响应头）及时发送
+                if chunks:
+                    break
+                continue
+            chunks.append(data)
+            size += len(data)
+            if size >= RESPONSE_BATCH_SIZE:
+                break
+        return chunks
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+
+
+class Connection:
+    """单个客户端连接：循环读取请求、交给应用处理并写出响应"""
+
+    def __init__(self, engine: 'AsyncEngine', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.engine = engine
+        self.reader = reader
+        self.writer = writer
+        self.loop = engine.loop
+        self.executor = engine.executor
+        self.timeout = engine.request_timeout
+        self.idle = True
+        peer = writer.get_extra_info('peername') or ('', 0)
+        self.client_address = peer[:2] if isinstance(peer, tuple) else (str(peer), 0)
+
+    async def handle(self):
+        try:
+            keep_alive = True
+            while keep_alive and not self.engine.stopping:
+                self.idle = True
+                try:
+                    head = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), self.timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send_error(431)
+                    break
+                self.idle = False
+                try:
+                    keep_alive = await self.handle_request(head)
+                except BadRequest as e:
+                    await self.send_error(e.status)
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            logger.exception('处理连接时出错')
+        finally:
+            self.writer.close()
+
+    def parse_head(self, head: bytes) -> Tuple[str, str, str, List[Tuple[str, str]]]:
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3:
+            raise BadRequest(400)
+        method, target, version = parts
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise BadRequest(505)
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip() or line[0] in ' \t':
+                raise BadRequest(400)
+            headers.append((name, value.strip()))
+        return method, target, version, headers
+
+    def make_environ(self, method: str, target: str, version: str,
+                     headers: List[Tuple[str, str]]) -> dict:
+        path, _, query = target.partition('?')
+        if path.startswith(('http://', 'https://')):
+            # 绝对形式的请求目标只保留路径部分
+            path = '/' + path.split('://', 1)[1].partition('/')[2]
+        server_address = self.writer.get_extra_info('sockname') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': target,
+            'RAW_URI': target,
+            'SERVER_NAME': self.engine.host,
+            'SERVER_PORT': str(server_address[1] if isinstance(server_address, tuple) else self.engine.port),
+            'SERVER_PROTOCOL': version,
+            'SERVER_SOFTWARE': 'fileserver-asyncio',
+            'REMOTE_ADDR': self.client_address[0],
+            'REMOTE_PORT': self.client_address[1],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if '_' in name:
+                # 与连字符形式的头混淆，按WSGI服务器的通行做法丢弃
+                continue
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+                continue
+            key = 'HTTP_' + key
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def read_body(self, environ: dict, version: str) -> RequestBody:
+        """准备请求体：小的请求体立即接收，较大的在应用读取时接收"""
+        chunked = 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower()
+        length_header = environ.get('CONTENT_LENGTH', '')
+        if chunked:
+            length = None
+        elif length_header:
+            if not length_header.isdigit():
+                raise BadRequest(400)
+            length = int(length_header)
+        else:
+            length = 0
+
+        max_length = self.engine.max_content_length
+        if max_length and length is not None and length > max_length:
+            raise BadRequest(413)
+        # 100 Continue 在应用第一次读取请求体时才发送
+        expect_continue = bool(length or chunked) and version == 'HTTP/1.1' \
+            and environ.get('HTTP_EXPECT', '').lower() == '100-continue'
+        body = RequestBody(self, length, expect_continue)
+        try:
+            await body.prefetch(PREFETCH_BODY_SIZE)
+        except ConnectionError:
+            raise BadRequest(400)
+        if chunked:
+            # 分块编码由服务器解码，请求体的结束由服务器判断
+            environ.pop('HTTP_TRANSFER_ENCODING', None)
+            environ.pop('CONTENT_LENGTH', None)
+            environ['wsgi.input_terminated'] = True
+        return body
+
+    async def handle_request(self, head: bytes) -> bool:
+        """处理一个请求，返回是否保持连接"""
+        method, target, version, headers = self.parse_head(head)
+        environ = self.make_environ(method, target, version, headers)
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+
+        body = await self.read_body(environ, version)
+        environ['wsgi.input'] = body
+        response = WSGIResponse(self.engine.app, environ)
+        try:
+            chunks = await self.loop.run_in_executor(self.executor, response.start)
+            if not body.can_discard(DISCARD_BODY_SIZE):
+                # 应用没有读完请求体（如超出配额被拒绝），剩余数据较多时不再接收，响应后关闭连接
+                keep_alive = False
+            keep_alive = await self.send_response(method, version, keep_alive, response, chunks)
+        finally:
+            await self.loop.run_in_executor(self.executor, response.close)
+        if keep_alive and not body.done:
+            keep_alive = await body.discard(DISCARD_BODY_SIZE)
+        return keep_alive and not self.engine.stopping
+
+    async def drain(self):
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+    async def send_response(self, method: str, version: str, keep_alive: bool,
+                            response: WSGIResponse, chunks: List[bytes]) -> bool:
+        status_code = int(response.status.split(' ', 1)[0])
+        header_names = {name.lower() for name, _ in response.headers}
+        has_body = method != 'HEAD' and status_code >= 200 and status_code not in (204, 304)
+        chunked = False
+        if has_body and 'content-length' not in header_names:
+            if version == 'HTTP/1.1':
+                chunked = True
+            else:
+                keep_alive = False
+
+        lines = [f'{version} {response.status}']
+        lines += [f'{name}: {value}' for name, value in response.headers
+                  if name.lower() not in ('connection', 'transfer-encoding')]
+        if 'date' not in header_names:
+            lines.append(f'Date: {http_date()}')
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        if not keep_alive:
+            lines.append('Connection: close')
+        elif version == 'HTTP/1.0':
+            lines.append('Connection: keep-alive')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        self.log_request(f'{method} {response.environ["REQUEST_URI"]} {version}', status_code)
+
+        if not has_body:
+            await self.drain()
+            return keep_alive
+
+        if isinstance(response.app_iter, FileBody):
+            await self.send_file_body(response.app_iter)
+            await self.drain()
+            return keep_alive
+
+        while chunks:
+            for data in chunks:
+                self.writer.write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+            await self.drain()
+            chunks = await self.loop.run_in_executor(self.executor, response.next_batch)
+        if chunked:
+            self.writer.write(b'0\r\n\r\n')
+        await self.drain()
+        return keep_alive
+
+    async def send_file_body(self, file_body: FileBody):
+        """bytes片段直接写出，文件区间用 loop.sendfile 发送（不支持时asyncio自动退回分块读写）"""
+        file_obj = open(os.dup(file_body.fd), 'rb')
+        try:
+            for part in file_body.parts:
+                if isinstance(part, bytes):
+                    self.writer.write(part)
+                    file_body.bytes_sent += len(part)
+                    continue
+                offset, length = part
+                await self.drain()
+                transfer = file_body.transfer
+                if transfer is None:
+                    file_body.bytes_sent += await self.loop.sendfile(self.writer.transport, file_obj, offset, length)
+                    continue
+                while length > 0:
+                    count = min(length, transfer.chunk_size)
+                    # 申请额度可能需要等待，在默认线程池中进行，不占用应用的线程
+                    await self.loop.run_in_executor(None, transfer.consume, count)
+                    sent = await self.loop.sendfile(self.writer.transport, file_obj, offset, count)
+                    file_body.bytes_sent += sent
+                    if sent < count:
+                        break
+                    offset += count
+                    length -= count
+        finally:
+            file_obj.close()
+
+    async def send_error(self, status: int):
+        reason = STATUS_REASONS.get(status, '')
+        body = f'{status} {reason}'.encode('latin-1')
+        self.writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\n'
+                          f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body)
+        try:
+            await self.drain()
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+
+    def log_request(self, request_line: str, status: int):
+        timestamp = datetime.now().strftime('%d/%b/%Y %H:%M:%S')
+        logger.info('%s - - [%s] "%s" %s -', self.client_address[0], timestamp, request_line, status)
+
+
+class AsyncEngine:
+    """事件循环服务器：接收连接，每个连接一个协程"""
+
+    def __init__(self, app, server_config: dict):
+        self.app = app
+        self.host = server_config.get('host', '0.0.0.0')
+        self.port = server_config.get('port', 9000)
+        self.threads = max(1, server_config.get('threads', 8))
+        self.request_timeout = server_config.get('request_timeout', 60)
+        self.graceful_timeout = server_config.get('graceful_timeout', 30)
+        self.max_content_length = app.config.get('MAX_CONTENT_LENGTH')
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='aio-worker')
+        self.connections = set()
+        self.stopping = False
+        self.loop = None
+        self.server = None
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_LIMIT)
+        connection = Connection(self, reader, writer)
+        self.connections.add(connection)
+        try:
+            await connection.handle()
+        finally:
+            self.connections.discard(connection)
+
+    async def start(self, sock):
+        """开始在监听socket上接收连接（在事件循环中调用）"""
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._on_connect, sock=sock, limit=MAX_HEADER_SIZE)
+
+    async def serve(self, sock):
+        await self.start(sock)
+        stopped = asyncio.Event()
+        self.loop.add_signal_handler(signal.SIGTERM, stopped.set)
+        await stopped.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """停止接收新连接，关闭空闲连接，等待进行中的请求完成"""
+        self.stopping = True
+        self.server.close()
+        # 结束统计推送等长连接
+        fileserver = self.app.extensions.get('fileserver')
+        if fileserver is not None:
+            fileserver.stop()
+        deadline = self.loop.time() + self.graceful_timeout
+        while self.connections and self.loop.time() < deadline:
+            for connection in list(self.connections):
+                if connection.idle:
+                    connection.writer.close()
+            await asyncio.sleep(0.1)
+        if self.connections:
+            print(f"工作进程 {os.getpid()} 等待请求完成超时，强制退出")
+        self.executor.shutdown(wait=False)
+
+
+def run(app, sock, server_config: dict):
+    """在当前进程中运行asyncio引擎，直到收到SIGTERM"""
+    if not logger.handlers and logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.StreamHandler())
+    # 每个连接占用一个文件描述符，尽量放宽软限制
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    sock.setblocking(False)
+    asyncio.run(AsyncEngine(app, server_config).serve(sock))
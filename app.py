@@ -3,21 +3,43 @@
 重构版本：模块化、高性能、支持用户认证和可视化大屏幕
 """
 import os
+import errno
+import posixpath
+import hmac
 import json
 import re
-from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for, flash, session
-from werkzeug.utils import secure_filename
+import threading
+import time
+from datetime import datetime
+from flask import Flask, Blueprint, Response, current_app, request, jsonify, render_template, redirect, url_for, flash, session, make_response
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.local import LocalProxy
 from config import config
 from utils import FileUtils, QRCodeUtils, ValidationUtils
+from metadata_index import MetadataIndex
+from chunked_upload import UploadSessionManager, UploadSessionError
+from streaming_upload import StreamingUploadReceiver, StreamingUploadError
+from file_transfer import send_file_range, content_disposition, SendfileRequestHandler
+from blob_store import BlobStore
+from zip_stream import ZipStreamer, collect_entries
+from stats_stream import StatsBroadcaster, StatsStreamFull
+from signed_url import UrlSigner, SignedUrlError
+from jobs import JobManager, JobError
+from trash import TrashManager, TrashError
+from quota import QuotaLedger, QuotaExceeded
+from bandwidth import BandwidthLimiter, ThrottledInput, throttle_iterable, TRANSFER_ENVIRON_KEY
+from admission import AdmissionController, AdmissionMiddleware, StaleWhileRevalidateCache, Overloaded, derive_limits
+from content_encoding import ContentEncoder
+from listing_cache import ListingCache
+from storage import LocalStorage
+from s3_storage import S3Storage
+import file_ops
 from auth import login_required, admin_required, AuthManager
+import metrics
 from version import get_version, get_version_description, get_release_date
 
-app = Flask(__name__)
+bp = Blueprint('main', __name__)
 
-# 从配置中加载设置
-server_config = config.get_server_config()
-upload_config = config.get_upload_config()
-session_config = config.get_session_config()
 
 def parse_file_size(size_str):
     """解析易懂的文件大小表示（如2GB、4MB、500KB等）"""
@@ -59,70 +81,830 @@ def parse_file_size(size_str):
     
     raise ValueError(f"不支持的文件大小类型: {type(size_str)}")
 
-app.secret_key = server_config.get('secret_key', 'your-secret-key-change-in-production')
 
-# 设置UTF-8编码配置
-app.config['JSON_AS_ASCII'] = False  # 确保JSON响应使用UTF-8
-app.config['ENCODING'] = 'utf-8'    # 设置默认编码
+class FileServer:
+    """
+    单个应用实例的运行时状态
+    
+    创建时只构造服务对象，不启动任何线程、不打开数据库连接，也不探测网络；
+    后台服务由 start() 启动。预派生（pre-fork）模式下每个工作进程在fork之后各自创建应用，
+    因此不会有线程、锁或SQLite连接跨进程共享。
+    """
+    
+    def __init__(self, app, config_manager):
+        self.app = app
+        self.server_config = config_manager.get_server_config()
+        self.upload_config = config_manager.get_upload_config()
+        self.index_config = config_manager.get_index_config()
+        self.storage_config = config_manager.get_storage_config()
+        self.download_config = config_manager.get_download_config()
+        self.metrics_config = config_manager.get_metrics_config()
+        self.dashboard_config = config_manager.get_dashboard_config()
+        self.signed_urls_config = config_manager.get_signed_urls_config()
+        self.jobs_config = config_manager.get_jobs_config()
+        self.trash_config = config_manager.get_trash_config()
+        self.quotas_config = config_manager.get_quotas_config()
+        self.bandwidth_config = config_manager.get_bandwidth_config()
+        self.admission_config = config_manager.get_admission_config()
+        self.compression_config = config_manager.get_compression_config()
+        self.listing_cache_config = config_manager.get_listing_cache_config()
+        self.host = self.server_config.get('host', '0.0.0.0')
+        self.port = self.server_config.get('port', 9000)
+        self._address = None
+        
+        upload_folder = app.config['UPLOAD_FOLDER']
+        staging_dir = FileUtils.get_internal_dir(upload_folder, 'staging')
+        
+        # 断点续传会话管理器，暂存数据与上传目录位于同一文件系统
+        self.upload_sessions = UploadSessionManager(staging_dir, self.upload_config.get('session_ttl', 24 * 3600))
+        
+        # 内容寻址去重存储（可选，只适用于本地文件系统）
+        backend = self.storage_config.get('backend', 'local')
+        self.blob_store = None
+        if backend == 'local' and self.storage_config.get('dedup', False):
+            self.blob_store = BlobStore(FileUtils.get_internal_dir(upload_folder, 'blobs'))
+        
+        # 上传目录的存储后端：本地文件系统或S3兼容的对象存储（内部数据目录始终位于本地）
+        if backend == 'local':
+            self.storage = LocalStorage(self.blob_store)
+        elif backend == 's3':
+            s3_config = self.storage_config.get('s3') or {}
+            self.storage = S3Storage(
+                upload_folder,
+                endpoint=s3_config.get('endpoint', ''),
+                bucket=s3_config.get('bucket', ''),
+                region=s3_config.get('region', 'us-east-1'),
+                access_key=s3_config.get('access_key', ''),
+                secret_key=s3_config.get('secret_key', ''),
+                prefix=s3_config.get('prefix', ''),
+                part_size=parse_file_size(s3_config.get('part_size', '8MB')),
+                range_size=parse_file_size(s3_config.get('range_size', '4MB')),
+                max_connections=s3_config.get('max_connections', 16),
+                upload_concurrency=s3_config.get('upload_concurrency', 4),
+                download_concurrency=s3_config.get('download_concurrency', 4),
+                timeout=s3_config.get('timeout', 60))
+        else:
+            raise ValueError(f'不支持的存储后端: {backend}')
+        
+        # 流式上传接收器，直接解析请求流写入暂存文件（去重模式下需要边接收边计算摘要）
+        self.streaming_receiver = StreamingUploadReceiver(
+            staging_dir,
+            app.config['MAX_CONTENT_LENGTH'],
+            self.upload_config.get('compute_sha256', False) or self.blob_store is not None)
+        
+        # 打包下载使用的流式ZIP生成器（所有下载共享压缩线程池，线程在首次使用时创建）
+        self.zip_streamer = ZipStreamer(self.download_config.get('zip_workers', 4),
+                                        self.download_config.get('zip_compress_level', 6))
+        
+        # 签名下载链接（无状态校验，所有工作进程使用同一个密钥）
+        self.url_signer = UrlSigner(self.signed_urls_config.get('secret') or app.secret_key,
+                                    self.signed_urls_config.get('max_ttl', 7 * 24 * 3600))
+        
+        # 后台任务（递归删除、移动、复制），线程池在首次提交任务时创建
+        self.jobs = JobManager(FileUtils.get_internal_dir(upload_folder, 'jobs'),
+                               workers=self.jobs_config.get('workers', 2),
+                               max_pending=self.jobs_config.get('max_pending', 100),
+                               retention=self.jobs_config.get('retention', 24 * 3600))
+        
+        # 回收站（可选）：删除只是rename到回收站，空间由后台线程限速回收（只适用于本地文件系统）
+        self.trash = None
+        if self.trash_config.get('enabled', True) and self.storage.is_local:
+            self.trash = TrashManager(upload_folder, FileUtils.get_internal_dir(upload_folder, 'trash'),
+                                      retention=self.trash_config.get('retention', 7 * 24 * 3600),
+                                      interval=self.trash_config.get('gc_interval', 600),
+                                      bytes_per_second=parse_file_size(self.trash_config.get('gc_rate', '64MB')),
+                                      items_per_second=self.trash_config.get('gc_items_per_second', 2000),
+                                      blob_store=self.blob_store)
+        
+        # 上传和下载的带宽限速（可选），多个工作进程通过状态文件分配速率
+        self.bandwidth = None
+        if self.bandwidth_config.get('enabled', False):
+            self.bandwidth = BandwidthLimiter(
+                FileUtils.get_internal_dir(upload_folder, 'bandwidth'),
+                rates={'download': parse_file_size(self.bandwidth_config.get('download_rate', '0')),
+                       'upload': parse_file_size(self.bandwidth_config.get('upload_rate', '0'))},
+                user_rates={'download': parse_file_size(self.bandwidth_config.get('user_download_rate', '0')),
+                            'upload': parse_file_size(self.bandwidth_config.get('user_upload_rate', '0'))},
+                weights=self.bandwidth_config.get('weights') or {},
+                publish_interval=self.bandwidth_config.get('publish_interval', 1))
+        
+        # 可压缩类型下载的内容压缩（可选，只适用于本地文件系统），预压缩副本的生成线程在首次需要时创建
+        self.content_encoder = None
+        if self.compression_config.get('enabled', True) and self.storage.is_local:
+            levels = self.compression_config.get('levels') or {}
+            self.content_encoder = ContentEncoder(
+                FileUtils.get_internal_dir(upload_folder, 'precompressed'),
+                encodings=self.compression_config.get('encodings', ['zstd', 'br', 'gzip']),
+                levels=levels,
+                mimetypes=self.compression_config.get('mimetypes', ['text/']),
+                extensions=self.compression_config.get('extensions', []),
+                min_size=parse_file_size(self.compression_config.get('min_size', '1KB')),
+                precompress=self.compression_config.get('precompress', True),
+                precompress_hits=self.compression_config.get('precompress_hits', 2),
+                precompress_min_size=parse_file_size(self.compression_config.get('precompress_min_size', '1MB')),
+                precompress_levels=self.compression_config.get('precompress_levels') or levels,
+                cache_size=parse_file_size(self.compression_config.get('cache_size', '2GB')))
+        
+        # 目录列表响应缓存（可选，只适用于本地文件系统），按目录状态校验，失效标记在所有工作进程之间共享
+        self.listing_cache = None
+        if self.listing_cache_config.get('enabled', True) and self.storage.is_local:
+            self.listing_cache = ListingCache(
+                upload_folder, FileUtils.get_internal_dir(upload_folder, 'listing'),
+                max_entries=self.listing_cache_config.get('max_entries', 512),
+                max_bytes=parse_file_size(self.listing_cache_config.get('max_size', '32MB')))
+        
+        # 按端点类别的准入控制（可选），未配置的类别按请求处理线程数推算限制，统计接口的结果由单飞缓存共享；
+        # asyncio 引擎下文件下载由事件循环发送，不占用线程，不计入传输类别
+        self.admission = None
+        self.stats_cache = None
+        self.admit_downloads = self.server_config.get('engine', 'threaded') != 'asyncio'
+        if self.admission_config.get('enabled', True):
+            limits = {**derive_limits(self.server_config.get('threads', 8)), **self.admission_config}
+            self.admission = AdmissionController(limits, self.admission_config.get('retry_after', 5))
+            self.stats_cache = StaleWhileRevalidateCache(self.admission_config.get('stats_ttl', 5),
+                                                         self.admission_config.get('stats_max_stale', 300))
+        
+        # 统计信息推送，生产者线程在首个订阅者到来时启动；每个订阅者占用一个请求处理线程，
+        # 未配置上限时至少四分之一的线程留给其他请求（8个线程时上限为5个，两个工作进程可以同时打开10个仪表板），
+        # 超出上限的页面退回为轮询统计接口
+        threads = self.server_config.get('threads', 8)
+        self.stats_stream = StatsBroadcaster(
+            self._collect_stats,
+            FileUtils.get_internal_dir(upload_folder, 'stats'),
+            interval=self.dashboard_config.get('refresh_interval', 30000) / 1000,
+            heartbeat=self.dashboard_config.get('stream_heartbeat', 15),
+            max_subscribers=self.dashboard_config.get('max_stream_clients') or max(1, threads - threads // 4 - 1))
+        
+        self.metadata_index = None
+        self.quota = None
+        self.started = False
+    
+    @property
+    def address(self) -> str:
+        """对外访问地址（首次使用时探测本机IP）"""
+        if self._address is None:
+            self._address = f"http://{FileUtils.get_local_ip()}:{self.port}"
+        return self._address
+    
+    def start(self):
+        """启动后台服务：文件元数据索引、存储配额账本、孤立blob回收、过期上传会话和回收站清理、带宽分配、指标快照"""
+        if self.started:
+            return
+        self.started = True
+        if self.metrics_config.get('enabled', True):
+            metrics.registry.start(FileUtils.get_internal_dir(self.app.config['UPLOAD_FOLDER'], 'metrics'),
+                                   self.metrics_config.get('flush_interval', 5))
+        if self.blob_store is not None:
+            # 启动时回收异常中断遗留的孤立blob
+            threading.Thread(target=self.blob_store.collect_garbage, name='blob-gc', daemon=True).start()
+        self.upload_sessions.start()
+        if self.trash is not None:
+            self.trash.start()
+        if self.bandwidth is not None:
+            self.bandwidth.start()
+        if self.index_config.get('enabled', True) and self.storage.is_local:
+            self.metadata_index = MetadataIndex(self.app.config['UPLOAD_FOLDER'],
+                                                reconcile_interval=self.index_config.get('reconcile_interval', 300))
+            self.metadata_index.start()
+        users = self.quotas_config.get('users') or {}
+        folders = self.quotas_config.get('folders') or {}
+        if users or folders:
+            # 配额用量账本随上传、删除、移动、复制增量更新，后台线程定期与磁盘对账
+            upload_folder = self.app.config['UPLOAD_FOLDER']
+            self.quota = QuotaLedger(upload_folder, os.path.join(FileUtils.get_internal_dir(upload_folder), 'quota.db'),
+                                     {name: parse_file_size(limit) for name, limit in users.items()},
+                                     {folder: parse_file_size(limit) for folder, limit in folders.items()},
+                                     self.measure_usage,
+                                     reconcile_interval=self.quotas_config.get('reconcile_interval', 3600),
+                                     stat=self.storage.lstat)
+            self.quota.start()
+    
+    def measure_usage(self, rel_path, from_disk=False):
+        """统计相对路径（目录递归）的文件总字节数：索引可用时查询索引，否则（或对账时）遍历磁盘"""
+        if (not from_disk and self.metadata_index is not None and self.metadata_index.ready
+                and rel_path.split('/', 1)[0] != FileUtils.INTERNAL_DIR):
+            return self.metadata_index.subtree_usage(rel_path)[1]
+        return self.storage.count([os.path.join(self.app.config['UPLOAD_FOLDER'], rel_path)])[1]
+    
+    def stop(self):
+        """进程退出前结束长连接（统计推送）、取消尚未开始的后台任务并暂停回收站清理，使平滑退出不必等到超时"""
+        self.stats_stream.close()
+        self.jobs.shutdown()
+        self.upload_sessions.stop()
+        if self.trash is not None:
+            self.trash.stop()
+        if self.quota is not None:
+            self.quota.stop()
+        if self.bandwidth is not None:
+            self.bandwidth.stop()
+        if self.content_encoder is not None:
+            self.content_encoder.stop()
+        self.storage.close()
+    
+    def submit_job(self, job_type, params, func, *args):
+        """提交后台任务，任务在应用上下文中执行 func(job, *args)"""
+        def run(job):
+            with self.app.app_context():
+                func(job, *args)
+        return self.jobs.submit(job_type, session['user_id'], params, run)
+    
+    def _collect_stats(self):
+        with self.app.app_context():
+            return collect_dashboard_stats()
+
+
+# 当前应用的运行时状态
+server = LocalProxy(lambda: current_app.extensions['fileserver'])
+
+
+def create_app(config_manager=None, start_services=True):
+    """
+    创建Flask应用
+    
+    Args:
+        config_manager: 配置管理器，默认为全局配置
+        start_services (bool): 是否立即启动后台服务（索引、blob回收）
+        
+    Returns:
+        Flask: 应用实例
+    """
+    config_manager = config_manager or config
+    server_config = config_manager.get_server_config()
+    upload_config = config_manager.get_upload_config()
+    
+    app = Flask(__name__)
+    app.secret_key = server_config.get('secret_key', 'your-secret-key-change-in-production')
+    
+    # 设置UTF-8编码配置
+    app.config['JSON_AS_ASCII'] = False  # 确保JSON响应使用UTF-8
+    app.config['ENCODING'] = 'utf-8'    # 设置默认编码
+    
+    # 处理上传文件夹路径，支持 ~ 扩展
+    upload_folder = upload_config.get('folder', 'uploads')
+    if upload_folder.startswith('~'):
+        upload_folder = os.path.expanduser(upload_folder)
+    app.config['UPLOAD_FOLDER'] = os.path.abspath(upload_folder)
+    app.config['MAX_CONTENT_LENGTH'] = parse_file_size(upload_config.get('max_file_size', '5000MB'))
+    app.config['UPLOAD_CHUNK_SIZE'] = parse_file_size(upload_config.get('chunk_size', '8MB'))
+    
+    # 确保上传目录存在
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    
+    # 初始化认证管理器
+    AuthManager.initialize(config_manager)
+    
+    app.extensions['fileserver'] = FileServer(app, config_manager)
+    app.register_blueprint(bp)
+    
+    if config_manager.get_metrics_config().get('enabled', True):
+        app.wsgi_app = metrics.MetricsMiddleware(app.wsgi_app)
+    if app.extensions['fileserver'].admission is not None:
+        # 位于最外层，在指标记录完成之后释放准入名额
+        app.wsgi_app = AdmissionMiddleware(app.wsgi_app)
+    
+    if start_services:
+        app.extensions['fileserver'].start()
+    return app
+
+
+def get_file_stats():
+    """获取文件统计信息：索引可用时走索引聚合查询，否则遍历目录"""
+    if server.metadata_index is not None and server.metadata_index.ready:
+        return server.metadata_index.get_file_stats()
+    return FileUtils.get_file_stats(current_app.config['UPLOAD_FOLDER'], server.storage)
+
+
+def get_file_type_stats():
+    """获取文件类型统计信息：索引可用时走索引聚合查询，否则遍历目录"""
+    if server.metadata_index is not None and server.metadata_index.ready:
+        return server.metadata_index.get_file_type_stats()
+    return FileUtils.get_file_type_stats(current_app.config['UPLOAD_FOLDER'], server.storage)
+
+
+def get_folder_size_stats():
+    """获取文件夹大小统计信息：索引可用时走索引聚合查询，否则遍历目录"""
+    if server.metadata_index is not None and server.metadata_index.ready:
+        return server.metadata_index.get_folder_size_stats()
+    return FileUtils.get_folder_size_stats(current_app.config['UPLOAD_FOLDER'], server.storage)
+
+
+def cached_stats(key, compute):
+    """
+    统计接口使用的结果：相同的并发请求共享一次计算，过期后先返回上一次的结果并在后台刷新
+    
+    未启用准入控制时直接计算。返回的结果被多个请求共享，调用方不能修改。
+    """
+    if server.stats_cache is None:
+        return compute()
+    app = current_app._get_current_object()
+    
+    def run():
+        with app.app_context():
+            return compute()
+    return server.stats_cache.get(key, run)
+
+
+def collect_dashboard_stats():
+    """获取仪表板和文件列表页展示的全部统计信息（由统计推送的生产者线程调用）"""
+    return {
+        'disk_usage': FileUtils.get_disk_usage(current_app.config['UPLOAD_FOLDER']),
+        'file_stats': get_file_stats(),
+        'file_type_stats': get_file_type_stats(),
+        'folder_size_stats': get_folder_size_stats()
+    }
+
+
+LIST_SORT_FIELDS = ('name', 'size', 'mtime', 'type')
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+
+
+def list_directory(current_path, sort='mtime', order='desc', prefix='', file_type='', cursor=None,
+                   limit=LIST_PAGE_SIZE):
+    """分页获取目录列表：索引可用时走索引的键集分页查询，否则扫描目录"""
+    if server.metadata_index is not None and server.metadata_index.ready:
+        rel = server.metadata_index.relpath(current_path)
+        if rel is not None:
+            return server.metadata_index.list_dir(rel, sort, order, prefix, file_type, cursor, limit)
+    return FileUtils.list_directory(current_path, current_app.config['UPLOAD_FOLDER'], sort, order,
+                                    prefix, file_type, cursor, limit, server.storage)
+
+
+def listing_response(current_path, key, build, mimetype):
+    """
+    目录列表响应（文件列表页面和 /api/list 共用）
+    
+    启用列表缓存时弱ETag由目录状态和 key（页面或查询参数）得出：未变化时直接返回304，不读取目录条目；
+    否则使用与目录状态一致的缓存响应体，没有时调用 build() 生成并缓存。
+    
+    Args:
+        current_path (str): 目录绝对路径
+        key (tuple): 区分同一目录不同表示的键
+        build: 生成响应体（str）的函数
+        mimetype (str): 响应类型
+    """
+    cache = server.listing_cache
+    state = cache.state(current_path) if cache is not None else None
+    if state is None:
+        return Response(build(), mimetype=mimetype)
+    key = (current_path,) + key
+    etag = cache.etag(state, key)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers={'Cache-Control': 'private, no-cache'})
+    else:
+        body = cache.get(key, state)
+        if body is None:
+            body = build()
+            cache.put(key, state, body)
+        response = Response(body, mimetype=mimetype, headers={'Cache-Control': 'private, no-cache'})
+    response.set_etag(etag, weak=True)
+    return response
+
+
+SEARCH_SORT_FIELDS = ('name', 'size', 'mtime', 'path')
+SEARCH_PAGE_SIZE = 50
+
+
+def search_files(**options):
+    """搜索文件：索引可用时走trigram全文索引，否则遍历目录树"""
+    if server.metadata_index is not None and server.metadata_index.ready:
+        return server.metadata_index.search(**options)
+    return FileUtils.search_files(current_app.config['UPLOAD_FOLDER'], storage=server.storage, **options)
+
+
+def parse_size_param(value):
+    """解析大小查询参数：纯数字为字节数，也可带单位（如10MB）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return parse_file_size(value)
+
+
+def parse_time_param(value):
+    """解析时间查询参数：时间戳，或 YYYY-MM-DD / YYYY-MM-DD HH:MM:SS 格式的本地时间"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f'无效的时间格式: {value}')
+
+
+def resolve_upload_folder(current_path):
+    """解析上传目标目录（不存在时创建），路径不安全或指向内部数据目录时返回None"""
+    if current_path:
+        # 安全检查当前路径
+        target_folder = resolve_dir_path(current_path)
+        if target_folder is None:
+            return None
+        
+        # 确保目标文件夹存在
+        server.storage.makedirs(target_folder)
+        return target_folder
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def place_uploaded_file(temp_path, filename, target_folder, digest=None):
+    """
+    将接收完成的暂存文件放到目标目录（本地文件系统为原子移动，同名时自动改名，不覆盖已有文件），返回(文件路径, 文件名)
+    
+    Raises:
+        QuotaExceeded: 按实际大小超出配额（此时暂存文件已删除）
+    """
+    size = os.path.getsize(temp_path)
+    try:
+        check_quota(target_folder, size)
+    except QuotaExceeded:
+        os.remove(temp_path)
+        raise
+    safe_filename = FileUtils.safe_filename(filename)
+    file_path, safe_filename = FileUtils.claim_unique_path(
+        target_folder, safe_filename, lambda path: server.storage.put_file(temp_path, path), server.storage.lexists)
+    dedup_file(file_path, digest)
+    index_add(file_path)
+    quota_add(file_path, size)
+    return file_path, safe_filename
+
+
+def dedup_file(file_path, digest=None):
+    """去重模式下将新文件纳入内容寻址存储"""
+    if server.blob_store is not None:
+        server.blob_store.ingest(file_path, digest)
+
+
+def index_add(path):
+    """通知索引新增或更新了路径，并使所在目录的列表缓存失效"""
+    if server.metadata_index is not None:
+        server.metadata_index.add_path(path)
+    if server.listing_cache is not None:
+        server.listing_cache.invalidate(path)
+
+
+def index_remove(path):
+    """通知索引删除了路径，并使所在目录的列表缓存失效"""
+    if server.metadata_index is not None:
+        server.metadata_index.remove_path(path)
+    if server.listing_cache is not None:
+        server.listing_cache.invalidate(path)
+
+
+def upload_rel_path(path):
+    """绝对路径相对于上传目录的路径（以/分隔，上传目录本身为空字符串）"""
+    rel_path = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    return '' if rel_path == '.' else rel_path
+
+
+def check_quota(target_folder, size):
+    """
+    检查当前用户向目标目录写入 size 字节是否超出配额（未配置配额或大小未知时不检查）
+    
+    Raises:
+        QuotaExceeded: 超出用户或文件夹配额
+    """
+    if server.quota is not None and size is not None:
+        server.quota.check(session['user_id'], upload_rel_path(target_folder), size)
+
+
+def quota_add(path, size=None, user_id=None):
+    """把新写入的文件或目录（递归）计入写入者（默认为当前用户）和所在文件夹的用量"""
+    if server.quota is None:
+        return
+    if size is not None:
+        files = [(upload_rel_path(path), size)]
+    else:
+        # 目录：逐个记录其中的文件（包括指向目录的符号链接本身）
+        files = [(upload_rel_path(file_path), file_size) for file_path, file_size in server.storage.walk(path)]
+    server.quota.add_files(user_id or session['user_id'], files)
+
+
+def quota_move(src, dest, size=None):
+    """通知配额账本路径已移动（包括移入、移出回收站）"""
+    if server.quota is not None:
+        server.quota.move(upload_rel_path(src), upload_rel_path(dest), size)
+
+
+def quota_remove(path, size=None):
+    """通知配额账本路径已删除"""
+    if server.quota is not None:
+        server.quota.remove(upload_rel_path(path), size)
+
+
+def resolve_dir_path(dirpath):
+    """解析用户给出的目录相对路径（可以是上传目录本身），返回绝对路径；路径不安全或指向内部数据目录时返回None"""
+    dir_path = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], dirpath))
+    if not FileUtils.is_safe_path(current_app.config['UPLOAD_FOLDER'], dir_path):
+        return None
+    rel_path = os.path.relpath(dir_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    if rel_path.split('/', 1)[0] == FileUtils.INTERNAL_DIR:
+        return None
+    return dir_path
+
+
+def resolve_file_path(filepath):
+    """解析用户给出的相对路径，返回(绝对路径, 规范化的相对路径)；路径不安全、指向上传目录本身或内部数据目录时返回None"""
+    file_path = resolve_dir_path(filepath)
+    if file_path is None:
+        return None
+    rel_path = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    if rel_path == '.':
+        return None
+    return file_path, rel_path
+
+
+def sync_index(path):
+    """按路径当前是否存在更新索引（用于可能只完成了一部分的操作）"""
+    if server.storage.lexists(path):
+        index_add(path)
+    else:
+        index_remove(path)
 
-# 处理上传文件夹路径，支持 ~ 扩展
-upload_folder = upload_config.get('folder', 'uploads')
-if upload_folder.startswith('~'):
-    upload_folder = os.path.expanduser(upload_folder)
-app.config['UPLOAD_FOLDER'] = os.path.abspath(upload_folder)
-app.config['MAX_CONTENT_LENGTH'] = parse_file_size(upload_config.get('max_file_size', '5000MB'))
 
-# 确保上传目录存在
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+def resolve_job_paths(rel_paths):
+    """
+    校验任务涉及的相对路径，返回去重后的绝对路径（已选中其父目录的路径会被合并）
+    
+    Raises:
+        JobError: 路径为空、不安全或不存在
+    """
+    if not isinstance(rel_paths, list) or not rel_paths:
+        raise JobError('请选择要操作的文件')
+    paths = []
+    for rel_path in rel_paths:
+        resolved = resolve_file_path(str(rel_path))
+        if resolved is None:
+            raise JobError('访问路径不安全', 403)
+        if not server.storage.lexists(resolved[0]):
+            raise JobError(f'文件不存在: {rel_path}', 404)
+        paths.append(resolved[0])
+    paths = sorted(set(paths))
+    return [path for path in paths
+            if not any(path.startswith(parent + os.sep) for parent in paths if parent != path)]
+
+
+def path_usage(path, rel_path):
+    """文件或目录（递归）的条目数和文件总字节数：目录只在索引可用时统计，否则返回(None, None)"""
+    if server.storage.islink(path) or not server.storage.isdir(path):
+        return 1, server.storage.lstat(path).st_size
+    if server.metadata_index is not None and server.metadata_index.ready:
+        return server.metadata_index.subtree_usage(rel_path)
+    return None, None
+
+
+def move_to_trash(paths):
+    """
+    把路径移入回收站（rename，与文件夹大小无关），立即从索引和统计中移除
+    
+    Returns:
+        tuple: (回收站条目列表, 无法移入回收站的路径列表（位于另一个文件系统，需要直接删除）)
+    """
+    entries = []
+    remaining = []
+    try:
+        for path in paths:
+            rel_path = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+            items, size = path_usage(path, rel_path)
+            try:
+                entries.append(server.trash.put(path, rel_path, session['user_id'], items, size))
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                remaining.append(path)
+                continue
+            index_remove(path)
+            quota_move(path, server.trash.data_path(entries[-1]['entry_id']), size)
+    finally:
+        if entries:
+            server.stats_stream.invalidate()
+    return entries, remaining
+
+
+def run_delete_job(job, paths):
+    """后台任务：递归删除"""
+    job.set_total(*server.storage.count(paths))
+    for path in paths:
+        job.checkpoint()
+        try:
+            server.storage.delete(path, job)
+        finally:
+            sync_index(path)
+            quota_remove(path)
+            server.stats_stream.invalidate()
+
+
+def run_transfer_job(job, paths, dest_dir, move):
+    """后台任务：复制或移动到目标目录"""
+    if move and server.storage.is_local:
+        # 同一文件系统内的移动只是rename，按条目计数即可
+        job.set_total(len(paths), 0)
+    else:
+        items, size = server.storage.count(paths)
+        job.set_total(items, size)
+    
+    if server.quota is not None:
+        # 开始复制或移动之前检查目标位置的配额
+        dest_rel = upload_rel_path(dest_dir)
+        if move:
+            for path in paths:
+                server.quota.check_move(upload_rel_path(path), dest_rel)
+        else:
+            server.quota.check(job.user_id, dest_rel, size)
+    
+    def on_done(src, dest):
+        if move:
+            sync_index(src)
+        if dest is not None:
+            sync_index(dest)
+            if move:
+                quota_move(src, dest)
+            else:
+                quota_add(dest, user_id=job.user_id)
+    
+    targets = file_ops.run_transfer(paths, dest_dir, job, server.storage.move if move else server.storage.copy,
+                                    on_done, server.storage.lexists)
+    job.set_result(targets=[os.path.relpath(target, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+                            for target in targets])
+
+
+def submit_transfer_job(action, paths, rel_paths, destination):
+    """
+    校验目标文件夹并提交移动或复制任务
+    
+    Raises:
+        JobError: 目标文件夹不安全、不存在，或位于源路径之内
+    """
+    destination = str(destination or '').strip().strip('/')
+    if destination:
+        resolved = resolve_file_path(destination)
+        if resolved is None:
+            raise JobError('目标路径不安全', 403)
+        dest_dir, destination = resolved
+    else:
+        dest_dir = current_app.config['UPLOAD_FOLDER']
+    if not server.storage.isdir(dest_dir):
+        raise JobError('目标文件夹不存在', 404)
+    for path in paths:
+        if dest_dir == path or dest_dir.startswith(path + os.sep):
+            raise JobError('不能移动或复制到自身或其子文件夹中')
+        if action == 'move' and os.path.dirname(path) == dest_dir:
+            raise JobError('目标文件夹与原位置相同')
+    return server.submit_job(action, {'paths': rel_paths, 'destination': destination},
+                             run_transfer_job, paths, dest_dir, action == 'move')
+
+
+def make_signed_url(rel_path, ttl, ip='', range_scope='', as_attachment=True, external=False):
+    """
+    生成签名下载链接
+    
+    Returns:
+        tuple: (链接, 过期时间戳)
+    
+    Raises:
+        ValueError: 有效期、IP范围或区间无效
+    """
+    params = server.url_signer.sign(rel_path, ttl, ip, range_scope)
+    expires = int(params['expires'])
+    if not as_attachment:
+        params['as_attachment'] = 'false'
+    return url_for('main.signed_download', filepath=rel_path, _external=external, **params), expires
+
 
-# 初始化认证管理器
-AuthManager.initialize(config)
+# 上传和下载路由，用于统计正在进行的传输
+UPLOAD_ENDPOINTS = {'main.handle_upload', 'main.handle_raw_upload', 'main.upload_session_chunk'}
+DOWNLOAD_ENDPOINTS = {'main.download', 'main.download_zip', 'main.signed_download'}
 
-# 服务器信息
-server_host = server_config.get('host', '0.0.0.0')
-server_port = server_config.get('port', 9000)
-server_address = f"http://{FileUtils.get_local_ip()}:{server_port}"
+
+def transfer_direction():
+    """当前请求的传输方向：upload / download，不是上传或下载时为None"""
+    if request.endpoint in UPLOAD_ENDPOINTS:
+        return 'upload'
+    if request.endpoint in DOWNLOAD_ENDPOINTS:
+        return 'download'
+    return None
+
+
+@bp.before_app_request
+def record_request_route():
+    """记录请求对应的路由模板（而不是实际路径），避免指标标签数量无限增长"""
+    if metrics.ROUTE_ENVIRON_KEY not in request.environ:
+        # 未启用指标
+        return
+    metrics.mark_request(request.environ, request.url_rule.rule if request.url_rule else 'unmatched',
+                         transfer_direction())
+
+
+# 各端点所属的准入类别（上传和下载属于 transfers）
+ADMISSION_ENDPOINTS = {
+    'main.file_list': 'listings',
+    'main.api_list': 'listings',
+    'main.api_search': 'listings',
+    'main.index': 'stats',
+    'main.api_stats': 'stats',
+    'main.api_file_type_stats': 'stats',
+    'main.api_folder_size_stats': 'stats',
+    'main.login': 'auth'
+}
+
+# 不计入传输类别的上传端点：断点续传的分片由同一个客户端并行发送（每个会话4个），
+# 分片请求很短，计入名额会让单个用户的并行分片互相排队甚至被拒绝
+UNGATED_TRANSFER_ENDPOINTS = {'main.upload_session_chunk'}
+
+
+def overloaded_response(error):
+    """准入控制拒绝请求时的响应：页面请求返回错误页，其他请求返回JSON，都带 Retry-After"""
+    if request.endpoint == 'main.login' or (request.method == 'GET' and not request.path.startswith('/api/')):
+        response = make_response(render_template('error.html',
+                                                 error_code=error.status_code,
+                                                 error_message=error.message))
+    else:
+        response = jsonify({'success': False, 'error': error.message})
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@bp.before_app_request
+def admit_request():
+    """按端点类别获取准入名额，名额用完且等待队列已满或排队超时时直接返回503"""
+    if server.admission is None:
+        return None
+    direction = transfer_direction()
+    if request.endpoint in UNGATED_TRANSFER_ENDPOINTS or (direction == 'download' and not server.admit_downloads):
+        return None
+    name = 'transfers' if direction else ADMISSION_ENDPOINTS.get(request.endpoint)
+    if name is None:
+        return None
+    try:
+        server.admission.admit(request.environ, name)
+    except Overloaded as e:
+        metrics.admission_rejected.inc(1, name)
+        return overloaded_response(e)
+    return None
+
+
+@bp.before_app_request
+def attach_bandwidth_limit():
+    """为上传和下载请求创建限速句柄：上传在读取请求体时限速，下载在发送响应体时限速"""
+    direction = transfer_direction()
+    if server.bandwidth is None or direction is None:
+        return
+    transfer = server.bandwidth.transfer(AuthManager.get_current_user(), direction)
+    request.environ[TRANSFER_ENVIRON_KEY] = transfer
+    if direction == 'upload':
+        request.environ['wsgi.input'] = ThrottledInput(request.environ['wsgi.input'], transfer)
 
 
 # 错误处理
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
+    metrics.http_errors.inc(1, '404')
     return render_template('error.html', 
                          error_code=404,
                          error_message='页面未找到'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
+    metrics.http_errors.inc(1, '500')
     return render_template('error.html', 
                          error_code=500,
                          error_message='服务器内部错误'), 500
 
-@app.errorhandler(413)
+@bp.app_errorhandler(413)
 def too_large_error(error):
+    metrics.http_errors.inc(1, '413')
     return render_template('error.html', 
                          error_code=413,
                          error_message='文件太大'), 413
 
-@app.errorhandler(403)
+@bp.app_errorhandler(403)
 def forbidden_error(error):
+    metrics.http_errors.inc(1, '403')
     return render_template('error.html', 
                          error_code=403,
                          error_message='访问被拒绝'), 403
 
 
 # 路由定义
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
     """首页 - 可视化大屏幕"""
     try:
         # 获取磁盘使用情况
-        disk_usage = FileUtils.get_disk_usage(app.config['UPLOAD_FOLDER'])
+        disk_usage = FileUtils.get_disk_usage(current_app.config['UPLOAD_FOLDER'])
         
-        # 获取文件统计信息
-        file_stats = FileUtils.get_file_stats(app.config['UPLOAD_FOLDER'])
+        # 获取文件统计信息（复制一份，缓存的结果由多个请求共享）
+        file_stats = dict(cached_stats('file_stats', get_file_stats))
         # 添加上传路径信息
-        file_stats['upload_folder'] = app.config['UPLOAD_FOLDER']
+        file_stats['upload_folder'] = current_app.config['UPLOAD_FOLDER']
         
         # 获取版本信息
         version_info = {
@@ -131,10 +913,18 @@ def index():
             'release_date': get_release_date()
         }
         
+        # 获取配额用量（未配置配额时为None）
+        quota = None
+        if server.quota is not None:
+            quota = server.quota.get_usage(session['user_id'], AuthManager.is_admin())
+        
         return render_template('dashboard.html', 
                              disk_usage=disk_usage,
                              file_stats=file_stats,
-                             address=server_address,
+                             quota=quota,
+                             bandwidth_enabled=server.bandwidth is not None,
+                             refresh_interval=server.dashboard_config.get('refresh_interval', 30000),
+                             address=server.address,
                              current_user=session.get('username'),
                              version_info=version_info)
     except Exception as e:
@@ -143,12 +933,12 @@ def index():
                              error_message=f"获取系统信息失败: {str(e)}"), 500
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """用户登录"""
     # 如果用户已登录，重定向到首页
     if session.get('logged_in'):
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
         
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
@@ -160,40 +950,44 @@ def login():
             AuthManager.login(username)
             flash('登录成功！', 'success')
             next_page = request.args.get('next')
-            return redirect(next_page or url_for('index'))
+            return redirect(next_page or url_for('main.index'))
         else:
             flash('用户名或密码错误！', 'error')
     
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """用户登出"""
     AuthManager.logout()
     flash('已成功登出！', 'success')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 
-@app.route('/upload', methods=['GET'])
+@bp.route('/upload', methods=['GET'])
 @login_required
 def upload_file():
     """文件上传页面"""
     # 计算前端需要的最大文件大小（MB单位）
-    max_filesize_mb = app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    max_filesize_mb = current_app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
     
     return render_template('upload.html', 
-                          address=server_address,
-                          max_content_length=app.config['MAX_CONTENT_LENGTH'],
+                          address=server.address,
+                          max_content_length=current_app.config['MAX_CONTENT_LENGTH'],
+                          chunk_size=current_app.config['UPLOAD_CHUNK_SIZE'],
                           max_filesize_mb=max_filesize_mb,
-                          allowed_extensions=upload_config.get('allowed_extensions', []),
+                          allowed_extensions=server.upload_config.get('allowed_extensions', []),
                           current_user=session.get('username'))
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 @login_required
 def handle_upload():
     """处理文件上传"""
+    if server.upload_config.get('streaming', True) and request.mimetype == 'multipart/form-data':
+        return handle_streaming_upload()
+    
     try:
         # 获取当前路径参数（从文件列表页面传递）
         current_path = request.form.get('current_path', '').strip()
@@ -222,7 +1016,7 @@ def handle_upload():
             return jsonify({'error': '请选择有效的文件'}), 400
         
         # 验证文件类型
-        allowed_extensions = upload_config.get('allowed_extensions', [])
+        allowed_extensions = server.upload_config.get('allowed_extensions', [])
         if not ValidationUtils.validate_file_extension(file.filename, allowed_extensions):
             return jsonify({'error': f'不支持的文件类型。支持的类型: {", ".join(allowed_extensions)}'}), 400
         
@@ -231,7 +1025,7 @@ def handle_upload():
         file_size = file.tell()
         file.seek(0)  # 重置文件指针
         
-        max_size = app.config['MAX_CONTENT_LENGTH']
+        max_size = current_app.config['MAX_CONTENT_LENGTH']
         if file_size > max_size:
             max_size_mb = max_size / (1024 * 1024)
             file_size_mb = file_size / (1024 * 1024)
@@ -241,53 +1035,25 @@ def handle_upload():
             }), 413
         
         # 保持原始文件名，正确处理中文文件名
-        original_filename = file.filename
-        
-        # 检查是否为中文文件名，如果是则进行特殊处理
-        try:
-            # 尝试使用UTF-8编码
-            original_filename.encode('utf-8')
-            # 如果文件名包含非ASCII字符，保留原始文件名但进行安全处理
-            if any(ord(char) > 127 for char in original_filename):
-                # 中文文件名：保留原始文件名，但替换危险字符
-                safe_filename = re.sub(r'[\\/:"*?<>|]', '_', original_filename)
-            else:
-                # 英文文件名：使用secure_filename
-                safe_filename = secure_filename(original_filename)
-        except UnicodeEncodeError:
-            # 如果UTF-8编码失败，使用安全文件名
-            safe_filename = secure_filename(original_filename)
-        
-        # 如果安全处理后文件名为空，使用原始文件名（进行基本清理）
-        if not safe_filename:
-            safe_filename = re.sub(r'[^\w\d\.\-]', '_', original_filename)
+        safe_filename = FileUtils.safe_filename(file.filename)
         
         # 构建文件路径，考虑当前浏览路径
-        if current_path:
-            # 安全检查当前路径
-            target_folder = os.path.join(app.config['UPLOAD_FOLDER'], current_path)
-            if not FileUtils.is_safe_path(app.config['UPLOAD_FOLDER'], target_folder):
-                return jsonify({'error': '访问路径不安全'}), 403
-            
-            # 确保目标文件夹存在
-            os.makedirs(target_folder, exist_ok=True)
-            file_path = os.path.join(target_folder, safe_filename)
-        else:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-        
-        # 检查文件是否已存在，如果存在则生成唯一文件名
-        counter = 1
-        name, ext = os.path.splitext(safe_filename)
-        while os.path.exists(file_path):
-            safe_filename = f"{name}_{counter}{ext}"
-            if current_path:
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], current_path, safe_filename)
-            else:
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-            counter += 1
+        target_folder = resolve_upload_folder(current_path)
+        if target_folder is None:
+            return jsonify({'error': '访问路径不安全'}), 403
+        check_quota(target_folder, file_size)
         
-        # 保存文件
-        file.save(file_path)
+        def save(path):
+            # 目标名已被占用时可能已经读取了部分数据，每次都从头写入
+            file.stream.seek(0)
+            server.storage.write(path, file.stream)
+        
+        # 独占地写入不冲突的文件名（并发上传同名文件不会互相覆盖）
+        file_path, safe_filename = FileUtils.claim_unique_path(target_folder, safe_filename, save,
+                                                               server.storage.lexists)
+        dedup_file(file_path)
+        index_add(file_path)
+        quota_add(file_path, file_size)
         
         return jsonify({
             'success': True,
@@ -296,6 +1062,8 @@ def handle_upload():
             'file_size': file_size
         }), 200
         
+    except QuotaExceeded as e:
+        return jsonify({'error': e.message, 'details': e.details}), e.status_code
     except Exception as e:
         return jsonify({
             'error': '文件上传失败',
@@ -303,70 +1071,350 @@ def handle_upload():
         }), 500
 
 
-@app.route('/files')
-@app.route('/files/<path:path>')
+def check_upload_filename(filename):
+    """验证上传文件名，不合法时抛出 StreamingUploadError"""
+    if not filename:
+        raise StreamingUploadError('请选择有效的文件', 400)
+    allowed_extensions = server.upload_config.get('allowed_extensions', [])
+    if not ValidationUtils.validate_file_extension(filename, allowed_extensions):
+        raise StreamingUploadError(f'不支持的文件类型。支持的类型: {", ".join(allowed_extensions)}', 400)
+
+
+def streaming_upload_response(received, target_folder):
+    """流式上传完成后放置文件并生成响应"""
+    _, safe_filename = place_uploaded_file(received['temp_path'], received['filename'], target_folder,
+                                           received['sha256'])
+    response = {
+        'success': True,
+        'message': f'文件 {safe_filename} 上传成功！',
+        'filename': safe_filename,
+        'file_size': received['size']
+    }
+    if received['sha256']:
+        response['sha256'] = received['sha256']
+    return jsonify(response), 200
+
+
+def handle_streaming_upload():
+    """流式处理multipart上传：边解析边写入，不经过临时文件缓存"""
+    target = {}
+    
+    def on_file(filename, fields):
+        check_upload_filename(filename)
+        target_folder = resolve_upload_folder(fields.get('current_path', '').strip())
+        if target_folder is None:
+            raise StreamingUploadError('访问路径不安全', 403)
+        # 文件数据之前检查配额（请求体长度包含其他表单字段，是文件大小的上限），超出时不再接收
+        check_quota(target_folder, request.content_length)
+        target['folder'] = target_folder
+    
+    try:
+        boundary = request.mimetype_params.get('boundary', '').encode('latin-1')
+        if not boundary:
+            return jsonify({'error': '请选择文件'}), 400
+        
+        received = server.streaming_receiver.receive_multipart(request.stream, boundary, on_file,
+                                                        request.headers.get('X-Content-SHA256'))
+        return streaming_upload_response(received, target['folder'])
+    except (StreamingUploadError, QuotaExceeded) as e:
+        response = {'error': e.message}
+        if e.details:
+            response['details'] = e.details
+        return jsonify(response), e.status_code
+    except RequestEntityTooLarge:
+        # 请求体超过 MAX_CONTENT_LENGTH（读取请求体时由werkzeug检查）
+        return jsonify({'error': '文件大小超出限制'}), 413
+    except Exception as e:
+        return jsonify({
+            'error': '文件上传失败',
+            'details': str(e)
+        }), 500
+
+
+@bp.route('/api/upload/stream', methods=['PUT'])
 @login_required
-def file_list(path=''):
-    """文件列表页面"""
+def handle_raw_upload():
+    """流式上传：请求体为文件原始字节，文件名和目标路径通过查询参数传递"""
     try:
-        # 正确处理路径，确保没有多余的斜杠
-        if path:
-            current_path = os.path.join(app.config['UPLOAD_FOLDER'], path)
-        else:
-            current_path = app.config['UPLOAD_FOLDER']
+        filename = request.args.get('filename', '').strip()
+        check_upload_filename(filename)
         
-        # 规范化路径，移除多余的斜杠
-        current_path = os.path.normpath(current_path)
+        target_folder = resolve_upload_folder(request.args.get('current_path', '').strip())
+        if target_folder is None:
+            return jsonify({'error': '访问路径不安全'}), 403
+        # 接收请求体之前按Content-Length检查配额
+        check_quota(target_folder, request.content_length)
         
-        # 安全检查
-        if not FileUtils.is_safe_path(app.config['UPLOAD_FOLDER'], current_path):
+        received = server.streaming_receiver.receive_raw(request.stream, filename,
+                                                  request.headers.get('X-Content-SHA256'))
+        return streaming_upload_response(received, target_folder)
+    except (StreamingUploadError, QuotaExceeded) as e:
+        response = {'error': e.message}
+        if e.details:
+            response['details'] = e.details
+        return jsonify(response), e.status_code
+    except RequestEntityTooLarge:
+        # 请求体超过 MAX_CONTENT_LENGTH（读取请求体时由werkzeug检查）
+        return jsonify({'error': '文件大小超出限制'}), 413
+    except Exception as e:
+        return jsonify({
+            'error': '文件上传失败',
+            'details': str(e)
+        }), 500
+
+
+@bp.route('/api/upload/precheck', methods=['POST'])
+@login_required
+def upload_precheck():
+    """秒传预检：服务器已有相同内容时直接创建文件，无需上传数据"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if server.blob_store is None:
+            return jsonify({'success': True, 'instant': False}), 200
+        
+        filename = (data.get('filename') or '').strip()
+        check_upload_filename(filename)
+        try:
+            file_size = int(data.get('size', -1))
+        except (TypeError, ValueError):
+            file_size = -1
+        digest = (data.get('sha256') or '').strip().lower()
+        if file_size < 0 or not digest:
+            return jsonify({'error': '缺少文件摘要或大小'}), 400
+        
+        blob_path = server.blob_store.lookup(digest, file_size)
+        if blob_path is None:
+            return jsonify({'success': True, 'instant': False}), 200
+        
+        target_folder = resolve_upload_folder((data.get('current_path') or '').strip())
+        if target_folder is None:
+            return jsonify({'error': '访问路径不安全'}), 403
+        check_quota(target_folder, file_size)
+        
+        try:
+            file_path, safe_filename = FileUtils.claim_unique_path(
+                target_folder, FileUtils.safe_filename(filename),
+                lambda path: server.blob_store.link(blob_path, path))
+        except FileNotFoundError:
+            # blob刚好被回收，按普通上传处理
+            return jsonify({'success': True, 'instant': False}), 200
+        index_add(file_path)
+        quota_add(file_path, file_size)
+        
+        return jsonify({
+            'success': True,
+            'instant': True,
+            'message': f'文件 {safe_filename} 秒传成功！',
+            'filename': safe_filename,
+            'file_size': file_size
+        }), 200
+    except StreamingUploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except QuotaExceeded as e:
+        return jsonify({'error': e.message, 'details': e.details}), e.status_code
+    except Exception as e:
+        return jsonify({'error': '秒传预检失败', 'details': str(e)}), 500
+
+
+@bp.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload_session():
+    """断点续传：创建上传会话"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not data.get('filename'):
+            return jsonify({'error': '请选择有效的文件'}), 400
+        
+        filename = data['filename']
+        try:
+            file_size = int(data.get('size', -1))
+        except (TypeError, ValueError):
+            file_size = -1
+        if file_size < 0:
+            return jsonify({'error': '文件大小无效'}), 400
+        
+        # 提前验证文件类型和大小，完成上传时会再次验证
+        allowed_extensions = server.upload_config.get('allowed_extensions', [])
+        if not ValidationUtils.validate_file_extension(filename, allowed_extensions):
+            return jsonify({'error': f'不支持的文件类型。支持的类型: {", ".join(allowed_extensions)}'}), 400
+        
+        max_size = current_app.config['MAX_CONTENT_LENGTH']
+        if not ValidationUtils.validate_file_size(file_size, max_size):
+            return jsonify({
+                'error': '文件大小超出限制',
+                'details': f'文件大小: {file_size / (1024 * 1024):.2f}MB, 最大限制: {max_size / (1024 * 1024):.2f}MB'
+            }), 413
+        
+        current_path = (data.get('current_path') or '').strip()
+        target_folder = resolve_dir_path(current_path)
+        if target_folder is None:
+            return jsonify({'error': '访问路径不安全'}), 403
+        # 按声明的大小检查配额，超出时不创建会话
+        check_quota(target_folder, file_size)
+        
+        upload = server.upload_sessions.create(filename, file_size, current_path, session['user_id'])
+        upload['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+        return jsonify(upload), 201
+    except QuotaExceeded as e:
+        return jsonify({'error': e.message, 'details': e.details}), e.status_code
+    except Exception as e:
+        return jsonify({'error': '创建上传会话失败', 'details': str(e)}), 500
+
+
+@bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_session_status(upload_id):
+    """断点续传：查询已接收的数据区间"""
+    try:
+        upload = server.upload_sessions.status(upload_id, session['user_id'])
+        upload['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+        return jsonify(upload), 200
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': '查询上传进度失败', 'details': str(e)}), 500
+
+
+@bp.route('/api/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+@login_required
+def upload_session_chunk(upload_id):
+    """断点续传：上传分片（请求体为原始字节，偏移量由offset参数或Upload-Offset头指定）"""
+    try:
+        offset = request.args.get('offset', request.headers.get('Upload-Offset'))
+        if offset is None or request.content_length is None:
+            return jsonify({'error': '缺少分片偏移量或长度'}), 400
+        try:
+            offset = int(offset)
+        except ValueError:
+            return jsonify({'error': '分片偏移量无效'}), 400
+        
+        upload = server.upload_sessions.write_chunk(upload_id, session['user_id'], offset,
+                                             request.content_length, request.stream)
+        return jsonify(upload), 200
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': '分片上传失败', 'details': str(e)}), 500
+
+
+@bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload_session(upload_id):
+    """断点续传：完成上传，将暂存文件移动到目标目录"""
+    try:
+        # 会话被标记为已完成，之后的分片写入、取消和重复的完成请求都被拒绝
+        upload = server.upload_sessions.complete(upload_id, session['user_id'])
+        
+        try:
+            # 验证文件类型
+            allowed_extensions = server.upload_config.get('allowed_extensions', [])
+            if not ValidationUtils.validate_file_extension(upload['filename'], allowed_extensions):
+                raise UploadSessionError(f'不支持的文件类型。支持的类型: {", ".join(allowed_extensions)}', 400)
+            
+            target_folder = resolve_upload_folder(upload['current_path'])
+            if target_folder is None:
+                raise UploadSessionError('访问路径不安全', 403)
+            
+            _, safe_filename = place_uploaded_file(upload['data_path'], upload['filename'], target_folder)
+        except QuotaExceeded:
+            # 暂存数据已删除，会话不能再继续
+            server.upload_sessions.remove(upload_id)
+            raise
+        except BaseException:
+            # 暂存文件仍在时恢复会话，客户端可以重试或取消
+            server.upload_sessions.reopen(upload_id, session['user_id'])
+            raise
+        server.upload_sessions.remove(upload_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'文件 {safe_filename} 上传成功！',
+            'filename': safe_filename,
+            'file_size': upload['size']
+        }), 200
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except QuotaExceeded as e:
+        return jsonify({'error': e.message, 'details': e.details}), e.status_code
+    except Exception as e:
+        return jsonify({'error': '文件上传失败', 'details': str(e)}), 500
+
+
+@bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload_session(upload_id):
+    """断点续传：取消上传"""
+    try:
+        server.upload_sessions.abort(upload_id, session['user_id'])
+        return jsonify({'success': True}), 200
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': '取消上传失败', 'details': str(e)}), 500
+
+
+@bp.route('/files')
+@bp.route('/files/<path:path>')
+@login_required
+def file_list(path=''):
+    """文件列表页面"""
+    try:
+        # 规范化路径并做安全检查（不允许访问内部数据目录）
+        current_path = resolve_dir_path(path)
+        if current_path is None:
             return render_template('error.html', 
                                  error_code=403,
                                  error_message='访问路径不安全'), 403
         
-        files_and_dirs = FileUtils.get_files_and_dirs(current_path, app.config['UPLOAD_FOLDER'])
+        # 只渲染第一页，后续分页、排序和过滤由页面通过 /api/list 获取
+        def render():
+            return render_template('file_list.html',
+                                   listing=list_directory(current_path),
+                                   list_path=path.strip('/'),
+                                   current_path=current_path,
+                                   upload_folder=current_app.config['UPLOAD_FOLDER'],
+                                   address=server.address,
+                                   trash_enabled=server.trash is not None,
+                                   current_user=session.get('username'))
         
-        return render_template('file_list.html',
-                             files_and_dirs=files_and_dirs,
-                             current_path=current_path,
-                             upload_folder=app.config['UPLOAD_FOLDER'],
-                             address=server_address,
-                             current_user=session.get('username'))
+        if '_flashes' in session:
+            # 有待显示的提示消息（只显示一次）时不使用缓存
+            return render()
+        # 页面内容还取决于当前用户和版本（模板可能随版本变化）
+        return listing_response(current_path, ('html', session.get('username'), get_version()),
+                                render, 'text/html')
     except Exception as e:
         return render_template('error.html', 
                              error_code=500,
                              error_message=f'获取文件列表失败: {str(e)}'), 500
 
 
-@app.route('/download/<path:filepath>')
+@bp.route('/download/<path:filepath>', methods=['GET', 'HEAD'])
 @login_required
 def download(filepath):
     """文件下载/预览"""
     try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filepath)
-        file_path = os.path.normpath(file_path)
-        
-        # 安全检查
-        if not FileUtils.is_safe_path(app.config['UPLOAD_FOLDER'], file_path):
+        # 安全检查（不允许访问内部数据目录）
+        file_path = resolve_dir_path(filepath)
+        if file_path is None:
             return render_template('error.html', 
                                  error_code=403,
                                  error_message='访问路径不安全'), 403
         
-        if not os.path.exists(file_path):
+        if not server.storage.exists(file_path):
             return render_template('error.html', 
                                  error_code=404,
                                  error_message='文件不存在'), 404
         
-        # 检查是否为文件夹
-        if os.path.isdir(file_path):
-            return render_template('error.html', 
-                                 error_code=400,
-                                 error_message='下载路径指向文件夹，请选择具体文件'), 400
+        # 文件夹打包为ZIP下载
+        if server.storage.isdir(file_path):
+            return zip_download_response([filepath], os.path.basename(file_path) or 'files')
         
         as_attachment = request.args.get('as_attachment', 'true').lower() == 'true'
         
-        # 直接返回文件，让浏览器处理文件名编码
-        return send_file(file_path, as_attachment=as_attachment)
+        # 支持Range、ETag和条件请求，响应体尽量使用sendfile零拷贝发送；可压缩类型按Accept-Encoding压缩
+        return send_file_range(file_path, request, as_attachment=as_attachment, encoder=server.content_encoder,
+                               storage=server.storage)
             
     except Exception as e:
         return render_template('error.html', 
@@ -374,28 +1422,124 @@ def download(filepath):
                              error_message=f'文件操作失败: {str(e)}'), 500
 
 
-@app.route('/delete/<path:filename>', methods=['DELETE'])
+@bp.route('/signed/<path:filepath>', methods=['GET', 'HEAD'])
+def signed_download(filepath):
+    """
+    签名链接下载
+    
+    只校验链接本身的签名、有效期和访问范围，不读取会话，因此可以交给脚本使用，
+    也可以由上游缓存保存（未限制IP的链接响应为public，缓存时间不超过链接的剩余有效期）。
+    """
+    try:
+        resolved = resolve_file_path(filepath)
+        if resolved is None:
+            return jsonify({'error': '访问路径不安全'}), 403
+        file_path, rel_path = resolved
+        
+        scope = server.url_signer.verify(rel_path, request.args, request.remote_addr)
+        
+        if not server.storage.isfile(file_path):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        as_attachment = request.args.get('as_attachment', 'true').lower() == 'true'
+        max_age = max(0, scope['expires'] - int(time.time()))
+        cache_control = f"{'private' if scope['ip'] else 'public'}, max-age={max_age}"
+        return send_file_range(file_path, request, as_attachment=as_attachment,
+                               cache_control=cache_control, range_limit=scope['range'],
+                               encoder=server.content_encoder, storage=server.storage)
+    except SignedUrlError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': f'文件操作失败: {str(e)}'}), 500
+
+
+def zip_download_response(rel_paths, archive_name):
+    """边打包边输出ZIP的下载响应"""
+    entries = collect_entries(current_app.config['UPLOAD_FOLDER'], rel_paths, server.storage)
+    headers = {
+        'Content-Disposition': content_disposition(f'{archive_name}.zip', True),
+        'Cache-Control': 'no-store'
+    }
+    body = server.zip_streamer.stream(entries, server.storage)
+    transfer = request.environ.get(TRANSFER_ENVIRON_KEY)
+    if transfer is not None:
+        body = throttle_iterable(body, transfer)
+    return Response(body, mimetype='application/zip', headers=headers, direct_passthrough=True)
+
+
+@bp.route('/download_zip', methods=['GET', 'POST'])
 @login_required
-def delete_file(filename):
-    """删除文件"""
+def download_zip():
+    """多选文件/文件夹打包下载，通过 paths 参数（可重复）指定相对路径"""
     try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        rel_paths = request.values.getlist('paths')
+        if not rel_paths:
+            return jsonify({'error': '请选择要下载的文件'}), 400
+        
+        normalized = []
+        for rel_path in rel_paths:
+            file_path = resolve_dir_path(rel_path)
+            if file_path is None:
+                return jsonify({'error': '访问路径不安全'}), 403
+            rel_path = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+            if not server.storage.exists(file_path):
+                return jsonify({'error': f'文件不存在: {rel_path}'}), 404
+            normalized.append(rel_path)
         
-        # 安全检查
-        if not FileUtils.is_safe_path(app.config['UPLOAD_FOLDER'], file_path):
+        # 只选了一项时压缩包以该项命名，否则以所在目录命名
+        if len(normalized) == 1:
+            archive_name = os.path.basename(normalized[0]) or 'files'
+        else:
+            parent = os.path.dirname(normalized[0])
+            archive_name = os.path.basename(parent) if parent and all(
+                os.path.dirname(p) == parent for p in normalized) else 'files'
+        return zip_download_response(normalized, archive_name)
+    except Exception as e:
+        return jsonify({'error': f'打包下载失败: {str(e)}'}), 500
+
+
+@bp.route('/delete/<path:filename>', methods=['DELETE'])
+@login_required
+def delete_file(filename):
+    """删除文件或文件夹：启用回收站时移入回收站，否则文件直接删除、文件夹交给后台任务删除"""
+    try:
+        # 安全检查（不允许删除上传目录本身和内部数据目录）
+        resolved = resolve_file_path(filename)
+        if resolved is None:
             return jsonify({'error': '访问路径不安全'}), 403
+        file_path, rel_path = resolved
         
-        if not os.path.exists(file_path):
+        if not server.storage.lexists(file_path):
             return jsonify({'error': '文件不存在'}), 404
         
-        # 安全删除文件
-        FileUtils.safe_delete(file_path)
+        if server.trash is not None:
+            entries, remaining = move_to_trash([file_path])
+            if entries:
+                return jsonify({'message': '已移到回收站', 'entry': entries[0]}), 200
+            # 位于另一个文件系统（挂载点）的路径无法rename到回收站，直接删除
+        
+        if server.storage.isdir(file_path) and not server.storage.islink(file_path):
+            # 文件夹可能包含大量文件，交给后台任务删除，请求立即返回
+            job = server.submit_job('delete', {'paths': [rel_path]}, run_delete_job, [file_path])
+            return jsonify({'message': '已开始删除文件夹', 'job': job}), 202
+        
+        # 删除文件（去重模式下同时释放无引用的blob）
+        file_size = server.storage.lstat(file_path).st_size
+        try:
+            server.storage.delete(file_path)
+        except OSError:
+            return jsonify({'error': '删除文件失败'}), 500
+        index_remove(file_path)
+        quota_remove(file_path, file_size)
+        server.stats_stream.invalidate()
         return jsonify({'message': '文件删除成功'}), 200
+    except JobError as e:
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         return jsonify({'error': f'删除文件失败: {str(e)}'}), 500
 
 
-@app.route('/create_folder', methods=['POST'])
+@bp.route('/create_folder', methods=['POST'])
 @login_required
 def create_folder():
     """创建文件夹"""
@@ -411,18 +1555,15 @@ def create_folder():
         # 获取当前路径（如果有）
         current_path = data.get('current_path', '')
         
-        # 构建完整路径
-        if current_path:
-            full_path = os.path.join(app.config['UPLOAD_FOLDER'], current_path, folder_name)
-        else:
-            full_path = os.path.join(app.config['UPLOAD_FOLDER'], folder_name)
-        
-        # 安全检查
-        if not FileUtils.is_safe_path(app.config['UPLOAD_FOLDER'], full_path):
+        # 构建完整路径并做安全检查（不允许在内部数据目录中创建）
+        resolved = resolve_file_path(os.path.join(current_path, folder_name))
+        if resolved is None:
             return jsonify({'error': '访问路径不安全'}), 403
+        full_path = resolved[0]
         
         # 创建文件夹
-        os.makedirs(full_path, exist_ok=True)
+        server.storage.makedirs(full_path)
+        index_add(full_path)
         
         return jsonify({
             'success': True,
@@ -433,32 +1574,369 @@ def create_folder():
         return jsonify({'error': f'创建文件夹失败: {str(e)}'}), 500
 
 
-@app.route('/api/stats')
+@bp.route('/api/list')
+@bp.route('/api/list/<path:path>')
+@login_required
+def api_list(path=''):
+    """
+    API接口：分页获取目录列表
+    
+    查询参数：sort（name/size/mtime/type）、order（asc/desc）、prefix（名称前缀）、
+    type（file/dir 或文件类型名称）、cursor（上一页返回的 next_cursor）、limit（每页条目数）
+    """
+    try:
+        current_path = resolve_dir_path(path)
+        if current_path is None:
+            return jsonify({'error': '访问路径不安全'}), 403
+        if not server.storage.isdir(current_path):
+            return jsonify({'error': '目录不存在'}), 404
+        
+        sort = request.args.get('sort', 'mtime')
+        if sort not in LIST_SORT_FIELDS:
+            return jsonify({'error': f'不支持的排序字段: {sort}'}), 400
+        order = request.args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': f'不支持的排序方向: {order}'}), 400
+        try:
+            limit = int(request.args.get('limit', LIST_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': '无效的limit参数'}), 400
+        limit = max(1, min(limit, LIST_MAX_PAGE_SIZE))
+        
+        prefix = request.args.get('prefix', '').strip()
+        file_type = request.args.get('type', '').strip()
+        cursor = request.args.get('cursor') or None
+        
+        def build():
+            listing = list_directory(current_path,
+                                     sort=sort,
+                                     order=order,
+                                     prefix=prefix,
+                                     file_type=file_type,
+                                     cursor=cursor,
+                                     limit=limit)
+            return current_app.json.dumps({
+                'success': True,
+                'data': listing
+            })
+        
+        return listing_response(current_path, ('json', sort, order, prefix, file_type, cursor, limit),
+                                build, 'application/json')
+    except Exception as e:
+        return jsonify({'error': f'获取文件列表失败: {str(e)}'}), 500
+
+
+@bp.route('/api/search')
+@login_required
+def api_search():
+    """
+    API接口：搜索文件和文件夹
+    
+    查询参数：q（路径子串）、glob（文件名通配符）、path（限定搜索目录）、type（file/dir 或文件类型名称）、
+    min_size/max_size（字节数或带单位，如10MB）、modified_after/modified_before（时间戳或日期）、
+    sort（name/size/mtime/path）、order（asc/desc）、cursor（上一页返回的 next_cursor）、limit
+    """
+    try:
+        under = request.args.get('path', '').strip().strip('/')
+        if under:
+            under_path = resolve_dir_path(under)
+            if under_path is None:
+                return jsonify({'error': '访问路径不安全'}), 403
+            under = os.path.relpath(under_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+            if under == '.':
+                under = ''
+        
+        sort = request.args.get('sort', 'mtime')
+        if sort not in SEARCH_SORT_FIELDS:
+            return jsonify({'error': f'不支持的排序字段: {sort}'}), 400
+        order = request.args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': f'不支持的排序方向: {order}'}), 400
+        try:
+            limit = max(1, min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), LIST_MAX_PAGE_SIZE))
+            min_size = parse_size_param(request.args.get('min_size'))
+            max_size = parse_size_param(request.args.get('max_size'))
+            modified_after = parse_time_param(request.args.get('modified_after'))
+            modified_before = parse_time_param(request.args.get('modified_before'))
+        except ValueError as e:
+            return jsonify({'error': f'无效的查询参数: {str(e)}'}), 400
+        
+        query = request.args.get('q', '').strip()
+        glob = request.args.get('glob', '').strip()
+        file_type = request.args.get('type', '').strip()
+        if not (query or glob or file_type or min_size is not None or max_size is not None
+                or modified_after is not None or modified_before is not None):
+            return jsonify({'error': '请输入搜索条件'}), 400
+        
+        result = search_files(query=query,
+                              glob=glob,
+                              under=under,
+                              file_type=file_type,
+                              min_size=min_size,
+                              max_size=max_size,
+                              modified_after=modified_after,
+                              modified_before=modified_before,
+                              sort=sort,
+                              order=order,
+                              cursor=request.args.get('cursor') or None,
+                              limit=limit)
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except Exception as e:
+        return jsonify({'error': f'搜索失败: {str(e)}'}), 500
+
+
+JOB_ACTIONS = ('delete', 'move', 'copy')
+
+
+@bp.route('/api/jobs', methods=['POST'])
+@login_required
+def create_job():
+    """
+    创建后台任务（递归删除、移动、复制，支持多选），立即返回任务信息
+    
+    请求参数（JSON）：
+    - action：delete / move / copy（启用回收站时 delete 直接移入回收站，返回回收站条目）
+    - paths：要操作的相对路径列表
+    - destination：移动或复制的目标文件夹（相对路径，空字符串表示根目录）
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action not in JOB_ACTIONS:
+            return jsonify({'success': False, 'error': f'不支持的操作: {action}'}), 400
+        
+        paths = resolve_job_paths(data.get('paths'))
+        rel_paths = [os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+                     for path in paths]
+        
+        if action == 'delete':
+            entries = []
+            if server.trash is not None:
+                # 移入回收站只是rename，直接在请求中完成
+                entries, paths = move_to_trash(paths)
+                if not paths:
+                    return jsonify({'success': True, 'entries': entries}), 200
+                rel_paths = [os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+                             for path in paths]
+            job = server.submit_job('delete', {'paths': rel_paths}, run_delete_job, paths)
+            return jsonify({'success': True, 'entries': entries, 'job': job}), 202
+        
+        job = submit_transfer_job(action, paths, rel_paths, data.get('destination'))
+        return jsonify({'success': True, 'job': job}), 202
+    except JobError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'创建任务失败: {str(e)}'}), 500
+
+
+@bp.route('/api/copy', methods=['POST'])
+@bp.route('/api/move', methods=['POST'])
+@login_required
+def copy_or_move():
+    """
+    在上传目录内复制或移动文件/文件夹（服务端完成，不经过浏览器）
+    
+    请求参数（JSON）：
+    - paths：要复制或移动的相对路径列表（也可以用 path 指定单个路径）
+    - destination：目标文件夹（相对路径，空字符串表示根目录）
+    
+    移动使用rename；复制优先使用reflink克隆或copy_file_range，数据不经过Python。
+    返回后台任务信息（HTTP 202），通过 /api/jobs/<job_id> 查询结果。
+    """
+    action = 'move' if request.path.endswith('/move') else 'copy'
+    label = '移动' if action == 'move' else '复制'
+    try:
+        data = request.get_json(silent=True) or {}
+        rel_paths = data.get('paths')
+        if rel_paths is None and data.get('path'):
+            rel_paths = [data['path']]
+        paths = resolve_job_paths(rel_paths)
+        rel_paths = [os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+                     for path in paths]
+        job = submit_transfer_job(action, paths, rel_paths, data.get('destination'))
+        return jsonify({'success': True, 'job': job}), 202
+    except JobError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'{label}失败: {str(e)}'}), 500
+
+
+@bp.route('/api/jobs', methods=['GET'])
+@login_required
+def list_jobs():
+    """列出当前用户的后台任务（管理员可以看到所有任务）"""
+    try:
+        jobs = server.jobs.list(session['user_id'], AuthManager.is_admin(),
+                                min(max(request.args.get('limit', 50, type=int), 1), 500))
+        return jsonify({'success': True, 'jobs': jobs})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'获取任务列表失败: {str(e)}'}), 500
+
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """查询后台任务的状态和进度"""
+    try:
+        return jsonify({'success': True, 'job': server.jobs.get(job_id, session['user_id'], AuthManager.is_admin())})
+    except JobError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'查询任务失败: {str(e)}'}), 500
+
+
+@bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    """取消后台任务（已处理的条目不会恢复）"""
+    try:
+        job = server.jobs.cancel(job_id, session['user_id'], AuthManager.is_admin())
+        return jsonify({'success': True, 'job': job}), 202
+    except JobError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'取消任务失败: {str(e)}'}), 500
+
+
+@bp.route('/api/trash', methods=['GET'])
+@login_required
+def list_trash():
+    """列出回收站中当前用户删除的条目（管理员可以看到所有条目）"""
+    if server.trash is None:
+        return jsonify({'success': False, 'error': '未启用回收站'}), 404
+    try:
+        return jsonify({'success': True, 'entries': server.trash.list(session['user_id'], AuthManager.is_admin())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'获取回收站失败: {str(e)}'}), 500
+
+
+@bp.route('/api/trash/<entry_id>/restore', methods=['POST'])
+@login_required
+def restore_trash(entry_id):
+    """把回收站中的条目恢复到原位置（原位置已被占用时自动改名）"""
+    if server.trash is None:
+        return jsonify({'success': False, 'error': '未启用回收站'}), 404
+    try:
+        entry = server.trash.get(entry_id, session['user_id'], AuthManager.is_admin())
+        data_path = server.trash.data_path(entry_id)
+        if server.quota is not None:
+            # 恢复会重新计入删除者和原文件夹的用量
+            server.quota.check_move(upload_rel_path(data_path), posixpath.dirname(entry['path']), entry['user_id'])
+        path = server.trash.restore(entry_id, session['user_id'], AuthManager.is_admin())
+        index_add(path)
+        quota_move(data_path, path, entry['size'])
+        server.stats_stream.invalidate()
+        return jsonify({
+            'success': True,
+            'message': '已恢复',
+            'path': os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        })
+    except TrashError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status_code
+    except QuotaExceeded as e:
+        return jsonify({'success': False, 'error': e.message, 'details': e.details}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'恢复失败: {str(e)}'}), 500
+
+
+@bp.route('/api/trash/<entry_id>', methods=['DELETE'])
+@login_required
+def purge_trash(entry_id):
+    """彻底删除回收站中的条目（磁盘空间由后台限速回收）"""
+    if server.trash is None:
+        return jsonify({'success': False, 'error': '未启用回收站'}), 404
+    try:
+        server.trash.purge(entry_id, session['user_id'], AuthManager.is_admin())
+        return jsonify({'success': True, 'message': '已彻底删除'})
+    except TrashError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'彻底删除失败: {str(e)}'}), 500
+
+
+@bp.route('/api/stats')
 @login_required
 def api_stats():
     """API接口：获取系统统计信息"""
     try:
-        disk_usage = FileUtils.get_disk_usage(app.config['UPLOAD_FOLDER'])
-        file_stats = FileUtils.get_file_stats(app.config['UPLOAD_FOLDER'])
+        disk_usage = FileUtils.get_disk_usage(current_app.config['UPLOAD_FOLDER'])
+        file_stats = cached_stats('file_stats', get_file_stats)
         
         return jsonify({
             'disk_usage': disk_usage,
             'file_stats': file_stats,
             'server_info': {
-                'address': server_address,
-                'upload_folder': app.config['UPLOAD_FOLDER'],
-                'max_file_size': app.config['MAX_CONTENT_LENGTH']
+                'address': server.address,
+                'upload_folder': current_app.config['UPLOAD_FOLDER'],
+                'max_file_size': current_app.config['MAX_CONTENT_LENGTH']
             }
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/file_type_stats')
+@bp.route('/api/quota')
+@login_required
+def api_quota():
+    """API接口：获取存储配额用量（管理员可以看到所有用户，其他用户只能看到自己）"""
+    if server.quota is None:
+        return jsonify({'success': True, 'enabled': False})
+    try:
+        return jsonify({
+            'success': True,
+            'enabled': True,
+            'quota': server.quota.get_usage(session['user_id'], AuthManager.is_admin())
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'获取配额用量失败: {str(e)}'}), 500
+
+@bp.route('/api/bandwidth')
+@login_required
+def api_bandwidth():
+    """API接口：获取各用户当前的上传和下载速率（所有工作进程合计；管理员可以看到所有用户，其他用户只能看到自己）"""
+    if server.bandwidth is None:
+        return jsonify({'success': True, 'enabled': False})
+    try:
+        user_id = None if AuthManager.is_admin() else session['user_id']
+        users = {}
+        for name, rates in server.bandwidth.get_throughput(user_id).items():
+            users[name] = {
+                'upload': rates['upload'],
+                'download': rates['download'],
+                'upload_formatted': f"{FileUtils.format_size(rates['upload'])}/s",
+                'download_formatted': f"{FileUtils.format_size(rates['download'])}/s"
+            }
+        return jsonify({'success': True, 'enabled': True, 'users': users})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'获取传输速率失败: {str(e)}'}), 500
+
+@bp.route('/api/stats/stream')
+@login_required
+def api_stats_stream():
+    """
+    SSE接口：推送统计信息
+    
+    首个事件为完整统计，之后只推送发生变化的部分；统计由后台生产者统一计算，
+    与打开的页面数量无关。
+    """
+    try:
+        subscription = server.stats_stream.subscribe()
+    except StatsStreamFull:
+        response = jsonify({'error': '统计推送连接数已达上限，请稍后重试'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    return Response(subscription,
+                    content_type='text/event-stream; charset=utf-8',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/file_type_stats')
 @login_required
 def api_file_type_stats():
     """获取文件类型统计信息"""
     try:
-        stats = FileUtils.get_file_type_stats(app.config['UPLOAD_FOLDER'])
+        stats = cached_stats('file_type_stats', get_file_type_stats)
         return jsonify({
             'success': True,
             'data': stats
@@ -469,12 +1947,12 @@ def api_file_type_stats():
             'error': str(e)
         }), 500
 
-@app.route('/api/folder_size_stats')
+@bp.route('/api/folder_size_stats')
 @login_required
 def api_folder_size_stats():
     """获取文件夹大小统计信息"""
     try:
-        stats = FileUtils.get_folder_size_stats(app.config['UPLOAD_FOLDER'])
+        stats = cached_stats('folder_size_stats', get_folder_size_stats)
         return jsonify({
             'success': True,
             'data': stats
@@ -486,7 +1964,80 @@ def api_folder_size_stats():
         }), 500
 
 
-@app.route('/api/preview', methods=['POST'])
+@bp.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus 指标（文本格式）
+    
+    配置了 metrics.token 时使用 Authorization: Bearer <token> 访问（供Prometheus抓取），
+    否则需要登录。
+    """
+    if not server.metrics_config.get('enabled', True):
+        return jsonify({'error': '未启用运行指标'}), 404
+    
+    token = server.metrics_config.get('token', '')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode('latin-1'),
+                                   f'Bearer {token}'.encode('utf-8')):
+            return jsonify({'error': '访问令牌无效'}), 401
+    elif 'user_id' not in session:
+        return jsonify({'error': '请先登录'}), 401
+    
+    try:
+        return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        return jsonify({'error': f'获取运行指标失败: {str(e)}'}), 500
+
+
+@bp.route('/api/sign', methods=['POST'])
+@login_required
+def api_sign():
+    """
+    POST接口：生成文件的签名下载链接
+    
+    请求参数（JSON）：
+    - filepath：文件相对路径
+    - expires_in：有效期（秒），默认为 signed_urls.default_ttl
+    - ip：可选，限制访问的IP地址或CIDR网段
+    - range：可选，限制可下载的字节区间，如 0-1048575
+    - as_attachment：是否作为附件下载，默认true
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filepath = str(data.get('filepath') or '').strip()
+        if not filepath:
+            return jsonify({'success': False, 'error': '文件路径不能为空'}), 400
+        
+        resolved = resolve_file_path(filepath)
+        if resolved is None:
+            return jsonify({'success': False, 'error': '访问路径不安全'}), 403
+        file_path, rel_path = resolved
+        if not server.storage.exists(file_path):
+            return jsonify({'success': False, 'error': '文件不存在'}), 404
+        if server.storage.isdir(file_path):
+            return jsonify({'success': False, 'error': '路径指向文件夹，请选择具体文件'}), 400
+        
+        try:
+            ttl = int(data.get('expires_in') or server.signed_urls_config.get('default_ttl', 3600))
+            url, expires = make_signed_url(rel_path, ttl,
+                                           ip=str(data.get('ip') or ''),
+                                           range_scope=str(data.get('range') or ''),
+                                           as_attachment=data.get('as_attachment', True) is not False,
+                                           external=True)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'url': url,
+            'filepath': rel_path,
+            'expires_at': expires
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'生成签名链接失败: {str(e)}'}), 500
+
+
+@bp.route('/api/preview', methods=['POST'])
 @login_required
 def api_preview():
     """POST接口：获取文件预览地址"""
@@ -505,33 +2056,32 @@ def api_preview():
                 'error': '文件路径不能为空'
             }), 400
         
-        # 构建完整路径
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filepath)
-        file_path = os.path.normpath(file_path)
-        
-        # 安全检查
-        if not FileUtils.is_safe_path(app.config['UPLOAD_FOLDER'], file_path):
+        # 构建完整路径并做安全检查
+        resolved = resolve_file_path(filepath)
+        if resolved is None:
             return jsonify({
                 'success': False,
                 'error': '访问路径不安全'
             }), 403
+        file_path = resolved[0]
         
-        if not os.path.exists(file_path):
+        if not server.storage.exists(file_path):
             return jsonify({
                 'success': False,
                 'error': '文件不存在'
             }), 404
         
         # 检查是否为文件夹
-        if os.path.isdir(file_path):
+        if server.storage.isdir(file_path):
             return jsonify({
                 'success': False,
                 'error': '路径指向文件夹，请选择具体文件'
             }), 400
         
-        # 生成安全的预览URL（使用临时token或会话验证）
-        # 这里直接返回文件路径，前端可以构建预览URL
-        preview_url = f"/download/{filepath}?as_attachment=false"
+        # 预览地址使用签名链接，在新窗口打开时不依赖会话
+        rel_path = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        preview_url, _ = make_signed_url(rel_path, server.signed_urls_config.get('default_ttl', 3600),
+                                         as_attachment=False)
         
         return jsonify({
             'success': True,
@@ -547,10 +2097,13 @@ def api_preview():
 
 
 if __name__ == '__main__':
-    debug = server_config.get('debug', False)
+    # 开发服务器；生产环境请使用 server.py 启动多进程服务
+    app = create_app()
+    fileserver = app.extensions['fileserver']
+    debug = fileserver.server_config.get('debug', False)
     
     print(f"=== 文件服务器启动信息 ===")
-    print(f"服务器地址: {server_address}")
+    print(f"服务器地址: {fileserver.address}")
     print(f"上传目录: {app.config['UPLOAD_FOLDER']}")
     print(f"最大文件大小: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024)} MB")
     print(f"调试模式: {debug}")
@@ -561,6 +2114,6 @@ if __name__ == '__main__':
     print("========================")
     
     # 显示二维码
-    QRCodeUtils.generate_qrcode(server_address)
+    QRCodeUtils.generate_qrcode(fileserver.address)
     
-    app.run(host=server_host, port=server_port, debug=debug)
+    app.run(host=fileserver.host, port=fileserver.port, debug=debug, request_handler=SendfileRequestHandler)
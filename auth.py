@@ -12,7 +12,7 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('请先登录', 'warning')
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('main.login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -23,12 +23,12 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('请先登录', 'warning')
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('main.login', next=request.url))
         
         # 检查是否为管理员（这里简单实现，可根据需要扩展）
         if session.get('user_id') != 'admin':
             flash('需要管理员权限', 'error')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         
         return f(*args, **kwargs)
     return decorated_function
@@ -0,0 +1,389 @@
+"""
+带宽限速与公平分配
+
+上传和下载在发送或接收每个数据块（最多 QUANTUM 字节）之前向限速器申请额度：
+- 每个用户一个令牌桶（按 session 中的 user_id 区分），限制单个用户的速率
+- 全局令牌桶按加权公平排队（self-clocked fair queueing）分配：每个用户的申请带有虚拟完成时间
+  （上一次的完成时间 + 字节数 / 权重），额度按虚拟完成时间从小到大发放。空闲用户不占用额度，
+  其余用户按权重平分全部带宽；同一用户的多个传输轮流获得该用户的份额，多开连接不会多占带宽
+- 数据块很小，等待时间以毫秒计，客户端看到的是平滑的速率而不是一段一段的停顿；
+  等待期间不读取请求体或不写入socket，由TCP窗口把背压传递给对端
+
+多个工作进程通过 state_dir 下的状态文件（每个进程一个，定期写入）协调：每个进程按本进程活跃传输
+所占的比例分得全局和各用户的速率，并据此汇总各用户当前的吞吐量。
+"""
+import os
+import json
+import time
+import heapq
+import uuid
+import itertools
+import threading
+from typing import Dict, Any, List, Optional
+
+# 每次申请额度的最大字节数
+QUANTUM = 64 * 1024
+
+# 不限速时（只统计吞吐量）每次申请的最大字节数
+UNLIMITED_CHUNK = 8 * 1024 * 1024
+
+# 令牌桶容量：限速的 BURST_SECONDS 秒（至少一个数据块）
+BURST_SECONDS = 0.1
+
+# 传输在最近 ACTIVE_WINDOW 秒内申请过额度才算活跃
+ACTIVE_WINDOW = 1.0
+
+DIRECTIONS = ('upload', 'download')
+
+# 请求的限速句柄在environ中的键
+TRANSFER_ENVIRON_KEY = 'fileserver.bandwidth'
+
+
+class _TokenBucket:
+    """预约式令牌桶：额度可以透支，申请者按透支的量等待，不需要轮询"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(QUANTUM, self.rate * BURST_SECONDS)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def set_rate(self, rate: float):
+        self._refill(time.monotonic())
+        self.rate = rate
+
+    def delay(self, size: int) -> float:
+        """获得 size 字节额度还需要等待的秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        return 0.0 if self.tokens >= size else (size - self.tokens) / self.rate
+
+    def take(self, size: int) -> float:
+        """预约 size 字节（可以透支），返回需要等待的秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= size
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Request:
+    """全局排队中的一次申请"""
+
+    __slots__ = ('tag', 'seq', 'size', 'cond')
+
+    def __init__(self, tag: float, seq: int, size: int, cond: threading.Condition):
+        self.tag = tag
+        self.seq = seq
+        self.size = size
+        self.cond = cond
+
+    def __lt__(self, other: '_Request') -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+
+class _Channel:
+    """一个方向（上传或下载）的限速状态"""
+
+    def __init__(self, rate: int, user_rate: int):
+        self.rate = rate
+        self.user_rate = user_rate
+        self.limited = rate > 0 or user_rate > 0
+        self.lock = threading.Lock()
+        self.bucket = _TokenBucket(rate) if rate > 0 else None
+        self.user_buckets: Dict[str, _TokenBucket] = {}
+        self.user_shares: Dict[str, float] = {}
+        # 加权公平排队：虚拟时间、各用户的虚拟完成时间、按虚拟完成时间排序的申请
+        self.vtime = 0.0
+        self.finish: Dict[str, float] = {}
+        self.queue: List[_Request] = []
+        self.seq = itertools.count()
+        self.transfers: Dict[int, 'Transfer'] = {}
+        self.bytes: Dict[str, int] = {}
+
+    def user_bucket(self, user_id: str) -> Optional[_TokenBucket]:
+        if self.user_rate <= 0:
+            return None
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = self.user_buckets[user_id] = _TokenBucket(self.user_rate * self.user_shares.get(user_id, 1.0))
+        return bucket
+
+    def acquire_shared(self, user_id: str, weight: float, size: int):
+        """按加权公平排队从全局令牌桶获得额度"""
+        with self.lock:
+            tag = max(self.vtime, self.finish.get(user_id, 0.0)) + size / weight
+            self.finish[user_id] = tag
+            request = _Request(tag, next(self.seq), size, threading.Condition(self.lock))
+            heapq.heappush(self.queue, request)
+            try:
+                while True:
+                    if self.queue[0] is not request:
+                        # 前面还有虚拟完成时间更早的申请，轮到时由它唤醒
+                        request.cond.wait()
+                        continue
+                    delay = self.bucket.delay(size)
+                    if delay <= 0:
+                        self.bucket.take(size)
+                        self.vtime = tag
+                        return
+                    request.cond.wait(delay)
+            finally:
+                self.queue.remove(request)
+                heapq.heapify(self.queue)
+                if self.queue:
+                    self.queue[0].cond.notify()
+
+
+class Transfer:
+    """一次上传或下载：发送或接收每个数据块之前调用 consume()"""
+
+    def __init__(self, limiter: 'BandwidthLimiter', channel: _Channel, user_id: str):
+        self.limiter = limiter
+        self.channel = channel
+        self.user_id = user_id
+        self.weight = limiter.weight(user_id)
+        self.last_active = time.monotonic()
+
+    @property
+    def chunk_size(self) -> int:
+        """调用方每次发送或接收的最大字节数"""
+        return QUANTUM if self.channel.limited else UNLIMITED_CHUNK
+
+    def consume(self, size: int):
+        """获得 size 字节的额度（按 chunk_size 分块申请，必要时等待）"""
+        channel = self.channel
+        step = self.chunk_size
+        while size > 0:
+            chunk = min(size, step)
+            size -= chunk
+            with channel.lock:
+                self.last_active = time.monotonic()
+                channel.transfers[id(self)] = self
+                channel.bytes[self.user_id] = channel.bytes.get(self.user_id, 0) + chunk
+                bucket = channel.user_bucket(self.user_id)
+                delay = bucket.take(chunk) if bucket is not None else 0.0
+            if delay > 0:
+                time.sleep(delay)
+            if channel.bucket is not None:
+                channel.acquire_shared(self.user_id, self.weight, chunk)
+
+
+class ThrottledInput:
+    """按限速读取的 wsgi.input 包装：每次最多读取一个数据块，读取后申请额度"""
+
+    def __init__(self, stream, transfer: Transfer):
+        self.stream = stream
+        self.transfer = transfer
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.transfer.chunk_size:
+            size = self.transfer.chunk_size
+        data = self.stream.read(size)
+        self.transfer.consume(len(data))
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.transfer.chunk_size:
+            size = self.transfer.chunk_size
+        data = self.stream.readline(size)
+        self.transfer.consume(len(data))
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+def throttle_iterable(iterable, transfer: Transfer):
+    """按限速输出的响应体：每个数据块发送前申请额度"""
+    try:
+        step = transfer.chunk_size
+        for data in iterable:
+            if len(data) <= step:
+                transfer.consume(len(data))
+                yield data
+                continue
+            for start in range(0, len(data), step):
+                chunk = data[start:start + step]
+                transfer.consume(len(chunk))
+                yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+class BandwidthLimiter:
+    """上传和下载的带宽限速器"""
+
+    def __init__(self, state_dir: str, rates: Dict[str, int], user_rates: Dict[str, int],
+                 weights: Optional[Dict[str, float]] = None, publish_interval: float = 1.0):
+        """
+        Args:
+            state_dir (str): 多进程共享的状态目录
+            rates: 方向（upload/download） -> 全局限速（字节/秒），0表示不限制
+            user_rates: 方向 -> 每个用户的限速（字节/秒），0表示不限制
+            weights: 用户名 -> 公平分配的权重（默认为1）
+            publish_interval (float): 写入本进程状态、重新计算各进程份额的间隔（秒）
+        """
+        self.state_dir = state_dir
+        self.weights = weights or {}
+        self.publish_interval = max(0.1, publish_interval)
+        self.channels = {direction: _Channel(rates.get(direction, 0), user_rates.get(direction, 0))
+                         for direction in DIRECTIONS}
+        self._last_bytes: Dict[str, Dict[str, int]] = {direction: {} for direction in DIRECTIONS}
+        self._last_publish = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = os.getpid()
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def weight(self, user_id: str) -> float:
+        weight = self.weights.get(user_id, 1)
+        return weight if weight > 0 else 1
+
+    def transfer(self, user_id: str, direction: str) -> Transfer:
+        """为一次上传或下载创建限速句柄"""
+        return Transfer(self, self.channels[direction], user_id)
+
+    # ------------------------------------------------------------------
+    # 多进程协调
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动后台线程：定期写入本进程状态并按各进程的活跃传输重新分配速率"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='bandwidth', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            os.remove(self._state_path(self._pid))
+        except OSError:
+            pass
+
+    def _state_path(self, pid: int) -> str:
+        return os.path.join(self.state_dir, f'{pid}.json')
+
+    def _run(self):
+        while not self._stop.wait(self.publish_interval):
+            try:
+                self._publish()
+            except Exception as e:
+                print(f"更新带宽状态失败: {e}")
+
+    def _active(self, channel: _Channel) -> Dict[str, int]:
+        """各用户在本进程中的活跃传输数（同时清理不再活跃的传输）"""
+        deadline = time.monotonic() - ACTIVE_WINDOW
+        active: Dict[str, int] = {}
+        with channel.lock:
+            for key, transfer in list(channel.transfers.items()):
+                if transfer.last_active < deadline:
+                    del channel.transfers[key]
+                else:
+                    active[transfer.user_id] = active.get(transfer.user_id, 0) + 1
+            # 不再活跃的用户的令牌桶和虚拟完成时间不再需要
+            for user_id in list(channel.user_buckets):
+                if user_id not in active:
+                    del channel.user_buckets[user_id]
+            if not channel.queue:
+                channel.finish = {user_id: tag for user_id, tag in channel.finish.items() if user_id in active}
+        return active
+
+    def _publish(self):
+        now = time.monotonic()
+        elapsed = max(now - self._last_publish, 1e-3)
+        self._last_publish = now
+        state = {'pid': self._pid, 'time': time.time(), 'active': {}, 'throughput': {}}
+        for direction, channel in self.channels.items():
+            with channel.lock:
+                totals = dict(channel.bytes)
+            last = self._last_bytes[direction]
+            self._last_bytes[direction] = totals
+            state['active'][direction] = self._active(channel)
+            state['throughput'][direction] = {user_id: (total - last.get(user_id, 0)) / elapsed
+                                              for user_id, total in totals.items() if total != last.get(user_id, 0)}
+
+        path = self._state_path(self._pid)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+        others = [other for other in self._read_states() if other['pid'] != self._pid]
+        for direction, channel in self.channels.items():
+            self._rebalance(channel, state['active'][direction],
+                            [other.get('active', {}).get(direction, {}) for other in others])
+
+    def _rebalance(self, channel: _Channel, local: Dict[str, int], remote: List[Dict[str, int]]):
+        """
+        按活跃传输数分配本进程的速率：每个用户的限速按该用户在各进程中的传输数比例分配，
+        全局限速按各进程活跃用户的权重（同一用户按传输数比例拆分）分配
+        """
+        totals = dict(local)
+        for active in remote:
+            for user_id, count in active.items():
+                totals[user_id] = totals.get(user_id, 0) + count
+        total_weight = sum(self.weight(user_id) for user_id in totals)
+        local_weight = sum(self.weight(user_id) * count / totals[user_id] for user_id, count in local.items())
+        # 用户刚在本进程开始传输时按一个传输计算，份额不会为0
+        shares = {user_id: max(local.get(user_id, 0), 1) / max(count, local.get(user_id, 0), 1)
+                  for user_id, count in totals.items()}
+        with channel.lock:
+            channel.user_shares = shares
+            for user_id, bucket in channel.user_buckets.items():
+                bucket.set_rate(channel.user_rate * shares.get(user_id, 1.0))
+            if channel.bucket is not None:
+                if not local:
+                    # 本进程空闲：按即将有一个权重为1的传输计算，避免新传输起步过慢
+                    share = 1 / (total_weight + 1)
+                else:
+                    share = local_weight / total_weight if total_weight else 1.0
+                channel.bucket.set_rate(channel.rate * share)
+
+    def _read_states(self) -> List[Dict[str, Any]]:
+        """读取所有进程的状态（忽略已经过期的，即进程已退出）"""
+        deadline = time.time() - self.publish_interval * 3
+        states = []
+        try:
+            names = os.listdir(self.state_dir)
+        except OSError:
+            return states
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if state.get('time', 0) >= deadline:
+                states.append(state)
+        return states
+
+    def get_throughput(self, user_id: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        所有进程合计的各用户当前吞吐量（字节/秒）
+
+        Args:
+            user_id (str): 只返回该用户（None表示所有用户）
+
+        Returns:
+            Dict[str, Dict[str, float]]: 用户名 -> {'upload': ..., 'download': ...}
+        """
+        result: Dict[str, Dict[str, float]] = {}
+        for state in self._read_states():
+            for direction, users in state.get('throughput', {}).items():
+                for name, rate in users.items():
+                    if user_id is None or name == user_id:
+                        result.setdefault(name, {d: 0.0 for d in DIRECTIONS})[direction] += rate
+        return result
@@ -0,0 +1,11 @@
+"""
+性能测试工具包
+
+在项目根目录下通过 `python -m benchmarks <子命令>` 运行：
+- tree：生成合成的上传目录树（文件数、深度、大小分布、扩展名比例可配置，支持百万级文件）
+- load：对运行中的服务器发起并发请求（上传、下载、文件列表和各统计接口）
+- micro：FileUtils 中目录列表、统计和路径检查的微基准
+- compare：对比两次运行的结果
+
+所有子命令都输出JSON结果（延迟p50/p95/p99、吞吐量、峰值内存），便于保存并对比不同版本。
+"""
@@ -0,0 +1,130 @@
+"""
+性能测试命令行入口
+
+Example:
+    python -m benchmarks tree /tmp/bench-tree --files 1000000 --depth 4 --fanout 8
+    python -m benchmarks micro /tmp/bench-tree --iterations 200 -o micro.json
+    python -m benchmarks load --url http://127.0.0.1:9000 --scenario all --concurrency 32 --duration 30 -o load.json
+    python -m benchmarks compare baseline.json load.json
+"""
+import os
+import sys
+import argparse
+
+# 以 `python -m benchmarks` 运行时保证能导入项目根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.results import make_report, write_report
+from benchmarks.tree import generate_tree, parse_size, DEFAULT_EXTENSION_MIX
+
+
+def cmd_tree(args):
+    result = generate_tree(args.root,
+                           files=args.files,
+                           depth=args.depth,
+                           fanout=args.fanout,
+                           size_distribution=args.sizes,
+                           extension_mix=args.extensions,
+                           fill=args.fill,
+                           seed=args.seed)
+    parameters = {key: getattr(args, key) for key in ('files', 'depth', 'fanout', 'sizes', 'extensions', 'fill', 'seed')}
+    write_report(make_report('tree', parameters, result), args.output)
+
+
+def cmd_micro(args):
+    from benchmarks.micro import run_microbenchmarks, MICROBENCHMARKS
+
+    names = MICROBENCHMARKS if 'all' in args.bench else args.bench
+    result = run_microbenchmarks(args.root, names, iterations=args.iterations, seed=args.seed)
+    parameters = {'root': os.path.abspath(args.root), 'bench': names, 'iterations': args.iterations, 'seed': args.seed}
+    write_report(make_report('micro', parameters, result), args.output)
+
+
+def cmd_load(args):
+    from benchmarks.load import LoadDriver, SCENARIOS
+
+    scenarios = SCENARIOS if 'all' in args.scenario else args.scenario
+    driver = LoadDriver(args.url, args.username, args.password,
+                        concurrency=args.concurrency,
+                        duration=args.duration,
+                        requests=args.requests,
+                        upload_size=parse_size(args.upload_size),
+                        upload_dir=args.upload_dir,
+                        max_targets=args.max_targets,
+                        server_pid=args.server_pid,
+                        seed=args.seed)
+    result = driver.run(scenarios)
+    parameters = {key: getattr(args, key) for key in ('url', 'concurrency', 'duration', 'requests', 'upload_size', 'seed')}
+    parameters['scenarios'] = scenarios
+    write_report(make_report('load', parameters, result), args.output)
+
+
+def cmd_compare(args):
+    from benchmarks.compare import load_report, compare_reports, format_comparison
+
+    comparison = compare_reports(load_report(args.baseline), load_report(args.current))
+    if args.output:
+        write_report(comparison, args.output)
+    for line in format_comparison(comparison):
+        print(line)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='文件服务器性能测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    tree = subparsers.add_parser('tree', help='生成合成目录树')
+    tree.add_argument('root', help='目标目录')
+    tree.add_argument('--files', type=int, default=10000, help='文件总数（默认10000）')
+    tree.add_argument('--depth', type=int, default=3, help='目录深度（默认3）')
+    tree.add_argument('--fanout', type=int, default=5, help='每个目录的子目录数（默认5）')
+    tree.add_argument('--sizes', default='lognormal:64KB,2.0',
+                      help='大小分布：fixed:4KB / uniform:1KB-10MB / lognormal:64KB,2.0')
+    tree.add_argument('--extensions', default=DEFAULT_EXTENSION_MIX, help='扩展名比例，如 .jpg:30,.pdf:10')
+    tree.add_argument('--fill', action='store_true', help='写入随机内容（默认创建稀疏文件）')
+    tree.add_argument('--seed', type=int, default=0)
+    tree.add_argument('-o', '--output', help='结果输出文件（默认打印）')
+    tree.set_defaults(func=cmd_tree)
+
+    micro = subparsers.add_parser('micro', help='FileUtils 微基准')
+    micro.add_argument('root', help='测试用目录树')
+    micro.add_argument('--bench', nargs='+', default=['all'],
+                       choices=['all', 'get_files_and_dirs', 'get_file_stats', 'is_safe_path'])
+    micro.add_argument('--iterations', type=int, default=100, help='每项调用次数（默认100）')
+    micro.add_argument('--seed', type=int, default=0)
+    micro.add_argument('-o', '--output')
+    micro.set_defaults(func=cmd_micro)
+
+    load = subparsers.add_parser('load', help='对运行中的服务器施加负载')
+    load.add_argument('--url', default='http://127.0.0.1:9000', help='服务器地址')
+    load.add_argument('--username', default='admin')
+    load.add_argument('--password', default='admin123')
+    load.add_argument('--scenario', nargs='+', default=['all'],
+                      choices=['all', 'upload', 'download', 'files', 'stats', 'file_type_stats', 'folder_size_stats'])
+    load.add_argument('--concurrency', type=int, default=8, help='并发数（默认8）')
+    load.add_argument('--duration', type=float, default=10.0, help='每个场景的持续时间（秒，默认10）')
+    load.add_argument('--requests', type=int, default=0, help='每个场景的请求总数，设置后忽略duration')
+    load.add_argument('--upload-size', default='1MB', help='上传场景的文件大小（默认1MB）')
+    load.add_argument('--upload-dir', default='bench-uploads', help='上传场景使用的目录，结束后删除')
+    load.add_argument('--max-targets', type=int, default=10000, help='下载和列表场景最多选取的路径数')
+    load.add_argument('--server-pid', type=int, help='服务器主进程PID，用于统计服务器峰值内存')
+    load.add_argument('--seed', type=int, default=0)
+    load.add_argument('-o', '--output')
+    load.set_defaults(func=cmd_load)
+
+    compare = subparsers.add_parser('compare', help='对比两次运行的结果')
+    compare.add_argument('baseline', help='基准结果文件')
+    compare.add_argument('current', help='当前结果文件')
+    compare.add_argument('-o', '--output', help='对比结果输出文件')
+    compare.set_defaults(func=cmd_compare)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+结果对比
+
+对比两次运行（同一子命令）的JSON结果，列出各项的p50/p95/p99延迟和吞吐量变化。
+"""
+import json
+from typing import Dict, Any, List
+
+METRICS = [('latency_ms', 'p50'), ('latency_ms', 'p95'), ('latency_ms', 'p99'), (None, 'throughput')]
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def flatten_results(results: Dict[str, Any], prefix: str = '') -> Dict[str, Dict[str, Any]]:
+    """展开嵌套的结果（如 get_file_stats.cold），只保留包含延迟统计的项"""
+    flat = {}
+    for name, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        key = f'{prefix}{name}'
+        if 'latency_ms' in value:
+            flat[key] = value
+        else:
+            flat.update(flatten_results(value, key + '.'))
+    return flat
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    对比两份结果
+
+    Returns:
+        Dict[str, Any]: 每一项每个指标的基准值、当前值和变化比例（当前/基准）
+    """
+    base_results = flatten_results(baseline.get('results', {}))
+    current_results = flatten_results(current.get('results', {}))
+    comparison = {}
+    for name in sorted(set(base_results) & set(current_results)):
+        entry = {}
+        for group, metric in METRICS:
+            base_value = (base_results[name].get(group) or {}).get(metric) if group else base_results[name].get(metric)
+            current_value = (current_results[name].get(group) or {}).get(metric) if group else current_results[name].get(metric)
+            if base_value is None or current_value is None:
+                continue
+            entry[metric] = {
+                'baseline': base_value,
+                'current': current_value,
+                'ratio': round(current_value / base_value, 4) if base_value else None
+            }
+        comparison[name] = entry
+    return {
+        'baseline': {'revision': baseline.get('revision'), 'timestamp': baseline.get('timestamp')},
+        'current': {'revision': current.get('revision'), 'timestamp': current.get('timestamp')},
+        'peak_rss': {'baseline': baseline.get('peak_rss'), 'current': current.get('peak_rss')},
+        'results': comparison,
+    }
+
+
+def format_comparison(comparison: Dict[str, Any]) -> List[str]:
+    """生成便于阅读的对比表格"""
+    lines = [f"{'项目':<32}{'指标':<12}{'基准':>14}{'当前':>14}{'变化':>10}"]
+    for name, metrics in comparison['results'].items():
+        for metric, values in metrics.items():
+            ratio = values['ratio']
+            change = f'{(ratio - 1) * 100:+.1f}%' if ratio is not None else '-'
+            lines.append(f"{name:<32}{metric:<12}{values['baseline']:>14}{values['current']:>14}{change:>10}")
+    return lines
+
@@ -0,0 +1,234 @@
+"""
+HTTP负载驱动
+
+对运行中的文件服务器按场景发起并发请求，每个并发使用独立的保持连接。
+支持的场景：
+- upload：POST /upload 上传指定大小的文件（写入单独的测试目录，结束后删除）
+- download：GET /download/<path>，文件从服务器上随机选取，完整读取响应体
+- files：GET /files/<path>，目录从服务器上随机选取（包括根目录）
+- stats / file_type_stats / folder_size_stats：对应的 /api 统计接口
+"""
+import os
+import json
+import time
+import random
+import threading
+import http.client
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, quote, urlencode
+
+from benchmarks.results import summarize_latencies, process_peak_rss
+
+SCENARIOS = ['upload', 'download', 'files', 'stats', 'file_type_stats', 'folder_size_stats']
+
+READ_SIZE = 256 * 1024
+
+
+class BenchmarkClient:
+    """带会话Cookie的HTTP客户端（每个并发一个实例）"""
+
+    def __init__(self, base_url: str, cookie: Optional[str] = None, timeout: float = 60):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.cookie = cookie
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method: str, path: str, body=None, headers: Optional[Dict[str, str]] = None):
+        """
+        发送请求并完整读取响应体
+
+        Returns:
+            Tuple[int, int, bytes]: 状态码、响应体字节数、响应体（较大的响应体不保留，返回空bytes）
+        """
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            set_cookie = response.getheader('Set-Cookie')
+            if set_cookie:
+                self.cookie = set_cookie.split(';', 1)[0]
+            received = 0
+            kept = []
+            while True:
+                data = response.read(READ_SIZE)
+                if not data:
+                    break
+                received += len(data)
+                if received <= READ_SIZE:
+                    kept.append(data)
+            if response.will_close:
+                self.close()
+            return response.status, received, b''.join(kept) if received <= READ_SIZE else b''
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def login(self, username: str, password: str):
+        status, _, _ = self.request('POST', '/login',
+                                    body=urlencode({'username': username, 'password': password}),
+                                    headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        if status != 302 or not self.cookie:
+            raise RuntimeError(f'登录失败（状态码 {status}）')
+
+    def get_json(self, path: str) -> Dict[str, Any]:
+        status, _, body = self.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f'请求 {path} 失败（状态码 {status}）')
+        return json.loads(body)
+
+
+def collect_paths(client: BenchmarkClient, item_type: str, limit: int) -> List[str]:
+    """通过搜索接口收集服务器上的文件或目录路径"""
+    paths = []
+    cursor = None
+    while len(paths) < limit:
+        params = {'type': item_type, 'sort': 'path', 'order': 'asc', 'limit': min(1000, limit - len(paths))}
+        if cursor:
+            params['cursor'] = cursor
+        data = client.get_json('/api/search?' + urlencode(params))['data']
+        paths.extend(item['relative_path'] for item in data['items'])
+        cursor = data.get('next_cursor')
+        if not cursor:
+            break
+    return paths
+
+
+def multipart_body(filename: str, content: bytes, current_path: str) -> Tuple[bytes, str]:
+    boundary = f'bench{random.getrandbits(64):016x}'
+    body = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="current_path"\r\n\r\n{current_path}\r\n'
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8') + content + \
+        f'\r\n--{boundary}--\r\n'.encode('ascii')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class LoadDriver:
+    """按场景运行并发负载"""
+
+    def __init__(self, base_url: str, username: str, password: str, concurrency: int = 8,
+                 duration: float = 10.0, requests: int = 0, upload_size: int = 1024 * 1024,
+                 upload_dir: str = 'bench-uploads', max_targets: int = 10000,
+                 server_pid: Optional[int] = None, seed: int = 0):
+        self.base_url = base_url
+        self.concurrency = max(1, concurrency)
+        self.duration = duration
+        self.requests = requests
+        self.upload_size = upload_size
+        self.upload_dir = upload_dir
+        self.max_targets = max_targets
+        self.server_pid = server_pid
+        self.rng = random.Random(seed)
+
+        admin = BenchmarkClient(base_url)
+        admin.login(username, password)
+        self.cookie = admin.cookie
+        self.admin = admin
+        self._files = None
+        self._dirs = None
+
+    def _targets(self, scenario: str) -> List[str]:
+        if scenario == 'download':
+            if self._files is None:
+                self._files = collect_paths(self.admin, 'file', self.max_targets)
+            if not self._files:
+                raise RuntimeError('服务器上没有可下载的文件')
+            return ['/download/' + quote(path) for path in self._files]
+        if scenario == 'files':
+            if self._dirs is None:
+                self._dirs = collect_paths(self.admin, 'dir', self.max_targets)
+            return ['/files'] + ['/files/' + quote(path) for path in self._dirs]
+        return ['/api/' + scenario]
+
+    def run_scenario(self, scenario: str) -> Dict[str, Any]:
+        """运行一个场景，返回延迟分布、吞吐量和状态码统计"""
+        if scenario not in SCENARIOS:
+            raise ValueError(f'不支持的场景: {scenario}')
+        if scenario == 'upload':
+            self.admin.request('POST', '/create_folder', body=json.dumps({'folder_name': self.upload_dir}),
+                               headers={'Content-Type': 'application/json'})
+            payload = os.urandom(self.upload_size)
+        else:
+            targets = self._targets(scenario)
+
+        lock = threading.Lock()
+        latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+        totals = {'errors': 0, 'bytes': 0, 'issued': 0}
+        deadline = time.perf_counter() + self.duration
+
+        def next_request() -> bool:
+            with lock:
+                if self.requests:
+                    if totals['issued'] >= self.requests:
+                        return False
+                elif time.perf_counter() >= deadline:
+                    return False
+                totals['issued'] += 1
+                return True
+
+        def worker(index: int):
+            client = BenchmarkClient(self.base_url, self.cookie)
+            rng = random.Random(self.rng.random())
+            sequence = 0
+            while next_request():
+                sequence += 1
+                if scenario == 'upload':
+                    body, content_type = multipart_body(f'bench_{index}_{sequence}.zip', payload, self.upload_dir)
+                    args = ('POST', '/upload', body, {'Content-Type': content_type})
+                    sent = len(payload)
+                else:
+                    args = ('GET', rng.choice(targets), None, None)
+                    sent = 0
+                started = time.perf_counter()
+                try:
+                    status, received, _ = client.request(*args)
+                except (OSError, http.client.HTTPException):
+                    with lock:
+                        totals['errors'] += 1
+                    continue
+                latency = time.perf_counter() - started
+                with lock:
+                    latencies.append(latency)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+                    totals['bytes'] += received + sent
+                    if status >= 400:
+                        totals['errors'] += 1
+            client.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if scenario == 'upload':
+            self.admin.request('DELETE', '/delete/' + quote(self.upload_dir))
+
+        result = summarize_latencies(latencies, elapsed, totals['errors'],
+                                     totals['bytes'] if scenario in ('upload', 'download') else 0)
+        result['status_codes'] = statuses
+        if self.server_pid:
+            result['server_peak_rss'] = process_peak_rss(self.server_pid)
+        return result
+
+    def run(self, scenarios: List[str]) -> Dict[str, Any]:
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = self.run_scenario(scenario)
+        self.admin.close()
+        return results
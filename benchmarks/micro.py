@@ -0,0 +1,94 @@
+"""
+FileUtils 微基准
+
+在本进程内直接调用，不经过HTTP：
+- get_files_and_dirs：随机选取目录列出内容
+- get_file_stats：冷启动（清空统计缓存）与缓存命中两种情况
+- is_safe_path：正常路径和各种越界路径混合
+"""
+import os
+import time
+import random
+from typing import List, Dict, Any, Callable
+
+from benchmarks.results import summarize_latencies
+from utils import FileUtils, stats_engine
+
+
+def sample_directories(root: str, limit: int, rng: random.Random) -> List[str]:
+    """收集目录树中的目录（最多limit个，随机抽样）"""
+    directories = []
+    for current, dirs, _ in os.walk(root):
+        dirs[:] = [d for d in dirs if not (current == root and d == FileUtils.INTERNAL_DIR)]
+        directories.append(current)
+    rng.shuffle(directories)
+    return directories[:limit]
+
+
+def time_calls(func: Callable[[], Any], iterations: int) -> Dict[str, Any]:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize_latencies(latencies, time.perf_counter() - started)
+
+
+def bench_get_files_and_dirs(root: str, iterations: int, rng: random.Random) -> Dict[str, Any]:
+    directories = sample_directories(root, 1000, rng)
+    picks = iter([rng.choice(directories) for _ in range(iterations)])
+    result = time_calls(lambda: FileUtils.get_files_and_dirs(next(picks), root), iterations)
+    result['directories_sampled'] = len(directories)
+    return result
+
+
+def bench_get_file_stats(root: str, iterations: int) -> Dict[str, Any]:
+    def cold():
+        stats_engine.clear()
+        FileUtils.get_file_stats(root)
+
+    cold_result = time_calls(cold, max(1, min(iterations, 5)))
+    # 预热后测量缓存命中的情况
+    FileUtils.get_file_stats(root)
+    warm_result = time_calls(lambda: FileUtils.get_file_stats(root), iterations)
+    return {'cold': cold_result, 'warm': warm_result}
+
+
+def bench_is_safe_path(root: str, iterations: int, rng: random.Random) -> Dict[str, Any]:
+    directories = sample_directories(root, 1000, rng)
+    candidates = []
+    for directory in directories:
+        candidates.append(os.path.join(directory, 'file.txt'))
+        candidates.append(os.path.join(directory, '..', '..', '..', 'etc', 'passwd'))
+    candidates += [os.path.join(root, '..'), '/etc/passwd', root + '_sibling', os.path.join(root, 'a/./b/../c')]
+    picks = iter([rng.choice(candidates) for _ in range(iterations)])
+    return time_calls(lambda: FileUtils.is_safe_path(root, next(picks)), iterations)
+
+
+MICROBENCHMARKS = ['get_files_and_dirs', 'get_file_stats', 'is_safe_path']
+
+
+def run_microbenchmarks(root: str, names: List[str], iterations: int = 100, seed: int = 0) -> Dict[str, Any]:
+    """
+    运行微基准
+
+    Args:
+        root (str): 测试用的目录树（通常由 tree 子命令生成）
+        names (List[str]): 要运行的微基准
+        iterations (int): 每项的调用次数（is_safe_path 自动放大100倍）
+        seed (int): 随机种子
+    """
+    rng = random.Random(seed)
+    root = os.path.abspath(root)
+    results = {}
+    for name in names:
+        if name == 'get_files_and_dirs':
+            results[name] = bench_get_files_and_dirs(root, iterations, rng)
+        elif name == 'get_file_stats':
+            results[name] = bench_get_file_stats(root, iterations)
+        elif name == 'is_safe_path':
+            results[name] = bench_is_safe_path(root, iterations * 100, rng)
+        else:
+            raise ValueError(f'不支持的微基准: {name}')
+    return results
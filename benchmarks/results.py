@@ -0,0 +1,142 @@
+"""
+结果汇总与输出
+"""
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from typing import List, Dict, Any, Optional
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """线性插值的百分位数，sorted_values 必须已排序"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize_latencies(latencies: List[float], elapsed: float, errors: int = 0,
+                        bytes_transferred: int = 0) -> Dict[str, Any]:
+    """
+    汇总一组请求（或调用）的耗时
+
+    Args:
+        latencies (List[float]): 每次的耗时（秒）
+        elapsed (float): 整体耗时（秒），用于计算吞吐量
+        errors (int): 失败次数
+        bytes_transferred (int): 传输的字节数，非0时额外输出字节吞吐量
+
+    Returns:
+        Dict[str, Any]: 次数、吞吐量以及毫秒为单位的延迟分布
+    """
+    values = sorted(latencies)
+    result = {
+        'count': len(values),
+        'errors': errors,
+        'elapsed': round(elapsed, 4),
+        'throughput': round(len(values) / elapsed, 2) if elapsed > 0 else 0,
+        'latency_ms': {
+            'min': round(values[0] * 1000, 4) if values else 0,
+            'mean': round(sum(values) / len(values) * 1000, 4) if values else 0,
+            'p50': round(percentile(values, 50) * 1000, 4),
+            'p95': round(percentile(values, 95) * 1000, 4),
+            'p99': round(percentile(values, 99) * 1000, 4),
+            'max': round(values[-1] * 1000, 4) if values else 0,
+        }
+    }
+    if bytes_transferred:
+        result['bytes'] = bytes_transferred
+        result['bytes_per_second'] = round(bytes_transferred / elapsed, 2) if elapsed > 0 else 0
+    return result
+
+
+def peak_rss() -> int:
+    """当前进程的峰值常驻内存（字节）"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def process_peak_rss(pid: int) -> Optional[Dict[str, int]]:
+    """
+    读取指定进程及其子进程的峰值常驻内存（依赖 /proc，其他平台返回None）
+
+    用于统计被压测服务器（包括 server.py 的各工作进程）的内存占用。
+    """
+    def read_hwm(target: int) -> Optional[int]:
+        try:
+            with open(f'/proc/{target}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            return None
+        return None
+
+    def children(target: int) -> List[int]:
+        result = []
+        try:
+            for tid in os.listdir(f'/proc/{target}/task'):
+                with open(f'/proc/{target}/task/{tid}/children') as f:
+                    result.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            pass
+        return result
+
+    processes = {}
+    pending = [pid]
+    while pending:
+        target = pending.pop()
+        hwm = read_hwm(target)
+        if hwm is None:
+            continue
+        processes[str(target)] = hwm
+        pending.extend(children(target))
+    if not processes:
+        return None
+    return {'total': sum(processes.values()), 'processes': processes}
+
+
+def git_revision() -> Optional[str]:
+    """当前代码的git提交，用于区分不同版本的结果"""
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                capture_output=True, text=True, timeout=5)
+        return output.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def make_report(benchmark: str, parameters: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    """生成带运行环境信息的结果"""
+    return {
+        'benchmark': benchmark,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'parameters': parameters,
+        'results': results,
+        'peak_rss': peak_rss(),
+    }
+
+
+def write_report(report: Dict[str, Any], output: Optional[str] = None):
+    """输出结果：指定文件时写入文件，否则打印到标准输出"""
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"结果已写入: {output}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,151 @@
+"""
+合成目录树生成器
+
+按给定的文件数、目录深度、每层子目录数、大小分布和扩展名比例生成测试用的上传目录。
+默认创建稀疏文件（只设置文件长度，不写入数据），百万级文件也能较快生成且几乎不占磁盘；
+需要测试真实读盘时使用 fill 写入随机内容。
+"""
+import os
+import math
+import time
+import random
+from typing import List, Tuple, Dict, Any, Callable
+
+# 扩展名默认比例，大致对应局域网文件共享的常见内容
+DEFAULT_EXTENSION_MIX = '.jpg:30,.png:10,.mp4:5,.pdf:15,.docx:10,.txt:10,.zip:5,.mp3:5,.py:5,.bin:5'
+
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+
+def parse_extension_mix(spec: str) -> Tuple[List[str], List[float]]:
+    """
+    解析扩展名比例
+
+    Example:
+        >>> parse_extension_mix('.jpg:3,.pdf:1')
+        (['.jpg', '.pdf'], [3.0, 1.0])
+    """
+    extensions = []
+    weights = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        ext, _, weight = item.partition(':')
+        ext = ext.strip()
+        if ext and not ext.startswith('.'):
+            ext = '.' + ext
+        extensions.append(ext)
+        weights.append(float(weight) if weight else 1.0)
+    if not extensions:
+        raise ValueError('扩展名比例不能为空')
+    return extensions, weights
+
+
+def parse_size(value: str) -> int:
+    """解析带单位的大小，如 4KB、1.5MB"""
+    value = value.strip().upper()
+    units = {'GB': 1024 ** 3, 'MB': 1024 ** 2, 'KB': 1024, 'B': 1}
+    for unit, factor in units.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(float(value))
+
+
+def make_size_sampler(spec: str, rng: random.Random) -> Callable[[], int]:
+    """
+    根据大小分布生成采样函数
+
+    支持：
+    - fixed:4KB              固定大小
+    - uniform:1KB-10MB       均匀分布
+    - lognormal:64KB,2.0     对数正态分布（中位数, sigma），接近真实文件大小的长尾分布
+    """
+    kind, _, args = spec.partition(':')
+    kind = kind.strip().lower()
+    if kind == 'fixed':
+        size = parse_size(args)
+        return lambda: size
+    if kind == 'uniform':
+        low, _, high = args.partition('-')
+        low, high = parse_size(low), parse_size(high)
+        return lambda: rng.randint(low, high)
+    if kind == 'lognormal':
+        median, _, sigma = args.partition(',')
+        mu = math.log(max(parse_size(median), 1))
+        sigma = float(sigma or 1.5)
+        return lambda: int(rng.lognormvariate(mu, sigma))
+    raise ValueError(f'不支持的大小分布: {spec}')
+
+
+def build_directories(root: str, depth: int, fanout: int) -> List[str]:
+    """创建目录结构，返回所有目录（包括根目录）的路径"""
+    directories = [root]
+    level = [root]
+    for d in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                path = os.path.join(parent, f'dir_{d}_{i}')
+                os.makedirs(path, exist_ok=True)
+                next_level.append(path)
+        directories.extend(next_level)
+        level = next_level
+    return directories
+
+
+def generate_tree(root: str, files: int = 10000, depth: int = 3, fanout: int = 5,
+                  size_distribution: str = 'lognormal:64KB,2.0',
+                  extension_mix: str = DEFAULT_EXTENSION_MIX,
+                  fill: bool = False, seed: int = 0) -> Dict[str, Any]:
+    """
+    生成合成目录树
+
+    Args:
+        root (str): 目标目录（不存在时创建）
+        files (int): 文件总数，平均分配到所有目录中
+        depth (int): 目录深度，0 表示所有文件都在根目录
+        fanout (int): 每个目录下的子目录数
+        size_distribution (str): 文件大小分布，见 make_size_sampler
+        extension_mix (str): 扩展名比例，如 ".jpg:30,.pdf:10"
+        fill (bool): 是否写入随机内容（默认创建稀疏文件）
+        seed (int): 随机种子，相同参数和种子生成相同的目录树
+
+    Returns:
+        Dict[str, Any]: 文件数、目录数、总大小、各扩展名数量和耗时
+    """
+    rng = random.Random(seed)
+    sample_size = make_size_sampler(size_distribution, rng)
+    extensions, weights = parse_extension_mix(extension_mix)
+
+    start = time.perf_counter()
+    os.makedirs(root, exist_ok=True)
+    directories = build_directories(root, depth, fanout)
+
+    total_size = 0
+    extension_counts: Dict[str, int] = {}
+    block = os.urandom(WRITE_BLOCK_SIZE) if fill else b''
+    for index in range(files):
+        directory = directories[index % len(directories)]
+        ext = rng.choices(extensions, weights)[0]
+        size = sample_size()
+        path = os.path.join(directory, f'file_{index:08d}{ext}')
+        with open(path, 'wb') as f:
+            if fill:
+                remaining = size
+                while remaining > 0:
+                    written = f.write(block[:min(remaining, WRITE_BLOCK_SIZE)])
+                    remaining -= written
+            else:
+                f.truncate(size)
+        total_size += size
+        extension_counts[ext] = extension_counts.get(ext, 0) + 1
+
+    return {
+        'root': os.path.abspath(root),
+        'file_count': files,
+        'dir_count': len(directories) - 1,
+        'total_size': total_size,
+        'extensions': extension_counts,
+        'elapsed': round(time.perf_counter() - start, 4),
+    }
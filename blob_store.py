@@ -0,0 +1,191 @@
+"""
+内容寻址去重存储模块
+
+开启去重后，每份内容只在内部数据目录中保存一次，文件名为内容的SHA-256；
+上传目录中用户可见的文件都是这些blob的硬链接。
+
+- 引用计数即 inode 的链接数减一（blob自身占一个链接），删除可见文件时由文件系统自动递减
+- 可见文件的inode上记录扩展属性 user.fileserver.sha256，删除时据此找到blob并在无引用时回收
+- 不支持扩展属性的文件系统，或异常中断留下的孤立blob，由 collect_garbage 扫描回收
+"""
+import os
+import hashlib
+import threading
+import uuid
+from typing import Dict, Any, List, Optional
+
+XATTR_NAME = 'user.fileserver.sha256'
+
+
+class BlobStore:
+    """内容寻址的blob存储"""
+
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, blob_dir: str):
+        """
+        初始化blob存储
+
+        Args:
+            blob_dir (str): blob目录，必须与上传目录位于同一文件系统（硬链接要求）
+        """
+        self.blob_dir = blob_dir
+        self._gc_lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    @staticmethod
+    def _valid_digest(digest: str) -> bool:
+        return isinstance(digest, str) and len(digest) == 64 and all(c in '0123456789abcdef' for c in digest)
+
+    def blob_path(self, digest: str) -> str:
+        """blob的存储路径（按摘要前缀分两级目录）"""
+        digest = digest.lower()
+        if not self._valid_digest(digest):
+            raise ValueError(f'无效的SHA-256摘要: {digest}')
+        return os.path.join(self.blob_dir, digest[:2], digest[2:4], digest)
+
+    @classmethod
+    def hash_file(cls, path: str) -> str:
+        """计算文件的SHA-256"""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(cls.READ_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def lookup(self, digest: str, size: int) -> Optional[str]:
+        """查找摘要和大小都匹配的blob，返回其路径"""
+        try:
+            path = self.blob_path(digest)
+            if os.stat(path).st_size == size:
+                return path
+        except (OSError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def _tag(path: str, digest: str):
+        try:
+            os.setxattr(path, XATTR_NAME, digest.encode('ascii'))
+        except (OSError, AttributeError):
+            # 文件系统不支持扩展属性时依赖垃圾回收
+            pass
+
+    @staticmethod
+    def read_tag(path: str) -> Optional[str]:
+        """读取可见文件对应的blob摘要"""
+        try:
+            return os.getxattr(path, XATTR_NAME, follow_symlinks=False).decode('ascii')
+        except (OSError, AttributeError, UnicodeDecodeError):
+            return None
+
+    def link(self, blob_path: str, dest_path: str):
+        """为blob创建新的可见路径（dest_path不能已存在）"""
+        os.link(blob_path, dest_path)
+
+    def ingest(self, path: str, digest: Optional[str] = None) -> str:
+        """
+        将已放置到上传目录中的文件纳入去重存储
+
+        已有相同内容时，把该文件原子替换为已有blob的硬链接，释放刚写入的副本；
+        否则该文件本身成为新的blob。
+
+        Returns:
+            str: 文件内容的SHA-256
+        """
+        digest = (digest or self.hash_file(path)).lower()
+        blob = self.blob_path(digest)
+        st = os.stat(path)
+
+        while True:
+            try:
+                blob_st = os.stat(blob)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                except FileExistsError:
+                    # 并发上传了相同内容，重新按已存在处理
+                    continue
+                break
+
+            if blob_st.st_ino == st.st_ino and blob_st.st_dev == st.st_dev:
+                break
+            if blob_st.st_size != st.st_size:
+                # 摘要相同但大小不同说明blob已损坏，用新内容替换
+                tmp_blob = f'{blob}.{uuid.uuid4().hex}.tmp'
+                os.link(path, tmp_blob)
+                os.replace(tmp_blob, blob)
+                break
+            tmp_path = os.path.join(os.path.dirname(path), f'.{uuid.uuid4().hex}.dedup')
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, path)
+            break
+
+        self._tag(blob, digest)
+        return digest
+
+    def collect_digests(self, path: str) -> List[str]:
+        """收集文件或目录（递归）中引用的blob摘要，用于删除后释放"""
+        digests = []
+        if os.path.isfile(path):
+            digest = self.read_tag(path)
+            if digest:
+                digests.append(digest)
+            return digests
+        for root, _, files in os.walk(path):
+            for name in files:
+                digest = self.read_tag(os.path.join(root, name))
+                if digest:
+                    digests.append(digest)
+        return digests
+
+    def release(self, digests: List[str]) -> int:
+        """可见文件删除后调用：没有其他引用的blob将被删除，返回删除的blob数"""
+        removed = 0
+        for digest in set(digests):
+            try:
+                blob = self.blob_path(digest)
+                if os.stat(blob).st_nlink <= 1:
+                    os.remove(blob)
+                    removed += 1
+            except (OSError, ValueError):
+                continue
+        return removed
+
+    def collect_garbage(self) -> Dict[str, Any]:
+        """扫描全部blob，删除已没有可见引用的blob"""
+        removed = 0
+        freed = 0
+        with self._gc_lock:
+            for root, _, files in os.walk(self.blob_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                        if name.endswith('.tmp') or st.st_nlink <= 1:
+                            os.remove(path)
+                            removed += 1
+                            freed += st.st_size
+                    except OSError:
+                        continue
+        return {'removed': removed, 'freed': freed}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """统计blob数量、实际占用和被引用次数"""
+        blob_count = 0
+        stored_size = 0
+        references = 0
+        for root, _, files in os.walk(self.blob_dir):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                blob_count += 1
+                stored_size += st.st_size
+                references += max(st.st_nlink - 1, 0)
+        return {'blob_count': blob_count, 'stored_size': stored_size, 'references': references}
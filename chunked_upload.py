@@ -0,0 +1,303 @@
+"""
+断点续传（分片上传）模块
+
+上传流程：
+1. 创建上传会话，声明文件名、大小和目标路径
+2. 按偏移量上传分片（可并行、可重试），分片直接写入暂存文件的对应位置
+3. 随时查询已接收的字节区间，断线后从缺失的区间继续上传
+4. 所有区间接收完毕后完成上传，暂存文件被移动到最终位置
+
+会话数据保存在上传目录的内部数据目录中，与最终位置处于同一文件系统，完成时只需一次rename。
+会话元数据的读写使用文件锁保护，多线程、多进程同时写入同一会话的分片也是安全的。
+写入分片时持有会话数据的共享锁，完成上传时取得排他锁（等待进行中的分片写完）后把会话标记为已完成，
+之后的分片写入、取消和重复的完成请求都被拒绝，暂存文件移动期间不会再被写入或删除。
+过期会话由后台线程定期清理（创建会话时也会清理一次）。
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterator
+
+
+class UploadSessionError(Exception):
+    """上传会话错误，附带HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class UploadSessionManager:
+    """上传会话管理器"""
+
+    COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, staging_dir: str, session_ttl: int = 24 * 3600, cleanup_interval: int = 600):
+        """
+        初始化上传会话管理器
+
+        Args:
+            staging_dir (str): 暂存目录
+            session_ttl (int): 会话在无活动后的保留时间（秒）
+            cleanup_interval (int): 后台清理过期会话的间隔（秒）
+        """
+        self.staging_dir = staging_dir
+        self.session_ttl = session_ttl
+        self.cleanup_interval = max(1, cleanup_interval)
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 内部工具
+    # ------------------------------------------------------------------
+    def _session_dir(self, upload_id: str) -> str:
+        # upload_id 来自URL，只接受uuid格式，防止路径穿越
+        try:
+            upload_id = uuid.UUID(upload_id).hex
+        except (ValueError, AttributeError):
+            raise UploadSessionError('上传会话不存在', 404)
+        return os.path.join(self.staging_dir, upload_id)
+
+    @staticmethod
+    def _read_meta(session_dir: str) -> Dict[str, Any]:
+        with open(os.path.join(session_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_meta(session_dir: str, meta: Dict[str, Any]):
+        tmp_path = os.path.join(session_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(session_dir, 'meta.json'))
+
+    @contextmanager
+    def _locked(self, upload_id: str, user_id: str) -> Iterator[Dict[str, Any]]:
+        """加锁读取会话元数据，退出时写回"""
+        session_dir = self._session_dir(upload_id)
+        try:
+            lock_file = open(os.path.join(session_dir, 'lock'), 'a')
+        except FileNotFoundError:
+            raise UploadSessionError('上传会话不存在', 404)
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                meta = self._read_meta(session_dir)
+            except FileNotFoundError:
+                raise UploadSessionError('上传会话不存在', 404)
+            if meta.get('user_id') != user_id:
+                raise UploadSessionError('无权访问该上传会话', 403)
+            yield meta
+            meta['updated_at'] = time.time()
+            if os.path.isdir(session_dir):
+                self._write_meta(session_dir, meta)
+
+    @contextmanager
+    def _data_lock(self, upload_id: str, exclusive: bool):
+        """会话数据锁：写入分片时共享，完成上传时排他"""
+        try:
+            lock_file = open(os.path.join(self._session_dir(upload_id), 'data.lock'), 'a')
+        except FileNotFoundError:
+            raise UploadSessionError('上传会话不存在', 404)
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    @staticmethod
+    def _check_open(meta: Dict[str, Any]):
+        if meta.get('finalized'):
+            raise UploadSessionError('上传已完成或正在完成', 409)
+
+    @staticmethod
+    def _merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+        """将[start, end)合并进已接收区间列表"""
+        merged = []
+        for r_start, r_end in sorted(ranges + [[start, end]]):
+            if merged and r_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], r_end)
+            else:
+                merged.append([r_start, r_end])
+        return merged
+
+    @staticmethod
+    def _missing_ranges(ranges: List[List[int]], size: int) -> List[List[int]]:
+        missing = []
+        position = 0
+        for r_start, r_end in ranges:
+            if r_start > position:
+                missing.append([position, r_start])
+            position = max(position, r_end)
+        if position < size:
+            missing.append([position, size])
+        return missing
+
+    def _describe(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        ranges = meta['ranges']
+        offset = ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+        received = sum(r_end - r_start for r_start, r_end in ranges)
+        return {
+            'upload_id': meta['upload_id'],
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': offset,
+            'received': received,
+            'missing': self._missing_ranges(ranges, meta['size']),
+            'complete': received == meta['size'],
+            'current_path': meta['current_path']
+        }
+
+    # ------------------------------------------------------------------
+    # 会话操作
+    # ------------------------------------------------------------------
+    def create(self, filename: str, size: int, current_path: str, user_id: str) -> Dict[str, Any]:
+        """创建上传会话，并预先创建与最终大小一致的（稀疏）暂存文件"""
+        self.cleanup_expired()
+
+        upload_id = uuid.uuid4().hex
+        session_dir = os.path.join(self.staging_dir, upload_id)
+        os.makedirs(session_dir)
+        with open(os.path.join(session_dir, 'data'), 'wb') as f:
+            f.truncate(size)
+        open(os.path.join(session_dir, 'lock'), 'a').close()
+
+        now = time.time()
+        meta = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': size,
+            'current_path': current_path,
+            'user_id': user_id,
+            'ranges': [],
+            'created_at': now,
+            'updated_at': now
+        }
+        self._write_meta(session_dir, meta)
+        return self._describe(meta)
+
+    def status(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """查询会话的上传进度"""
+        with self._locked(upload_id, user_id) as meta:
+            return self._describe(meta)
+
+    def write_chunk(self, upload_id: str, user_id: str, offset: int, length: int, stream) -> Dict[str, Any]:
+        """
+        将分片写入暂存文件的指定偏移量
+
+        分片数据直接从请求流写入文件，不在内存中缓存整个分片；写入过程只持有会话数据的共享锁，
+        因此同一会话的多个分片可以并行写入。
+
+        Raises:
+            UploadSessionError: 会话不存在（404）、已完成（409）或分片超出文件范围（416）
+        """
+        session_dir = self._session_dir(upload_id)
+        with self._data_lock(upload_id, exclusive=False):
+            with self._locked(upload_id, user_id) as meta:
+                self._check_open(meta)
+                size = meta['size']
+            if offset < 0 or length < 0 or offset + length > size:
+                raise UploadSessionError('分片超出文件范围', 416)
+
+            written = 0
+            fd = os.open(os.path.join(session_dir, 'data'), os.O_WRONLY)
+            try:
+                while written < length:
+                    data = stream.read(min(self.COPY_BUFFER_SIZE, length - written))
+                    if not data:
+                        break
+                    os.pwrite(fd, data, offset + written)
+                    written += len(data)
+            finally:
+                os.close(fd)
+
+            with self._locked(upload_id, user_id) as meta:
+                if written:
+                    meta['ranges'] = self._merge_range(meta['ranges'], offset, offset + written)
+                result = self._describe(meta)
+
+        if written < length:
+            raise UploadSessionError('分片数据不完整，请从当前进度重试', 400)
+        return result
+
+    def complete(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """
+        检查会话是否已接收全部数据，并把会话标记为已完成
+
+        等待进行中的分片写入结束后再检查；标记之后不再接受分片写入、取消和重复的完成请求。
+        调用方移动暂存文件后调用 remove()，移动失败时调用 reopen()。
+
+        Returns:
+            Dict[str, Any]: 会话信息，其中data_path为暂存文件路径，调用方负责将其移动到最终位置
+
+        Raises:
+            UploadSessionError: 会话不存在（404）、尚未上传完整或已完成（409）
+        """
+        with self._data_lock(upload_id, exclusive=True):
+            with self._locked(upload_id, user_id) as meta:
+                self._check_open(meta)
+                result = self._describe(meta)
+                if not result['complete']:
+                    raise UploadSessionError('文件尚未上传完整', 409)
+                meta['finalized'] = True
+        result['data_path'] = os.path.join(self._session_dir(upload_id), 'data')
+        return result
+
+    def reopen(self, upload_id: str, user_id: str):
+        """完成上传失败时调用：暂存文件仍在时取消已完成标记以便重试，否则删除会话"""
+        if not os.path.exists(os.path.join(self._session_dir(upload_id), 'data')):
+            self.remove(upload_id)
+            return
+        with self._locked(upload_id, user_id) as meta:
+            meta['finalized'] = False
+
+    def abort(self, upload_id: str, user_id: str):
+        """取消上传会话并删除暂存数据（正在完成的会话不能取消）"""
+        with self._locked(upload_id, user_id) as meta:
+            self._check_open(meta)
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def remove(self, upload_id: str):
+        """删除会话目录（完成上传后调用）"""
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='upload-session-gc', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.cleanup_interval):
+            try:
+                self.cleanup_expired()
+            except Exception as e:
+                print(f"清理过期上传会话失败: {e}")
+
+    def cleanup_expired(self):
+        """清理长时间无活动的会话"""
+        deadline = time.time() - self.session_ttl
+        try:
+            entries = list(os.scandir(self.staging_dir))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                meta_path = os.path.join(entry.path, 'meta.json')
+                if os.path.getmtime(meta_path) < deadline:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                # 元数据缺失的残留目录
+                try:
+                    if entry.stat().st_mtime < deadline:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                except OSError:
+                    continue
+
@@ -49,22 +49,45 @@ class Config:
             Dict[str, Any]: 默认配置字典，包含所有必要的配置项
             
         默认配置包括：
-        - server: 服务器相关配置（主机、端口、调试模式、密钥）
+        - server: 服务器相关配置（主机、端口、调试模式、密钥、工作进程数、每个进程的线程数、服务引擎（threaded/asyncio）、超时）
         - upload: 文件上传配置（上传文件夹、最大文件大小、允许的扩展名）
         - users: 用户列表（默认包含admin和user两个用户）
         - session: 会话配置（超时时间、安全设置）
-        - dashboard: 仪表板配置（刷新间隔、显示选项）
+        - dashboard: 仪表板配置（统计刷新间隔（毫秒）、显示选项、统计推送的心跳间隔和每个进程的订阅连接上限）
+        - index: 文件元数据索引配置（是否启用、对账间隔）
+        - storage: 存储配置（存储后端、S3兼容对象存储的连接参数、是否开启内容寻址去重）
+        - download: 下载配置（打包下载的压缩线程数和压缩级别）
+        - metrics: 运行指标配置（是否启用、访问令牌、多进程快照写入间隔）
+        - signed_urls: 签名下载链接配置（签名密钥（为空时使用server.secret_key）、默认和最长有效期）
+        - jobs: 后台任务配置（每个进程的任务线程数、排队上限、已结束任务的保留时间）
+        - trash: 回收站配置（是否启用、保留时间、后台回收间隔和限速）
+        - quotas: 存储配额配置（按用户名和按文件夹相对路径的配额、与磁盘对账的间隔）
+        - bandwidth: 带宽限速配置（是否启用、上传和下载的全局及每用户限速（每秒字节数）、用户权重、多进程状态写入间隔）
+        - compression: 下载内容压缩配置（是否启用、压缩格式的优先顺序和级别、可压缩的MIME类型和扩展名、最小文件大小、
+          预压缩副本的生成条件、压缩级别和总大小上限）
+        - listing_cache: 目录列表缓存配置（是否启用、每个进程缓存的响应数量和总大小上限）
+        - admission: 准入控制配置（是否启用、拒绝时的Retry-After、统计结果的缓存和过期后继续使用的时间、
+          每个进程按传输/列表/统计/登录分类的并发上限、等待队列长度和等待时限，未配置时按server.threads推算）
         """
         return {
             "server": {
                 "host": "0.0.0.0",
                 "port": 9000,
                 "debug": False,
-                "secret_key": "your-secret-key-change-in-production"
+                "secret_key": "your-secret-key-change-in-production",
+                "workers": 2,
+                "threads": 8,
+                "engine": "threaded",
+                "request_timeout": 60,
+                "graceful_timeout": 30
             },
             "upload": {
                 "folder": "uploads",
                 "max_file_size": 5000,
+                "chunk_size": "8MB",
+                "session_ttl": 86400,
+                "streaming": True,
+                "compute_sha256": False,
                 "allowed_extensions": [".txt", ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".jpg", ".jpeg", ".png", ".gif", ".zip", ".rar", ".mp4", ".mp3", ".avi", ".mov"]
             },
             "users": [
@@ -86,7 +109,95 @@ class Config:
             "dashboard": {
                 "refresh_interval": 30000,
                 "show_file_stats": True,
-                "show_disk_usage": True
+                "show_disk_usage": True,
+                "stream_heartbeat": 15
+            },
+            "index": {
+                "enabled": True,
+                "reconcile_interval": 300
+            },
+            "storage": {
+                "backend": "local",
+                "dedup": False,
+                "s3": {
+                    "endpoint": "",
+                    "bucket": "",
+                    "region": "us-east-1",
+                    "access_key": "",
+                    "secret_key": "",
+                    "prefix": "",
+                    "part_size": "8MB",
+                    "range_size": "4MB",
+                    "max_connections": 16,
+                    "upload_concurrency": 4,
+                    "download_concurrency": 4,
+                    "timeout": 60
+                }
+            },
+            "download": {
+                "zip_workers": 4,
+                "zip_compress_level": 6
+            },
+            "metrics": {
+                "enabled": True,
+                "token": "",
+                "flush_interval": 5
+            },
+            "signed_urls": {
+                "secret": "",
+                "default_ttl": 3600,
+                "max_ttl": 604800
+            },
+            "jobs": {
+                "workers": 2,
+                "max_pending": 100,
+                "retention": 86400
+            },
+            "trash": {
+                "enabled": True,
+                "retention": 604800,
+                "gc_interval": 600,
+                "gc_rate": "64MB",
+                "gc_items_per_second": 2000
+            },
+            "quotas": {
+                "users": {},
+                "folders": {},
+                "reconcile_interval": 3600
+            },
+            "bandwidth": {
+                "enabled": False,
+                "download_rate": "0",
+                "upload_rate": "0",
+                "user_download_rate": "0",
+                "user_upload_rate": "0",
+                "weights": {},
+                "publish_interval": 1
+            },
+            "compression": {
+                "enabled": True,
+                "encodings": ["zstd", "br", "gzip"],
+                "levels": {"gzip": 6, "br": 4, "zstd": 3},
+                "min_size": "1KB",
+                "mimetypes": ["text/", "application/json", "application/xml", "application/javascript",
+                              "application/x-ndjson", "application/sql", "image/svg+xml"],
+                "extensions": [".log", ".jsonl", ".ndjson", ".yaml", ".yml", ".toml", ".ini", ".conf"],
+                "precompress": True,
+                "precompress_hits": 2,
+                "precompress_min_size": "1MB",
+                "precompress_levels": {"gzip": 9, "br": 9, "zstd": 12},
+                "cache_size": "2GB"
+            },
+            "listing_cache": {
+                "enabled": True,
+                "max_entries": 512,
+                "max_size": "32MB"
+            },
+            "admission": {
+                "enabled": True,
+                "retry_after": 5,
+                "stats_ttl": 5,
+                "stats_max_stale": 300
             }
         }
     
@@ -135,6 +246,15 @@ class Config:
         
         merge_dict(self.config, user_config)
     
+    def reload(self):
+        """
+        重新加载配置文件
+        
+        先恢复默认配置再合并配置文件，用于平滑重启时读取修改后的配置。
+        """
+        self.config = self._load_default_config()
+        self._load_config()
+    
     def save_config(self):
         """
         保存配置到文件
@@ -321,7 +441,7 @@ class Config:
             
         Example:
             >>> config.get_server_config()
-            {'host': '127.0.0.1', 'port': 9000, 'debug': True}
+            {'host': '127.0.0.1', 'port': 9000, 'debug': True, 'workers': 2, 'threads': 8, 'engine': 'threaded'}
         """
         return self.get('server', {})
     
@@ -356,13 +476,173 @@ class Config:
         获取仪表板配置
         
         Returns:
-            Dict[str, Any]: 仪表板配置字典，包含enable_stats、refresh_interval等设置
+            Dict[str, Any]: 仪表板配置字典，包含refresh_interval、stream_heartbeat等设置，
+            以及可选的max_stream_clients（每个工作进程的统计推送连接数上限，未配置时按server.threads推算）
             
         Example:
             >>> config.get_dashboard_config()
-            {'enable_stats': True, 'refresh_interval': 300}
+            {'refresh_interval': 30000, 'show_file_stats': True, 'show_disk_usage': True, 'stream_heartbeat': 15}
         """
         return self.get('dashboard', {})
+    
+    def get_index_config(self) -> Dict[str, Any]:
+        """
+        获取文件索引配置
+        
+        Returns:
+            Dict[str, Any]: 索引配置字典，包含enabled、reconcile_interval等设置
+            
+        Example:
+            >>> config.get_index_config()
+            {'enabled': True, 'reconcile_interval': 300}
+        """
+        return self.get('index', {})
+    
+    def get_storage_config(self) -> Dict[str, Any]:
+        """
+        获取存储配置
+        
+        Returns:
+            Dict[str, Any]: 存储配置字典，包含backend、dedup、s3等设置
+            
+        Example:
+            >>> config.get_storage_config()
+            {'backend': 'local', 'dedup': False, 's3': {'endpoint': '', 'bucket': '', 'region': 'us-east-1', ...}}
+        """
+        return self.get('storage', {})
+    
+    def get_download_config(self) -> Dict[str, Any]:
+        """
+        获取下载配置
+        
+        Returns:
+            Dict[str, Any]: 下载配置字典，包含zip_workers、zip_compress_level等设置
+            
+        Example:
+            >>> config.get_download_config()
+            {'zip_workers': 4, 'zip_compress_level': 6}
+        """
+        return self.get('download', {})
+    
+    def get_metrics_config(self) -> Dict[str, Any]:
+        """
+        获取运行指标配置
+        
+        Returns:
+            Dict[str, Any]: 指标配置字典，包含enabled、token、flush_interval等设置
+            
+        Example:
+            >>> config.get_metrics_config()
+            {'enabled': True, 'token': '', 'flush_interval': 5}
+        """
+        return self.get('metrics', {})
+    
+    def get_signed_urls_config(self) -> Dict[str, Any]:
+        """
+        获取签名下载链接配置
+        
+        Returns:
+            Dict[str, Any]: 签名链接配置字典，包含secret、default_ttl、max_ttl等设置
+            
+        Example:
+            >>> config.get_signed_urls_config()
+            {'secret': '', 'default_ttl': 3600, 'max_ttl': 604800}
+        """
+        return self.get('signed_urls', {})
+    
+    def get_jobs_config(self) -> Dict[str, Any]:
+        """
+        获取后台任务配置
+        
+        Returns:
+            Dict[str, Any]: 后台任务配置字典，包含workers、max_pending、retention等设置
+            
+        Example:
+            >>> config.get_jobs_config()
+            {'workers': 2, 'max_pending': 100, 'retention': 86400}
+        """
+        return self.get('jobs', {})
+    
+    def get_trash_config(self) -> Dict[str, Any]:
+        """
+        获取回收站配置
+        
+        Returns:
+            Dict[str, Any]: 回收站配置字典，包含enabled、retention、gc_interval、gc_rate等设置
+            
+        Example:
+            >>> config.get_trash_config()
+            {'enabled': True, 'retention': 604800, 'gc_interval': 600, 'gc_rate': '64MB', 'gc_items_per_second': 2000}
+        """
+        return self.get('trash', {})
+    
+    def get_quotas_config(self) -> Dict[str, Any]:
+        """
+        获取存储配额配置
+        
+        Returns:
+            Dict[str, Any]: 存储配额配置字典，包含users、folders（配额格式同max_file_size，如"10GB"）、reconcile_interval
+            
+        Example:
+            >>> config.get_quotas_config()
+            {'users': {'user': '10GB'}, 'folders': {'shared': '50GB'}, 'reconcile_interval': 3600}
+        """
+        return self.get('quotas', {})
+    
+    def get_bandwidth_config(self) -> Dict[str, Any]:
+        """
+        获取带宽限速配置
+        
+        Returns:
+            Dict[str, Any]: 带宽限速配置字典，包含enabled、download_rate、user_download_rate（每秒字节数，格式同max_file_size，"0"表示不限制）、weights等设置
+            
+        Example:
+            >>> config.get_bandwidth_config()
+            {'enabled': True, 'download_rate': '100MB', 'user_download_rate': '20MB', 'weights': {'admin': 2}}
+        """
+        return self.get('bandwidth', {})
+    
+    def get_compression_config(self) -> Dict[str, Any]:
+        """
+        获取下载内容压缩配置
+        
+        Returns:
+            Dict[str, Any]: 下载内容压缩配置字典，包含enabled、encodings（zstd、br需要安装zstandard、brotli）、levels、
+            mimetypes、extensions、min_size、precompress、precompress_hits、precompress_min_size、cache_size等设置
+            
+        Example:
+            >>> config.get_compression_config()
+            {'enabled': True, 'encodings': ['zstd', 'br', 'gzip'], 'levels': {'gzip': 6}, 'min_size': '1KB', 'precompress': True, 'cache_size': '2GB', ...}
+        """
+        return self.get('compression', {})
+    
+    def get_listing_cache_config(self) -> Dict[str, Any]:
+        """
+        获取目录列表缓存配置
+        
+        Returns:
+            Dict[str, Any]: 目录列表缓存配置字典，包含enabled、max_entries、max_size（每个工作进程）
+            
+        Example:
+            >>> config.get_listing_cache_config()
+            {'enabled': True, 'max_entries': 512, 'max_size': '32MB'}
+        """
+        return self.get('listing_cache', {})
+    
+    def get_admission_config(self) -> Dict[str, Any]:
+        """
+        获取准入控制配置
+        
+        Returns:
+            Dict[str, Any]: 准入控制配置字典，包含enabled、retry_after、stats_ttl、stats_max_stale，
+            以及可选的transfers、listings、stats、auth各类别的concurrency、queue、timeout（每个工作进程，
+            未配置的类别按server.threads推算）
+            
+        Example:
+            >>> config.get_admission_config()
+            {'enabled': True, 'retry_after': 5, 'stats_ttl': 5, 'stats_max_stale': 300}
+        """
+        return self.get('admission', {})
 
 
 # 全局配置实例
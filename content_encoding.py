@@ -0,0 +1,383 @@
+"""
+下载内容压缩（Content-Encoding）
+
+文本、CSV、日志、JSON等可压缩类型的文件按请求的 Accept-Encoding 协商压缩格式：
+- gzip 总是可用；安装了 zstandard / brotli 时还支持 zstd 和 br，按配置的顺序优先选择
+- 没有预压缩副本时边读取边压缩，内存占用与文件大小无关，响应不带 Content-Length
+- 经常下载的文件由后台线程生成预压缩副本（.fileserver/precompressed），之后的下载像原文件一样用sendfile发送
+- 副本的文件名包含源文件的 inode、大小和修改时间，源文件变化后旧副本不再匹配（由后台清理），不会发送过期内容
+- 副本总大小超过上限时删除最久未使用的副本
+
+压缩后的内容使用弱ETag（原ETag加编码名），响应带 Vary: Accept-Encoding。
+Range 请求只返回原始内容，断点续传不受影响。
+"""
+import os
+import time
+import uuid
+import zlib
+import queue
+import hashlib
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from bandwidth import TRANSFER_ENVIRON_KEY
+
+READ_CHUNK_SIZE = 256 * 1024
+
+# 预压缩副本的文件扩展名
+SIDECAR_SUFFIXES = {'gzip': '.gz', 'br': '.br', 'zstd': '.zst'}
+
+# 压缩后大于原文件这个比例时不保存副本（内容本身不可压缩）
+MAX_SIDECAR_RATIO = 0.9
+
+# 等待生成副本的文件数上限，队列满时丢弃（下次下载时再提交）
+MAX_PENDING_BUILDS = 32
+
+# 下载次数计数表的条目上限，超过时清空重新计数
+MAX_TRACKED_FILES = 4096
+
+# 未完成的临时副本（进程异常退出遗留）超过这个时间（秒）后清除
+STALE_TEMP_AGE = 3600
+
+Compressor = Tuple[Callable[[bytes], bytes], Callable[[], bytes]]
+
+
+def _gzip_compressor(level: int) -> Compressor:
+    obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return obj.compress, obj.flush
+
+
+def _zstd_compressor(level: int) -> Compressor:
+    obj = zstandard.ZstdCompressor(level=level).compressobj()
+    return obj.compress, obj.flush
+
+
+def _brotli_compressor(level: int) -> Compressor:
+    obj = brotli.Compressor(quality=level)
+    return obj.process, obj.finish
+
+
+# 当前环境可用的压缩格式：{编码名: 按级别创建 (compress, finish) 的函数}
+COMPRESSORS = {'gzip': _gzip_compressor}
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _zstd_compressor
+if brotli is not None:
+    COMPRESSORS['br'] = _brotli_compressor
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """解析 Accept-Encoding 请求头，返回 {编码名（小写）: q值}"""
+    result = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        result[name] = quality
+    return result
+
+
+def negotiate_encoding(header: str, encodings: List[str]) -> Optional[str]:
+    """
+    按 Accept-Encoding 从服务器支持的编码中选择（q值相同时按服务器的顺序），不压缩时返回None
+
+    客户端的 identity（或 *）q值更高时不压缩。
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, wildcard)
+        if encoding == 'gzip' and 'gzip' not in accepted:
+            quality = accepted.get('x-gzip', wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    if best is not None and accepted.get('identity', wildcard if '*' in accepted else 0.0) > best_quality:
+        return None
+    return best
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """压缩内容的弱ETag（不同压缩级别的输出字节不同，不能使用强ETag）"""
+    return f'W/{etag[:-1]}-{encoding}"'
+
+
+class CompressingBody:
+    """
+    边读取边压缩的响应体
+
+    每次读取一个数据块并输出压缩结果，内存占用与文件大小无关。
+    启用带宽限速时按压缩后的字节数申请额度。
+    """
+
+    def __init__(self, fd: int, compressor: Compressor, environ: dict):
+        self.fd = fd
+        self.compressor = compressor
+        self.transfer = environ.get(TRANSFER_ENVIRON_KEY)
+
+    def __iter__(self) -> Iterator[bytes]:
+        compress, finish = self.compressor
+        offset = 0
+        while True:
+            data = os.pread(self.fd, READ_CHUNK_SIZE, offset)
+            if data:
+                offset += len(data)
+                output = compress(data)
+            else:
+                output = finish()
+            if output and self.transfer is not None:
+                step = self.transfer.chunk_size
+                for start in range(0, len(output), step):
+                    chunk = output[start:start + step]
+                    self.transfer.consume(len(chunk))
+                    yield chunk
+            elif output:
+                yield output
+            if not data:
+                return
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ContentEncoder:
+    """可压缩类型的判断、压缩格式协商，以及预压缩副本的查找、后台生成和清理"""
+
+    def __init__(self, cache_dir: str, encodings: List[str], levels: Dict[str, int], mimetypes: List[str],
+                 extensions: List[str], min_size: int = 1024, precompress: bool = True,
+                 precompress_hits: int = 2, precompress_min_size: int = 1024 * 1024,
+                 precompress_levels: Optional[Dict[str, int]] = None, cache_size: int = 2 * 1024 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (str): 预压缩副本目录
+            encodings: 按优先顺序排列的压缩格式（gzip、zstd、br），当前环境不可用的格式被忽略
+            levels: 实时压缩使用的压缩级别 {编码名: 级别}
+            mimetypes: 可压缩的MIME类型，以 / 结尾的项匹配该大类（如 "text/"）
+            extensions: MIME类型未知时按扩展名判断可压缩的文件（如 ".log"）
+            min_size (int): 小于这个大小的文件不压缩
+            precompress (bool): 是否为经常下载的文件生成预压缩副本
+            precompress_hits (int): 同一文件在本进程内下载多少次后生成副本
+            precompress_min_size (int): 小于这个大小的文件不生成副本
+            precompress_levels: 生成副本使用的压缩级别（默认同 levels）
+            cache_size (int): 副本总大小上限
+        """
+        self.cache_dir = cache_dir
+        self.encodings = [encoding for encoding in encodings if encoding in COMPRESSORS]
+        self.levels = levels
+        self.mimetypes = tuple(mimetypes)
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.min_size = min_size
+        self.precompress = precompress
+        self.precompress_hits = max(1, precompress_hits)
+        self.precompress_min_size = precompress_min_size
+        self.precompress_levels = precompress_levels or levels
+        self.cache_size = cache_size
+        self._hits = {}
+        self._incompressible = set()
+        self._pending = set()
+        self._queue = queue.Queue(MAX_PENDING_BUILDS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # 协商
+    # ------------------------------------------------------------------
+    def is_compressible(self, file_path: str, mimetype: str, size: int) -> bool:
+        """文件是否按内容类型和大小需要压缩"""
+        if not self.encodings or size < self.min_size:
+            return False
+        if any(mimetype.startswith(item) if item.endswith('/') else mimetype == item for item in self.mimetypes):
+            return True
+        return mimetype == 'application/octet-stream' and file_path.lower().endswith(self.extensions)
+
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        """按 Accept-Encoding 选择压缩格式，不压缩时返回None"""
+        return negotiate_encoding(accept_encoding, self.encodings)
+
+    def compressor(self, encoding: str) -> Compressor:
+        """实时压缩使用的压缩器"""
+        return COMPRESSORS[encoding](self.levels.get(encoding, 6))
+
+    # ------------------------------------------------------------------
+    # 预压缩副本
+    # ------------------------------------------------------------------
+    def sidecar_path(self, file_path: str, st: os.stat_result, encoding: str) -> str:
+        """源文件当前版本的副本路径（文件名包含源文件的 inode、大小和修改时间）"""
+        digest = hashlib.sha1(os.fsencode(file_path)).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2],
+                            f'{digest}-{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}{SIDECAR_SUFFIXES[encoding]}')
+
+    def open_sidecar(self, file_path: str, st: os.stat_result, encoding: str) -> Optional[int]:
+        """
+        打开源文件当前版本的预压缩副本
+
+        副本不存在时记录一次下载，达到次数后提交后台生成，返回None（由调用方实时压缩）。
+        """
+        if not self.precompress or st.st_size < self.precompress_min_size:
+            return None
+        path = self.sidecar_path(file_path, st, encoding)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            self._record_hit(file_path, path, encoding)
+            return None
+        try:
+            # 更新修改时间，清理时按最近使用的时间保留
+            os.utime(fd)
+        except OSError:
+            pass
+        return fd
+
+    def _record_hit(self, file_path: str, path: str, encoding: str):
+        with self._lock:
+            if path in self._incompressible or path in self._pending:
+                return
+            if len(self._hits) >= MAX_TRACKED_FILES:
+                self._hits.clear()
+            hits = self._hits.get(path, 0) + 1
+            if hits < self.precompress_hits:
+                self._hits[path] = hits
+                return
+            self._hits.pop(path, None)
+            try:
+                self._queue.put_nowait((file_path, path, encoding))
+            except queue.Full:
+                return
+            self._pending.add(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='precompress', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """停止后台生成（正在生成的副本被丢弃）"""
+        self._stop.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            task = self._queue.get()
+            if task is None:
+                return
+            file_path, path, encoding = task
+            try:
+                self.build(file_path, path, encoding)
+            except Exception as e:
+                print(f"生成预压缩副本失败: {file_path}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+
+    def build(self, file_path: str, path: str, encoding: str) -> bool:
+        """
+        生成预压缩副本：写入临时文件后rename，生成期间源文件发生变化或内容不可压缩时丢弃
+
+        Returns:
+            bool: 是否生成了副本
+        """
+        if os.path.exists(path):
+            return False
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        compress, finish = COMPRESSORS[encoding](self.precompress_levels.get(encoding, self.levels.get(encoding, 6)))
+        try:
+            with open(file_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                before = os.fstat(src.fileno())
+                while True:
+                    if self._stop.is_set():
+                        return False
+                    data = src.read(READ_CHUNK_SIZE)
+                    if not data:
+                        break
+                    dst.write(compress(data))
+                dst.write(finish())
+                after = os.fstat(src.fileno())
+            if path != self.sidecar_path(file_path, after, encoding) or \
+                    (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+                # 提交之后或生成期间源文件被修改
+                return False
+            if os.path.getsize(temp_path) > after.st_size * MAX_SIDECAR_RATIO:
+                with self._lock:
+                    self._incompressible.add(path)
+                return False
+            os.rename(temp_path, path)
+        finally:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        self._remove_outdated(path)
+        self.evict()
+        return True
+
+    @staticmethod
+    def _remove_outdated(path: str):
+        """删除同一源文件旧版本的同格式副本"""
+        directory, name = os.path.split(path)
+        prefix = name.split('-', 1)[0] + '-'
+        suffix = os.path.splitext(name)[1]
+        for entry in os.scandir(directory):
+            if entry.name != name and entry.name.startswith(prefix) and entry.name.endswith(suffix):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """副本总大小超过上限时删除最久未使用的副本，同时清除遗留的临时文件"""
+        now = time.time()
+        sidecars = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith('.tmp'):
+                    if now - st.st_mtime > STALE_TEMP_AGE:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    continue
+                sidecars.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.cache_size:
+            return
+        sidecars.sort()
+        for _, size, path in sidecars:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.cache_size:
+                break
@@ -0,0 +1,294 @@
+"""
+文件操作模块：删除、复制、移动
+
+供后台任务调用。操作逐个条目进行，通过 job 汇报进度，并在条目之间（大文件在数据块之间）响应取消；
+单个条目失败不会中断整个操作，失败原因记录到任务中。
+
+复制文件时依次尝试（前两种方式数据都不经过Python）：
+1. reflink克隆（FICLONE，btrfs/XFS等支持写时复制的文件系统），只复制元数据，与文件大小无关
+2. copy_file_range（Linux），由内核在文件之间复制，支持的文件系统上同样会使用克隆或服务端复制
+3. 按块读写
+"""
+import os
+import errno
+import shutil
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from utils import FileUtils
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# copy_file_range 每次调用复制的最大字节数（在两次调用之间汇报进度、响应取消）
+COPY_RANGE_SIZE = 64 * 1024 * 1024
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# 表示文件系统或内核不支持该复制方式（应改用下一种方式）的错误码
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EBADF,
+                      errno.EOPNOTSUPP, errno.EPERM, errno.ETXTBSY}
+
+# 删除时每累积这么多个blob摘要释放一次，避免大目录一次占用过多内存
+RELEASE_BATCH = 1000
+
+
+def count_tree(paths: List[str]) -> Tuple[int, int]:
+    """统计路径（目录递归）包含的条目数和文件总字节数，不跟随符号链接"""
+    items = 0
+    size = 0
+    stack = list(paths)
+    while stack:
+        path = stack.pop()
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        items += 1
+        if os.path.isdir(path) and not os.path.islink(path):
+            try:
+                with os.scandir(path) as entries:
+                    stack.extend(entry.path for entry in entries)
+            except OSError:
+                continue
+        else:
+            size += st.st_size
+    return items, size
+
+
+def delete_tree(path: str, job, blob_store=None):
+    """
+    删除文件或目录（递归），自底向上逐个删除
+
+    去重模式下同时释放不再被引用的blob。
+    """
+    digests = []
+
+    def remove_file(file_path: str):
+        try:
+            size = os.lstat(file_path).st_size
+            digest = blob_store.read_tag(file_path) if blob_store is not None else None
+            os.remove(file_path)
+        except OSError as e:
+            job.record_error(file_path, e)
+            job.advance(current=file_path)
+            return
+        if digest:
+            digests.append(digest)
+            if len(digests) >= RELEASE_BATCH:
+                blob_store.release(digests)
+                digests.clear()
+        job.advance(size=size, current=file_path)
+
+    try:
+        if os.path.islink(path) or not os.path.isdir(path):
+            remove_file(path)
+            return
+        for root, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                remove_file(os.path.join(root, name))
+            for name in dirs:
+                dir_path = os.path.join(root, name)
+                try:
+                    if os.path.islink(dir_path):
+                        os.remove(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+                except OSError as e:
+                    job.record_error(dir_path, e)
+                job.advance(current=dir_path)
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            job.record_error(path, e)
+        job.advance(current=path)
+    finally:
+        if digests:
+            blob_store.release(digests)
+
+
+def _clone(fsrc, fdst) -> bool:
+    """尝试reflink克隆整个文件，文件系统不支持时返回False"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+
+
+def _copy_range(fsrc, fdst, size: int, src: str, job) -> bool:
+    """使用copy_file_range复制，内核或文件系统不支持时返回False（此时尚未复制任何数据）"""
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    copied = 0
+    while copied < size:
+        try:
+            count = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_RANGE_SIZE, size - copied))
+        except OSError as e:
+            if copied == 0 and e.errno in UNSUPPORTED_ERRNOS:
+                return False
+            raise
+        if count == 0:
+            # 复制过程中源文件被截短
+            break
+        copied += count
+        job.advance(items=0, size=count, current=src)
+    return True
+
+
+def _copy_chunks(fsrc, fdst, src: str, job):
+    """按块读写复制"""
+    while True:
+        data = fsrc.read(COPY_BUFFER_SIZE)
+        if not data:
+            break
+        fdst.write(data)
+        # 大文件在数据块之间汇报进度、响应取消
+        job.advance(items=0, size=len(data), current=src)
+
+
+def copy_file(src: str, dest: str, job, blob_store=None):
+    """
+    复制单个文件（dest不能已存在），保留修改时间
+
+    去重模式下内容已在blob存储中的文件直接硬链接到blob，不复制数据；
+    否则依次尝试reflink克隆、copy_file_range和按块读写。
+    """
+    digest = blob_store.read_tag(src) if blob_store is not None else None
+    if digest:
+        blob = blob_store.lookup(digest, os.path.getsize(src))
+        if blob is not None:
+            blob_store.link(blob, dest)
+            job.advance(size=os.path.getsize(dest), current=src)
+            return
+
+    with open(src, 'rb') as fsrc:
+        # 独占创建目标，已存在时抛出 FileExistsError（此时不能进入下面的清理，否则会删除别人的文件）
+        fdst = open(dest, 'xb')
+        completed = False
+        try:
+            with fdst:
+                size = os.fstat(fsrc.fileno()).st_size
+                if _clone(fsrc, fdst):
+                    job.advance(items=0, size=size, current=src)
+                elif not _copy_range(fsrc, fdst, size, src, job):
+                    _copy_chunks(fsrc, fdst, src, job)
+            shutil.copystat(src, dest)
+            completed = True
+        finally:
+            if not completed:
+                try:
+                    os.remove(dest)
+                except OSError:
+                    pass
+    job.advance(current=src)
+
+
+def copy_tree(src: str, dest: str, job, blob_store=None):
+    """复制文件或目录（递归）到dest（dest不能已存在），符号链接按链接本身复制"""
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+        job.advance(current=src)
+        return
+    if not os.path.isdir(src):
+        copy_file(src, dest, job, blob_store)
+        return
+
+    os.mkdir(dest)
+    job.advance(current=src)
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dest, os.path.relpath(root, src))
+        for name in dirs:
+            src_path = os.path.join(root, name)
+            try:
+                if os.path.islink(src_path):
+                    os.symlink(os.readlink(src_path), os.path.join(target_root, name))
+                else:
+                    os.mkdir(os.path.join(target_root, name))
+            except OSError as e:
+                job.record_error(src_path, e)
+                # 目标目录创建失败时不再进入该子树
+                if not os.path.isdir(os.path.join(target_root, name)):
+                    dirs.remove(name)
+            job.advance(current=src_path)
+        for name in files:
+            src_path = os.path.join(root, name)
+            try:
+                if os.path.islink(src_path):
+                    os.symlink(os.readlink(src_path), os.path.join(target_root, name))
+                    job.advance(current=src_path)
+                else:
+                    copy_file(src_path, os.path.join(target_root, name), job, blob_store)
+            except OSError as e:
+                job.record_error(src_path, e)
+                job.advance(current=src_path)
+        try:
+            shutil.copystat(root, target_root)
+        except OSError:
+            pass
+
+
+def move_path(src: str, dest: str, job, blob_store=None):
+    """
+    移动文件或目录到dest（dest已存在时抛出 FileExistsError，不会覆盖）
+
+    同一文件系统内直接rename（整个源路径计为一个条目）；跨文件系统时先复制再删除源路径。
+    """
+    try:
+        FileUtils.rename_noreplace(src, dest)
+        job.advance(current=src)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copy_tree(src, dest, job, blob_store)
+    delete_tree(src, job, blob_store)
+
+
+def run_transfer(sources: List[str], dest_dir: str, job, operation: Callable[[str, str, object], None],
+                 on_done: Optional[Callable[[str, Optional[str]], None]] = None,
+                 exists: Callable[[str], bool] = os.path.lexists) -> List[str]:
+    """
+    把多个源路径复制或移动到目标目录
+
+    Args:
+        sources: 源路径列表
+        dest_dir (str): 目标目录
+        job: 任务对象
+        operation: operation(源路径, 目标路径, job)，如存储后端的 copy 或 move
+        on_done: 每个源路径处理完成后的回调，参数为(源路径, 目标路径)，未能创建目标时目标路径为None
+        exists: 检查路径是否存在（存储后端的 lexists）
+
+    Returns:
+        List[str]: 生成的目标路径
+    """
+    targets = []
+    for src in sources:
+        job.checkpoint()
+        attempted = []
+
+        def create(path: str):
+            # 操作的第一步独占地创建目标（mkdir、open(..., 'xb')、link等），
+            # 目标名已被占用时抛出 FileExistsError，由 claim_unique_path 换下一个名字
+            attempted.append(path)
+            operation(src, path, job)
+
+        try:
+            FileUtils.claim_unique_path(dest_dir, os.path.basename(src.rstrip(os.sep)), create, exists)
+        except OSError as e:
+            job.record_error(src, e)
+        finally:
+            dest = attempted[-1] if attempted else None
+            if dest is not None and exists(dest):
+                targets.append(dest)
+            if on_done is not None:
+                on_done(src, dest)
+    return targets
@@ -0,0 +1,423 @@
+"""
+文件传输模块
+
+为 /download 提供完整的HTTP文件服务能力：
+- 单区间、多区间（multipart/byteranges）Range 请求及 If-Range
+- 基于 inode+大小+修改时间 的稳定 ETag 与 Last-Modified，支持 If-None-Match / If-Modified-Since 返回304
+- If-Match / If-Unmodified-Since 前置条件检查
+- 响应体尽量零拷贝：在本项目的请求处理器下使用 os.sendfile 直接从文件写入socket；
+  在提供 wsgi.file_wrapper 的服务器（如gunicorn）下完整文件交给服务器处理；否则用 os.pread 分块读取
+- 启用带宽限速时（environ中有限速句柄）按数据块申请额度后再发送，不交给服务器的file_wrapper
+- 可压缩类型按 Accept-Encoding 返回压缩内容：有预压缩副本时发送副本（同样使用sendfile），否则边读取边压缩
+- 不在本地文件系统中的文件（对象存储）通过存储后端按区间读取，ETag 使用对象自身的ETag
+"""
+import os
+import mimetypes
+import unicodedata
+import uuid
+from typing import List, Optional, Tuple, Iterator, Union
+from urllib.parse import quote
+
+from flask import Response
+from werkzeug.http import http_date, parse_date
+from werkzeug.serving import WSGIRequestHandler
+
+from bandwidth import TRANSFER_ENVIRON_KEY
+from content_encoding import CompressingBody, variant_etag
+
+# 请求处理器在environ中提供的sendfile回调
+SENDFILE_ENVIRON_KEY = 'fileserver.sendfile'
+
+READ_CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 32
+
+
+class SendfileRequestHandler(WSGIRequestHandler):
+    """支持 os.sendfile 零拷贝输出的请求处理器"""
+
+    def make_environ(self):
+        environ = super().make_environ()
+        if hasattr(os, 'sendfile') and type(self.connection).__name__ == 'socket':
+            environ[SENDFILE_ENVIRON_KEY] = self._sendfile
+        return environ
+
+    def _sendfile(self, fd: int, offset: int, count: int):
+        """把文件区间直接写入socket"""
+        socket_fd = self.connection.fileno()
+        while count > 0:
+            sent = os.sendfile(socket_fd, fd, offset, count)
+            if sent == 0:
+                raise ConnectionError('客户端连接已断开')
+            offset += sent
+            count -= sent
+
+
+def make_etag(st: os.stat_result) -> str:
+    """根据inode、大小和修改时间生成强ETag；对象存储的元数据带有对象自身的ETag时直接使用"""
+    etag = getattr(st, 'etag', None)
+    if etag:
+        etag = etag.strip('"')
+        return f'"{etag}"'
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    解析Range请求头
+
+    Returns:
+        Optional[List[Tuple[int, int]]]: 闭区间列表；空列表表示不可满足（416）；
+        None 表示请求头无效或区间过多，应忽略Range返回完整文件
+    """
+    if not header or not header.strip().lower().startswith('bytes='):
+        return None
+
+    ranges = []
+    try:
+        for spec in header.strip()[6:].split(','):
+            spec = spec.strip()
+            if not spec:
+                continue
+            start_str, sep, end_str = spec.partition('-')
+            if not sep:
+                return None
+            if not start_str:
+                # 后缀区间：最后N个字节
+                length = int(end_str)
+                if length <= 0 or size == 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(start_str)
+            end = int(end_str) if end_str else None
+            if start < 0 or (end is not None and end < start):
+                return None
+            if start >= size:
+                continue
+            if end is None:
+                end = size - 1
+            ranges.append((start, min(end, size - 1)))
+    except ValueError:
+        return None
+
+    if len(ranges) > MAX_RANGES:
+        # 区间过多时先合并，仍然过多则忽略Range
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        if len(merged) > MAX_RANGES:
+            return None
+        ranges = merged
+    return ranges
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    """比较ETag：弱比较忽略两边的 W/ 前缀，强比较时弱ETag不匹配任何值"""
+    if weak:
+        etag = etag[2:] if etag.startswith('W/') else etag
+    elif etag.startswith('W/'):
+        return any(candidate.strip() == '*' for candidate in header.split(','))
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if weak:
+            candidate = candidate[2:] if candidate.startswith('W/') else candidate
+        if candidate == etag:
+            return True
+    return False
+
+
+def _if_range_matches(if_range: str, etag: str, last_modified: int) -> bool:
+    """If-Range 只允许强ETag比较或与Last-Modified完全相等的日期"""
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == last_modified
+
+
+def content_disposition(filename: str, as_attachment: bool) -> str:
+    """生成Content-Disposition头，非ASCII文件名使用RFC 5987编码"""
+    value = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        simple = simple.replace('\\', '\\\\').replace('"', '\\"')
+        quoted = quote(filename, safe="!#$&+^`|~")
+        return f'{value}; filename="{simple}"; filename*=UTF-8\'\'{quoted}'
+    escaped = filename.replace('\\', '\\\\').replace('"', '\\"')
+    return f'{value}; filename="{escaped}"'
+
+
+class FileBody:
+    """
+    文件响应体
+
+    由若干片段组成：bytes 片段原样输出，(offset, length) 片段从文件读取。
+    文件片段在支持时通过sendfile直接写入socket，否则分块读取。
+    sendfile 发送的数据不经过迭代，因此由响应体自己统计已发送字节数（bytes_sent），
+    关闭时通过 on_close 回调通知（见 metrics.MetricsMiddleware）。
+    启用带宽限速时每个数据块发送前向限速句柄申请额度。
+    """
+
+    def __init__(self, fd: int, parts: List[Union[bytes, Tuple[int, int]]], environ: dict):
+        self.fd = fd
+        self.parts = parts
+        self.sendfile = environ.get(SENDFILE_ENVIRON_KEY)
+        self.transfer = environ.get(TRANSFER_ENVIRON_KEY)
+        self.bytes_sent = 0
+        self.on_close = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                self.bytes_sent += len(part)
+                continue
+            offset, length = part
+            if self.sendfile is not None:
+                # 先让服务器发送响应头和此前的数据，再把文件区间直接写入socket
+                yield b''
+                step = length if self.transfer is None else self.transfer.chunk_size
+                while length > 0:
+                    count = min(step, length)
+                    if self.transfer is not None:
+                        self.transfer.consume(count)
+                    self.sendfile(self.fd, offset, count)
+                    offset += count
+                    length -= count
+                    self.bytes_sent += count
+                continue
+            step = READ_CHUNK_SIZE if self.transfer is None else min(READ_CHUNK_SIZE, self.transfer.chunk_size)
+            while length > 0:
+                data = os.pread(self.fd, min(step, length), offset)
+                if not data:
+                    break
+                offset += len(data)
+                length -= len(data)
+                if self.transfer is not None:
+                    self.transfer.consume(len(data))
+                yield data
+                self.bytes_sent += len(data)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.on_close is not None:
+            on_close, self.on_close = self.on_close, None
+            on_close(self.bytes_sent)
+
+
+class StorageBody:
+    """
+    存储后端（对象存储）中文件的响应体
+
+    与 FileBody 的片段格式相同，(offset, length) 片段通过 storage.open_range 读取。
+    同样自己统计已发送字节数并在关闭时调用 on_close，指标和准入控制中间件按相同方式处理。
+    """
+
+    def __init__(self, storage, path: str, parts: List[Union[bytes, Tuple[int, int]]], environ: dict):
+        self.storage = storage
+        self.path = path
+        self.parts = parts
+        self.transfer = environ.get(TRANSFER_ENVIRON_KEY)
+        self.bytes_sent = 0
+        self.on_close = None
+        self._reader = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                self.bytes_sent += len(part)
+                continue
+            self._reader = self.storage.open_range(self.path, *part)
+            for data in self._reader:
+                if self.transfer is None:
+                    yield data
+                    self.bytes_sent += len(data)
+                    continue
+                # 分段可能较大，按限速的数据块大小申请额度后发送
+                step = self.transfer.chunk_size
+                for start in range(0, len(data), step):
+                    piece = data[start:start + step]
+                    self.transfer.consume(len(piece))
+                    yield piece
+                    self.bytes_sent += len(piece)
+            self._reader = None
+
+    def close(self):
+        if self._reader is not None:
+            # 提前结束时取消尚未完成的预取
+            self._reader.close()
+            self._reader = None
+        if self.on_close is not None:
+            on_close, self.on_close = self.on_close, None
+            on_close(self.bytes_sent)
+
+
+def send_file_range(file_path: str, request, as_attachment: bool = True,
+                    download_name: Optional[str] = None, cache_control: str = 'private, no-cache',
+                    range_limit: Optional[Tuple[int, Optional[int]]] = None, encoder=None,
+                    storage=None) -> Response:
+    """
+    发送文件，处理条件请求和Range请求
+
+    Args:
+        file_path (str): 文件绝对路径
+        request: 当前请求对象
+        as_attachment (bool): 是否作为附件下载
+        download_name (str): 下载文件名，默认为文件本身的名字
+        cache_control (str): Cache-Control 响应头
+        range_limit: 只允许下载的字节区间 (start, end)，end为None表示到文件末尾；
+            未带Range的请求返回该区间，超出区间的Range请求返回403
+        encoder: content_encoding.ContentEncoder，为None时不压缩；Range请求和限定了区间的请求不压缩
+        storage: 存储后端，为None或本地文件系统时直接读取文件；其他后端通过 open_range 读取，不压缩
+    """
+    if storage is not None and not storage.is_local:
+        fd = None
+        st = storage.stat(file_path)
+        encoder = None
+    else:
+        fd = os.open(file_path, os.O_RDONLY)
+    # 响应体接管文件描述符后由响应体负责关闭
+    handed_off = False
+    try:
+        if fd is not None:
+            st = os.fstat(fd)
+        size = st.st_size
+        etag = make_etag(st)
+        last_modified = int(st.st_mtime)
+
+        mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': cache_control,
+            'Content-Disposition': content_disposition(download_name or os.path.basename(file_path), as_attachment)
+        }
+
+        # 内容编码协商（压缩内容是同一资源的另一种表示，使用不同的ETag）
+        encoding = None
+        if encoder is not None and range_limit is None and encoder.is_compressible(file_path, mimetype, size):
+            headers['Vary'] = 'Accept-Encoding'
+            if request.method in ('GET', 'HEAD') and not request.headers.get('Range'):
+                encoding = encoder.negotiate(request.headers.get('Accept-Encoding', ''))
+                if encoding is not None:
+                    etag = variant_etag(etag, encoding)
+                    headers['ETag'] = etag
+
+        # 前置条件
+        if_match = request.headers.get('If-Match')
+        if if_match and not _etag_matches(if_match, etag, weak=False):
+            return Response(status=412, headers=headers)
+        if_unmodified_since = parse_date(request.headers.get('If-Unmodified-Since'))
+        if not if_match and if_unmodified_since and last_modified > if_unmodified_since.timestamp():
+            return Response(status=412, headers=headers)
+
+        # 条件GET
+        if request.method in ('GET', 'HEAD'):
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match:
+                not_modified = _etag_matches(if_none_match, etag, weak=True)
+            else:
+                if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+                not_modified = bool(if_modified_since) and last_modified <= if_modified_since.timestamp()
+            if not_modified:
+                headers.pop('Content-Disposition')
+                return Response(status=304, headers=headers)
+
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            sidecar_fd = encoder.open_sidecar(file_path, st, encoding)
+            if sidecar_fd is None:
+                # 边读取边压缩，长度未知
+                if request.method == 'HEAD':
+                    return Response(status=200, headers=headers, content_type=mimetype)
+                body = CompressingBody(fd, encoder.compressor(encoding), request.environ)
+                handed_off = True
+                return Response(body, status=200, headers=headers, content_type=mimetype, direct_passthrough=True)
+            # 改为发送预压缩副本（没有Range，下面按完整文件处理）
+            os.close(fd)
+            fd = sidecar_fd
+            size = os.fstat(fd).st_size
+
+        # Range请求（If-Range不匹配时返回完整文件）
+        ranges = None
+        range_header = request.headers.get('Range')
+        if range_header and request.method in ('GET', 'HEAD'):
+            if _if_range_matches(request.headers.get('If-Range', '').strip(), etag, last_modified):
+                ranges = parse_range_header(range_header, size)
+
+        if range_limit is not None and ranges != []:
+            limit_start = range_limit[0]
+            limit_end = size - 1 if range_limit[1] is None else min(range_limit[1], size - 1)
+            if limit_start > limit_end:
+                ranges = []
+            elif ranges is None:
+                if (limit_start, limit_end) != (0, size - 1):
+                    ranges = [(limit_start, limit_end)]
+            elif any(start < limit_start or end > limit_end for start, end in ranges):
+                return Response(status=403, headers={'Cache-Control': 'no-store'})
+
+        if ranges == []:
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers)
+
+        if ranges is None:
+            status = 200
+            parts = [(0, size)] if size else []
+            content_type = mimetype
+            content_length = size
+        elif len(ranges) == 1:
+            status = 206
+            start, end = ranges[0]
+            parts = [(start, end - start + 1)]
+            content_type = mimetype
+            content_length = end - start + 1
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            status = 206
+            boundary = uuid.uuid4().hex
+            parts = []
+            for start, end in ranges:
+                parts.append((f'\r\n--{boundary}\r\n'
+                              f'Content-Type: {mimetype}\r\n'
+                              f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode('latin-1'))
+                parts.append((start, end - start + 1))
+            parts.append(f'\r\n--{boundary}--\r\n'.encode('latin-1'))
+            content_type = f'multipart/byteranges; boundary={boundary}'
+            content_length = sum(len(part) if isinstance(part, bytes) else part[1] for part in parts)
+
+        headers['Content-Length'] = str(content_length)
+
+        if request.method == 'HEAD':
+            return Response(status=status, headers=headers, content_type=content_type)
+
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if fd is None:
+            body = StorageBody(storage, file_path, parts, request.environ)
+        elif (status == 200 and parts and SENDFILE_ENVIRON_KEY not in request.environ
+                and TRANSFER_ENVIRON_KEY not in request.environ and file_wrapper is not None):
+            # 完整文件交给服务器的file_wrapper（如gunicorn会使用sendfile）；
+            # file_wrapper 会一直读到文件末尾，Range响应只能由 FileBody 按区间长度发送
+            file_obj = os.fdopen(fd, 'rb')
+            handed_off = True
+            body = file_wrapper(file_obj, READ_CHUNK_SIZE)
+        else:
+            body = FileBody(fd, parts, request.environ)
+            handed_off = True
+
+        return Response(body, status=status, headers=headers, content_type=content_type,
+                        direct_passthrough=True)
+    finally:
+        if not handed_off and fd is not None:
+            os.close(fd)
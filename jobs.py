@@ -0,0 +1,346 @@
+"""
+后台任务模块
+
+耗时的文件操作（递归删除、移动、复制及多选批量操作）不在请求中执行：
+请求只创建任务并立即返回任务ID，任务在每个工作进程内有界的线程池中执行。
+
+- 任务状态保存在 .fileserver/jobs/<job_id>.json，任何工作进程都能查询
+- 执行中的任务定期写回进度（条目数、字节数、当前路径）和失败条目
+- 取消请求写入 <job_id>.cancel 标记，执行任务的进程在处理条目的间隙检查标记并尽快停止
+- 执行任务的进程退出后仍未结束的任务视为中断（interrupted）
+- 已结束的任务保留一段时间后清理
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled', 'interrupted')
+
+# 每个任务最多记录的失败条目数（总数另行统计）
+MAX_RECORDED_ERRORS = 100
+
+
+class JobError(Exception):
+    """任务错误，附带HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+    pass
+
+
+class Job:
+    """执行中的任务：汇报进度、记录失败条目、响应取消"""
+
+    # 进度写回和取消检查的最小间隔（秒）
+    CHECKPOINT_INTERVAL = 0.5
+
+    def __init__(self, manager: 'JobManager', record: Dict[str, Any]):
+        self.manager = manager
+        self.record = record
+        self._last_checkpoint = time.monotonic()
+
+    @property
+    def id(self) -> str:
+        return self.record['job_id']
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self.record['params']
+
+    @property
+    def user_id(self) -> str:
+        return self.record['user_id']
+
+    def set_total(self, items: int, size: int):
+        """设置需要处理的条目总数和总字节数"""
+        progress = self.record['progress']
+        progress['total_items'] = items
+        progress['total_bytes'] = size
+        self.checkpoint(force=True)
+
+    def advance(self, items: int = 1, size: int = 0, current: Optional[str] = None):
+        """记录已处理的条目和字节数，必要时写回进度并检查是否已取消"""
+        progress = self.record['progress']
+        progress['done_items'] += items
+        progress['done_bytes'] += size
+        if current is not None:
+            progress['current'] = current
+        self.checkpoint()
+
+    def record_error(self, path: str, error: Exception):
+        """记录失败的条目，操作继续处理其余条目"""
+        self.record['error_count'] += 1
+        if len(self.record['errors']) < MAX_RECORDED_ERRORS:
+            message = error.strerror if isinstance(error, OSError) and error.strerror else str(error)
+            self.record['errors'].append({'path': path, 'error': message})
+
+    def set_result(self, **result):
+        self.record['result'].update(result)
+
+    def checkpoint(self, force: bool = False):
+        """
+        定期写回进度并检查取消标记
+
+        Raises:
+            JobCancelled: 任务已被取消
+        """
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < self.CHECKPOINT_INTERVAL:
+            return
+        self._last_checkpoint = now
+        self.manager._write(self.record)
+        if self.manager.cancel_requested(self.id):
+            raise JobCancelled()
+
+
+class JobManager:
+    """任务管理器：提交、执行、查询和取消任务"""
+
+    def __init__(self, state_dir: str, workers: int = 2, max_pending: int = 100, retention: int = 24 * 3600):
+        """
+        初始化任务管理器（线程池在首次提交任务时创建）
+
+        Args:
+            state_dir (str): 任务状态目录
+            workers (int): 每个进程同时执行的任务数
+            max_pending (int): 每个进程排队和执行中的任务上限，超过时拒绝新任务
+            retention (int): 已结束任务的保留时间（秒）
+        """
+        self.state_dir = state_dir
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._last_cleanup = 0.0
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 状态文件
+    # ------------------------------------------------------------------
+    def _job_path(self, job_id: str, suffix: str = '.json') -> str:
+        # job_id 来自URL，只接受uuid格式，防止路径穿越
+        try:
+            job_id = uuid.UUID(job_id).hex
+        except (ValueError, AttributeError):
+            raise JobError('任务不存在', 404)
+        return os.path.join(self.state_dir, job_id + suffix)
+
+    def _write(self, record: Dict[str, Any]):
+        record['updated_at'] = time.time()
+        path = self._job_path(record['job_id'])
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, job_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise JobError('任务不存在', 404)
+        if record['status'] not in FINISHED_STATES and not self._process_alive(record.get('pid')):
+            # 执行任务的工作进程已退出（重启、崩溃或升级）
+            record['status'] = 'interrupted'
+            record['message'] = '执行任务的进程已退出'
+        return record
+
+    @staticmethod
+    def _process_alive(pid: Optional[int]) -> bool:
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _check_owner(record: Dict[str, Any], user_id: str, is_admin: bool):
+        if not is_admin and record.get('user_id') != user_id:
+            raise JobError('无权访问该任务', 403)
+
+    @staticmethod
+    def describe(record: Dict[str, Any]) -> Dict[str, Any]:
+        """对外返回的任务信息"""
+        progress = dict(record['progress'])
+        if progress['total_bytes']:
+            progress['percent'] = min(100.0, round(progress['done_bytes'] * 100 / progress['total_bytes'], 1))
+        elif progress['total_items']:
+            progress['percent'] = min(100.0, round(progress['done_items'] * 100 / progress['total_items'], 1))
+        else:
+            progress['percent'] = 100.0 if record['status'] == 'completed' else 0.0
+        return {
+            'job_id': record['job_id'],
+            'type': record['type'],
+            'status': record['status'],
+            'user_id': record['user_id'],
+            'params': record['params'],
+            'progress': progress,
+            'result': record['result'],
+            'error_count': record['error_count'],
+            'errors': record['errors'],
+            'message': record.get('message', ''),
+            'created_at': record['created_at'],
+            'started_at': record.get('started_at'),
+            'finished_at': record.get('finished_at')
+        }
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return os.path.exists(self._job_path(job_id, '.cancel'))
+
+    # ------------------------------------------------------------------
+    # 任务操作
+    # ------------------------------------------------------------------
+    def submit(self, job_type: str, user_id: str, params: Dict[str, Any],
+               func: Callable[[Job], None]) -> Dict[str, Any]:
+        """
+        提交任务，立即返回任务信息
+
+        Args:
+            job_type (str): 任务类型（delete/move/copy）
+            user_id (str): 提交任务的用户
+            params (Dict[str, Any]): 任务参数（原样保存，供查询）
+            func: 执行任务的函数，参数为 Job
+
+        Raises:
+            JobError: 任务队列已满
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobError('任务队列已满，请稍后重试', 503)
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job-worker')
+        record = {
+            'job_id': uuid.uuid4().hex,
+            'type': job_type,
+            'status': 'queued',
+            'user_id': user_id,
+            'params': params,
+            'pid': os.getpid(),
+            'progress': {'total_items': 0, 'done_items': 0, 'total_bytes': 0, 'done_bytes': 0, 'current': ''},
+            'result': {},
+            'error_count': 0,
+            'errors': [],
+            'created_at': time.time()
+        }
+        # 提交后执行线程会修改 record，先取得提交时的任务信息
+        result = self.describe(record)
+        try:
+            self._write(record)
+            self._executor.submit(self._run, record, func)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self.cleanup_expired()
+        return result
+
+    def _run(self, record: Dict[str, Any], func: Callable[[Job], None]):
+        job = Job(self, record)
+        try:
+            if self.cancel_requested(job.id):
+                raise JobCancelled()
+            record['status'] = 'running'
+            record['started_at'] = time.time()
+            self._write(record)
+            func(job)
+            if record['error_count']:
+                record['status'] = 'failed'
+                record['message'] = f"{record['error_count']} 个条目处理失败"
+            else:
+                record['status'] = 'completed'
+        except JobCancelled:
+            record['status'] = 'cancelled'
+            record['message'] = '任务已取消'
+        except Exception as e:
+            record['status'] = 'failed'
+            record['message'] = str(e)
+        finally:
+            record['finished_at'] = time.time()
+            try:
+                self._write(record)
+                try:
+                    os.remove(self._job_path(job.id, '.cancel'))
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                print(f"写入任务状态失败: {e}")
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id: str, user_id: str, is_admin: bool = False) -> Dict[str, Any]:
+        """查询任务"""
+        record = self._read(job_id)
+        self._check_owner(record, user_id, is_admin)
+        return self.describe(record)
+
+    def list(self, user_id: str, is_admin: bool = False, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出用户的任务（管理员可以看到所有任务），最新的在前"""
+        records = []
+        for entry in os.scandir(self.state_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                record = self._read(entry.name[:-len('.json')])
+            except JobError:
+                continue
+            if is_admin or record.get('user_id') == user_id:
+                records.append(record)
+        records.sort(key=lambda record: record['created_at'], reverse=True)
+        return [self.describe(record) for record in records[:limit]]
+
+    def cancel(self, job_id: str, user_id: str, is_admin: bool = False) -> Dict[str, Any]:
+        """
+        请求取消任务（执行任务的进程在处理下一个条目前停止）
+
+        Raises:
+            JobError: 任务不存在、无权访问或已结束
+        """
+        record = self._read(job_id)
+        self._check_owner(record, user_id, is_admin)
+        if record['status'] in FINISHED_STATES:
+            raise JobError('任务已结束', 409)
+        with open(self._job_path(job_id, '.cancel'), 'w'):
+            pass
+        result = self.describe(record)
+        result['cancel_requested'] = True
+        return result
+
+    def cleanup_expired(self):
+        """清理超过保留时间的已结束任务（最多每分钟执行一次）"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        deadline = now - self.retention
+        for entry in os.scandir(self.state_dir):
+            try:
+                if entry.stat().st_mtime >= deadline:
+                    continue
+                if entry.name.endswith('.json'):
+                    if self._read(entry.name[:-len('.json')])['status'] not in FINISHED_STATES:
+                        continue
+                os.remove(entry.path)
+            except (OSError, JobError):
+                continue
+
+    def shutdown(self):
+        """进程退出前取消尚未开始的任务"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
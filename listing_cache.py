@@ -0,0 +1,107 @@
+"""
+目录列表缓存
+
+文件列表页面和 /api/list 的响应体按目录缓存在进程内，目录未变化时直接返回缓存，浏览器带 If-None-Match 时返回304：
+- 目录状态由目录本身的 inode、修改时间和失效标记组成，获取状态只需要两次stat，不读取目录条目
+- 目录中新增、删除、重命名条目会改变目录的修改时间；条目本身的变化（如子目录的修改时间）不会，
+  因此上传、删除、新建文件夹等操作通过失效标记显式失效所在目录及其上级目录
+- 失效标记是 .fileserver/listing 下按目录命名的空文件，修改它的时间戳即可让所有工作进程的缓存和已发出的ETag失效
+- 缓存按条目数和响应体总大小做LRU淘汰
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+DirState = Tuple[int, int, int]
+
+
+class ListingCache:
+    """按目录状态校验的目录列表响应缓存（每个工作进程一份）"""
+
+    def __init__(self, root: str, stamp_dir: str, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024):
+        """
+        Args:
+            root (str): 上传目录
+            stamp_dir (str): 失效标记目录（所有工作进程共享）
+            max_entries (int): 缓存的响应体数量上限
+            max_bytes (int): 缓存的响应体总大小上限（字符数）
+        """
+        self.root = root
+        self.stamp_dir = stamp_dir
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.stamp_dir, exist_ok=True)
+
+    def _stamp_path(self, path: str) -> str:
+        rel = os.path.relpath(os.path.normpath(path), self.root)
+        return os.path.join(self.stamp_dir, hashlib.sha1(os.fsencode(rel)).hexdigest())
+
+    def state(self, path: str) -> Optional[DirState]:
+        """目录的当前状态 (inode, 修改时间, 失效标记)，目录不存在时返回None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isdir(path):
+            return None
+        try:
+            stamp = os.stat(self._stamp_path(path)).st_mtime_ns
+        except FileNotFoundError:
+            stamp = 0
+        return st.st_ino, st.st_mtime_ns, stamp
+
+    @staticmethod
+    def etag(state: DirState, key: Tuple) -> str:
+        """由目录状态和表示（页面或查询参数）得出的ETag值（不含引号，作为弱ETag使用）"""
+        variant = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        return f'{state[0]:x}-{state[1]:x}-{state[2]:x}-{variant}'
+
+    def get(self, key: Tuple, state: DirState) -> Optional[str]:
+        """获取与目录当前状态一致的缓存响应体"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != state:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Tuple, state: DirState, body: str):
+        """保存响应体（state 为生成前获取的目录状态），超过上限时淘汰最久未使用的条目"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[key] = (state, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def invalidate(self, path: str):
+        """路径新增、删除或修改后，使其所在目录和上级目录的列表失效（所有工作进程）"""
+        parent = os.path.dirname(os.path.normpath(path))
+        for directory in (parent, os.path.dirname(parent)):
+            if os.path.relpath(directory, self.root).startswith(os.pardir):
+                break
+            stamp = self._stamp_path(directory)
+            now = time.time_ns()
+            try:
+                os.utime(stamp, ns=(now, now))
+            except FileNotFoundError:
+                try:
+                    with open(stamp, 'a'):
+                        pass
+                except OSError as e:
+                    print(f"目录列表缓存失效失败: {directory}: {e}")
+            except OSError as e:
+                print(f"目录列表缓存失效失败: {directory}: {e}")
+            if directory == self.root:
+                break
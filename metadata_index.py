@@ -0,0 +1,747 @@
+"""
+文件元数据索引模块
+
+使用SQLite在上传目录下维护一份持久化的文件元数据索引（路径、大小、修改时间、扩展名、父目录），
+统计类接口直接通过索引上的聚合查询返回结果，无需每次遍历整个目录树。
+
+索引的维护方式：
+- 首次启动时在后台线程中全量构建
+- 上传、删除、创建文件夹等路由主动调用 add_path / remove_path 增量更新
+- 安装了 watchdog 时监听文件系统事件；否则定期按目录修改时间进行增量对账
+- 多进程部署时各工作进程共享同一份索引，构建和对账通过文件锁保证同一时间只有一个进程执行
+
+文件名搜索使用FTS5的trigram分词为文件名和相对路径建立全文索引，由触发器与entries表保持同步，
+子串和通配符查询直接查找trigram倒排表；SQLite不支持trigram时退化为扫描entries表。
+"""
+import os
+import stat
+import fcntl
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from metrics import timed
+from utils import FileUtils
+
+
+class MetadataIndex:
+    """上传目录的元数据索引"""
+
+    BATCH_SIZE = 5000
+
+    def __init__(self, root: str, db_path: Optional[str] = None, reconcile_interval: int = 300):
+        """
+        初始化元数据索引
+
+        Args:
+            root (str): 被索引的上传目录
+            db_path (str): 索引数据库路径，默认为上传目录下的内部数据目录
+            reconcile_interval (int): 对账间隔（秒），小于等于0表示不定期对账
+        """
+        self.root = os.path.abspath(root)
+        self.db_path = db_path or os.path.join(FileUtils.get_internal_dir(self.root), 'index.db')
+        self.reconcile_interval = reconcile_interval
+        self.ready = False
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._observer = None
+        self.fts_enabled = False
+        self._init_schema()
+
+    # ------------------------------------------------------------------
+    # 数据库连接与表结构
+    # ------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # INSERT OR REPLACE 替换旧记录时也要触发删除触发器，保持全文索引同步
+            conn.execute('PRAGMA recursive_triggers=ON')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        """创建索引表"""
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    path TEXT PRIMARY KEY,
+                    parent TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    top TEXT NOT NULL,
+                    is_dir INTEGER NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    mtime REAL NOT NULL DEFAULT 0,
+                    ext TEXT NOT NULL DEFAULT ''
+                )
+            ''')
+            # 目录列表按父目录分页，各排序方式都有对应的覆盖索引
+            conn.execute('DROP INDEX IF EXISTS idx_entries_parent')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_parent_name ON entries(parent, name)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_parent_mtime ON entries(parent, mtime, name)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_parent_size ON entries(parent, size, name)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_top ON entries(top, is_dir)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_ext ON entries(ext, is_dir)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._init_search_schema(conn)
+
+    def _init_search_schema(self, conn: sqlite3.Connection):
+        """创建文件名搜索使用的trigram全文索引及同步触发器"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'").fetchone()
+        try:
+            with conn:
+                conn.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts
+                    USING fts5(name, path, content='entries', tokenize='trigram')
+                ''')
+                self._create_search_triggers(conn)
+                if not exists:
+                    # 已有索引数据库升级时，从entries表重建全文索引
+                    conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(f"SQLite不支持FTS5 trigram，文件搜索将扫描索引表: {e}")
+            return
+        self.fts_enabled = True
+
+    @staticmethod
+    def _create_search_triggers(conn: sqlite3.Connection):
+        """创建保持全文索引与entries表同步的触发器"""
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, name, path) VALUES (new.rowid, new.name, new.path);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name, path)
+                VALUES ('delete', old.rowid, old.name, old.path);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF name, path ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name, path)
+                VALUES ('delete', old.rowid, old.name, old.path);
+                INSERT INTO entries_fts(rowid, name, path) VALUES (new.rowid, new.name, new.path);
+            END
+        ''')
+
+    @staticmethod
+    def _drop_search_triggers(conn: sqlite3.Connection):
+        """删除全文索引同步触发器（全量构建期间使用）"""
+        for trigger in ('entries_fts_insert', 'entries_fts_delete', 'entries_fts_update'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: Any):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    # ------------------------------------------------------------------
+    # 路径与记录
+    # ------------------------------------------------------------------
+    def relpath(self, abs_path: str) -> Optional[str]:
+        """将绝对路径转换为索引中使用的相对路径（以/分隔），不在索引范围内返回None"""
+        abs_path = os.path.abspath(abs_path)
+        if abs_path == self.root:
+            return ''
+        if not FileUtils.is_safe_path(self.root, abs_path):
+            return None
+        rel = os.path.relpath(abs_path, self.root).replace(os.sep, '/')
+        if rel.split('/', 1)[0] == FileUtils.INTERNAL_DIR:
+            return None
+        return rel
+
+    @staticmethod
+    def _make_row(rel: str, is_dir: bool, st: os.stat_result) -> Tuple:
+        parent, _, name = rel.rpartition('/')
+        if '/' in rel:
+            top = rel.split('/', 1)[0]
+        else:
+            top = name if is_dir else ''
+        if is_dir:
+            return (rel, parent, name, top, 1, 0, st.st_mtime, '')
+        ext = os.path.splitext(name)[1].lower()
+        return (rel, parent, name, top, 0, st.st_size, st.st_mtime, ext)
+
+    def _scan_tree(self, rel: str):
+        """遍历rel目录下的整个子树，生成索引记录（不包含rel本身）"""
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            current_abs = os.path.join(self.root, current) if current else self.root
+            try:
+                with os.scandir(current_abs) as it:
+                    for entry in it:
+                        if not current and entry.name == FileUtils.INTERNAL_DIR:
+                            continue
+                        child = f'{current}/{entry.name}' if current else entry.name
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        yield self._make_row(child, is_dir, st)
+                        if is_dir:
+                            stack.append(child)
+            except OSError:
+                continue
+
+    @staticmethod
+    def _insert_rows(conn: sqlite3.Connection, rows) -> int:
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= MetadataIndex.BATCH_SIZE:
+                conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            count += len(batch)
+        return count
+
+    @staticmethod
+    def _delete_subtree(conn: sqlite3.Connection, rel: str):
+        """删除rel及其所有子项的记录（利用主键范围查询，'0'是'/'的下一个字符）"""
+        conn.execute('DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)',
+                     (rel, rel + '/', rel + '0'))
+
+    # ------------------------------------------------------------------
+    # 构建与增量更新
+    # ------------------------------------------------------------------
+    @timed('index_build')
+    def build(self) -> int:
+        """全量重建索引，返回索引的条目数"""
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                if self.fts_enabled:
+                    # 全量构建时先停用逐行同步的触发器，插入完成后一次性重建全文索引
+                    self._drop_search_triggers(conn)
+                    conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('delete-all')")
+                conn.execute('DELETE FROM entries')
+                count = self._insert_rows(conn, self._scan_tree(''))
+                if self.fts_enabled:
+                    conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+                    self._create_search_triggers(conn)
+                self._set_meta(conn, 'root_mtime', os.stat(self.root).st_mtime)
+                self._set_meta(conn, 'built_at', time.time())
+        self.ready = True
+        return count
+
+    def add_path(self, abs_path: str):
+        """新增或更新一个文件/目录（目录会连同子树一起索引）"""
+        rel = self.relpath(abs_path)
+        if not rel:
+            return
+        try:
+            st = os.stat(abs_path, follow_symlinks=False)
+        except OSError:
+            self.remove_path(abs_path)
+            return
+        # 指向目录的符号链接按文件记录，不进入其子树
+        is_dir = stat.S_ISDIR(st.st_mode)
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                # 确保父目录链也在索引中；已有的父目录记录保持不变，
+                # 否则会用当前修改时间覆盖旧值，对账时误以为目录没有变化而漏掉绕过服务器的修改
+                parts = rel.split('/')
+                for i in range(1, len(parts)):
+                    parent_rel = '/'.join(parts[:i])
+                    try:
+                        parent_st = os.stat(os.path.join(self.root, parent_rel))
+                    except OSError:
+                        continue
+                    conn.execute('INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 self._make_row(parent_rel, True, parent_st))
+                conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             self._make_row(rel, is_dir, st))
+                if is_dir:
+                    self._insert_rows(conn, self._scan_tree(rel))
+
+    def remove_path(self, abs_path: str):
+        """删除一个文件/目录（目录会连同子树一起删除）"""
+        rel = self.relpath(abs_path)
+        if not rel:
+            return
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                self._delete_subtree(conn, rel)
+
+    def move_path(self, src_abs: str, dest_abs: str):
+        """处理重命名/移动"""
+        self.remove_path(src_abs)
+        self.add_path(dest_abs)
+
+    def _rescan_dir(self, conn: sqlite3.Connection, rel: str) -> List[str]:
+        """对比单个目录的直接子项与索引记录，返回仍存在的子目录列表"""
+        abs_dir = os.path.join(self.root, rel) if rel else self.root
+        indexed = {row[0]: row for row in conn.execute(
+            'SELECT name, is_dir, size, mtime FROM entries WHERE parent = ?', (rel,))}
+        seen = set()
+        rows = []
+        new_dirs = []
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    if not rel and entry.name == FileUtils.INTERNAL_DIR:
+                        continue
+                    child = f'{rel}/{entry.name}' if rel else entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    seen.add(entry.name)
+                    old = indexed.get(entry.name)
+                    if old is not None and old[1] == int(is_dir):
+                        if not is_dir and (old[2] != st.st_size or old[3] != st.st_mtime):
+                            rows.append(self._make_row(child, False, st))
+                        continue
+                    if old is not None:
+                        # 文件与目录类型发生变化，先删除旧记录
+                        self._delete_subtree(conn, child)
+                    rows.append(self._make_row(child, is_dir, st))
+                    if is_dir:
+                        new_dirs.append(child)
+        except OSError:
+            return []
+        for name, row in indexed.items():
+            if name not in seen:
+                self._delete_subtree(conn, f'{rel}/{name}' if rel else name)
+        self._insert_rows(conn, rows)
+        for child in new_dirs:
+            self._insert_rows(conn, self._scan_tree(child))
+        return [f'{rel}/{name}' if rel else name
+                for name, row in indexed.items() if row[1] and name in seen]
+
+    @timed('index_reconcile')
+    def reconcile(self):
+        """
+        按目录修改时间增量对账
+
+        只有修改时间发生变化的目录才会重新读取其直接子项；未变化的目录只需一次stat。
+        注意：原地改写文件内容不会改变目录修改时间，这类变化依赖文件系统监听或路由钩子更新。
+        """
+        if not self.ready:
+            self.build()
+            return
+        conn = self._connect()
+        dir_mtimes = dict(conn.execute('SELECT path, mtime FROM entries WHERE is_dir = 1'))
+        root_mtime = self._get_meta('root_mtime')
+        dir_mtimes[''] = float(root_mtime) if root_mtime is not None else None
+
+        stack = ['']
+        while stack and not self._stop_event.is_set():
+            rel = stack.pop()
+            abs_dir = os.path.join(self.root, rel) if rel else self.root
+            try:
+                st = os.stat(abs_dir)
+            except OSError:
+                continue
+            if dir_mtimes.get(rel) != st.st_mtime:
+                with self._write_lock:
+                    with conn:
+                        subdirs = self._rescan_dir(conn, rel)
+                        if rel:
+                            conn.execute('UPDATE entries SET mtime = ? WHERE path = ?', (st.st_mtime, rel))
+                        else:
+                            self._set_meta(conn, 'root_mtime', st.st_mtime)
+            else:
+                subdirs = [row[0] for row in conn.execute(
+                    'SELECT path FROM entries WHERE parent = ? AND is_dir = 1', (rel,))]
+            stack.extend(subdirs)
+
+    # ------------------------------------------------------------------
+    # 后台维护
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动后台线程：构建索引（若尚未构建）、文件系统监听和定期对账"""
+        thread = threading.Thread(target=self._run, name='metadata-index', daemon=True)
+        thread.start()
+        self._start_watcher()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    @contextmanager
+    def _maintenance_lock(self, blocking: bool = True) -> Iterator[bool]:
+        """多个工作进程共享同一份索引时，同一时间只由一个进程构建或对账"""
+        with open(self.db_path + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+
+    def _run(self):
+        try:
+            with self._maintenance_lock():
+                if self._get_meta('built_at') is None:
+                    self.build()
+                else:
+                    # 已有索引（或其他进程刚刚构建完成），先对账一次再对外提供服务
+                    self.ready = True
+                    self.reconcile()
+        except Exception as e:
+            print(f"构建文件索引失败: {e}")
+
+        while self.reconcile_interval > 0 and not self._stop_event.wait(self.reconcile_interval):
+            try:
+                with self._maintenance_lock(blocking=False) as acquired:
+                    # 其他进程正在对账时跳过本轮
+                    if acquired:
+                        self.reconcile()
+            except Exception as e:
+                print(f"文件索引对账失败: {e}")
+
+    def _start_watcher(self):
+        """使用watchdog监听文件系统变化（可选依赖）"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("watchdog 未安装，文件索引仅依赖路由更新和定期对账")
+            return
+
+        index = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                index.add_path(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    index.add_path(event.src_path)
+
+            def on_deleted(self, event):
+                index.remove_path(event.src_path)
+
+            def on_moved(self, event):
+                index.move_path(event.src_path, event.dest_path)
+
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), self.root, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+        except Exception as e:
+            self._observer = None
+            print(f"启动文件系统监听失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 目录列表
+    # ------------------------------------------------------------------
+    # 排序字段对应的列，与 FileUtils.list_sort_key 的排序键一一对应，两种实现的游标可以通用
+    SORT_COLUMNS = {
+        'name': ('name',),
+        'size': ('size', 'name'),
+        'mtime': ('mtime', 'name'),
+        'type': ('(1 - is_dir)', 'ext', 'name'),
+    }
+
+    def _refresh_dir(self, rel: str):
+        """目录修改时间与索引不一致时（如绕过路由直接改动了磁盘），先同步该目录的直接子项"""
+        abs_dir = os.path.join(self.root, rel) if rel else self.root
+        try:
+            st = os.stat(abs_dir)
+        except OSError:
+            return
+        if rel:
+            row = self._connect().execute('SELECT mtime FROM entries WHERE path = ?', (rel,)).fetchone()
+            indexed_mtime = row[0] if row else None
+        else:
+            root_mtime = self._get_meta('root_mtime')
+            indexed_mtime = float(root_mtime) if root_mtime is not None else None
+        if indexed_mtime == st.st_mtime:
+            return
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                self._rescan_dir(conn, rel)
+                if rel:
+                    conn.execute('UPDATE entries SET mtime = ? WHERE path = ?', (st.st_mtime, rel))
+                else:
+                    self._set_meta(conn, 'root_mtime', st.st_mtime)
+
+    @staticmethod
+    def _like_escape(text: str) -> str:
+        """转义LIKE模式中的通配符（配合 ESCAPE '\\' 使用）"""
+        return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    @staticmethod
+    def _type_condition(file_type: str, alias: str = '') -> Tuple[str, List[str]]:
+        """类型过滤（file/dir 或文件类型名称）对应的SQL条件和参数"""
+        if file_type == 'dir':
+            return f'{alias}is_dir = 1', []
+        if file_type == 'file':
+            return f'{alias}is_dir = 0', []
+        extensions = FileUtils.type_filter_extensions(file_type) or []
+        placeholders = ', '.join('?' * len(extensions))
+        if file_type == '其他':
+            return f'{alias}is_dir = 0 AND {alias}ext NOT IN ({placeholders})', extensions
+        if extensions:
+            return f'{alias}is_dir = 0 AND {alias}ext IN ({placeholders})', extensions
+        return '0', []
+
+    @timed('index_list_dir')
+    def list_dir(self, rel: str, sort: str = 'mtime', order: str = 'desc', prefix: str = '',
+                 file_type: str = '', cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """
+        分页获取目录列表（与 FileUtils.list_directory 返回格式一致）
+
+        使用键集分页：游标记录上一页最后一项的排序键，下一页从该键之后继续，
+        翻到第几页都只需一次索引范围扫描。
+        """
+        self._refresh_dir(rel)
+        columns = self.SORT_COLUMNS.get(sort, self.SORT_COLUMNS['mtime'])
+        descending = order == 'desc'
+
+        where = ['parent = ?']
+        params: List[Any] = [rel]
+        if prefix:
+            where.append("name LIKE ? ESCAPE '\\'")
+            params.append(self._like_escape(prefix) + '%')
+        if file_type:
+            condition, condition_params = self._type_condition(file_type)
+            where.append(condition)
+            params.extend(condition_params)
+
+        conn = self._connect()
+        file_count, dir_count = conn.execute(
+            f'SELECT COALESCE(SUM(is_dir = 0), 0), COALESCE(SUM(is_dir), 0) FROM entries WHERE {" AND ".join(where)}',
+            params).fetchone()
+
+        cursor_key = FileUtils.decode_cursor(cursor, FileUtils.list_sort_key(
+            sort if sort in self.SORT_COLUMNS else 'mtime', '', False, 0, 0.0))
+        if cursor_key is not None:
+            where.append(f'({", ".join(columns)}) {"<" if descending else ">"} ({", ".join("?" * len(columns))})')
+            params.extend(cursor_key)
+
+        direction = 'DESC' if descending else 'ASC'
+        rows = conn.execute(
+            f'SELECT name, is_dir, size, mtime FROM entries WHERE {" AND ".join(where)} '
+            f'ORDER BY {", ".join(f"{column} {direction}" for column in columns)} LIMIT ?',
+            params + [limit + 1]).fetchall()
+
+        page = rows[:limit]
+        abs_dir = os.path.join(self.root, rel) if rel else self.root
+        items = []
+        for name, is_dir, _, _ in page:
+            relative_path = f'{rel}/{name}' if rel else name
+            try:
+                st = os.stat(os.path.join(abs_dir, name))
+            except OSError:
+                st = None
+            items.append(FileUtils.build_list_item(name, relative_path, bool(is_dir), st))
+
+        next_cursor = None
+        if len(rows) > limit:
+            name, is_dir, size, mtime = page[-1]
+            next_cursor = FileUtils.encode_cursor(
+                FileUtils.list_sort_key(sort if sort in self.SORT_COLUMNS else 'mtime', name, bool(is_dir), size, mtime))
+
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'total': file_count + dir_count,
+            'file_count': file_count,
+            'dir_count': dir_count
+        }
+
+    # ------------------------------------------------------------------
+    # 搜索
+    # ------------------------------------------------------------------
+    SEARCH_SORT_COLUMNS = {
+        'name': ('e.name', 'e.path'),
+        'size': ('e.size', 'e.path'),
+        'mtime': ('e.mtime', 'e.path'),
+        'path': ('e.path',),
+    }
+
+    @timed('index_search')
+    def search(self, query: str = '', glob: str = '', under: str = '', file_type: str = '',
+               min_size: Optional[int] = None, max_size: Optional[int] = None,
+               modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+               sort: str = 'mtime', order: str = 'desc', cursor: Optional[str] = None,
+               limit: int = 50) -> Dict[str, Any]:
+        """
+        搜索文件和文件夹（与 FileUtils.search_files 返回格式一致）
+
+        Args:
+            query (str): 相对路径中包含的子串（不区分大小写）
+            glob (str): 文件名通配符，如 *.mp4（区分大小写）
+            under (str): 只搜索该目录（相对路径）下的子树
+            file_type (str): 类型过滤 file/dir 或文件类型名称
+            min_size / max_size (int): 文件大小范围（字节）
+            modified_after / modified_before (float): 修改时间范围（时间戳）
+            sort (str): 排序字段 name/size/mtime/path
+            order (str): asc 或 desc
+            cursor (str): 上一页返回的游标
+            limit (int): 每页条目数
+
+        Returns:
+            Dict[str, Any]: items 和 next_cursor
+        """
+        columns = self.SEARCH_SORT_COLUMNS.get(sort, self.SEARCH_SORT_COLUMNS['mtime'])
+        descending = order == 'desc'
+        where: List[str] = []
+        params: List[Any] = []
+        # 子串至少3个字符才能使用trigram索引，否则扫描entries表
+        use_fts = self.fts_enabled and (len(query) >= 3 or bool(glob))
+
+        if query:
+            if use_fts and len(query) >= 3:
+                where.append('entries_fts MATCH ?')
+                params.append('path : "' + query.replace('"', '""') + '"')
+            else:
+                where.append("e.path LIKE ? ESCAPE '\\'")
+                params.append('%' + self._like_escape(query) + '%')
+        if glob:
+            where.append(f'{"f" if use_fts else "e"}.name GLOB ?')
+            params.append(glob)
+        if under:
+            where.append('e.path >= ? AND e.path < ?')
+            params.extend([under + '/', under + '0'])
+        if file_type:
+            condition, condition_params = self._type_condition(file_type, 'e.')
+            where.append(condition)
+            params.extend(condition_params)
+        if min_size is not None:
+            where.append('e.size >= ?')
+            params.append(min_size)
+        if max_size is not None:
+            where.append('e.size <= ?')
+            params.append(max_size)
+        if modified_after is not None:
+            where.append('e.mtime >= ?')
+            params.append(modified_after)
+        if modified_before is not None:
+            where.append('e.mtime < ?')
+            params.append(modified_before)
+
+        cursor_key = FileUtils.decode_cursor(cursor, FileUtils.search_sort_key(
+            sort if sort in self.SEARCH_SORT_COLUMNS else 'mtime', '', '', 0, 0.0))
+        if cursor_key is not None:
+            where.append(f'({", ".join(columns)}) {"<" if descending else ">"} ({", ".join("?" * len(columns))})')
+            params.extend(cursor_key)
+
+        if use_fts:
+            source = 'entries_fts f JOIN entries e ON e.rowid = f.rowid'
+        else:
+            source = 'entries e'
+        direction = 'DESC' if descending else 'ASC'
+        rows = self._connect().execute(
+            f'SELECT e.path, e.name, e.is_dir, e.size, e.mtime FROM {source} '
+            f'WHERE {" AND ".join(where) or "1"} '
+            f'ORDER BY {", ".join(f"{column} {direction}" for column in columns)} LIMIT ?',
+            params + [limit + 1]).fetchall()
+
+        page = rows[:limit]
+        items = []
+        for path, name, is_dir, _, _ in page:
+            try:
+                st = os.stat(os.path.join(self.root, path))
+            except OSError:
+                # 索引尚未同步的已删除项，等待对账清理
+                continue
+            items.append(FileUtils.build_list_item(name, path, bool(is_dir), st))
+
+        next_cursor = None
+        if len(rows) > limit:
+            path, name, is_dir, size, mtime = page[-1]
+            next_cursor = FileUtils.encode_cursor(
+                FileUtils.search_sort_key(sort if sort in self.SEARCH_SORT_COLUMNS else 'mtime', path, name, size, mtime))
+
+        return {
+            'items': items,
+            'next_cursor': next_cursor
+        }
+
+    # ------------------------------------------------------------------
+    # 聚合查询
+    # ------------------------------------------------------------------
+    def get_file_stats(self) -> Dict[str, Any]:
+        """获取文件统计信息（与 FileUtils.get_file_stats 返回格式一致）"""
+        row = self._connect().execute('''
+            SELECT COALESCE(SUM(is_dir = 0), 0), COALESCE(SUM(is_dir), 0), COALESCE(SUM(size), 0)
+            FROM entries
+        ''').fetchone()
+        file_count, dir_count, total_size = row
+        return {
+            "file_count": file_count,
+            "dir_count": dir_count,
+            "total_size": total_size,
+            "total_size_formatted": FileUtils.format_size(total_size)
+        }
+
+    def subtree_usage(self, rel: str) -> Tuple[int, int]:
+        """统计rel及其所有子项的条目数和文件总字节数"""
+        row = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE path = ? OR (path >= ? AND path < ?)',
+            (rel, rel + '/', rel + '0')).fetchone()
+        return row[0], row[1]
+
+    def get_file_type_stats(self) -> Dict[str, Any]:
+        """获取文件类型统计信息（与 FileUtils.get_file_type_stats 返回格式一致）"""
+        file_type_stats = {}
+        total_size = 0
+        rows = self._connect().execute(
+            'SELECT ext, COUNT(*), SUM(size) FROM entries WHERE is_dir = 0 GROUP BY ext')
+        for ext, count, size in rows:
+            file_type = FileUtils.classify_file_type(ext)
+            stats = file_type_stats.setdefault(file_type, {'count': 0, 'size': 0})
+            stats['count'] += count
+            stats['size'] += size
+            total_size += size
+
+        for stats in file_type_stats.values():
+            stats['size_formatted'] = FileUtils.format_size(stats['size'])
+            stats['percentage'] = round((stats['size'] / total_size) * 100, 2) if total_size > 0 else 0
+
+        return {
+            'file_type_stats': file_type_stats,
+            'total_size': total_size,
+            'total_size_formatted': FileUtils.format_size(total_size)
+        }
+
+    def get_folder_size_stats(self, limit: int = 10) -> Dict[str, Any]:
+        """获取顶层文件夹大小统计信息（与 FileUtils.get_folder_size_stats 返回格式一致）"""
+        conn = self._connect()
+        total_folders = conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE parent = '' AND is_dir = 1").fetchone()[0]
+        rows = conn.execute('''
+            SELECT d.name, COALESCE(SUM(f.size), 0) AS folder_size
+            FROM entries d
+            LEFT JOIN entries f ON f.top = d.name AND f.is_dir = 0
+            WHERE d.parent = '' AND d.is_dir = 1
+            GROUP BY d.name
+            ORDER BY folder_size DESC
+            LIMIT ?
+        ''', (limit,))
+        folder_stats = {
+            name: {'size': size, 'size_formatted': FileUtils.format_size(size)}
+            for name, size in rows
+        }
+        return {
+            'folder_stats': folder_stats,
+            'total_folders': total_folders
+        }
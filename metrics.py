@@ -0,0 +1,516 @@
+"""
+运行指标模块
+
+提供 Prometheus 文本格式的 /metrics 数据：
+- 计数器、仪表和直方图按线程分片记录：每个线程只写自己的分片，记录时不加锁，
+  采集时才汇总所有分片（已结束线程的分片并入基准值后丢弃）
+- 多进程部署时每个进程定期把自己的汇总写入内部目录下的快照文件（<pid>.json），
+  任一进程响应 /metrics 时合并所有快照；已退出进程的计数器和直方图并入归档文件，仪表值丢弃
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import bisect
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Any, List, Tuple, Optional, Callable, Iterator
+
+# 请求延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# 内部操作耗时直方图的桶上限（秒）
+OPERATION_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+ARCHIVE_FILE = 'archive.json'
+
+# 请求上下文中记录指标信息的environ键
+ROUTE_ENVIRON_KEY = 'fileserver.metrics.route'
+TRANSFER_ENVIRON_KEY = 'fileserver.metrics.transfer'
+
+
+class _Metric:
+    """按线程分片存储的指标基类"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (线程, 分片) 列表，采集时汇总
+        self._shards: List[Tuple[threading.Thread, Dict[tuple, Any]]] = []
+        # 已结束线程的分片汇总
+        self._retired: Dict[tuple, Any] = {}
+
+    def _shard(self) -> Dict[tuple, Any]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merge_value(self, target: Dict[tuple, Any], key: tuple, value: Any):
+        target[key] = target.get(key, 0) + value
+
+    def collect(self) -> Dict[tuple, Any]:
+        """汇总所有线程分片的当前值"""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    for key, value in shard.copy().items():
+                        self._merge_value(self._retired, key, value)
+            self._shards = alive
+            total: Dict[tuple, Any] = {}
+            for key, value in self._retired.items():
+                self._merge_value(total, key, value)
+            for _, shard in alive:
+                for key, value in shard.copy().items():
+                    self._merge_value(total, key, value)
+        return total
+
+    def reset(self):
+        """清空所有值（fork后的子进程不应继承父进程的计数）"""
+        with self._lock:
+            self._local = threading.local()
+            self._shards = []
+            self._retired = {}
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, *labels: str):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的仪表（各线程分片求和，因此可以在一个线程inc、另一个线程dec）"""
+
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1, *labels: str):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    """直方图：每个标签组合记录各桶计数、总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        data = shard.get(labels)
+        if data is None:
+            # [各桶计数..., +Inf桶计数, 总和]
+            data = [0] * (len(self.buckets) + 1) + [0.0]
+            shard[labels] = data
+        data[bisect.bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def _merge_value(self, target: Dict[tuple, Any], key: tuple, value: Any):
+        current = target.get(key)
+        if current is None:
+            target[key] = list(value)
+        else:
+            for i, v in enumerate(value):
+                current[i] += v
+
+
+def _merge_snapshot(target: Dict[str, Any], snapshot: Dict[str, Any], include_gauges: bool = True):
+    """把一个快照合并进目标快照（计数器、仪表求和，直方图逐桶求和）"""
+    for name, metric in snapshot.items():
+        if metric['kind'] == 'gauge' and not include_gauges:
+            continue
+        entry = target.setdefault(name, {key: metric[key] for key in metric if key != 'samples'})
+        samples = entry.setdefault('samples', {})
+        for key, value in metric['samples'].items():
+            if metric['kind'] == 'histogram':
+                current = samples.get(key)
+                samples[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                samples[key] = samples.get(key, 0) + value
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: List[str], values: List[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """指标注册表，负责快照的写入、合并和文本格式输出"""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.snapshot_dir = None
+        self.flush_interval = 5
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def _check_fork(self):
+        """fork后首次使用时清空继承自父进程的值"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex
+            self._flusher = None
+            self._stop = threading.Event()
+            for metric in self.metrics.values():
+                metric.reset()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前进程的指标汇总（可JSON序列化）"""
+        self._check_fork()
+        result = {}
+        for name, metric in self.metrics.items():
+            entry = {
+                'kind': metric.kind,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'samples': {json.dumps(list(key)): value for key, value in metric.collect().items()}
+            }
+            if isinstance(metric, Histogram):
+                entry['buckets'] = list(metric.buckets)
+            result[name] = entry
+        return result
+
+    def start(self, snapshot_dir: str, flush_interval: float = 5):
+        """
+        开启多进程快照：定期把本进程的指标写入 snapshot_dir
+
+        Args:
+            snapshot_dir (str): 快照目录，同一部署的所有进程必须相同
+            flush_interval (float): 写入间隔（秒）
+        """
+        self._check_fork()
+        self.snapshot_dir = snapshot_dir
+        self.flush_interval = flush_interval
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self._claim_snapshot_file()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.snapshot_dir, f'{pid}.json')
+
+    def _claim_snapshot_file(self):
+        """PID被复用时，先把上一个同PID进程留下的快照归档"""
+        path = self._snapshot_path(self._pid)
+        data = self._read_json(path)
+        if data is not None and data.get('token') != self._token:
+            with self._archive_lock():
+                self._archive(path)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"写入指标快照失败: {e}")
+
+    def flush(self):
+        """把本进程的指标写入快照文件"""
+        if self.snapshot_dir is None:
+            return
+        self._check_fork()
+        path = self._snapshot_path(self._pid)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'pid': self._pid, 'token': self._token, 'time': time.time(),
+                       'metrics': self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def stop(self):
+        """停止定期写入并写入最后一次快照（进程退出前调用）"""
+        self._stop.set()
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _archive_lock(self) -> Iterator[None]:
+        """归档文件的进程间锁"""
+        fd = os.open(os.path.join(self.snapshot_dir, 'archive.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _archive(self, path: str):
+        """把已退出进程的快照并入归档（调用方持有归档锁）"""
+        data = self._read_json(path)
+        if data is not None:
+            archive_path = os.path.join(self.snapshot_dir, ARCHIVE_FILE)
+            archive = self._read_json(archive_path) or {}
+            _merge_snapshot(archive, data.get('metrics', {}), include_gauges=False)
+            tmp_path = f'{archive_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(archive, f)
+            os.replace(tmp_path, archive_path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def collect_all(self) -> Dict[str, Any]:
+        """合并所有进程的指标：本进程使用实时值，其他进程使用最近的快照"""
+        merged: Dict[str, Any] = {}
+        _merge_snapshot(merged, self.snapshot())
+        if self.snapshot_dir is None:
+            return merged
+
+        with self._archive_lock():
+            for name in os.listdir(self.snapshot_dir):
+                if not name.endswith('.json') or name == ARCHIVE_FILE:
+                    continue
+                try:
+                    pid = int(name[:-5])
+                except ValueError:
+                    continue
+                if pid == self._pid:
+                    continue
+                path = os.path.join(self.snapshot_dir, name)
+                if not self._process_alive(pid):
+                    self._archive(path)
+                    continue
+                data = self._read_json(path)
+                if data is not None:
+                    _merge_snapshot(merged, data.get('metrics', {}))
+            archive = self._read_json(os.path.join(self.snapshot_dir, ARCHIVE_FILE))
+        if archive:
+            _merge_snapshot(merged, archive)
+        return merged
+
+    def render(self) -> str:
+        """生成Prometheus文本格式"""
+        lines = []
+        for name, metric in sorted(self.collect_all().items()):
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["kind"]}')
+            labelnames = metric['labelnames']
+            for key, value in sorted(metric['samples'].items()):
+                labels = json.loads(key)
+                if metric['kind'] != 'histogram':
+                    lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric['buckets']) + ['+Inf'], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(float(bound))
+                    lines.append(f'{name}_bucket{_format_labels(labelnames, labels, ("le", le))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labelnames, labels)} {_format_value(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(labelnames, labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标注册表（每个进程一份）
+registry = MetricsRegistry()
+
+http_requests = registry.counter('fileserver_http_requests_total', '按路由、方法和状态码统计的请求数',
+                                 ('route', 'method', 'status'))
+http_request_duration = registry.histogram('fileserver_http_request_duration_seconds',
+                                           '请求耗时（包括响应体传输）', ('route', 'method'))
+http_requests_in_flight = registry.gauge('fileserver_http_requests_in_flight', '正在处理的请求数')
+http_errors = registry.counter('fileserver_http_errors_total', '错误处理器返回的错误数', ('status',))
+upload_bytes = registry.counter('fileserver_upload_bytes_total', '接收的请求体字节数', ('route',))
+download_bytes = registry.counter('fileserver_download_bytes_total', '发送的响应体字节数', ('route',))
+transfers_in_flight = registry.gauge('fileserver_transfers_in_flight', '正在进行的上传和下载', ('direction',))
+admission_rejected = registry.counter('fileserver_admission_rejected_total', '准入控制拒绝的请求数', ('class',))
+operation_duration = registry.histogram('fileserver_operation_duration_seconds', '内部操作耗时',
+                                        ('operation',), OPERATION_BUCKETS)
+
+
+def timed(operation: str) -> Callable:
+    """记录函数耗时的装饰器"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                operation_duration.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorator
+
+
+class CountingInput:
+    """统计读取字节数的 wsgi.input 包装"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self.stream.readline(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readlines(self, *args):
+        lines = self.stream.readlines(*args)
+        self.bytes_read += sum(len(line) for line in lines)
+        return lines
+
+    def __iter__(self):
+        for line in self.stream:
+            self.bytes_read += len(line)
+            yield line
+
+
+class _CountingIterable:
+    """统计响应体字节数，关闭时记录请求指标"""
+
+    def __init__(self, app_iter, on_close: Callable[[int], None]):
+        self.app_iter = app_iter
+        self.on_close = on_close
+        self.bytes_sent = 0
+
+    def __iter__(self):
+        for data in self.app_iter:
+            self.bytes_sent += len(data)
+            yield data
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.on_close(self.bytes_sent)
+
+
+class MetricsMiddleware:
+    """
+    记录请求指标的WSGI中间件
+
+    路由和传输方向由应用在请求处理开始时通过 mark_request 写入environ。
+    自己计数已发送字节数的响应体（如 FileBody，需要保持原类型以便服务器使用sendfile）不包装，
+    改为设置其 on_close 回调。
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        environ[ROUTE_ENVIRON_KEY] = 'unmatched'
+        counting_input = None
+        if 'wsgi.input' in environ:
+            counting_input = CountingInput(environ['wsgi.input'])
+            environ['wsgi.input'] = counting_input
+        status_holder = ['500']
+
+        def _start_response(status, headers, exc_info=None):
+            status_holder[0] = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        finished = []
+
+        def finish(bytes_sent: int):
+            if finished:
+                return
+            finished.append(True)
+            route = environ[ROUTE_ENVIRON_KEY]
+            method = environ.get('REQUEST_METHOD', '')
+            http_requests_in_flight.dec()
+            http_requests.inc(1, route, method, status_holder[0])
+            http_request_duration.observe(time.perf_counter() - started, route, method)
+            if counting_input is not None and counting_input.bytes_read:
+                upload_bytes.inc(counting_input.bytes_read, route)
+            if bytes_sent:
+                download_bytes.inc(bytes_sent, route)
+            direction = environ.get(TRANSFER_ENVIRON_KEY)
+            if direction:
+                transfers_in_flight.dec(1, direction)
+
+        try:
+            app_iter = self.wsgi_app(environ, _start_response)
+        except BaseException:
+            finish(0)
+            raise
+        if hasattr(app_iter, 'bytes_sent') and hasattr(app_iter, 'on_close'):
+            app_iter.on_close = finish
+            return app_iter
+        return _CountingIterable(app_iter, finish)
+
+
+def mark_request(environ: dict, route: str, direction: Optional[str] = None):
+    """请求开始处理时记录路由和传输方向（upload/download）"""
+    environ[ROUTE_ENVIRON_KEY] = route
+    if direction:
+        environ[TRANSFER_ENVIRON_KEY] = direction
+        transfers_in_flight.inc(1, direction)
@@ -0,0 +1,383 @@
+"""
+存储配额
+
+按用户和按文件夹限制可以占用的空间。用量保存在 .fileserver/quota.db（SQLite）中，
+上传、删除、移动、复制时增量更新，不需要在每次上传时遍历目录：
+
+- usage 表：每个配置了配额的用户和文件夹的当前用量（字节）
+- owners 表：通过服务器上传或复制产生的每个文件的所有者和大小，删除和移动时据此调整用户用量；
+  不是通过服务器写入的文件不计入任何用户，只计入所在文件夹
+- 内部数据目录（如回收站）中的文件不计入用量，移入回收站即释放配额，恢复时重新计入
+
+文件夹用量的变化量由调用方给出；未给出时把相关文件夹标记为待重新统计，由后台线程通过 measure 回调
+重新统计（不阻塞请求，优先使用元数据索引）。后台线程还会定期遍历磁盘对账，修正绕过服务器对文件的修改。
+"""
+import os
+import time
+import fcntl
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils import FileUtils
+
+
+class QuotaExceeded(Exception):
+    """超出存储配额"""
+
+    def __init__(self, message: str, status_code: int = 507, details: str = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+
+def _contains(folder: str, path: str) -> bool:
+    return path == folder or path.startswith(folder + '/')
+
+
+def _counted(path: str) -> bool:
+    """内部数据目录（回收站等）中的文件不计入用量"""
+    return path.split('/', 1)[0] != FileUtils.INTERNAL_DIR
+
+
+class QuotaLedger:
+    """配额用量账本"""
+
+    def __init__(self, root: str, db_path: str, users: Dict[str, int], folders: Dict[str, int],
+                 measure: Callable[[str, bool], int], reconcile_interval: int = 3600,
+                 stat: Callable[[str], Any] = os.lstat):
+        """
+        Args:
+            root (str): 上传目录
+            db_path (str): 账本数据库路径
+            users (Dict[str, int]): 用户名 -> 配额（字节）
+            folders (Dict[str, int]): 文件夹相对路径 -> 配额（字节）
+            measure: 统计相对路径（目录递归）文件总字节数的函数，路径不存在时返回0；
+                第二个参数为True时必须遍历磁盘（对账），否则可以使用元数据索引
+            reconcile_interval (int): 与磁盘对账的间隔（秒），0表示不定期对账
+            stat: 获取文件元数据的函数（参数为绝对路径，不跟随符号链接），路径不存在时抛出 FileNotFoundError；
+                默认 os.lstat，使用对象存储时传入存储后端的 lstat
+        """
+        self.root = root
+        self.db_path = db_path
+        self.users = users
+        self.folders = {folder.strip('/'): limit for folder, limit in folders.items() if folder.strip('/')}
+        self.measure = measure
+        self.reconcile_interval = reconcile_interval
+        self.stat = stat
+        self._local = threading.local()
+        self._dirty: Set[str] = set()
+        self._dirty_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._init_schema()
+
+    # ------------------------------------------------------------------
+    # 数据库
+    # ------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS usage (
+                    scope TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (scope, name)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS owners (
+                    path TEXT PRIMARY KEY,
+                    user TEXT NOT NULL,
+                    size INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_owners_user ON owners(user)')
+            known = {row[0] for row in conn.execute("SELECT name FROM usage WHERE scope = 'folder'")}
+        # 新配置的文件夹需要先统计一次
+        for folder in self.folders:
+            if folder not in known:
+                self._mark_dirty(folder)
+
+    @staticmethod
+    def _add_usage(conn: sqlite3.Connection, scope: str, name: str, delta: int):
+        if delta:
+            conn.execute('INSERT OR IGNORE INTO usage (scope, name, bytes) VALUES (?, ?, 0)', (scope, name))
+            conn.execute('UPDATE usage SET bytes = MAX(bytes + ?, 0) WHERE scope = ? AND name = ?',
+                         (delta, scope, name))
+
+    @staticmethod
+    def _subtree_condition(rel: str) -> Tuple[str, Tuple[str, str, str]]:
+        # 利用主键范围查询，'0'是'/'的下一个字符
+        return 'path = ? OR (path >= ? AND path < ?)', (rel, rel + '/', rel + '0')
+
+    def _get_usage(self, scope: str, name: str) -> int:
+        row = self._connect().execute('SELECT bytes FROM usage WHERE scope = ? AND name = ?',
+                                      (scope, name)).fetchone()
+        return row[0] if row else 0
+
+    # ------------------------------------------------------------------
+    # 查询与检查
+    # ------------------------------------------------------------------
+    def folders_containing(self, path: str) -> List[str]:
+        """包含该相对路径的配额文件夹"""
+        return [folder for folder in self.folders if _contains(folder, path)]
+
+    def check(self, user_id: Optional[str], rel_dir: str, size: int, charge_user: bool = True,
+              exclude_folders: Iterable[str] = ()):
+        """
+        检查在 rel_dir 中新增 size 字节是否超出配额
+
+        Args:
+            user_id (str): 写入文件的用户
+            rel_dir (str): 目标目录的相对路径（根目录为空字符串）
+            size (int): 新增的字节数
+            charge_user (bool): 是否计入用户配额（移动不改变文件所有者，不计入）
+            exclude_folders: 不需要检查的文件夹（移动前已经计入这些文件夹）
+
+        Raises:
+            QuotaExceeded: 超出用户或文件夹配额
+        """
+        if charge_user and user_id in self.users:
+            used = self._get_usage('user', user_id)
+            if used + size > self.users[user_id]:
+                raise QuotaExceeded('超出用户存储配额', 507, self._format_details(used, size, self.users[user_id]))
+        for folder in self.folders_containing(rel_dir):
+            if folder in exclude_folders:
+                continue
+            used = self._get_usage('folder', folder)
+            if used + size > self.folders[folder]:
+                raise QuotaExceeded(f'超出文件夹 "{folder}" 的存储配额', 507,
+                                    self._format_details(used, size, self.folders[folder]))
+
+    def check_move(self, src: str, dest_dir: str, user_id: Optional[str] = None):
+        """
+        检查把 src 移动到 dest_dir 是否超出配额
+
+        只检查 src 原本不在其中的目标文件夹；从内部数据目录移出（如从回收站恢复）时还检查 user_id 的用户配额。
+        需要检查时统计 src 的大小。
+
+        Raises:
+            QuotaExceeded: 超出用户或文件夹配额
+        """
+        src_folders = set(self.folders_containing(src)) if _counted(src) else set()
+        charge_user = user_id in self.users and not _counted(src)
+        if charge_user or any(folder not in src_folders for folder in self.folders_containing(dest_dir)):
+            self.check(user_id, dest_dir, self.measure(src, False), charge_user, src_folders)
+
+    @staticmethod
+    def _format_details(used: int, size: int, limit: int) -> str:
+        return (f'已用: {FileUtils.format_size(used)}, 本次: {FileUtils.format_size(size)}, '
+                f'配额: {FileUtils.format_size(limit)}')
+
+    @staticmethod
+    def _describe(used: int, limit: int) -> Dict[str, Any]:
+        return {
+            'used': used,
+            'limit': limit,
+            'used_formatted': FileUtils.format_size(used),
+            'limit_formatted': FileUtils.format_size(limit),
+            'percent': round(used * 100 / limit, 1) if limit else 100.0
+        }
+
+    def get_usage(self, user_id: Optional[str] = None, is_admin: bool = False) -> Dict[str, Any]:
+        """
+        获取配额用量
+
+        Returns:
+            Dict[str, Any]: users（管理员可以看到所有用户，其他用户只能看到自己）和 folders
+        """
+        users = {name: limit for name, limit in self.users.items() if is_admin or name == user_id}
+        return {
+            'users': {name: self._describe(self._get_usage('user', name), limit) for name, limit in users.items()},
+            'folders': {folder: self._describe(self._get_usage('folder', folder), limit)
+                        for folder, limit in self.folders.items()}
+        }
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+    def add_files(self, user_id: Optional[str], files: Iterable[Tuple[str, int]]):
+        """
+        记录新写入的文件（上传或复制产生），计入写入者和所在文件夹
+
+        Args:
+            user_id (str): 写入文件的用户
+            files: (相对路径, 大小) 序列
+        """
+        conn = self._connect()
+        with conn:
+            for rel, size in files:
+                if not _counted(rel):
+                    continue
+                if user_id:
+                    old = conn.execute('SELECT user, size FROM owners WHERE path = ?', (rel,)).fetchone()
+                    if old is not None:
+                        self._add_usage(conn, 'user', old[0], -old[1])
+                    conn.execute('INSERT OR REPLACE INTO owners (path, user, size) VALUES (?, ?, ?)',
+                                 (rel, user_id, size))
+                    self._add_usage(conn, 'user', user_id, size)
+                for folder in self.folders_containing(rel):
+                    self._add_usage(conn, 'folder', folder, size)
+
+    def remove(self, rel: str, size: Optional[int] = None):
+        """
+        记录删除了相对路径（目录连同子树）
+
+        Args:
+            rel (str): 被删除的相对路径
+            size (int): 被删除的文件总字节数，未知时重新统计相关文件夹
+        """
+        condition, params = self._subtree_condition(rel)
+        conn = self._connect()
+        with conn:
+            if _counted(rel):
+                for user, total in conn.execute(
+                        f'SELECT user, SUM(size) FROM owners WHERE {condition} GROUP BY user', params).fetchall():
+                    self._add_usage(conn, 'user', user, -total)
+                for folder in self.folders_containing(rel):
+                    if size is None:
+                        self._mark_dirty(folder)
+                    else:
+                        self._add_usage(conn, 'folder', folder, -size)
+            conn.execute(f'DELETE FROM owners WHERE {condition}', params)
+        self._mark_descendants_dirty(rel)
+
+    def move(self, src: str, dest: str, size: Optional[int] = None):
+        """
+        记录相对路径从 src 移动到了 dest（包括移入、移出回收站）
+
+        所有者不变；移入内部数据目录时释放用户用量，移出时重新计入。
+        文件夹用量只在移动跨越配额文件夹时变化，size 未给出时重新统计这些文件夹。
+        """
+        condition, params = self._subtree_condition(src)
+        conn = self._connect()
+        with conn:
+            if _counted(src) != _counted(dest):
+                sign = -1 if _counted(src) else 1
+                for user, total in conn.execute(
+                        f'SELECT user, SUM(size) FROM owners WHERE {condition} GROUP BY user', params).fetchall():
+                    self._add_usage(conn, 'user', user, sign * total)
+            conn.execute(f'UPDATE owners SET path = ? || substr(path, ?) WHERE {condition}',
+                         (dest, len(src) + 1) + params)
+            src_folders = set(self.folders_containing(src)) if _counted(src) else set()
+            dest_folders = set(self.folders_containing(dest)) if _counted(dest) else set()
+            for folder in src_folders ^ dest_folders:
+                if size is None:
+                    self._mark_dirty(folder)
+                else:
+                    self._add_usage(conn, 'folder', folder, size if folder in dest_folders else -size)
+        self._mark_descendants_dirty(src)
+        self._mark_descendants_dirty(dest)
+
+    def _mark_descendants_dirty(self, rel: str):
+        """配额文件夹本身或其上级被删除、移动时，重新统计该文件夹"""
+        for folder in self.folders:
+            if _contains(rel, folder):
+                self._mark_dirty(folder)
+
+    def _mark_dirty(self, folder: str):
+        with self._dirty_lock:
+            self._dirty.add(folder)
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # 对账
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动后台线程：重新统计被标记的文件夹，定期与磁盘对账"""
+        threading.Thread(target=self._run, name='quota-ledger', daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    @contextmanager
+    def _reconcile_lock(self, blocking: bool = True) -> Iterator[bool]:
+        """多个工作进程共享同一个账本时，同一时间只由一个进程对账"""
+        with open(self.db_path + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+
+    def _run(self):
+        next_reconcile = time.monotonic() + self.reconcile_interval
+        while not self._stop_event.is_set():
+            timeout = next_reconcile - time.monotonic() if self.reconcile_interval > 0 else None
+            if timeout is None or timeout > 0:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                with self._dirty_lock:
+                    dirty, self._dirty = self._dirty, set()
+                if dirty:
+                    self._recount_folders(dirty)
+                if self.reconcile_interval > 0 and time.monotonic() >= next_reconcile:
+                    next_reconcile = time.monotonic() + self.reconcile_interval
+                    with self._reconcile_lock(blocking=False) as acquired:
+                        # 其他进程正在对账时跳过本轮
+                        if acquired:
+                            self.reconcile()
+            except Exception as e:
+                print(f"配额对账失败: {e}")
+
+    def _recount_folders(self, folders: Iterable[str], from_disk: bool = False):
+        for folder in folders:
+            if folder not in self.folders:
+                continue
+            size = self.measure(folder, from_disk)
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO usage (scope, name, bytes) VALUES (?, ?, ?)',
+                             ('folder', folder, size))
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        与磁盘对账：删除已不存在的文件的所有者记录，更新被修改过的文件大小，
+        重新计算用户用量并重新统计所有配额文件夹
+
+        Returns:
+            Dict[str, int]: removed（删除的记录数）和 updated（更新了大小的记录数）
+        """
+        conn = self._connect()
+        removed = []
+        updated = []
+        for path, size in conn.execute('SELECT path, size FROM owners').fetchall():
+            try:
+                st = self.stat(os.path.join(self.root, path))
+            except (FileNotFoundError, NotADirectoryError):
+                removed.append((path,))
+                continue
+            except OSError:
+                # 存储暂时不可用（权限、网络等）时保留记录，下次对账再处理
+                continue
+            if st.st_size != size:
+                updated.append((st.st_size, path))
+        with conn:
+            conn.executemany('DELETE FROM owners WHERE path = ?', removed)
+            conn.executemany('UPDATE owners SET size = ? WHERE path = ?', updated)
+            totals = {user: total for user, total in conn.execute(
+                'SELECT user, SUM(size) FROM owners WHERE path NOT LIKE ? GROUP BY user',
+                (FileUtils.INTERNAL_DIR + '/%',))}
+            conn.execute("DELETE FROM usage WHERE scope = 'user'")
+            conn.executemany("INSERT INTO usage (scope, name, bytes) VALUES ('user', ?, ?)", totals.items())
+        self._recount_folders(self.folders, from_disk=True)
+        return {'removed': len(removed), 'updated': len(updated)}
@@ -0,0 +1,801 @@
+"""
+S3兼容对象存储后端
+
+上传目录映射为存储桶中的一个前缀：<上传目录>/a/b.txt 对应对象键 <prefix>a/b.txt。
+目录没有对应的对象，由键中的 / 隐含表示；新建的空文件夹用以 / 结尾的零字节对象标记。
+
+- 请求使用 AWS Signature V4 签名（标准库实现，不依赖boto3），兼容 AWS S3、MinIO、Ceph RGW 等，
+  使用路径风格的地址（<endpoint>/<bucket>/<key>）
+- HTTP连接放在连接池中复用（keep-alive），同时使用的连接数不超过 max_connections；
+  空闲连接被服务端关闭时自动换新连接重试一次
+- 写入大于 part_size 的文件时使用分片上传，多个分片在线程池中并行上传（每个文件最多 upload_concurrency 个），
+  内存占用与文件大小无关
+- 读取时按 range_size 拆成多个Range GET，并行预取后面的分段（最多 download_concurrency 个），按顺序输出；
+  后续分段带 If-Match，对象在读取过程中被替换时中止而不是拼出混合的内容
+- 写入不覆盖已有对象：先检查目标是否存在，再用 If-None-Match: * 条件写入（不支持条件写入的服务忽略该头）
+- 复制使用服务端复制（CopyObject，超过5GB时分片复制），数据不经过服务器；移动是复制后删除源对象；
+  删除目录时每批最多删除1000个对象（DeleteObjects）
+"""
+import os
+import io
+import hmac
+import time
+import stat
+import errno
+import base64
+import hashlib
+import threading
+import http.client
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from storage import DIRECT_JOB, StorageBackend, StorageError
+
+# S3 的限制：单个分片上传最多10000个分片，CopyObject 最多复制5GB
+MAX_PARTS = 10000
+COPY_OBJECT_LIMIT = 5 * 1024 * 1024 * 1024
+COPY_PART_SIZE = 512 * 1024 * 1024
+DELETE_BATCH = 1000
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+
+
+class ObjectStat:
+    """与 os.stat_result 常用属性兼容的对象元数据（目录没有修改时间，st_mtime为0、st_mtime_ns为None）"""
+
+    __slots__ = ('st_mode', 'st_size', 'st_mtime', 'st_mtime_ns', 'st_ctime', 'st_ino', 'st_dev', 'st_nlink',
+                 'etag')
+
+    def __init__(self, size: int = 0, mtime: float = 0, etag: Optional[str] = None, is_dir: bool = False):
+        self.st_mode = (stat.S_IFDIR | 0o755) if is_dir else (stat.S_IFREG | 0o644)
+        self.st_size = size
+        self.st_mtime = mtime
+        self.st_mtime_ns = None if is_dir else int(mtime * 1e9)
+        self.st_ctime = mtime
+        self.st_ino = 0
+        self.st_dev = 0
+        self.st_nlink = 1
+        self.etag = etag
+
+
+DIRECTORY_STAT = ObjectStat(is_dir=True)
+
+
+class ObjectEntry:
+    """与 os.DirEntry 常用方法兼容的目录条目，元数据来自列表结果，不需要额外请求"""
+
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, name: str, path: str, st: ObjectStat):
+        self.name = name
+        self.path = path
+        self._stat = st
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return stat.S_ISDIR(self._stat.st_mode)
+
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return not self.is_dir()
+
+    def is_symlink(self) -> bool:
+        return False
+
+    def stat(self, follow_symlinks: bool = True) -> ObjectStat:
+        return self._stat
+
+    def inode(self) -> int:
+        return 0
+
+
+class _Listing(list):
+    """scandir 的结果，与 os.scandir 一样可以用于 with 语句"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _ConnectionPool:
+    """到对象存储的keep-alive连接池，同时使用的连接数不超过上限"""
+
+    def __init__(self, scheme: str, host: str, port: Optional[int], size: int, timeout: float):
+        self.factory = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        获取连接，返回(连接, 是否是复用的空闲连接)
+
+        Raises:
+            StorageError: 等待空闲连接超时
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise StorageError('对象存储连接数已达上限，请稍后重试', 503)
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self.factory(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool = True):
+        """归还连接：响应已完整读取的连接放回池中，否则关闭"""
+        if reusable:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class _ObjectReader(io.RawIOBase):
+    """GET响应的读取对象：读完后把连接放回连接池，提前关闭时丢弃连接"""
+
+    def __init__(self, pool: _ConnectionPool, conn: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        super().__init__()
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if self._conn is None:
+            return b''
+        return self._response.read() if size is None or size < 0 else self._response.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            # 响应体已读完时 http.client 会关闭响应对象，此时连接可以发送下一个请求
+            self._pool.release(conn, self._response.isclosed() and not self._response.will_close)
+        super().close()
+
+
+class _MultipartUpload:
+    """一次分片上传：分片在线程池中并行上传，同时进行中的分片数不超过上限（调用方在提交时等待）"""
+
+    def __init__(self, storage: 'S3Storage', key: str, concurrency: int):
+        self.storage = storage
+        self.key = key
+        _, data = storage._request('POST', key, query=[('uploads', '')])
+        self.upload_id = _text(ElementTree.fromstring(data), 'UploadId')
+        if not self.upload_id:
+            raise StorageError('对象存储没有返回分片上传ID')
+        self._slots = threading.Semaphore(max(1, concurrency))
+        self._futures = []
+
+    def _submit(self, func: Callable, *args):
+        self._slots.acquire()
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                self._slots.release()
+                raise future.exception()
+        number = len(self._futures) + 1
+        future = self.storage._get_executor().submit(func, number, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def submit_data(self, read: Callable[[], bytes]):
+        """提交一个数据分片，read() 在上传线程中调用，返回分片数据"""
+        self._submit(self._put_part, read)
+
+    def submit_copy(self, source: str, start: int, end: int):
+        """提交一个从已有对象服务端复制的分片（闭区间）"""
+        self._submit(self._copy_part, source, start, end)
+
+    def _part_query(self, number: int) -> List[Tuple[str, str]]:
+        return [('partNumber', str(number)), ('uploadId', self.upload_id)]
+
+    def _put_part(self, number: int, read: Callable[[], bytes]) -> str:
+        response, _ = self.storage._request('PUT', self.key, query=self._part_query(number), body=read())
+        return response.getheader('ETag', '')
+
+    def _copy_part(self, number: int, source: str, start: int, end: int) -> str:
+        _, data = self.storage._request('PUT', self.key, query=self._part_query(number),
+                                        headers={'x-amz-copy-source': source,
+                                                 'x-amz-copy-source-range': f'bytes={start}-{end}'})
+        return _text(_parse_result(data), 'ETag')
+
+    def complete(self, exclusive: bool = True):
+        """
+        等待所有分片上传完成并合并为对象
+
+        Raises:
+            FileExistsError: exclusive 为True且目标对象已存在
+        """
+        etags = [future.result() for future in self._futures]
+        body = '<CompleteMultipartUpload>' + ''.join(
+            f'<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>'
+            for number, etag in enumerate(etags, 1)) + '</CompleteMultipartUpload>'
+        _, data = self.storage._request('POST', self.key, query=[('uploadId', self.upload_id)],
+                                        headers={'if-none-match': '*'} if exclusive else None,
+                                        body=body.encode('utf-8'))
+        # 合并失败时也可能返回200，错误在响应体中
+        _parse_result(data)
+        self.upload_id = None
+
+    def abort(self):
+        """取消分片上传，释放已上传的分片（可以重复调用）"""
+        if self.upload_id is None:
+            return
+        for future in self._futures:
+            future.cancel()
+        wait(self._futures)
+        try:
+            self.storage._request('DELETE', self.key, query=[('uploadId', self.upload_id)], expect=(200, 204))
+        except OSError as e:
+            print(f"取消分片上传失败: {self.key}: {e}")
+        self.upload_id = None
+
+
+class _ErrorsOnly:
+    """转发失败条目和取消检查、但不计入进度的任务对象（移动时删除源对象使用，进度已在复制时计入）"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def advance(self, items: int = 1, size: int = 0, current=None):
+        self.job.checkpoint()
+
+    def record_error(self, path: str, error: Exception):
+        self.job.record_error(path, error)
+
+    def checkpoint(self, force: bool = False):
+        self.job.checkpoint(force)
+
+
+def _tag(element) -> str:
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _children(element, name: str) -> list:
+    return [child for child in element if _tag(child) == name]
+
+
+def _text(element, name: str) -> str:
+    for child in element:
+        if _tag(child) == name:
+            return child.text or ''
+    return ''
+
+
+def _parse_result(data: bytes):
+    """解析操作结果XML，结果为 <Error> 时抛出 StorageError"""
+    root = ElementTree.fromstring(data)
+    if _tag(root) == 'Error':
+        raise StorageError(f"对象存储返回错误: {_text(root, 'Code')} {_text(root, 'Message')}".strip())
+    return root
+
+
+def _parse_iso_time(value: str) -> float:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def _read_full(stream, size: int) -> bytes:
+    """从流中读取size字节（流结束时可以不足）"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        data = stream.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b''.join(chunks)
+
+
+class S3Storage(StorageBackend):
+    """S3兼容对象存储"""
+
+    def __init__(self, root: str, endpoint: str, bucket: str, region: str = 'us-east-1',
+                 access_key: str = '', secret_key: str = '', prefix: str = '',
+                 part_size: int = 8 * 1024 * 1024, range_size: int = 4 * 1024 * 1024,
+                 max_connections: int = 16, upload_concurrency: int = 4, download_concurrency: int = 4,
+                 timeout: float = 60):
+        """
+        Args:
+            root (str): 上传目录（挂载点）
+            endpoint (str): 服务地址，如 http://127.0.0.1:9000 或 https://s3.amazonaws.com
+            bucket (str): 存储桶
+            region (str): 签名使用的区域
+            access_key (str): 访问密钥ID，为空时发送匿名请求
+            secret_key (str): 访问密钥
+            prefix (str): 存储桶中的键前缀
+            part_size (int): 分片上传的分片大小（不小于5MB）
+            range_size (int): 分段读取时每个Range GET的大小
+            max_connections (int): 连接池大小，也是上传和下载线程池的线程数
+            upload_concurrency (int): 每个文件同时上传的分片数
+            download_concurrency (int): 每个下载同时预取的分段数
+            timeout (float): 连接和读取超时（秒），也是等待空闲连接的时间
+        """
+        parts = urlsplit(endpoint)
+        if parts.scheme not in ('http', 'https') or not parts.hostname or not bucket:
+            raise ValueError('对象存储需要配置 endpoint（http/https地址）和 bucket')
+        self.root = os.path.abspath(root)
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        prefix = prefix.strip('/')
+        self.prefix = prefix + '/' if prefix else ''
+        self.part_size = max(5 * 1024 * 1024, part_size)
+        self.range_size = max(64 * 1024, range_size)
+        self.max_connections = max(1, max_connections)
+        self.upload_concurrency = max(1, upload_concurrency)
+        self.download_concurrency = max(1, download_concurrency)
+        self.host = parts.netloc
+        self.base_path = parts.path.rstrip('/')
+        self._pool = _ConnectionPool(parts.scheme, parts.hostname, parts.port, self.max_connections, timeout)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._signing_keys = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """上传分片和预取分段共用的线程池（首次使用时创建）"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix='s3')
+            return self._executor
+
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self._pool.close()
+
+    # 路径与对象键
+
+    def _key(self, path: str) -> str:
+        rel = os.path.relpath(os.path.normpath(path), self.root)
+        if rel == os.curdir:
+            return self.prefix
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            raise ValueError(f'路径不在上传目录中: {path}')
+        return self.prefix + rel.replace(os.sep, '/')
+
+    def _dir_prefix(self, path: str) -> str:
+        key = self._key(path)
+        return key if key == self.prefix else key + '/'
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key[len(self.prefix):].rstrip('/').split('/'))
+
+    def _source(self, key: str) -> str:
+        """x-amz-copy-source 头的值"""
+        return quote(f'/{self.bucket}/{key}', safe='/-_.~')
+
+    # 请求签名和发送
+
+    def _signing_key(self, date: str) -> bytes:
+        key = self._signing_keys.get(date)
+        if key is None:
+            key = ('AWS4' + self.secret_key).encode('utf-8')
+            for part in (date, self.region, 's3', 'aws4_request'):
+                key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+            self._signing_keys = {date: key}
+        return key
+
+    def _sign(self, method: str, uri: str, query: str, headers: Dict[str, str], payload_hash: str):
+        """按 AWS Signature V4 添加 Authorization 头（headers 的键均为小写）"""
+        amz_date = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        if not self.access_key:
+            return
+        names = sorted(headers)
+        canonical_headers = ''.join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in names)
+        signed_headers = ';'.join(names)
+        canonical_request = '\n'.join([method, uri, query, canonical_headers, signed_headers, payload_hash])
+        scope = f'{amz_date[:8]}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                    hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+        signature = hmac.new(self._signing_key(amz_date[:8]), string_to_sign.encode('utf-8'),
+                             hashlib.sha256).hexdigest()
+        headers['authorization'] = (f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+                                    f'SignedHeaders={signed_headers}, Signature={signature}')
+
+    def _send(self, method: str, key: str, query: Optional[List[Tuple[str, str]]] = None,
+              headers: Optional[Dict[str, str]] = None, body: bytes = b''):
+        """发送签名请求，返回(连接, 响应)；调用方读取响应后必须归还连接"""
+        uri = quote(f'{self.base_path}/{self.bucket}' + (f'/{key}' if key else ''), safe='/-_.~')
+        query_string = '&'.join(f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+                                for name, value in sorted(query or []))
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        headers['host'] = self.host
+        if body:
+            headers['content-length'] = str(len(body))
+        self._sign(method, uri, query_string, headers, hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256)
+        target = f'{uri}?{query_string}' if query_string else uri
+        for attempt in range(2):
+            conn, reused = self._pool.acquire()
+            try:
+                conn.request(method, target, body=body or None, headers=headers)
+                return conn, conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                self._pool.release(conn, False)
+                if reused and attempt == 0 and isinstance(e, (ConnectionResetError, BrokenPipeError)):
+                    # 空闲的keep-alive连接已被服务端关闭，换新连接重试一次
+                    continue
+                raise StorageError(f'对象存储请求失败: {e}') from e
+
+    def _error(self, status: int, data: bytes, key: str) -> OSError:
+        code = message = ''
+        if data:
+            try:
+                root = ElementTree.fromstring(data)
+                code, message = _text(root, 'Code'), _text(root, 'Message')
+            except ElementTree.ParseError:
+                pass
+        if status == 404:
+            return FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), key)
+        if status == 412 or code == 'ConditionalRequestConflict':
+            return FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), key)
+        return StorageError(f'对象存储返回错误: HTTP {status} {code} {message}'.strip(), 503 if status == 503 else 502)
+
+    def _request(self, method: str, key: str = '', query: Optional[List[Tuple[str, str]]] = None,
+                 headers: Optional[Dict[str, str]] = None, body: bytes = b'', expect: Tuple[int, ...] = (200,)):
+        """
+        发送请求并读取完整的响应体，返回(响应, 响应体)
+
+        Raises:
+            FileNotFoundError: 对象不存在
+            FileExistsError: 条件写入的目标已存在
+            StorageError: 其他错误
+        """
+        conn, response = self._send(method, key, query, headers, body)
+        try:
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self._pool.release(conn, False)
+            raise StorageError(f'对象存储请求失败: {e}') from e
+        self._pool.release(conn, not response.will_close)
+        if response.status not in expect:
+            raise self._error(response.status, data, key)
+        return response, data
+
+    def _list(self, prefix: str, delimiter: str = '', max_keys: int = 0) -> Iterator[Tuple[List[str], list]]:
+        """分页列出前缀下的对象，每页产生 (公共前缀列表, [(键, 大小, 修改时间, ETag)])"""
+        token = ''
+        while True:
+            query = [('list-type', '2'), ('prefix', prefix)]
+            if delimiter:
+                query.append(('delimiter', delimiter))
+            if max_keys:
+                query.append(('max-keys', str(max_keys)))
+            if token:
+                query.append(('continuation-token', token))
+            _, data = self._request('GET', query=query)
+            root = ElementTree.fromstring(data)
+            prefixes = [_text(item, 'Prefix') for item in _children(root, 'CommonPrefixes')]
+            contents = [(_text(item, 'Key'), int(_text(item, 'Size') or 0),
+                         _parse_iso_time(_text(item, 'LastModified')), _text(item, 'ETag'))
+                        for item in _children(root, 'Contents')]
+            yield prefixes, contents
+            token = _text(root, 'NextContinuationToken')
+            if max_keys or _text(root, 'IsTruncated') != 'true' or not token:
+                return
+
+    def _put_object(self, key: str, data: bytes, exclusive: bool = False):
+        self._request('PUT', key, headers={'if-none-match': '*'} if exclusive else None, body=data)
+
+    def _check_absent(self, path: str):
+        """写入前检查目标（文件或目录）不存在"""
+        if self.lexists(path):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+
+    def _copy_object(self, src_key: str, dest_key: str, size: int):
+        """服务端复制对象"""
+        if size <= COPY_OBJECT_LIMIT:
+            _, data = self._request('PUT', dest_key, headers={'x-amz-copy-source': self._source(src_key)})
+            # 复制失败时也可能返回200，错误在响应体中
+            _parse_result(data)
+            return
+        part_size = max(COPY_PART_SIZE, -(-size // MAX_PARTS))
+        upload = _MultipartUpload(self, dest_key, self.upload_concurrency)
+        try:
+            for start in range(0, size, part_size):
+                upload.submit_copy(self._source(src_key), start, min(start + part_size, size) - 1)
+            upload.complete(exclusive=False)
+        except BaseException:
+            upload.abort()
+            raise
+
+    # 元数据和列表
+
+    def stat(self, path: str) -> ObjectStat:
+        key = self._key(path)
+        if key == self.prefix:
+            return DIRECTORY_STAT
+        try:
+            response, _ = self._request('HEAD', key)
+            last_modified = response.getheader('Last-Modified')
+            return ObjectStat(int(response.getheader('Content-Length') or 0),
+                              parsedate_to_datetime(last_modified).timestamp() if last_modified else 0,
+                              response.getheader('ETag'))
+        except FileNotFoundError:
+            pass
+        for prefixes, contents in self._list(key + '/', '/', max_keys=1):
+            if prefixes or contents:
+                return DIRECTORY_STAT
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+    def scandir(self, path: str) -> _Listing:
+        prefix = self._dir_prefix(path)
+        entries = _Listing()
+        found = prefix == self.prefix
+        for prefixes, contents in self._list(prefix, '/'):
+            for item in prefixes:
+                found = True
+                name = item[len(prefix):].rstrip('/')
+                if name:
+                    entries.append(ObjectEntry(name, os.path.join(path, name), DIRECTORY_STAT))
+            for key, size, mtime, etag in contents:
+                found = True
+                name = key[len(prefix):]
+                if name:
+                    entries.append(ObjectEntry(name, os.path.join(path, name), ObjectStat(size, mtime, etag)))
+        if not found:
+            if self.isfile(path):
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return entries
+
+    def walk(self, path: str) -> Iterator[Tuple[str, int]]:
+        st = self.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            yield path, st.st_size
+            return
+        for _, contents in self._list(self._dir_prefix(path)):
+            for key, size, _, _ in contents:
+                if not key.endswith('/'):
+                    yield self._path(key), size
+
+    def count(self, paths: List[str]) -> Tuple[int, int]:
+        items = 0
+        total = 0
+        for path in paths:
+            try:
+                st = self.stat(path)
+            except OSError:
+                continue
+            items += 1
+            if not stat.S_ISDIR(st.st_mode):
+                total += st.st_size
+                continue
+            prefix = self._dir_prefix(path)
+            dirs = set()
+            for _, contents in self._list(prefix):
+                for key, size, _, _ in contents:
+                    rel = key[len(prefix):]
+                    if not rel:
+                        continue
+                    names = rel.rstrip('/').split('/')
+                    # 隐含的中间目录和空目录标记都计为目录
+                    dirs.update('/'.join(names[:i]) for i in range(1, len(names)))
+                    if key.endswith('/'):
+                        dirs.add(rel.rstrip('/'))
+                    else:
+                        items += 1
+                        total += size
+            items += len(dirs)
+        return items, total
+
+    # 读取
+
+    def open(self, path: str) -> _ObjectReader:
+        key = self._key(path)
+        conn, response = self._send('GET', key)
+        if response.status != 200:
+            try:
+                data = response.read()
+            finally:
+                self._pool.release(conn, False)
+            raise self._error(response.status, data, key)
+        return _ObjectReader(self._pool, conn, response)
+
+    def _get_range(self, key: str, start: int, length: int, etag: Optional[str] = None) -> Tuple[bytes, str]:
+        """读取一个分段，返回(数据, ETag)"""
+        headers = {'range': f'bytes={start}-{start + length - 1}'}
+        if etag:
+            headers['if-match'] = etag
+        try:
+            response, data = self._request('GET', key, headers=headers, expect=(200, 206))
+        except FileExistsError:
+            raise StorageError('文件在读取过程中被修改', 409)
+        if response.status == 200:
+            data = data[start:start + length]
+        if len(data) != length:
+            raise StorageError('文件在读取过程中被修改', 409)
+        return data, response.getheader('ETag', '')
+
+    def open_range(self, path: str, offset: int, length: int) -> Iterator[bytes]:
+        if length <= 0:
+            return
+        key = self._key(path)
+        end = offset + length
+        segments = [(start, min(self.range_size, end - start)) for start in range(offset, end, self.range_size)]
+        # 第一个分段确定对象的ETag，之后的分段都要求同一个ETag
+        data, etag = self._get_range(key, *segments[0])
+        remaining = iter(segments[1:])
+        pending = deque()
+        executor = self._get_executor() if len(segments) > 1 else None
+
+        def prefetch():
+            while len(pending) < self.download_concurrency:
+                segment = next(remaining, None)
+                if segment is None:
+                    return
+                pending.append(executor.submit(self._get_range, key, segment[0], segment[1], etag))
+
+        try:
+            if executor is not None:
+                prefetch()
+            yield data
+            while pending:
+                data, _ = pending.popleft().result()
+                prefetch()
+                yield data
+        finally:
+            for future in pending:
+                future.cancel()
+
+    # 写入
+
+    def write(self, path: str, stream) -> int:
+        key = self._key(path)
+        self._check_absent(path)
+        data = _read_full(stream, self.part_size)
+        if len(data) < self.part_size:
+            self._put_object(key, data, exclusive=True)
+            return len(data)
+        upload = _MultipartUpload(self, key, self.upload_concurrency)
+        total = 0
+        try:
+            while data:
+                total += len(data)
+                upload.submit_data(lambda data=data: data)
+                data = _read_full(stream, self.part_size)
+            upload.complete()
+        except BaseException:
+            upload.abort()
+            raise
+        return total
+
+    def put_file(self, local_path: str, path: str):
+        key = self._key(path)
+        self._check_absent(path)
+        size = os.path.getsize(local_path)
+        if size <= self.part_size:
+            with open(local_path, 'rb') as f:
+                self._put_object(key, f.read(), exclusive=True)
+        else:
+            part_size = max(self.part_size, -(-size // MAX_PARTS))
+            fd = os.open(local_path, os.O_RDONLY)
+            try:
+                upload = _MultipartUpload(self, key, self.upload_concurrency)
+                try:
+                    for offset in range(0, size, part_size):
+                        # 分片数据在上传线程中读取，内存中最多有 upload_concurrency 个分片
+                        upload.submit_data(lambda offset=offset: os.pread(fd, min(part_size, size - offset), offset))
+                    upload.complete()
+                except BaseException:
+                    upload.abort()
+                    raise
+            finally:
+                os.close(fd)
+        os.remove(local_path)
+
+    def makedirs(self, path: str):
+        key = self._key(path)
+        if key == self.prefix:
+            return
+        try:
+            if stat.S_ISDIR(self.stat(path).st_mode):
+                return
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+        except FileNotFoundError:
+            self._put_object(key + '/', b'')
+
+    # 删除、复制、移动
+
+    def _delete_objects(self, keys: List[str]) -> Dict[str, str]:
+        """批量删除对象，返回删除失败的 {键: 原因}"""
+        body = ('<Delete><Quiet>true</Quiet>' +
+                ''.join(f'<Object><Key>{escape(key)}</Key></Object>' for key in keys) +
+                '</Delete>').encode('utf-8')
+        md5 = base64.b64encode(hashlib.md5(body).digest()).decode('ascii')
+        _, data = self._request('POST', query=[('delete', '')], headers={'content-md5': md5}, body=body)
+        return {_text(error, 'Key'): f"{_text(error, 'Code')} {_text(error, 'Message')}".strip()
+                for error in _children(_parse_result(data), 'Error')}
+
+    def _delete_keys(self, objects: List[Tuple[str, int]], job):
+        """分批删除对象，逐个汇报进度"""
+        for start in range(0, len(objects), DELETE_BATCH):
+            job.checkpoint()
+            batch = objects[start:start + DELETE_BATCH]
+            try:
+                errors = self._delete_objects([key for key, _ in batch])
+            except OSError as e:
+                errors = {key: e for key, _ in batch}
+            for key, size in batch:
+                item_path = self._path(key)
+                if key in errors:
+                    error = errors[key]
+                    job.record_error(item_path, error if isinstance(error, OSError) else StorageError(error))
+                    job.advance(current=item_path)
+                else:
+                    job.advance(size=0 if key.endswith('/') else size, current=item_path)
+
+    def delete(self, path: str, job=None):
+        job = job or DIRECT_JOB
+        st = self.stat(path)
+        if stat.S_ISDIR(st.st_mode):
+            objects = [(key, size) for _, contents in self._list(self._dir_prefix(path))
+                       for key, size, _, _ in contents]
+        else:
+            objects = [(self._key(path), st.st_size)]
+        self._delete_keys(objects, job)
+
+    def _copy(self, src: str, dest: str, job) -> List[Tuple[str, int]]:
+        """复制文件或目录，返回复制成功的源对象 [(键, 大小)]"""
+        # CopyObject 不支持条件写入，复制前检查目标
+        self._check_absent(dest)
+        st = self.stat(src)
+        if not stat.S_ISDIR(st.st_mode):
+            self._copy_object(self._key(src), self._key(dest), st.st_size)
+            job.advance(size=st.st_size, current=src)
+            return [(self._key(src), st.st_size)]
+        src_prefix = self._dir_prefix(src)
+        dest_prefix = self._dir_prefix(dest)
+        # 目标目录的标记，源目录为空时也能看到复制结果
+        self._put_object(dest_prefix, b'')
+        job.advance(current=src)
+        copied = []
+        for _, contents in self._list(src_prefix):
+            for key, size, _, _ in contents:
+                if key == src_prefix:
+                    copied.append((key, size))
+                    continue
+                item_path = self._path(key)
+                try:
+                    self._copy_object(key, dest_prefix + key[len(src_prefix):], size)
+                except OSError as e:
+                    job.record_error(item_path, e)
+                    job.advance(current=item_path)
+                    continue
+                copied.append((key, size))
+                job.advance(size=0 if key.endswith('/') else size, current=item_path)
+        return copied
+
+    def copy(self, src: str, dest: str, job=None):
+        self._copy(src, dest, job or DIRECT_JOB)
+
+    def move(self, src: str, dest: str, job=None):
+        # 对象存储没有重命名：复制完成后只删除复制成功的源对象，复制失败的条目留在原处
+        copied = self._copy(src, dest, job or DIRECT_JOB)
+        self._delete_keys(copied, _ErrorsOnly(job) if job is not None else DIRECT_JOB)
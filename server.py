@@ -0,0 +1,308 @@
+"""
+多进程服务启动器
+
+生产环境使用 `python server.py` 启动，替代单进程的Flask开发服务器：
+- 主进程绑定 server.host / server.port 后预先派生（pre-fork）server.workers 个工作进程，共享同一个监听socket
+- 工作进程在fork之后才导入并创建应用（create_app），线程、SQLite连接等状态不会跨进程共享；
+  主进程导入过的项目模块（config、utils 等）在工作进程中丢弃后重新导入，因此新的工作进程总是运行磁盘上的当前代码
+- 每个工作进程使用 server.threads 个线程处理请求，线程全忙时不再accept，新连接留在内核队列中由其他工作进程接收
+- server.engine 设为 "asyncio" 时改用 aio_server 中的事件循环引擎，连接的读写不占用线程
+- SIGHUP：平滑重启，重新读取配置和应用代码（server.py 本身除外），先启动新一批工作进程，再通知旧进程处理完当前请求后退出
+- SIGTERM / SIGINT：平滑停止，超过 server.graceful_timeout 仍未退出的工作进程会被强制结束
+- 工作进程意外退出时自动补齐
+
+注意：修改监听地址和端口需要完全重启主进程。
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    使用固定大小线程池的WSGI服务器（工作进程内使用）
+
+    直接使用主进程传入的监听socket；线程全部占用时暂停accept。
+    """
+
+    multithread = True
+    multiprocess = True
+    # 收到停止信号后置为True，保持连接的请求处理完当前请求即关闭连接
+    stopping = False
+
+    def __init__(self, host: str, port: int, app, threads: int, handler, fd: int):
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        # 多个进程共同监听，accept可能被其他进程抢先，必须使用非阻塞socket
+        self.socket.setblocking(False)
+        self.threads = threads
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def get_request(self):
+        # 先占用一个线程名额再accept；没有空闲线程时不接收新连接
+        if not self._slots.acquire(timeout=0.5):
+            raise BlockingIOError('没有空闲的工作线程')
+        try:
+            request, client_address = super().get_request()
+        except BaseException:
+            self._slots.release()
+            raise
+        request.setblocking(True)
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        try:
+            self._pool.submit(self._process_request_thread, request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self, timeout: float) -> bool:
+        """等待正在处理的请求全部完成，超时返回False"""
+        deadline = time.monotonic() + timeout
+        for _ in range(self.threads):
+            if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                return False
+        return True
+
+
+def forget_project_modules():
+    """丢弃从fork继承来的项目模块（主进程导入的 config、utils 及其依赖），之后的导入读取磁盘上的当前代码"""
+    current = sys.modules.get(__name__)
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if module is not current and path and os.path.dirname(os.path.abspath(path)) == ROOT_DIR:
+            del sys.modules[name]
+
+
+def run_worker(listen_socket: socket.socket, server_config: dict):
+    """工作进程入口：创建应用并处理请求，收到SIGTERM后处理完当前请求再退出"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    forget_project_modules()
+    import metrics
+    from app import create_app
+
+    if server_config.get('engine', 'threaded') == 'asyncio':
+        import aio_server
+        app = create_app()
+        print(f"工作进程 {os.getpid()} 已启动（asyncio引擎）")
+        aio_server.run(app, listen_socket, server_config)
+        metrics.registry.stop()
+        os._exit(0)
+
+    from file_transfer import SendfileRequestHandler
+
+    class WorkerRequestHandler(SendfileRequestHandler):
+        # 连接空闲或读写停滞超过该时间即断开，避免慢客户端长期占用线程
+        timeout = server_config.get('request_timeout', 60)
+
+        def handle_one_request(self):
+            super().handle_one_request()
+            if self.server.stopping:
+                self.close_connection = True
+
+    app = create_app()
+    httpd = PooledWSGIServer(server_config.get('host', '0.0.0.0'),
+                             server_config.get('port', 9000),
+                             app,
+                             max(1, server_config.get('threads', 8)),
+                             WorkerRequestHandler,
+                             listen_socket.fileno())
+    listen_socket.close()
+
+    def handle_term(signum, frame):
+        httpd.stopping = True
+        # shutdown() 会等待serve_forever退出，不能在serve_forever所在的线程中直接调用
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+        # 结束统计推送等长连接，否则drain要一直等到超时
+        app.extensions['fileserver'].stop()
+
+    signal.signal(signal.SIGTERM, handle_term)
+    print(f"工作进程 {os.getpid()} 已启动")
+    httpd.serve_forever()
+
+    if not httpd.drain(server_config.get('graceful_timeout', 30)):
+        print(f"工作进程 {os.getpid()} 等待请求完成超时，强制退出")
+    # os._exit 不会执行清理逻辑，退出前写入最后一次指标快照
+    metrics.registry.stop()
+    os._exit(0)
+
+
+class Master:
+    """主进程：绑定端口、管理工作进程"""
+
+    # 工作进程启动后这么短时间内就退出视为启动失败，补齐前等待一段时间，避免反复fork
+    MIN_WORKER_LIFETIME = 1.0
+
+    def __init__(self, config_manager):
+        self.config = config_manager
+        self.server_config = config_manager.get_server_config()
+        self.socket = None
+        self.generation = 0
+        # pid -> (代数, 启动时间)
+        self.workers = {}
+        # 已通知退出的旧工作进程 pid -> 强制结束的时间
+        self.retiring = {}
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def bind(self):
+        host = self.server_config.get('host', '0.0.0.0')
+        port = self.server_config.get('port', 9000)
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(socket.SOMAXCONN)
+        sock.set_inheritable(True)
+        self.socket = sock
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.socket, self.server_config)
+            except BaseException as e:
+                print(f"工作进程 {os.getpid()} 异常退出: {e}")
+            finally:
+                os._exit(1)
+        self.workers[pid] = (self.generation, time.monotonic())
+
+    def spawn_workers(self):
+        for _ in range(max(1, self.server_config.get('workers', 2))):
+            self.spawn_worker()
+
+    def retire_workers(self, pids):
+        """通知工作进程平滑退出"""
+        deadline = time.monotonic() + self.server_config.get('graceful_timeout', 30) + 5
+        for pid in pids:
+            self.retiring[pid] = deadline
+            self._signal(pid, signal.SIGTERM)
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reload(self):
+        """平滑重启：先启动新一代工作进程，再让旧进程处理完当前请求后退出"""
+        print("收到SIGHUP，平滑重启工作进程")
+        self.config.reload()
+        new_server_config = self.config.get_server_config()
+        for key in ('host', 'port'):
+            if new_server_config.get(key) != self.server_config.get(key):
+                print(f"监听地址配置 {key} 已修改，需要完全重启后生效")
+        new_server_config['host'] = self.server_config.get('host', '0.0.0.0')
+        new_server_config['port'] = self.server_config.get('port', 9000)
+        self.server_config = new_server_config
+
+        old_pids = [pid for pid in self.workers]
+        self.generation += 1
+        self.spawn_workers()
+        self.retire_workers(old_pids)
+
+    def reap(self):
+        """回收已退出的工作进程，当前一代的进程意外退出时补齐"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.pop(pid, None)
+            info = self.workers.pop(pid, None)
+            if info is None:
+                continue
+            generation, started_at = info
+            if self.stop_requested or generation != self.generation:
+                continue
+            print(f"工作进程 {pid} 意外退出（状态 {status}），重新启动")
+            if time.monotonic() - started_at < self.MIN_WORKER_LIFETIME:
+                time.sleep(self.MIN_WORKER_LIFETIME)
+            self.spawn_worker()
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                print(f"工作进程 {pid} 退出超时，强制结束")
+                self._signal(pid, signal.SIGKILL)
+                self.retiring[pid] = now + 5
+
+    def run(self):
+        self.bind()
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_stop(signum, frame):
+            self.stop_requested = True
+
+        signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.spawn_workers()
+        while not self.stop_requested:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.2)
+
+        print("正在停止服务...")
+        self.socket.close()
+        self.retire_workers(list(self.workers))
+        while self.workers:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+        print("服务已停止")
+
+
+def main():
+    # 主进程只在这里导入项目模块，工作进程启动时会丢弃并重新导入（见 forget_project_modules）
+    from config import config
+    from utils import FileUtils, QRCodeUtils
+
+    server_config = config.get_server_config()
+    port = server_config.get('port', 9000)
+    address = f"http://{FileUtils.get_local_ip()}:{port}"
+
+    print("=== 文件服务器启动信息 ===")
+    print(f"服务器地址: {address}")
+    print(f"监听: {server_config.get('host', '0.0.0.0')}:{port}")
+    print(f"工作进程数: {server_config.get('workers', 2)} | 每进程线程数: {server_config.get('threads', 8)}")
+    print(f"主进程PID: {os.getpid()}（kill -HUP 平滑重启，kill -TERM 停止）")
+    print("========================")
+    QRCodeUtils.generate_qrcode(address)
+
+    Master(config).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
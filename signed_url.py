@@ -0,0 +1,142 @@
+"""
+签名下载链接
+
+签名链接形如 /signed/<相对路径>?expires=<时间戳>&ip=<地址>&range=<区间>&sig=<签名>：
+- expires：过期时间（Unix时间戳）
+- ip：可选，只允许该地址或网段（如 10.0.0.0/8）访问
+- range：可选，只允许下载文件的该字节区间（如 0-1048575，结束位置可省略表示到文件末尾）
+- sig：HMAC-SHA256 签名（base64url），覆盖路径和以上所有参数
+
+校验只依赖密钥和链接本身，不查询会话或任何服务端状态，所有工作进程使用同一份配置即可互相校验。
+"""
+import time
+import hmac
+import base64
+import hashlib
+import ipaddress
+from typing import Dict, Optional, Tuple
+
+SIGNATURE_VERSION = 'v1'
+
+
+class SignedUrlError(Exception):
+    """签名链接无效，附带HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 403):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def parse_range_scope(value: str) -> Tuple[int, Optional[int]]:
+    """
+    解析区间范围 start-end（包含两端，end可省略）
+
+    Raises:
+        ValueError: 格式无效
+    """
+    start, sep, end = value.strip().partition('-')
+    if not sep or not start.isdigit() or (end and not end.isdigit()):
+        raise ValueError(f'无效的区间: {value}')
+    if end and int(end) < int(start):
+        raise ValueError(f'无效的区间: {value}')
+    return int(start), int(end) if end else None
+
+
+def parse_ip_scope(value: str) -> str:
+    """
+    规范化IP范围（单个地址或CIDR网段）
+
+    Raises:
+        ValueError: 格式无效
+    """
+    try:
+        return str(ipaddress.ip_network(value.strip(), strict=False))
+    except ValueError:
+        raise ValueError(f'无效的IP范围: {value}')
+
+
+class UrlSigner:
+    """签名链接的生成和校验"""
+
+    def __init__(self, secret: str, max_ttl: int = 7 * 24 * 3600):
+        """
+        Args:
+            secret (str): 签名密钥
+            max_ttl (int): 链接最长有效期（秒）
+        """
+        # 派生专用密钥，即使与会话共用同一个secret_key，签名也无法用于伪造会话
+        self.key = hmac.new(secret.encode('utf-8'), b'signed-url', hashlib.sha256).digest()
+        self.max_ttl = max_ttl
+
+    def _signature(self, path: str, expires: int, ip: str, range_scope: str) -> str:
+        message = '\n'.join((SIGNATURE_VERSION, path, str(expires), ip, range_scope)).encode('utf-8')
+        digest = hmac.new(self.key, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+    def sign(self, path: str, ttl: int, ip: str = '', range_scope: str = '') -> Dict[str, str]:
+        """
+        为相对路径生成签名参数
+
+        Args:
+            path (str): 文件相对路径（使用 / 分隔）
+            ttl (int): 有效期（秒），不超过 max_ttl
+            ip (str): IP地址或CIDR网段，为空表示不限制
+            range_scope (str): 允许下载的字节区间，为空表示整个文件
+
+        Returns:
+            Dict[str, str]: 需要附加到链接上的查询参数
+
+        Raises:
+            ValueError: 参数无效
+        """
+        if ttl <= 0 or ttl > self.max_ttl:
+            raise ValueError(f'有效期必须在1到{self.max_ttl}秒之间')
+        params = {'expires': str(int(time.time()) + ttl)}
+        if ip:
+            params['ip'] = ip = parse_ip_scope(ip)
+        if range_scope:
+            parse_range_scope(range_scope)
+            params['range'] = range_scope = range_scope.strip()
+        params['sig'] = self._signature(path, int(params['expires']), ip, range_scope)
+        return params
+
+    def verify(self, path: str, params, remote_addr: Optional[str]) -> Dict[str, object]:
+        """
+        校验签名链接
+
+        Args:
+            path (str): 文件相对路径（使用 / 分隔）
+            params: 请求的查询参数
+            remote_addr (str): 客户端地址
+
+        Returns:
+            Dict[str, object]: expires（过期时间戳）、ip（IP范围，未限制时为空）、
+            range（允许的区间 (start, end)，未限制时为None）
+
+        Raises:
+            SignedUrlError: 签名无效、已过期或访问范围不符
+        """
+        expires = params.get('expires', '')
+        signature = params.get('sig', '')
+        ip = params.get('ip', '')
+        range_scope = params.get('range', '')
+        if not expires.isdigit() or not signature:
+            raise SignedUrlError('缺少签名参数')
+        expected = self._signature(path, int(expires), ip, range_scope)
+        if not hmac.compare_digest(signature.encode('utf-8'), expected.encode('ascii')):
+            raise SignedUrlError('签名无效')
+        if int(expires) < time.time():
+            raise SignedUrlError('链接已过期')
+        if ip:
+            try:
+                allowed = ipaddress.ip_address(remote_addr or '') in ipaddress.ip_network(ip)
+            except ValueError:
+                allowed = False
+            if not allowed:
+                raise SignedUrlError('当前地址无权使用该链接')
+        return {
+            'expires': int(expires),
+            'ip': ip,
+            'range': parse_range_scope(range_scope) if range_scope else None
+        }
@@ -0,0 +1,231 @@
+"""
+统计信息推送（Server-Sent Events）
+
+仪表板和文件列表页通过 /api/stats/stream 订阅统计信息，不再各自轮询统计接口：
+- 每个进程只有一个后台生产者线程，有订阅者时每隔 interval 秒获取一次统计信息，
+  与上一次的结果比较后只把变化的部分推送给所有订阅者；没有订阅者时线程空闲等待
+- 多个工作进程通过 .fileserver/stats 下的共享快照文件协调：快照未过期时直接读取，
+  过期后由持有文件锁的进程重新计算，因此无论打开多少个页面，每个间隔内最多计算一次
+- 新订阅者先收到一次完整统计，之后只收到变化的部分；错过中间的推送时重新发送完整统计
+
+事件格式：
+    event: stats
+    id: <版本号>
+    data: {"disk_usage": {...}, "file_stats": {...}, "file_type_stats": {...}, "folder_size_stats": {...}}
+"""
+import os
+import json
+import time
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, Optional
+
+SNAPSHOT_FILE = 'snapshot.json'
+
+# 客户端断线后的重连间隔（毫秒）
+RETRY_INTERVAL = 5000
+
+# 文件变化触发重新统计时，两次统计之间的最短间隔（秒）
+MIN_REFRESH_INTERVAL = 1.0
+
+
+class StatsStreamFull(Exception):
+    """订阅者数量已达上限"""
+    pass
+
+
+class StatsSubscription:
+    """
+    单个订阅者的事件流（WSGI响应体）
+
+    订阅在创建时登记，close() 时注销；即使响应体从未被迭代也会由服务器调用 close()。
+    """
+
+    def __init__(self, broadcaster: 'StatsBroadcaster'):
+        self.broadcaster = broadcaster
+        self.closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.broadcaster._stream(self)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broadcaster._unsubscribe()
+
+
+class StatsBroadcaster:
+    """统计信息生产者：进程内单线程计算，广播给所有订阅者"""
+
+    def __init__(self, compute: Callable[[], Dict[str, Any]], state_dir: str, interval: float = 30,
+                 heartbeat: float = 15, max_subscribers: int = 4):
+        """
+        Args:
+            compute: 计算完整统计信息的函数，返回 {分区名: 统计数据}
+            state_dir (str): 进程间共享快照和文件锁所在目录
+            interval (float): 统计间隔（秒）
+            heartbeat (float): 没有数据推送时发送心跳注释的间隔（秒），用于及时发现断开的连接
+            max_subscribers (int): 每个进程的订阅者上限，每个订阅者会占用一个请求处理线程
+        """
+        self.compute = compute
+        self.state_dir = state_dir
+        self.interval = max(1.0, interval)
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._invalidated = threading.Event()
+        self._subscribers = 0
+        self._snapshot = None
+        self._delta = None
+        self._version = 0
+        self._fresh_until = 0.0
+        self._thread = None
+
+    def subscribe(self) -> StatsSubscription:
+        """
+        登记一个订阅者
+
+        Raises:
+            StatsStreamFull: 订阅者已达上限或服务正在停止
+        """
+        with self._cond:
+            if self._stop.is_set() or self._subscribers >= self.max_subscribers:
+                raise StatsStreamFull()
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stats-stream', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return StatsSubscription(self)
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def invalidate(self):
+        """
+        文件发生变化后调用：丢弃共享快照并尽快重新统计推送（两次统计至少间隔 MIN_REFRESH_INTERVAL 秒）
+
+        其他工作进程的生产者在各自的下一个间隔重新统计。
+        """
+        try:
+            os.remove(os.path.join(self.state_dir, SNAPSHOT_FILE))
+        except FileNotFoundError:
+            pass
+        self._invalidated.set()
+
+    def close(self):
+        """结束所有事件流并停止生产者线程（进程退出前调用，避免长连接拖住平滑退出）"""
+        self._stop.set()
+        self._invalidated.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self):
+        next_at = 0.0
+        last_at = 0.0
+        while not self._stop.is_set():
+            with self._cond:
+                while self._subscribers == 0 and not self._stop.is_set():
+                    self._cond.wait()
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                # 上一次的结果仍在有效期内（如页面刷新后重新订阅），到期或文件发生变化后再计算
+                if self._invalidated.wait(delay):
+                    self._invalidated.clear()
+                    next_at = min(next_at, last_at + MIN_REFRESH_INTERVAL)
+                continue
+            self._invalidated.clear()
+            last_at = time.monotonic()
+            next_at = last_at + self.interval
+            try:
+                stats = self._load()
+            except Exception as e:
+                print(f"获取统计信息失败: {e}")
+                continue
+            self._publish(stats, next_at)
+
+    def _publish(self, stats: Dict[str, Any], fresh_until: float):
+        with self._cond:
+            previous = self._snapshot or {}
+            delta = {name: value for name, value in stats.items() if previous.get(name) != value}
+            self._snapshot = stats
+            self._fresh_until = fresh_until
+            if delta:
+                self._version += 1
+                self._delta = delta
+            self._cond.notify_all()
+
+    @contextmanager
+    def _shared_lock(self) -> Iterator[None]:
+        """共享快照的进程间锁"""
+        fd = os.open(os.path.join(self.state_dir, 'snapshot.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_shared(self) -> Optional[Dict[str, Any]]:
+        """读取其他进程在有效期内写入的快照"""
+        try:
+            with open(os.path.join(self.state_dir, SNAPSHOT_FILE), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if time.time() - data['generated_at'] < self.interval:
+                return data['stats']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _load(self) -> Dict[str, Any]:
+        """获取统计信息：优先使用共享快照，过期时计算并写回"""
+        with self._shared_lock():
+            stats = self._read_shared()
+            if stats is not None:
+                return stats
+            # 经过一次JSON序列化，保证与从共享快照读到的结果可以直接比较
+            data = json.dumps({'generated_at': time.time(), 'stats': self.compute()}, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, prefix='.snapshot-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, os.path.join(self.state_dir, SNAPSHOT_FILE))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            return json.loads(data)['stats']
+
+    @staticmethod
+    def _format_event(version: int, payload: Dict[str, Any]) -> bytes:
+        data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        return f'event: stats\nid: {version}\ndata: {data}\n\n'.encode('utf-8')
+
+    def _stream(self, subscription: StatsSubscription) -> Iterator[bytes]:
+        seen = None
+        try:
+            yield f'retry: {RETRY_INTERVAL}\n\n'.encode('ascii')
+            # 空数据块让服务器立即发送已产生的数据（包括响应头），不等凑满一批
+            yield b''
+            while not subscription.closed:
+                with self._cond:
+                    if seen is None:
+                        # 首个事件：等待有效期内的完整统计
+                        ready = lambda: self._stop.is_set() or (
+                            self._snapshot is not None and time.monotonic() < self._fresh_until)
+                    else:
+                        ready = lambda: self._stop.is_set() or self._version != seen
+                    if not self._cond.wait_for(ready, self.heartbeat):
+                        event = b': ping\n\n'
+                    elif self._stop.is_set():
+                        return
+                    else:
+                        full = seen is None or self._version != seen + 1
+                        seen = self._version
+                        event = self._format_event(seen, self._snapshot if full else self._delta)
+                yield event
+                yield b''
+        finally:
+            subscription.close()
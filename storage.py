@@ -0,0 +1,285 @@
+"""
+存储后端
+
+上传目录中的用户文件都通过存储后端访问，路由、后台任务以及 FileUtils 的列表、搜索和统计不直接调用 os：
+- LocalStorage：本地文件系统（默认）。stat/scandir 直接返回 os 的结果，下载仍然使用sendfile，
+  移动仍然是rename，复制仍然优先reflink克隆
+- S3Storage（见 s3_storage.py）：S3兼容的对象存储
+
+后端"挂载"在上传目录上：所有方法的参数都是上传目录下的绝对路径，与路由中使用的路径相同。
+stat() 和 scandir() 返回的对象与 os.stat_result / os.DirEntry 的常用属性和方法兼容，
+因此同一份列表、搜索、统计和打包代码适用于任何后端。内部数据目录（.fileserver）始终位于本地。
+"""
+import os
+import stat
+import errno
+import shutil
+from typing import Iterator, List, Tuple
+
+import file_ops
+from utils import FileUtils
+
+READ_CHUNK_SIZE = 256 * 1024
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+class StorageError(OSError):
+    """存储后端请求失败（对象存储返回错误、连接失败等），附带建议的HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(errno.EIO, message)
+        self.message = message
+        self.status_code = status_code
+
+    def __str__(self):
+        return self.message
+
+
+class _DirectJob:
+    """不在后台任务中执行操作时使用的任务对象：不汇报进度，遇到第一个失败的条目即抛出异常"""
+
+    def set_total(self, items: int, size: int):
+        pass
+
+    def advance(self, items: int = 1, size: int = 0, current=None):
+        pass
+
+    def record_error(self, path: str, error: Exception):
+        raise error
+
+    def checkpoint(self, force: bool = False):
+        pass
+
+
+DIRECT_JOB = _DirectJob()
+
+
+class StorageBackend:
+    """
+    存储后端接口
+
+    删除、复制和移动接受一个任务对象（jobs.Job），逐个条目汇报进度并响应取消；
+    单个条目失败时记录到任务中并继续处理其余条目。不传任务对象时遇到第一个失败即抛出异常。
+    """
+
+    # 是否是本地文件系统（sendfile、回收站rename、去重硬链接、元数据索引等只适用于本地文件）
+    is_local = False
+
+    def stat(self, path: str):
+        """
+        获取文件或目录的元数据（跟随符号链接）
+
+        Raises:
+            FileNotFoundError: 路径不存在
+        """
+        raise NotImplementedError
+
+    def lstat(self, path: str):
+        """获取元数据，不跟随符号链接"""
+        return self.stat(path)
+
+    def exists(self, path: str) -> bool:
+        try:
+            self.stat(path)
+            return True
+        except OSError:
+            return False
+
+    def lexists(self, path: str) -> bool:
+        """路径是否存在（符号链接本身存在即可）"""
+        return self.exists(path)
+
+    def isdir(self, path: str) -> bool:
+        try:
+            return stat.S_ISDIR(self.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def isfile(self, path: str) -> bool:
+        try:
+            return stat.S_ISREG(self.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def islink(self, path: str) -> bool:
+        return False
+
+    def scandir(self, path: str):
+        """
+        列出目录的直接子项，返回可以用于 with 语句的 DirEntry 迭代器
+
+        Raises:
+            FileNotFoundError: 目录不存在
+        """
+        raise NotImplementedError
+
+    def open(self, path: str):
+        """打开文件用于顺序读取，返回带 read(n) 和 close() 的二进制文件对象"""
+        raise NotImplementedError
+
+    def open_range(self, path: str, offset: int, length: int) -> Iterator[bytes]:
+        """读取文件的一个字节区间，按顺序产生数据块"""
+        raise NotImplementedError
+
+    def write(self, path: str, stream) -> int:
+        """
+        从可读对象（read(n)）流式写入新文件，返回写入的字节数
+
+        Raises:
+            FileExistsError: 目标已存在（不会覆盖）
+        """
+        raise NotImplementedError
+
+    def put_file(self, local_path: str, path: str):
+        """
+        把本地暂存文件放到目标路径，成功后本地文件不再存在
+
+        Raises:
+            FileExistsError: 目标已存在（不会覆盖，此时本地文件保留）
+        """
+        with open(local_path, 'rb') as f:
+            self.write(path, f)
+        os.remove(local_path)
+
+    def makedirs(self, path: str):
+        """创建目录（包括上级目录），已存在时不报错"""
+        raise NotImplementedError
+
+    def walk(self, path: str) -> Iterator[Tuple[str, int]]:
+        """递归列出路径（文件或目录）中的文件，产生 (路径, 大小)"""
+        raise NotImplementedError
+
+    def count(self, paths: List[str]) -> Tuple[int, int]:
+        """统计路径（目录递归）包含的条目数和文件总字节数"""
+        raise NotImplementedError
+
+    def delete(self, path: str, job=None):
+        """删除文件或目录（递归）"""
+        raise NotImplementedError
+
+    def copy(self, src: str, dest: str, job=None):
+        """
+        复制文件或目录（递归）到dest
+
+        Raises:
+            FileExistsError: dest 已存在（不会覆盖）
+        """
+        raise NotImplementedError
+
+    def move(self, src: str, dest: str, job=None):
+        """
+        移动（重命名）文件或目录到dest
+
+        Raises:
+            FileExistsError: dest 已存在（不会覆盖）
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """释放连接等资源"""
+
+
+class LocalStorage(StorageBackend):
+    """本地文件系统存储，删除、复制、移动使用 file_ops（去重模式下同时维护blob引用）"""
+
+    is_local = True
+
+    def __init__(self, blob_store=None):
+        """
+        Args:
+            blob_store: 去重存储，为None时不去重
+        """
+        self.blob_store = blob_store
+
+    def stat(self, path: str):
+        return os.stat(path)
+
+    def lstat(self, path: str):
+        return os.lstat(path)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def lexists(self, path: str) -> bool:
+        return os.path.lexists(path)
+
+    def isdir(self, path: str) -> bool:
+        return os.path.isdir(path)
+
+    def isfile(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def islink(self, path: str) -> bool:
+        return os.path.islink(path)
+
+    def scandir(self, path: str):
+        return os.scandir(path)
+
+    def open(self, path: str):
+        return open(path, 'rb')
+
+    def open_range(self, path: str, offset: int, length: int) -> Iterator[bytes]:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            while length > 0:
+                data = os.pread(fd, min(READ_CHUNK_SIZE, length), offset)
+                if not data:
+                    break
+                offset += len(data)
+                length -= len(data)
+                yield data
+        finally:
+            os.close(fd)
+
+    def write(self, path: str, stream) -> int:
+        # 独占创建目标，已存在时抛出 FileExistsError（此时不能进入下面的清理，否则会删除别人的文件）
+        f = open(path, 'xb')
+        completed = False
+        try:
+            with f:
+                shutil.copyfileobj(stream, f, WRITE_CHUNK_SIZE)
+                size = f.tell()
+            completed = True
+            return size
+        finally:
+            if not completed:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def put_file(self, local_path: str, path: str):
+        # 暂存目录与上传目录位于同一文件系统，rename即可
+        FileUtils.rename_noreplace(local_path, path)
+
+    def makedirs(self, path: str):
+        os.makedirs(path, exist_ok=True)
+
+    def walk(self, path: str) -> Iterator[Tuple[str, int]]:
+        if os.path.islink(path) or not os.path.isdir(path):
+            yield path, os.lstat(path).st_size
+            return
+        # 包括指向目录的符号链接本身
+        for root, dirs, names in os.walk(path):
+            for name in names + [name for name in dirs if os.path.islink(os.path.join(root, name))]:
+                file_path = os.path.join(root, name)
+                try:
+                    yield file_path, os.lstat(file_path).st_size
+                except OSError:
+                    continue
+
+    def count(self, paths: List[str]) -> Tuple[int, int]:
+        return file_ops.count_tree(paths)
+
+    def delete(self, path: str, job=None):
+        file_ops.delete_tree(path, job or DIRECT_JOB, self.blob_store)
+
+    def copy(self, src: str, dest: str, job=None):
+        file_ops.copy_tree(src, dest, job or DIRECT_JOB, self.blob_store)
+
+    def move(self, src: str, dest: str, job=None):
+        file_ops.move_path(src, dest, job or DIRECT_JOB, self.blob_store)
+
+
+# 未指定存储后端时（如基准测试直接调用 FileUtils）使用的本地文件系统
+local_storage = LocalStorage()
@@ -0,0 +1,191 @@
+"""
+流式上传模块
+
+直接增量解析请求体（multipart/form-data 或原始字节流），边接收边写入暂存文件：
+- 不经过Werkzeug的临时文件缓存，每个字节只写一次磁盘
+- 接收过程中实时检查大小限制，超限立即中止
+- 可选地边接收边计算SHA-256，并与客户端提供的摘要比对
+- 暂存文件与上传目录位于同一文件系统，接收完成后由调用方原子rename到最终位置
+"""
+import os
+import hashlib
+import tempfile
+from typing import Dict, Any, Callable, Optional
+
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+
+
+class StreamingUploadError(Exception):
+    """流式上传错误，附带HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400, details: str = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+
+class _StagedFile:
+    """正在写入的暂存文件"""
+
+    def __init__(self, staging_dir: str, filename: str, max_size: int, compute_digest: bool):
+        self.filename = filename
+        self.max_size = max_size
+        self.size = 0
+        self.hasher = hashlib.sha256() if compute_digest else None
+        fd, self.path = tempfile.mkstemp(dir=staging_dir, prefix='stream-', suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise StreamingUploadError(
+                '文件大小超出限制',
+                413,
+                f'最大限制: {self.max_size / (1024 * 1024):.2f}MB'
+            )
+        self.file.write(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def result(self, expected_sha256: Optional[str]) -> Dict[str, Any]:
+        self.close()
+        digest = self.hasher.hexdigest() if self.hasher is not None else None
+        if expected_sha256 and digest is None:
+            raise StreamingUploadError('文件校验失败', 400, 'sha256 字段需位于文件字段之前')
+        if expected_sha256 and digest != expected_sha256.strip().lower():
+            raise StreamingUploadError('文件校验失败', 400, f'期望SHA-256: {expected_sha256}, 实际: {digest}')
+        return {
+            'temp_path': self.path,
+            'filename': self.filename,
+            'size': self.size,
+            'sha256': digest
+        }
+
+
+class StreamingUploadReceiver:
+    """流式上传接收器"""
+
+    READ_SIZE = 256 * 1024
+    FILE_FIELD_NAMES = ('file', 'files[]', 'dzfile', 'file[0]')
+    MAX_FIELD_SIZE = 64 * 1024
+
+    def __init__(self, staging_dir: str, max_size: int, compute_digest: bool = True):
+        """
+        初始化流式上传接收器
+
+        Args:
+            staging_dir (str): 暂存目录，需与上传目录位于同一文件系统
+            max_size (int): 单个文件的最大字节数
+            compute_digest (bool): 是否边接收边计算SHA-256
+        """
+        self.staging_dir = staging_dir
+        self.max_size = max_size
+        self.compute_digest = compute_digest
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def receive_raw(self, stream, filename: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        接收原始字节流请求体
+
+        Returns:
+            Dict[str, Any]: temp_path、filename、size、sha256
+        """
+        staged = _StagedFile(self.staging_dir, filename, self.max_size,
+                             self.compute_digest or bool(expected_sha256))
+        try:
+            while True:
+                data = stream.read(self.READ_SIZE)
+                if not data:
+                    break
+                staged.write(data)
+            return staged.result(expected_sha256)
+        except BaseException:
+            staged.discard()
+            raise
+
+    def receive_multipart(self, stream, boundary: bytes,
+                          on_file: Callable[[str, Dict[str, str]], None],
+                          expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        增量解析multipart请求体，只保存第一个文件字段
+
+        Args:
+            stream: 请求输入流
+            boundary (bytes): multipart分隔符
+            on_file: 遇到文件字段时的回调，参数为文件名和此前已解析的表单字段，
+                     可抛出 StreamingUploadError 提前拒绝（如文件类型不允许）
+            expected_sha256 (str): 客户端提供的摘要（也可通过 sha256 表单字段提供）
+
+        Returns:
+            Dict[str, Any]: temp_path、filename、size、sha256 以及 fields（其他表单字段）
+        """
+        decoder = MultipartDecoder(boundary)
+        fields: Dict[str, str] = {}
+        staged: Optional[_StagedFile] = None
+        finished: Optional[_StagedFile] = None
+        current_field: Optional[str] = None
+        field_buffer = bytearray()
+        # 当前part的去向：'field' 收集为表单字段，'file' 写入暂存文件，None 丢弃
+        target = None
+
+        try:
+            while True:
+                chunk = stream.read(self.READ_SIZE)
+                decoder.receive_data(chunk or None)
+                event = decoder.next_event()
+                while not isinstance(event, NeedData):
+                    if isinstance(event, Field):
+                        target = 'field'
+                        current_field = event.name
+                        field_buffer.clear()
+                    elif isinstance(event, File):
+                        if finished is None and staged is None and self._is_file_field(event.name) and event.filename:
+                            on_file(event.filename, fields)
+                            compute_digest = self.compute_digest or bool(expected_sha256 or fields.get('sha256'))
+                            staged = _StagedFile(self.staging_dir, event.filename, self.max_size, compute_digest)
+                            target = 'file'
+                        else:
+                            target = None
+                    elif isinstance(event, Data):
+                        if target == 'file':
+                            staged.write(event.data)
+                            if not event.more_data:
+                                staged.close()
+                                finished, staged = staged, None
+                        elif target == 'field':
+                            field_buffer.extend(event.data)
+                            if len(field_buffer) > self.MAX_FIELD_SIZE:
+                                raise StreamingUploadError('表单字段过大', 413)
+                            if not event.more_data:
+                                fields[current_field] = field_buffer.decode('utf-8', 'replace')
+                    elif isinstance(event, Epilogue):
+                        break
+                    event = decoder.next_event()
+                if isinstance(event, Epilogue) or not chunk:
+                    break
+
+            if finished is None:
+                raise StreamingUploadError('请选择文件', 400)
+            result = finished.result(expected_sha256 or fields.get('sha256'))
+            result['fields'] = fields
+            return result
+        except BaseException:
+            for staged_file in (staged, finished):
+                if staged_file is not None:
+                    staged_file.discard()
+            raise
+
+    def _is_file_field(self, name: str) -> bool:
+        return name.startswith('file') or name in self.FILE_FIELD_NAMES
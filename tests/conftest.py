@@ -0,0 +1,67 @@
+"""
+测试公共夹具
+
+项目的模块位于仓库根目录（没有包结构），测试前把根目录加入 sys.path。
+"""
+import os
+import sys
+import json
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def merge_dict(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_dict(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def write_config(tmp_path, overrides=None):
+    """在临时目录中写入测试配置（上传目录位于临时目录中），返回配置文件路径"""
+    data = {
+        'upload': {'folder': str(tmp_path / 'uploads')},
+        'bandwidth': {'enabled': False},
+        'admission': {'enabled': False}
+    }
+    merge_dict(data, overrides or {})
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """创建使用临时上传目录的应用：make_app(overrides) -> app，测试结束时停止后台服务"""
+    from config import Config
+    from app import create_app
+
+    apps = []
+
+    def factory(overrides=None, start_services=True):
+        app = create_app(Config(write_config(tmp_path, overrides)), start_services=start_services)
+        app.config['TESTING'] = True
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        app.extensions['fileserver'].stop()
+
+
+def login(client, username='user', password='user123'):
+    response = client.post('/login', data={'username': username, 'password': password}, buffered=True)
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def client(make_app):
+    """已登录普通用户的测试客户端"""
+    return login(make_app().test_client())
@@ -0,0 +1,75 @@
+"""准入控制：默认限制按线程数推算，单个用户的并行上传不被拒绝"""
+import io
+import os
+
+import pytest
+
+from admission import derive_limits, CLASSES
+from conftest import login
+
+
+@pytest.mark.parametrize('threads', [4, 8, 16, 32, 64])
+def test_derived_limits_leave_threads_for_other_classes(threads):
+    limits = derive_limits(threads)
+    assert set(limits) == set(CLASSES)
+    for limit in limits.values():
+        assert limit['concurrency'] >= 1
+        assert limit['concurrency'] + limit['queue'] < threads
+
+
+def test_derived_limits_fit_parallel_uploads():
+    # 上传页面同时上传5个文件
+    assert derive_limits(8)['transfers']['concurrency'] >= 5
+    assert derive_limits(2) == {}
+
+
+def test_defaults_follow_server_threads(make_app):
+    app = make_app({'admission': {'enabled': True}, 'server': {'threads': 16}})
+    gates = app.extensions['fileserver'].admission.gates
+    assert gates['transfers'].concurrency == derive_limits(16)['transfers']['concurrency']
+    assert gates['stats'].concurrency == 4
+
+
+def test_configured_class_overrides_derived_limit(make_app):
+    app = make_app({'admission': {'enabled': True, 'stats': {'concurrency': 3, 'queue': 1}}})
+    gates = app.extensions['fileserver'].admission.gates
+    assert gates['stats'].concurrency == 3
+    assert gates['listings'].concurrency == derive_limits(8)['listings']['concurrency']
+
+
+def busy_transfers_app(make_app, engine='threaded'):
+    """传输类别的唯一名额已被占用且不排队的应用"""
+    app = make_app({'server': {'engine': engine},
+                    'admission': {'enabled': True, 'transfers': {'concurrency': 1, 'queue': 0}}})
+    app.extensions['fileserver'].admission.gates['transfers'].acquire()
+    return app
+
+
+def test_chunk_uploads_are_not_gated(make_app):
+    app = busy_transfers_app(make_app)
+    client = login(app.test_client())
+
+    response = client.put('/api/upload/stream?filename=a.txt&current_path=', data=b'hello', buffered=True)
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+    # 会话创建不属于传输类别，分片上传也不计入名额
+    upload = client.post('/api/uploads', json={'filename': 'a.txt', 'size': 5, 'current_path': ''},
+                         buffered=True).get_json()
+    response = client.put(f"/api/uploads/{upload['upload_id']}?offset=0", data=b'hello', buffered=True)
+    assert response.status_code == 200
+    response = client.post(f"/api/uploads/{upload['upload_id']}/complete", buffered=True)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('engine, status', [('threaded', 503), ('asyncio', 200)])
+def test_downloads_gated_only_on_threaded_engine(make_app, engine, status):
+    app = busy_transfers_app(make_app, engine)
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'a.txt'), 'wb') as f:
+        f.write(b'hello')
+    client = login(app.test_client())
+    assert client.get('/download/a.txt', buffered=True).status_code == status
+    # 上传在两种引擎下都占用线程，都计入名额
+    response = client.post('/upload', data={'file': (io.BytesIO(b'x'), 'b.txt'), 'current_path': ''},
+                           buffered=True)
+    assert response.status_code == 503
@@ -0,0 +1,169 @@
+"""断点续传会话：完成上传与分片写入、取消、重复完成之间的并发，过期会话的后台清理"""
+import io
+import os
+import time
+import threading
+
+import pytest
+
+from chunked_upload import UploadSessionManager, UploadSessionError
+from conftest import login
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return UploadSessionManager(str(tmp_path / 'staging'))
+
+
+def uploaded(manager, content=b'hello'):
+    upload = manager.create('a.txt', len(content), '', 'user')
+    manager.write_chunk(upload['upload_id'], 'user', 0, len(content), io.BytesIO(content))
+    return upload['upload_id']
+
+
+def test_finalized_session_rejects_changes(manager):
+    upload_id = uploaded(manager)
+    result = manager.complete(upload_id, 'user')
+    with open(result['data_path'], 'rb') as f:
+        assert f.read() == b'hello'
+
+    for attempt in (lambda: manager.write_chunk(upload_id, 'user', 0, 5, io.BytesIO(b'xxxxx')),
+                    lambda: manager.complete(upload_id, 'user'),
+                    lambda: manager.abort(upload_id, 'user')):
+        with pytest.raises(UploadSessionError) as info:
+            attempt()
+        assert info.value.status_code == 409
+    with open(result['data_path'], 'rb') as f:
+        assert f.read() == b'hello'
+
+    manager.remove(upload_id)
+    with pytest.raises(UploadSessionError) as info:
+        manager.complete(upload_id, 'user')
+    assert info.value.status_code == 404
+
+
+def test_incomplete_session_is_not_finalized(manager):
+    upload = manager.create('a.txt', 10, '', 'user')
+    with pytest.raises(UploadSessionError) as info:
+        manager.complete(upload['upload_id'], 'user')
+    assert info.value.status_code == 409
+    manager.write_chunk(upload['upload_id'], 'user', 0, 10, io.BytesIO(b'0123456789'))
+    assert manager.complete(upload['upload_id'], 'user')['complete']
+
+
+def test_reopen_after_failed_placement(manager):
+    upload_id = uploaded(manager)
+    manager.complete(upload_id, 'user')
+    manager.reopen(upload_id, 'user')
+    manager.write_chunk(upload_id, 'user', 0, 5, io.BytesIO(b'HELLO'))
+    with open(manager.complete(upload_id, 'user')['data_path'], 'rb') as f:
+        assert f.read() == b'HELLO'
+
+    # 暂存文件已被移走：会话被删除
+    upload_id = uploaded(manager)
+    os.remove(manager.complete(upload_id, 'user')['data_path'])
+    manager.reopen(upload_id, 'user')
+    with pytest.raises(UploadSessionError) as info:
+        manager.status(upload_id, 'user')
+    assert info.value.status_code == 404
+
+
+def test_complete_waits_for_chunk_in_flight(manager):
+    upload = manager.create('a.txt', 10, '', 'user')
+    upload_id = upload['upload_id']
+    manager.write_chunk(upload_id, 'user', 0, 10, io.BytesIO(b'0123456789'))
+
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowStream:
+        def read(self, size):
+            started.set()
+            release.wait(5)
+            return b'abcde'
+
+    # 重传一个已接收的分片，写入过程中收到完成请求
+    writer = threading.Thread(target=manager.write_chunk, args=(upload_id, 'user', 0, 5, SlowStream()))
+    writer.start()
+    assert started.wait(5)
+    results = []
+    completer = threading.Thread(target=lambda: results.append(manager.complete(upload_id, 'user')))
+    completer.start()
+    time.sleep(0.2)
+    assert results == []
+    release.set()
+    writer.join(5)
+    completer.join(5)
+    with open(results[0]['data_path'], 'rb') as f:
+        assert f.read() == b'abcde56789'
+
+
+def test_concurrent_complete_requests(make_app):
+    app = make_app()
+    client = login(app.test_client())
+    content = os.urandom(100000)
+    upload = client.post('/api/uploads', json={'filename': 'a.txt', 'size': len(content), 'current_path': ''},
+                         buffered=True).get_json()
+    url = f"/api/uploads/{upload['upload_id']}"
+    assert client.put(f'{url}?offset=0', data=content, buffered=True).status_code == 200
+
+    statuses = []
+    barrier = threading.Barrier(8)
+
+    def complete():
+        other = login(app.test_client())
+        barrier.wait()
+        statuses.append(other.post(f'{url}/complete', buffered=True).status_code)
+
+    threads = [threading.Thread(target=complete) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert statuses.count(200) == 1
+    assert set(statuses) <= {200, 404, 409}
+    upload_folder = app.config['UPLOAD_FOLDER']
+    assert sorted(name for name in os.listdir(upload_folder) if not name.startswith('.')) == ['a.txt']
+    with open(os.path.join(upload_folder, 'a.txt'), 'rb') as f:
+        assert f.read() == content
+
+
+def test_failed_complete_can_be_retried(make_app, monkeypatch):
+    import app as app_module
+
+    app = make_app()
+    client = login(app.test_client())
+    upload = client.post('/api/uploads', json={'filename': 'a.txt', 'size': 5, 'current_path': ''},
+                         buffered=True).get_json()
+    url = f"/api/uploads/{upload['upload_id']}"
+    client.put(f'{url}?offset=0', data=b'hello', buffered=True)
+
+    place = app_module.place_uploaded_file
+
+    def failing(*args):
+        raise OSError('disk error')
+
+    monkeypatch.setattr(app_module, 'place_uploaded_file', failing)
+    assert client.post(f'{url}/complete', buffered=True).status_code == 500
+    monkeypatch.setattr(app_module, 'place_uploaded_file', place)
+    assert client.post(f'{url}/complete', buffered=True).status_code == 200
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'a.txt'), 'rb') as f:
+        assert f.read() == b'hello'
+
+
+def test_background_cleanup_removes_expired_sessions(tmp_path):
+    manager = UploadSessionManager(str(tmp_path / 'staging'), session_ttl=60, cleanup_interval=1)
+    expired = manager.create('old.txt', 5, '', 'user')['upload_id']
+    active = manager.create('new.txt', 5, '', 'user')['upload_id']
+    old = time.time() - 120
+    os.utime(os.path.join(manager.staging_dir, expired, 'meta.json'), (old, old))
+
+    manager.start()
+    try:
+        deadline = time.monotonic() + 5
+        while os.path.exists(os.path.join(manager.staging_dir, expired)) and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        manager.stop()
+    assert not os.path.exists(os.path.join(manager.staging_dir, expired))
+    assert manager.status(active, 'user')['size'] == 5
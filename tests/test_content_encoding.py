@@ -0,0 +1,230 @@
+"""下载内容压缩：编码协商、边读边压缩、预压缩副本的生成与失效，以及下载路由的协商行为"""
+import os
+import gzip
+import time
+
+import pytest
+
+from bandwidth import TRANSFER_ENVIRON_KEY
+from content_encoding import ContentEncoder, CompressingBody, negotiate_encoding, variant_etag, COMPRESSORS
+from conftest import login
+
+TEXT = b''.join(b'line %d: the quick brown fox jumps over the lazy dog\n' % i for i in range(40000))
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', None),
+    ('gzip', 'gzip'),
+    ('GZIP;q=0.5, deflate', 'gzip'),
+    ('x-gzip', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', 'gzip'),
+    ('*;q=0.5, identity', None),
+    ('deflate, identity;q=0.1', None),
+    ('gzip;q=0.4, identity;q=0.5', None),
+    ('gzip;q=bogus', None),
+])
+def test_negotiate_gzip(header, expected):
+    assert negotiate_encoding(header, ['gzip']) == expected
+
+
+def test_negotiate_prefers_server_order_on_ties():
+    assert negotiate_encoding('gzip, br, zstd', ['zstd', 'br', 'gzip']) == 'zstd'
+    assert negotiate_encoding('gzip, br;q=0.5, zstd;q=0.1', ['zstd', 'br', 'gzip']) == 'gzip'
+
+
+def test_variant_etag():
+    assert variant_etag('"abc"', 'gzip') == 'W/"abc-gzip"'
+
+
+class FakeTransfer:
+    chunk_size = 1000
+
+    def __init__(self):
+        self.consumed = []
+
+    def consume(self, size):
+        self.consumed.append(size)
+
+
+def test_compressing_body_paced_by_bandwidth_limiter(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(TEXT)
+    transfer = FakeTransfer()
+    body = CompressingBody(os.open(str(path), os.O_RDONLY), COMPRESSORS['gzip'](6),
+                           {TRANSFER_ENVIRON_KEY: transfer})
+    chunks = list(body)
+    body.close()
+    assert body.fd is None
+    data = b''.join(chunks)
+    assert gzip.decompress(data) == TEXT
+    # 按压缩后的字节数申请额度，每次不超过限速器的块大小
+    assert sum(transfer.consumed) == len(data)
+    assert max(len(chunk) for chunk in chunks) <= FakeTransfer.chunk_size
+
+
+@pytest.fixture
+def encoder(tmp_path):
+    encoder = ContentEncoder(str(tmp_path / 'cache'), ['zstd', 'br', 'gzip', 'lzma'], {'gzip': 6},
+                             ['text/', 'application/json'], ['.log'], min_size=1024, precompress_hits=2,
+                             precompress_min_size=1024, cache_size=10 * 1024 * 1024)
+    yield encoder
+    encoder.stop()
+
+
+def test_is_compressible(encoder):
+    assert 'lzma' not in encoder.encodings
+    assert encoder.is_compressible('a.txt', 'text/plain', 2048)
+    assert encoder.is_compressible('a.json', 'application/json', 2048)
+    assert encoder.is_compressible('server.LOG', 'application/octet-stream', 2048)
+    assert not encoder.is_compressible('a.txt', 'text/plain', 100)
+    assert not encoder.is_compressible('a.jpg', 'image/jpeg', 2048)
+    assert not encoder.is_compressible('a.bin', 'application/octet-stream', 2048)
+
+
+def test_sidecar_build_and_invalidation(encoder, tmp_path):
+    source = tmp_path / 'a.txt'
+    source.write_bytes(TEXT)
+    st = os.stat(str(source))
+    path = encoder.sidecar_path(str(source), st, 'gzip')
+    assert encoder.build(str(source), path, 'gzip')
+    fd = encoder.open_sidecar(str(source), st, 'gzip')
+    with os.fdopen(fd, 'rb') as f:
+        assert gzip.decompress(f.read()) == TEXT
+
+    # 源文件变化后旧副本不再匹配，生成新副本时删除旧副本
+    source.write_bytes(TEXT + b'more')
+    new_st = os.stat(str(source))
+    assert encoder.open_sidecar(str(source), new_st, 'gzip') is None
+    new_path = encoder.sidecar_path(str(source), new_st, 'gzip')
+    assert encoder.build(str(source), new_path, 'gzip')
+    assert not os.path.exists(path)
+
+    # 提交后源文件又被修改：丢弃
+    stale = encoder.sidecar_path(str(source), new_st, 'gzip') + '.old'
+    source.write_bytes(TEXT)
+    assert not encoder.build(str(source), stale, 'gzip')
+    assert not os.path.exists(stale)
+
+
+def test_incompressible_content_is_not_cached(encoder, tmp_path):
+    source = tmp_path / 'random.txt'
+    source.write_bytes(os.urandom(64 * 1024))
+    st = os.stat(str(source))
+    path = encoder.sidecar_path(str(source), st, 'gzip')
+    assert not encoder.build(str(source), path, 'gzip')
+    assert not os.path.exists(path)
+    assert [name for _, _, files in os.walk(encoder.cache_dir) for name in files] == []
+    assert path in encoder._incompressible
+
+
+def test_eviction(encoder, tmp_path):
+    paths = []
+    for i in range(3):
+        source = tmp_path / f'{i}.txt'
+        source.write_bytes(TEXT[i:])
+        path = encoder.sidecar_path(str(source), os.stat(str(source)), 'gzip')
+        assert encoder.build(str(source), path, 'gzip')
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(path)
+    encoder.cache_size = os.path.getsize(paths[1]) + os.path.getsize(paths[2])
+    encoder.evict()
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+
+def test_hits_trigger_background_build(encoder, tmp_path):
+    source = tmp_path / 'a.txt'
+    source.write_bytes(TEXT)
+    st = os.stat(str(source))
+    assert encoder.open_sidecar(str(source), st, 'gzip') is None
+    assert not encoder._pending
+    assert encoder.open_sidecar(str(source), st, 'gzip') is None
+    path = encoder.sidecar_path(str(source), st, 'gzip')
+    deadline = time.monotonic() + 10
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    fd = encoder.open_sidecar(str(source), st, 'gzip')
+    assert fd is not None
+    os.close(fd)
+
+
+@pytest.fixture
+def download_app(make_app):
+    app = make_app({'compression': {'enabled': True, 'encodings': ['gzip'], 'mimetypes': ['text/'],
+                                    'min_size': '1KB', 'precompress': True, 'precompress_hits': 2,
+                                    'precompress_min_size': '1KB'}})
+    folder = app.config['UPLOAD_FOLDER']
+    with open(os.path.join(folder, 'a.txt'), 'wb') as f:
+        f.write(TEXT)
+    with open(os.path.join(folder, 'small.txt'), 'wb') as f:
+        f.write(b'tiny')
+    with open(os.path.join(folder, 'photo.jpg'), 'wb') as f:
+        f.write(TEXT)
+    return app
+
+
+def test_download_negotiation(download_app):
+    client = login(download_app.test_client())
+    identity = client.get('/download/a.txt')
+    assert identity.data == TEXT
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['Vary'] == 'Accept-Encoding'
+
+    response = client.get('/download/a.txt', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == variant_etag(identity.headers['ETag'], 'gzip')
+    assert gzip.decompress(response.data) == TEXT
+    assert len(response.data) < len(TEXT) // 5
+
+    etag = response.headers['ETag']
+    cached = client.get('/download/a.txt', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert cached.status_code == 304
+    # 压缩内容的ETag不匹配原始内容
+    assert client.get('/download/a.txt', headers={'If-None-Match': etag}).status_code == 200
+
+    # Range 请求返回原始内容
+    ranged = client.get('/download/a.txt', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-99'})
+    assert ranged.status_code == 206
+    assert 'Content-Encoding' not in ranged.headers
+    assert ranged.data == TEXT[:100]
+
+    for name in ('small.txt', 'photo.jpg'):
+        response = client.get(f'/download/{name}', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        assert 'Vary' not in response.headers
+
+
+def test_download_uses_precompressed_copy(download_app):
+    client = login(download_app.test_client())
+    encoder = download_app.extensions['fileserver'].content_encoder
+    path = os.path.join(download_app.config['UPLOAD_FOLDER'], 'a.txt')
+    sidecar = encoder.sidecar_path(path, os.stat(path), 'gzip')
+    for _ in range(2):
+        response = client.get('/download/a.txt', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Length' not in response.headers
+    deadline = time.monotonic() + 10
+    while not os.path.exists(sidecar):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+    response = client.get('/download/a.txt', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) == os.path.getsize(sidecar)
+    assert gzip.decompress(response.data) == TEXT
+
+    # 源文件被覆盖后不会发送过期的副本
+    with open(path, 'wb') as f:
+        f.write(TEXT[:5000])
+    response = client.get('/download/a.txt', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(response.data) == TEXT[:5000]
+
+
+def test_signed_range_link_is_not_compressed(download_app):
+    client = login(download_app.test_client())
+    url = client.post('/api/sign', json={'filepath': 'a.txt', 'range': '0-99'}).get_json()['url']
+    response = download_app.test_client().get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 206
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == TEXT[:100]
@@ -0,0 +1,161 @@
+"""复制和移动：file_ops 的各种复制方式、符号链接、重名和跨文件系统移动，以及 /api/copy、/api/move 接口"""
+import os
+import time
+import errno
+
+import pytest
+
+import file_ops
+from utils import FileUtils
+from conftest import login
+
+
+class RecordingJob:
+    """记录进度和失败条目的任务对象"""
+
+    def __init__(self):
+        self.items = 0
+        self.size = 0
+        self.errors = []
+
+    def advance(self, items=1, size=0, current=None):
+        self.items += items
+        self.size += size
+
+    def record_error(self, path, error):
+        self.errors.append((path, error))
+
+    def checkpoint(self, force=False):
+        pass
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src = tmp_path / 'src'
+    (src / 'sub' / 'deep').mkdir(parents=True)
+    (src / 'a.bin').write_bytes(os.urandom(3 * 1024 * 1024 + 5))
+    (src / 'sub' / 'b.txt').write_bytes(b'hello')
+    (src / 'sub' / 'deep' / 'c.txt').write_bytes(b'')
+    os.symlink('sub/b.txt', str(src / 'link'))
+    os.symlink('/etc', str(src / 'sub' / 'outside'))
+    os.utime(str(src / 'a.bin'), (1000, 1000))
+    return tmp_path
+
+
+def assert_same_tree(src, dest):
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target = os.path.join(dest, rel)
+        assert sorted(os.listdir(root)) == sorted(os.listdir(target))
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                assert os.readlink(os.path.join(target, name)) == os.readlink(path)
+            elif os.path.isfile(path):
+                with open(path, 'rb') as f1, open(os.path.join(target, name), 'rb') as f2:
+                    assert f1.read() == f2.read()
+
+
+@pytest.mark.parametrize('method', ['auto', 'copy_file_range', 'chunks'])
+def test_copy_tree(tree, monkeypatch, method):
+    if method != 'auto':
+        monkeypatch.setattr(file_ops, '_clone', lambda fsrc, fdst: False)
+    if method == 'chunks':
+        monkeypatch.setattr(file_ops, '_copy_range', lambda fsrc, fdst, size, src, job: False)
+    job = RecordingJob()
+    file_ops.copy_tree(str(tree / 'src'), str(tree / 'dest'), job)
+    assert job.errors == []
+    assert_same_tree(str(tree / 'src'), str(tree / 'dest'))
+    # 符号链接按链接本身复制，不进入链接指向的目录
+    assert os.path.islink(str(tree / 'dest' / 'sub' / 'outside'))
+    assert os.stat(str(tree / 'dest' / 'a.bin')).st_mtime == 1000
+    assert job.size == 3 * 1024 * 1024 + 5 + 5
+    assert job.items == 8
+
+
+def test_copy_file_never_overwrites(tree):
+    dest = tree / 'exists.txt'
+    dest.write_bytes(b'keep')
+    with pytest.raises(FileExistsError):
+        file_ops.copy_file(str(tree / 'src' / 'sub' / 'b.txt'), str(dest), RecordingJob())
+    assert dest.read_bytes() == b'keep'
+
+
+def test_move_across_filesystems(tree, monkeypatch):
+    def cross_device(src, dest):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(FileUtils, 'rename_noreplace', staticmethod(cross_device))
+    reference = tree / 'reference'
+    file_ops.copy_tree(str(tree / 'src'), str(reference), RecordingJob())
+    job = RecordingJob()
+    file_ops.move_path(str(tree / 'src'), str(tree / 'moved'), job)
+    assert job.errors == []
+    assert not os.path.exists(str(tree / 'src'))
+    assert_same_tree(str(reference), str(tree / 'moved'))
+
+
+def test_run_transfer_picks_unique_names(tree):
+    dest_dir = tree / 'dest'
+    dest_dir.mkdir()
+    (dest_dir / 'sub').mkdir()
+    (dest_dir / 'a.bin').write_bytes(b'old')
+    done = []
+    job = RecordingJob()
+    targets = file_ops.run_transfer([str(tree / 'src' / 'a.bin'), str(tree / 'src' / 'sub'),
+                                     str(tree / 'src' / 'missing')],
+                                    str(dest_dir), job, file_ops.copy_tree,
+                                    on_done=lambda src, dest: done.append((src, dest)))
+    assert [os.path.basename(target) for target in targets] == ['a_1.bin', 'sub_1']
+    assert (dest_dir / 'a.bin').read_bytes() == b'old'
+    assert (dest_dir / 'sub_1' / 'b.txt').read_bytes() == b'hello'
+    assert len(done) == 3
+    assert [path for path, _ in job.errors] == [str(tree / 'src' / 'missing')]
+
+
+def wait_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/api/jobs/{job_id}').get_json()['job']
+        if job['status'] not in ('queued', 'running') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def test_api_copy_and_move(make_app):
+    app = make_app()
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(folder, 'docs', 'sub'))
+    os.makedirs(os.path.join(folder, 'archive'))
+    with open(os.path.join(folder, 'docs', 'sub', 'a.txt'), 'wb') as f:
+        f.write(b'hello')
+    client = login(app.test_client())
+
+    response = client.post('/api/copy', json={'paths': ['docs'], 'destination': 'archive'})
+    assert response.status_code == 202
+    job = wait_job(client, response.get_json()['job']['job_id'])
+    assert job['status'] == 'completed'
+    assert job['result']['targets'] == ['archive/docs']
+    assert open(os.path.join(folder, 'archive', 'docs', 'sub', 'a.txt'), 'rb').read() == b'hello'
+
+    # 再次复制到同一位置时自动改名
+    job = wait_job(client, client.post('/api/copy', json={'path': 'docs/sub/a.txt', 'destination': 'docs'})
+                   .get_json()['job']['job_id'])
+    assert job['result']['targets'] == ['docs/a.txt']
+    job = wait_job(client, client.post('/api/copy', json={'path': 'docs/a.txt', 'destination': 'docs'})
+                   .get_json()['job']['job_id'])
+    assert job['result']['targets'] == ['docs/a_1.txt']
+
+    job = wait_job(client, client.post('/api/move', json={'paths': ['docs/sub'], 'destination': ''})
+                   .get_json()['job']['job_id'])
+    assert job['status'] == 'completed' and job['result']['targets'] == ['sub']
+    assert not os.path.exists(os.path.join(folder, 'docs', 'sub'))
+    names = [item['name'] for item in client.get('/api/list').get_json()['data']['items']]
+    assert sorted(names) == ['archive', 'docs', 'sub']
+
+    assert client.post('/api/move', json={'paths': ['sub'], 'destination': ''}).status_code == 400
+    assert client.post('/api/copy', json={'paths': ['archive'], 'destination': 'archive/docs'}).status_code == 400
+    assert client.post('/api/copy', json={'paths': ['sub'], 'destination': 'missing'}).status_code == 404
+    assert client.post('/api/copy', json={'paths': ['sub'], 'destination': '../..'}).status_code == 403
+    assert client.post('/api/copy', json={'paths': ['../x'], 'destination': ''}).status_code == 403
+    assert client.post('/api/copy', json={'destination': ''}).status_code == 400
@@ -0,0 +1,272 @@
+"""
+两种服务引擎的兼容性：同一组路由分别在线程池引擎（server.PooledWSGIServer）和 asyncio 引擎（aio_server）下运行
+
+服务器在测试进程的后台线程中运行，通过真实的socket用 http.client 访问。
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+import http.client
+from urllib.parse import urlencode
+
+import pytest
+
+from utils import FileUtils
+
+MAX_FILE_SIZE = 8 * 1024 * 1024
+
+
+def start_threaded(app, sock):
+    from server import PooledWSGIServer
+    from file_transfer import SendfileRequestHandler
+
+    class Handler(SendfileRequestHandler):
+        timeout = 10
+
+    httpd = PooledWSGIServer('127.0.0.1', sock.getsockname()[1], app, 8, Handler, sock.fileno())
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True)
+    thread.start()
+
+    def stop():
+        httpd.shutdown()
+        httpd.server_close()
+    return stop
+
+
+def start_asyncio(app, sock):
+    from aio_server import AsyncEngine
+
+    sock.setblocking(False)
+    engine = AsyncEngine(app, {'host': '127.0.0.1', 'threads': 8, 'request_timeout': 10})
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(engine.start(sock))
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait(5)
+
+    def stop():
+        async def close():
+            engine.stopping = True
+            engine.server.close()
+            await engine.server.wait_closed()
+            for connection in list(engine.connections):
+                connection.writer.close()
+            while engine.connections:
+                await asyncio.sleep(0.05)
+        asyncio.run_coroutine_threadsafe(close(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+        engine.executor.shutdown(wait=True)
+    return stop
+
+
+@pytest.fixture(params=['threaded', 'asyncio'])
+def live_server(request, make_app):
+    app = make_app({
+        'upload': {'max_file_size': '8MB'},
+        'quotas': {'users': {'user': '4MB'}}
+    })
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(64)
+    stop = (start_threaded if request.param == 'threaded' else start_asyncio)(app, sock)
+    server = Server(request.param, app, sock.getsockname()[1])
+    yield server
+    server.close()
+    stop()
+    sock.close()
+
+
+class Server:
+    """测试用客户端：保持一个keep-alive连接，自动携带登录cookie"""
+
+    def __init__(self, engine, app, port):
+        self.engine = engine
+        self.app = app
+        self.port = port
+        self.cookie = ''
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+
+    @property
+    def upload_folder(self):
+        return self.app.config['UPLOAD_FOLDER']
+
+    def request(self, method, url, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.conn.request(method, url, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response, data
+
+    def login(self, username='user', password='user123'):
+        response, _ = self.request('POST', '/login', urlencode({'username': username, 'password': password}),
+                                   {'Content-Type': 'application/x-www-form-urlencoded'})
+        assert response.status == 302
+        return self
+
+    def raw(self):
+        """新开一个原始socket连接（用于逐步发送请求）"""
+        return socket.create_connection(('127.0.0.1', self.port), timeout=10)
+
+    def close(self):
+        self.conn.close()
+
+
+def read_response_head(sock):
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def multipart(fields, files, boundary='testboundary'):
+    body = b''
+    for name, value in fields.items():
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode()
+    for name, (filename, content) in files.items():
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode() + content + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def test_login_list_and_stats(live_server):
+    server = live_server.login()
+    response, data = server.request('GET', '/api/list')
+    assert response.status == 200
+    assert json.loads(data)['success'] is True
+    response, data = server.request('GET', '/api/stats')
+    assert response.status == 200
+    response, _ = server.request('GET', '/files')
+    assert response.status == 200
+
+
+def test_multipart_upload_and_range_download(live_server):
+    server = live_server.login()
+    content = os.urandom(2 * 1024 * 1024 + 17)
+    body, content_type = multipart({'current_path': ''}, {'file': ('big.zip', content)})
+    response, data = server.request('POST', '/upload', body, {'Content-Type': content_type})
+    assert response.status == 200, data
+    with open(os.path.join(server.upload_folder, 'big.zip'), 'rb') as f:
+        assert f.read() == content
+
+    response, data = server.request('GET', '/download/big.zip', headers={'Range': 'bytes=100-1099'})
+    assert response.status == 206
+    assert data == content[100:1100]
+    response, data = server.request('GET', '/download/big.zip')
+    assert response.status == 200
+    assert data == content
+    # 同一个连接上的后续请求仍然正常
+    response, _ = server.request('GET', '/api/list')
+    assert response.status == 200
+
+
+def test_chunked_raw_upload(live_server):
+    server = live_server.login()
+    content = os.urandom(300 * 1024)
+
+    def chunks():
+        for start in range(0, len(content), 50000):
+            yield content[start:start + 50000]
+
+    server.conn.request('PUT', '/api/upload/stream?filename=raw.txt&current_path=', body=chunks(),
+                        headers={'Cookie': server.cookie}, encode_chunked=True)
+    response = server.conn.getresponse()
+    data = response.read()
+    assert response.status == 200, data
+    with open(os.path.join(server.upload_folder, 'raw.txt'), 'rb') as f:
+        assert f.read() == content
+
+
+def test_content_length_over_limit_rejected(live_server):
+    # 管理员没有配额限制，只检查请求体大小上限
+    server = live_server.login('admin', 'admin123')
+    with server.raw() as sock:
+        sock.sendall((f'PUT /api/upload/stream?filename=x.txt HTTP/1.1\r\nHost: localhost\r\n'
+                      f'Cookie: {server.cookie}\r\nContent-Length: {MAX_FILE_SIZE + 1}\r\n\r\n').encode())
+        head = read_response_head(sock)
+    assert head.split(b' ', 2)[1] == b'413'
+
+
+def test_quota_rejected_before_body_is_sent(live_server):
+    server = live_server.login()
+    size = 6 * 1024 * 1024
+    with server.raw() as sock:
+        sock.sendall((f'PUT /api/upload/stream?filename=big.txt&current_path= HTTP/1.1\r\nHost: localhost\r\n'
+                      f'Cookie: {server.cookie}\r\nContent-Length: {size}\r\n'
+                      f'Expect: 100-continue\r\n\r\n').encode())
+        head = read_response_head(sock)
+    status = head.split(b' ', 2)[1]
+    if server.engine == 'threaded' and status == b'100':
+        # werkzeug 收到请求头后立即回复 100 Continue
+        return
+    assert status == b'507'
+    assert not os.path.exists(os.path.join(server.upload_folder, 'big.txt'))
+
+
+def test_quota_rejection_does_not_receive_body(live_server):
+    if live_server.engine != 'asyncio':
+        pytest.skip('只有 asyncio 引擎在应用读取前不接收请求体')
+    server = live_server.login()
+    size = 6 * 1024 * 1024
+    with server.raw() as sock:
+        sock.sendall((f'PUT /api/upload/stream?filename=big.txt&current_path= HTTP/1.1\r\nHost: localhost\r\n'
+                      f'Cookie: {server.cookie}\r\nContent-Length: {size}\r\n\r\n').encode())
+        # 只发送一小部分请求体，服务器不等待其余部分即拒绝并关闭连接
+        sock.sendall(b'x' * 1024)
+        head = read_response_head(sock)
+        assert head.split(b' ', 2)[1] == b'507'
+        assert b'Connection: close' in head
+    assert not os.path.isdir(os.path.join(server.upload_folder, FileUtils.INTERNAL_DIR, 'spool'))
+
+
+def test_small_unread_body_keeps_connection(live_server):
+    server = live_server.login()
+    # 应用不读取请求体（未知路由），剩余的少量数据被丢弃，连接可以继续使用
+    response, _ = server.request('POST', '/no-such-route', b'x' * 100000,
+                                 {'Content-Type': 'application/octet-stream'})
+    assert response.status in (404, 405)
+    response, _ = server.request('GET', '/api/list')
+    assert response.status == 200
+
+
+def test_concurrent_requests(live_server):
+    server = live_server.login()
+    results = []
+
+    def worker():
+        client = Server(server.engine, server.app, server.port)
+        client.cookie = server.cookie
+        for _ in range(5):
+            response, _ = client.request('GET', '/api/list')
+            results.append(response.status)
+        client.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(20)
+    assert time.monotonic() - started < 20
+    assert results == [200] * 40
@@ -0,0 +1,162 @@
+"""file_transfer.send_file_range：Range、multipart/byteranges、条件请求和 wsgi.file_wrapper"""
+import os
+import re
+
+import pytest
+from flask import Flask, request
+from werkzeug.http import http_date
+from werkzeug.wsgi import FileWrapper
+
+from file_transfer import send_file_range, parse_range_header
+
+SIZE = 1024000
+
+
+@pytest.fixture
+def content(tmp_path):
+    data = os.urandom(SIZE)
+    (tmp_path / 'data.bin').write_bytes(data)
+    return data
+
+
+@pytest.fixture
+def file_client(tmp_path, content):
+    app = Flask(__name__)
+    path = str(tmp_path / 'data.bin')
+
+    @app.route('/f', methods=['GET', 'HEAD'])
+    def serve():
+        return send_file_range(path, request)
+
+    return app.test_client()
+
+
+def test_parse_range_header():
+    assert parse_range_header('bytes=0-99', 1000) == [(0, 99)]
+    assert parse_range_header('bytes=-100', 1000) == [(900, 999)]
+    assert parse_range_header('bytes=900-', 1000) == [(900, 999)]
+    assert parse_range_header('bytes=2000-3000', 1000) == []
+    assert parse_range_header('items=0-1', 1000) is None
+
+
+def test_full_file(file_client, content):
+    response = file_client.get('/f')
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == str(SIZE)
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.data == content
+
+
+def test_single_range(file_client, content):
+    response = file_client.get('/f', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{SIZE}'
+    assert response.headers['Content-Length'] == '100'
+    assert response.data == content[100:200]
+
+
+def test_suffix_range(file_client, content):
+    response = file_client.get('/f', headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.data == content[-10:]
+
+
+def test_unsatisfiable_range(file_client):
+    response = file_client.get('/f', headers={'Range': f'bytes={SIZE}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{SIZE}'
+
+
+def test_multiple_ranges(file_client, content):
+    response = file_client.get('/f', headers={'Range': 'bytes=0-9,500-519,-5'})
+    assert response.status_code == 206
+    match = re.match(r'multipart/byteranges; boundary=(\w+)', response.headers['Content-Type'])
+    assert match
+    boundary = match.group(1).encode()
+    assert response.headers['Content-Length'] == str(len(response.data))
+
+    parts = response.data.split(b'--' + boundary)
+    assert parts[-1] == b'--\r\n'
+    bodies = {}
+    for part in parts[1:-1]:
+        head, body = part.split(b'\r\n\r\n', 1)
+        content_range = re.search(rb'Content-Range: bytes (\d+)-(\d+)/(\d+)', head)
+        start, end = int(content_range.group(1)), int(content_range.group(2))
+        bodies[(start, end)] = body[:-2]
+    assert bodies == {
+        (0, 9): content[0:10],
+        (500, 519): content[500:520],
+        (SIZE - 5, SIZE - 1): content[-5:]
+    }
+
+
+def test_if_none_match_returns_304(file_client):
+    etag = file_client.get('/f').headers['ETag']
+    response = file_client.get('/f', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    # 弱比较
+    assert file_client.get('/f', headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert file_client.get('/f', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_if_modified_since_returns_304(file_client):
+    last_modified = file_client.get('/f').headers['Last-Modified']
+    assert file_client.get('/f', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert file_client.get('/f', headers={'If-Modified-Since': http_date(0)}).status_code == 200
+
+
+def test_if_match_precondition(file_client):
+    assert file_client.get('/f', headers={'If-Match': '"other"'}).status_code == 412
+
+
+def test_if_range_mismatch_returns_full_file(file_client, content):
+    response = file_client.get('/f', headers={'Range': 'bytes=0-99', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == content
+    etag = response.headers['ETag']
+    response = file_client.get('/f', headers={'Range': 'bytes=0-99', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == content[:100]
+
+
+def test_head(file_client):
+    response = file_client.head('/f', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.headers['Content-Length'] == '100'
+    assert response.data == b''
+
+
+class RecordingWrapper(FileWrapper):
+    instances = []
+
+    def __init__(self, file, buffer_size=8192):
+        super().__init__(file, buffer_size)
+        RecordingWrapper.instances.append(self)
+
+
+def test_file_wrapper_full_file(file_client, content):
+    RecordingWrapper.instances.clear()
+    response = file_client.get('/f', environ_overrides={'wsgi.file_wrapper': RecordingWrapper})
+    assert response.status_code == 200
+    assert response.data == content
+    assert len(RecordingWrapper.instances) == 1
+
+
+def test_file_wrapper_single_range_sends_only_the_range(file_client, content):
+    RecordingWrapper.instances.clear()
+    response = file_client.get('/f', headers={'Range': 'bytes=0-99'},
+                               environ_overrides={'wsgi.file_wrapper': RecordingWrapper})
+    assert response.status_code == 206
+    assert response.headers['Content-Length'] == '100'
+    assert response.data == content[:100]
+    assert RecordingWrapper.instances == []
+
+
+def test_file_wrapper_multiple_ranges(file_client, content):
+    response = file_client.get('/f', headers={'Range': 'bytes=0-9,20-29'},
+                               environ_overrides={'wsgi.file_wrapper': RecordingWrapper})
+    assert response.status_code == 206
+    assert response.headers['Content-Length'] == str(len(response.data))
+    assert content[0:10] in response.data and content[20:30] in response.data
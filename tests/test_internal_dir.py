@@ -0,0 +1,85 @@
+"""上传目录下的内部数据目录（.fileserver）不能通过任何路由读取或写入"""
+import io
+import os
+
+import pytest
+
+from utils import FileUtils
+
+INTERNAL = FileUtils.INTERNAL_DIR
+
+
+@pytest.fixture
+def upload_folder(client):
+    return client.application.config['UPLOAD_FOLDER']
+
+
+def planted(upload_folder):
+    """内部数据目录中由请求写入的文件或目录（名称为 x.txt 或 planted）"""
+    found = []
+    for root, dirs, files in os.walk(os.path.join(upload_folder, INTERNAL)):
+        found.extend(os.path.join(root, name) for name in dirs + files if name in ('x.txt', 'planted'))
+    return found
+
+
+@pytest.mark.parametrize('url', [
+    f'/api/list/{INTERNAL}',
+    f'/api/list/{INTERNAL}/staging',
+    f'/api/list/sub/../{INTERNAL}',
+    f'/files/{INTERNAL}',
+    f'/files/{INTERNAL}/trash',
+    f'/download/{INTERNAL}',
+    f'/download/{INTERNAL}/index.db',
+    f'/api/search?q=a&path={INTERNAL}',
+    f'/download_zip?paths={INTERNAL}',
+])
+def test_internal_dir_cannot_be_read(client, url):
+    assert client.get(url, buffered=True).status_code == 403
+
+
+def test_preview_and_sign_reject_internal_dir(client):
+    for url in ('/api/preview', '/api/sign'):
+        response = client.post(url, json={'filepath': f'{INTERNAL}/index.db'}, buffered=True)
+        assert response.status_code == 403
+
+
+@pytest.mark.parametrize('current_path', [INTERNAL, f'{INTERNAL}/precompressed', f'a/../{INTERNAL}'])
+def test_upload_into_internal_dir_rejected(client, upload_folder, current_path):
+    response = client.post('/upload', data={'file': (io.BytesIO(b'planted'), 'x.txt'),
+                                            'current_path': current_path}, buffered=True)
+    assert response.status_code == 403
+    response = client.put(f'/api/upload/stream?filename=x.txt&current_path={current_path}', data=b'planted',
+                          buffered=True)
+    assert response.status_code == 403
+    response = client.post('/api/uploads', json={'filename': 'x.txt', 'size': 7,
+                                                 'current_path': current_path}, buffered=True)
+    assert response.status_code == 403
+    assert planted(upload_folder) == []
+
+
+@pytest.mark.parametrize('folder_name, current_path', [
+    (INTERNAL, ''),
+    ('planted', INTERNAL),
+    ('planted', f'{INTERNAL}/precompressed'),
+])
+def test_create_folder_in_internal_dir_rejected(client, upload_folder, folder_name, current_path):
+    response = client.post('/create_folder', json={'folder_name': folder_name, 'current_path': current_path},
+                           buffered=True)
+    assert response.status_code == 403
+    assert planted(upload_folder) == []
+
+
+def test_listing_and_search_hide_internal_dir(client, upload_folder):
+    assert os.path.isdir(os.path.join(upload_folder, INTERNAL))
+    client.post('/upload', data={'file': (io.BytesIO(b'hello'), 'visible.txt'), 'current_path': ''}, buffered=True)
+
+    items = client.get('/api/list', buffered=True).get_json()['data']['items']
+    assert [item['name'] for item in items] == ['visible.txt']
+
+    for query in ('q=fileserver', 'q=staging', 'q=index', 'glob=*'):
+        items = client.get(f'/api/search?{query}', buffered=True).get_json()['data']['items']
+        assert all(not item['relative_path'].startswith(INTERNAL) for item in items)
+
+    response = client.get('/files', buffered=True)
+    assert response.status_code == 200
+    assert INTERNAL.encode() not in response.data
@@ -0,0 +1,168 @@
+"""后台任务：执行、进度、失败条目、取消、中断和清理，以及 /api/jobs 接口"""
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+import pytest
+
+from jobs import JobManager, JobError, Job
+from utils import FileUtils
+from conftest import login
+
+
+def wait(manager, job_id, user='user', timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = manager.get(job_id, user)
+        if job['status'] not in ('queued', 'running') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(str(tmp_path / 'jobs'), workers=2, max_pending=3, retention=60)
+    yield manager
+    manager.shutdown()
+
+
+def test_completed_job_reports_progress(manager):
+    def run(job):
+        job.set_total(4, 400)
+        for i in range(4):
+            job.advance(1, 100, current=f'f{i}')
+        job.set_result(moved=4)
+
+    job = manager.submit('move', 'user', {'paths': ['a']}, run)
+    assert job['status'] == 'queued'
+    job = wait(manager, job['job_id'])
+    assert job['status'] == 'completed'
+    assert job['progress']['done_items'] == 4 and job['progress']['percent'] == 100.0
+    assert job['progress']['current'] == 'f3'
+    assert job['result'] == {'moved': 4}
+    assert job['params'] == {'paths': ['a']}
+    assert job['started_at'] <= job['finished_at']
+
+
+def test_item_errors_and_exceptions_fail_the_job(manager):
+    def partial(job):
+        job.set_total(3, 0)
+        job.record_error('a', FileNotFoundError(2, 'No such file'))
+        job.advance(2)
+
+    job = wait(manager, manager.submit('delete', 'user', {}, partial)['job_id'])
+    assert job['status'] == 'failed'
+    assert job['errors'] == [{'path': 'a', 'error': 'No such file'}]
+    assert job['error_count'] == 1
+
+    def broken(job):
+        raise RuntimeError('boom')
+
+    job = wait(manager, manager.submit('delete', 'user', {}, broken)['job_id'])
+    assert job['status'] == 'failed' and job['message'] == 'boom'
+
+
+def test_cancel_running_job(manager, monkeypatch):
+    monkeypatch.setattr(Job, 'CHECKPOINT_INTERVAL', 0)
+    started = threading.Event()
+
+    def run(job):
+        started.set()
+        while True:
+            job.advance()
+            time.sleep(0.01)
+
+    job_id = manager.submit('delete', 'user', {}, run)['job_id']
+    assert started.wait(5)
+    assert manager.cancel(job_id, 'user')['cancel_requested']
+    job = wait(manager, job_id)
+    assert job['status'] == 'cancelled'
+    assert job['progress']['done_items'] > 0
+    assert not os.path.exists(os.path.join(manager.state_dir, job_id + '.cancel'))
+    with pytest.raises(JobError) as info:
+        manager.cancel(job_id, 'user')
+    assert info.value.status_code == 409
+
+
+def test_queue_limit(manager):
+    release = threading.Event()
+    jobs = [manager.submit('copy', 'user', {}, lambda job: release.wait(5)) for _ in range(3)]
+    with pytest.raises(JobError) as info:
+        manager.submit('copy', 'user', {}, lambda job: None)
+    assert info.value.status_code == 503
+    release.set()
+    for job in jobs:
+        assert wait(manager, job['job_id'])['status'] == 'completed'
+    manager.submit('copy', 'user', {}, lambda job: None)
+
+
+def test_access_control_and_listing(manager):
+    first = manager.submit('copy', 'user', {}, lambda job: None)
+    second = manager.submit('move', 'other', {}, lambda job: None)
+    wait(manager, first['job_id'])
+    wait(manager, second['job_id'], 'other')
+    with pytest.raises(JobError) as info:
+        manager.get(second['job_id'], 'user')
+    assert info.value.status_code == 403
+    assert manager.get(second['job_id'], 'user', is_admin=True)['type'] == 'move'
+    for job_id in ('../../etc/passwd', 'missing', '0' * 32):
+        with pytest.raises(JobError) as info:
+            manager.get(job_id, 'user')
+        assert info.value.status_code == 404
+    assert [job['job_id'] for job in manager.list('user')] == [first['job_id']]
+    assert [job['job_id'] for job in manager.list('user', is_admin=True)] == [second['job_id'], first['job_id']]
+
+
+def test_job_of_exited_process_is_interrupted(manager):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    job_id = '1' * 32
+    record = {'job_id': job_id, 'type': 'copy', 'status': 'running', 'user_id': 'user', 'params': {},
+              'pid': exited.pid, 'result': {}, 'error_count': 0, 'errors': [], 'created_at': time.time(),
+              'progress': {'total_items': 0, 'done_items': 0, 'total_bytes': 0, 'done_bytes': 0, 'current': ''}}
+    with open(os.path.join(manager.state_dir, job_id + '.json'), 'w') as f:
+        json.dump(record, f)
+    assert manager.get(job_id, 'user')['status'] == 'interrupted'
+
+
+def test_cleanup_expired(manager):
+    job_id = wait(manager, manager.submit('copy', 'user', {}, lambda job: None)['job_id'])['job_id']
+    path = os.path.join(manager.state_dir, job_id + '.json')
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    manager._last_cleanup = 0
+    manager.cleanup_expired()
+    assert not os.path.exists(path)
+
+
+def test_api_delete_job(make_app):
+    app = make_app({'trash': {'enabled': False}})
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(folder, 'dir', 'sub'))
+    for name in ('dir/sub/a.txt', 'dir/b.txt', 'c.txt'):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b'x' * 10)
+    client = login(app.test_client())
+
+    response = client.post('/api/jobs', json={'action': 'delete', 'paths': ['dir', 'c.txt']})
+    assert response.status_code == 202
+    job_id = response.get_json()['job']['job_id']
+    job = wait(app.extensions['fileserver'].jobs, job_id)
+    assert job['status'] == 'completed'
+    assert [name for name in os.listdir(folder) if name != FileUtils.INTERNAL_DIR] == []
+
+    assert client.get(f'/api/jobs/{job_id}').get_json()['job']['status'] == 'completed'
+    assert job_id in [job['job_id'] for job in client.get('/api/jobs').get_json()['jobs']]
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 409
+    assert client.get('/api/jobs/not-a-job').status_code == 404
+
+    other = login(app.test_client(), 'admin', 'admin123')
+    assert other.get(f'/api/jobs/{job_id}').status_code == 200
+
+    assert client.post('/api/jobs', json={'action': 'chmod', 'paths': ['x']}).status_code == 400
+    assert client.post('/api/jobs', json={'action': 'delete', 'paths': ['../x']}).status_code == 403
+    assert client.post('/api/jobs', json={'action': 'delete', 'paths': ['missing']}).status_code == 404
+    assert client.post('/api/jobs', json={'action': 'delete', 'paths': []}).status_code == 400
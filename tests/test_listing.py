@@ -0,0 +1,126 @@
+"""目录列表分页：扫描目录和元数据索引两种实现的排序、过滤、游标，以及无效游标"""
+import os
+import time
+import base64
+import json
+
+import pytest
+
+from utils import FileUtils
+from metadata_index import MetadataIndex
+from conftest import login
+
+SORTS = ['name', 'size', 'mtime', 'type']
+
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / 'uploads'
+    root.mkdir()
+    for i in range(7):
+        path = root / f'file{i}.{"txt" if i % 2 else "jpg"}'
+        path.write_bytes(b'x' * (i * 10))
+        os.utime(path, (1000 + i, 1000 + i))
+    for name in ('dir_a', 'dir_b'):
+        (root / name).mkdir()
+    return str(root)
+
+
+def encode(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def collect(list_page, limit):
+    """按游标逐页读取，返回所有条目名"""
+    names = []
+    cursor = None
+    while True:
+        page = list_page(cursor, limit)
+        names.extend(item['name'] for item in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return names
+
+
+@pytest.fixture(params=['scan', 'index'])
+def lister(request, folder, tmp_path):
+    if request.param == 'scan':
+        def list_page(sort, order, cursor, limit, **filters):
+            return FileUtils.list_directory(folder, folder, sort, order, cursor=cursor, limit=limit, **filters)
+        return list_page
+    index = MetadataIndex(folder, db_path=str(tmp_path / 'index.db'), reconcile_interval=0)
+    index.build()
+
+    def list_page(sort, order, cursor, limit, **filters):
+        return index.list_dir('', sort, order, cursor=cursor, limit=limit, **filters)
+    return list_page
+
+
+@pytest.mark.parametrize('sort', SORTS)
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_pages_cover_full_listing(lister, sort, order):
+    full = [item['name'] for item in lister(sort, order, None, 100)['items']]
+    assert len(full) == 9
+    assert collect(lambda cursor, limit: lister(sort, order, cursor, limit), 2) == full
+
+
+def test_sort_orders(lister):
+    by_mtime = [item['name'] for item in lister('mtime', 'asc', None, 3)['items']]
+    assert by_mtime == ['file0.jpg', 'file1.txt', 'file2.jpg']
+    by_size = [item['name'] for item in lister('size', 'desc', None, 3)['items']]
+    assert by_size == ['file6.jpg', 'file5.txt', 'file4.jpg']
+    by_type = [item['name'] for item in lister('type', 'asc', None, 100)['items']]
+    assert by_type[:2] == ['dir_a', 'dir_b']
+    assert by_type[2:] == ['file0.jpg', 'file2.jpg', 'file4.jpg', 'file6.jpg',
+                           'file1.txt', 'file3.txt', 'file5.txt']
+
+
+def test_filters(lister):
+    page = lister('name', 'asc', None, 2, prefix='FILE', file_type='file')
+    assert page['total'] == 7 and page['file_count'] == 7 and page['dir_count'] == 0
+    assert [item['name'] for item in page['items']] == ['file0.jpg', 'file1.txt']
+    dirs = lister('name', 'asc', None, 100, file_type='dir')
+    assert [item['name'] for item in dirs['items']] == ['dir_a', 'dir_b']
+
+
+@pytest.mark.parametrize('cursor', [
+    encode(['file3.txt', 'extra']),        # 长度与排序键不一致（来自其他排序方式）
+    encode([1004.0, 'file4.jpg']),         # 类型不一致
+    encode([{'a': 1}]),
+    encode([None]),
+    encode('file3.txt'),
+    'not-base64!',
+])
+def test_mismatched_cursor_is_ignored(lister, cursor):
+    full = [item['name'] for item in lister('name', 'asc', None, 100)['items']]
+    assert [item['name'] for item in lister('name', 'asc', cursor, 100)['items']] == full
+
+
+def test_cursor_from_other_sort_is_ignored(lister):
+    cursor = lister('mtime', 'desc', None, 2)['next_cursor']
+    assert len(lister('name', 'asc', cursor, 100)['items']) == 9
+    assert len(lister('type', 'asc', cursor, 100)['items']) == 9
+
+
+def test_search_ignores_mismatched_cursor(folder):
+    full = FileUtils.search_files(folder, query='file', sort='size', order='asc')['items']
+    result = FileUtils.search_files(folder, query='file', sort='size', order='asc',
+                                    cursor=encode(['file1.txt', 10]))
+    assert result['items'] == full
+
+
+@pytest.mark.parametrize('index_enabled', [False, True])
+def test_api_list_with_crafted_cursor(make_app, index_enabled):
+    app = make_app({'index': {'enabled': index_enabled}, 'listing_cache': {'enabled': False}})
+    for i in range(3):
+        with open(os.path.join(app.config['UPLOAD_FOLDER'], f'{i}.txt'), 'wb') as f:
+            f.write(b'x')
+    index = app.extensions['fileserver'].metadata_index
+    deadline = time.monotonic() + 10
+    while index is not None and not index.ready and time.monotonic() < deadline:
+        time.sleep(0.05)
+    client = login(app.test_client())
+    for cursor in (encode([1, 2, 3]), encode([[1], 'a']), encode(['a', 'b'])):
+        response = client.get('/api/list', query_string={'sort': 'mtime', 'cursor': cursor})
+        assert response.status_code == 200
+        assert len(response.get_json()['data']['items']) == 3
@@ -0,0 +1,130 @@
+"""目录列表缓存：ETag校验、失效标记和LRU淘汰"""
+import io
+import os
+
+from listing_cache import ListingCache
+from conftest import login
+
+
+def make_cache(tmp_path, **kwargs):
+    root = tmp_path / 'uploads'
+    (root / 'a' / 'b').mkdir(parents=True)
+    return ListingCache(str(root), str(tmp_path / 'stamps'), **kwargs), str(root)
+
+
+def test_state_follows_directory_and_stamp(tmp_path):
+    cache, root = make_cache(tmp_path)
+    state = cache.state(os.path.join(root, 'a'))
+    assert cache.state(os.path.join(root, 'a')) == state
+    assert cache.state(os.path.join(root, 'missing')) is None
+    open(os.path.join(root, 'file.txt'), 'w').close()
+    assert cache.state(os.path.join(root, 'file.txt')) is None
+
+    # 目录中新增条目改变修改时间
+    mtime = os.stat(os.path.join(root, 'a')).st_mtime
+    open(os.path.join(root, 'a', 'new.txt'), 'w').close()
+    os.utime(os.path.join(root, 'a'), (mtime + 10, mtime + 10))
+    assert cache.state(os.path.join(root, 'a')) != state
+
+
+def test_invalidate_parent_and_grandparent(tmp_path):
+    cache, root = make_cache(tmp_path)
+    states = {rel: cache.state(os.path.join(root, rel) if rel else root) for rel in ('', 'a', 'a/b')}
+    # a/b/c.txt 发生变化：a/b 和 a 失效，根目录不受影响
+    cache.invalidate(os.path.join(root, 'a', 'b', 'c.txt'))
+    assert cache.state(os.path.join(root, 'a', 'b')) != states['a/b']
+    assert cache.state(os.path.join(root, 'a')) != states['a']
+    assert cache.state(root) == states['']
+
+    # 顶层条目只失效根目录，不越过上传目录
+    cache.invalidate(os.path.join(root, 'top.txt'))
+    assert cache.state(root) != states['']
+    assert len(os.listdir(str(tmp_path / 'stamps'))) == 3
+
+
+def test_get_requires_matching_state(tmp_path):
+    cache, root = make_cache(tmp_path)
+    state = cache.state(root)
+    cache.put(('k',), state, 'body')
+    assert cache.get(('k',), state) == 'body'
+    cache.invalidate(os.path.join(root, 'x'))
+    assert cache.get(('k',), cache.state(root)) is None
+
+
+def test_etag_depends_on_state_and_key(tmp_path):
+    cache, root = make_cache(tmp_path)
+    state = cache.state(root)
+    assert cache.etag(state, ('a', 1)) == cache.etag(state, ('a', 1))
+    assert cache.etag(state, ('a', 1)) != cache.etag(state, ('a', 2))
+    assert cache.etag(state, ('a', 1)) != cache.etag((state[0], state[1], state[2] + 1), ('a', 1))
+
+
+def test_lru_eviction(tmp_path):
+    cache, root = make_cache(tmp_path, max_entries=2, max_bytes=10)
+    state = cache.state(root)
+    cache.put(('a',), state, 'aaaa')
+    cache.put(('b',), state, 'bbbb')
+    assert cache.get(('a',), state) == 'aaaa'
+    cache.put(('c',), state, 'cccc')
+    assert cache.get(('b',), state) is None
+    assert cache.get(('a',), state) == 'aaaa'
+    # 单个过大的响应体不缓存
+    cache.put(('e',), state, 'x' * 11)
+    assert cache.get(('e',), state) is None
+    assert cache.get(('a',), state) == 'aaaa'
+
+
+def test_eviction_by_size(tmp_path):
+    cache, root = make_cache(tmp_path, max_entries=10, max_bytes=10)
+    state = cache.state(root)
+    cache.put(('a',), state, 'aaaaaa')
+    cache.put(('b',), state, 'bbbb')
+    cache.put(('c',), state, 'cc')
+    assert cache.get(('a',), state) is None
+    assert cache.get(('b',), state) == 'bbbb' and cache.get(('c',), state) == 'cc'
+    # 替换同一个键时先扣除旧的大小
+    cache.put(('b',), state, 'bbbbbbbb')
+    assert cache.get(('b',), state) == 'bbbbbbbb' and cache.get(('c',), state) == 'cc'
+
+
+def test_api_list_revalidation(make_app):
+    app = make_app({'index': {'enabled': False}})
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(folder, 'docs'))
+    client = login(app.test_client())
+
+    response = client.get('/api/list')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get('/api/list', headers={'If-None-Match': etag}).status_code == 304
+    # 不同的查询参数是不同的表示
+    other = client.get('/api/list?sort=name', headers={'If-None-Match': etag})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+
+    # 上传到子目录不改变根目录的修改时间，由失效标记让根目录的列表失效（子目录的大小和时间变化）
+    response = client.post('/upload', data={'file': (io.BytesIO(b'hello'), 'a.txt'), 'current_path': 'docs'},
+                           buffered=True)
+    assert response.status_code == 200
+    response = client.get('/api/list', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    etag = response.headers['ETag']
+    docs = client.get('/api/list/docs').get_json()['data']['items']
+    assert [item['name'] for item in docs] == ['a.txt']
+
+    # 绕过服务器新增的条目改变目录修改时间
+    mtime = os.stat(folder).st_mtime
+    open(os.path.join(folder, 'oob.txt'), 'w').close()
+    os.utime(folder, (mtime + 10, mtime + 10))
+    response = client.get('/api/list', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'oob.txt' in [item['name'] for item in response.get_json()['data']['items']]
+
+
+def test_disabled_cache_sends_no_etag(make_app):
+    app = make_app({'listing_cache': {'enabled': False}, 'index': {'enabled': False}})
+    client = login(app.test_client())
+    response = client.get('/api/list')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
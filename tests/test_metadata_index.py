@@ -0,0 +1,126 @@
+"""元数据索引：对照真实目录树的全量构建、增量更新、对账和聚合统计"""
+import os
+
+import pytest
+
+from metadata_index import MetadataIndex
+from utils import FileUtils
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def paths(index):
+    return {row[0]: row[1] for row in index._connect().execute('SELECT path, is_dir FROM entries')}
+
+
+def touch_dir(path, mtime):
+    """把目录修改时间设为固定值，避免文件系统时间精度导致对账判断不稳定"""
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'uploads'
+    write(str(root / 'a.txt'), 10)
+    write(str(root / 'docs' / 'b.pdf'), 100)
+    write(str(root / 'docs' / 'sub' / 'c.jpg'), 1000)
+    write(str(root / 'music' / 'd.mp3'), 5)
+    write(str(root / FileUtils.INTERNAL_DIR / 'trash' / 'e.txt'), 50)
+    return str(root)
+
+
+@pytest.fixture
+def index(tree, tmp_path):
+    index = MetadataIndex(tree, db_path=str(tmp_path / 'index.db'), reconcile_interval=0)
+    index.build()
+    yield index
+    index.stop()
+
+
+def test_build_skips_internal_dir(index):
+    assert paths(index) == {'a.txt': 0, 'docs': 1, 'docs/b.pdf': 0, 'docs/sub': 1, 'docs/sub/c.jpg': 0,
+                            'music': 1, 'music/d.mp3': 0}
+    assert index.ready
+
+
+def test_aggregate_stats(index, tree):
+    assert index.get_file_stats() == {'file_count': 4, 'dir_count': 3, 'total_size': 1115,
+                                      'total_size_formatted': FileUtils.format_size(1115)}
+    assert index.subtree_usage('docs') == (4, 1100)
+    assert index.subtree_usage('missing') == (0, 0)
+    folders = index.get_folder_size_stats()
+    assert folders['total_folders'] == 2
+    assert list(folders['folder_stats']) == ['docs', 'music']
+    assert folders['folder_stats']['docs']['size'] == 1100
+    type_stats = index.get_file_type_stats()
+    assert type_stats['total_size'] == 1115
+    assert type_stats['file_type_stats'][FileUtils.classify_file_type('.jpg')]['size'] == 1000
+
+
+def test_add_and_remove(index, tree):
+    write(os.path.join(tree, 'docs', 'new', 'f.txt'), 7)
+    index.add_path(os.path.join(tree, 'docs', 'new'))
+    assert paths(index)['docs/new'] == 1
+    assert index.subtree_usage('docs') == (6, 1107)
+
+    index.remove_path(os.path.join(tree, 'docs'))
+    assert set(paths(index)) == {'a.txt', 'music', 'music/d.mp3'}
+
+    # 磁盘上已不存在的路径按删除处理
+    os.remove(os.path.join(tree, 'a.txt'))
+    index.add_path(os.path.join(tree, 'a.txt'))
+    assert 'a.txt' not in paths(index)
+
+    os.makedirs(os.path.join(tree, 'music', 'moved'))
+    os.rename(os.path.join(tree, 'music', 'd.mp3'), os.path.join(tree, 'music', 'moved', 'd.mp3'))
+    index.move_path(os.path.join(tree, 'music', 'd.mp3'), os.path.join(tree, 'music', 'moved', 'd.mp3'))
+    assert set(paths(index)) == {'music', 'music/moved', 'music/moved/d.mp3'}
+
+
+def test_symlink_to_directory_is_not_followed(index, tree, tmp_path):
+    outside = tmp_path / 'outside'
+    write(str(outside / 'big.bin'), 4096)
+    link = os.path.join(tree, 'docs', 'link')
+    os.symlink(str(outside), link)
+
+    index.add_path(link)
+    entries = paths(index)
+    assert entries['docs/link'] == 0
+    assert 'docs/link/big.bin' not in entries
+    assert index.subtree_usage('docs')[1] < 4096
+
+    index.build()
+    assert paths(index)['docs/link'] == 0
+
+
+def test_reconcile_picks_up_out_of_band_changes(index, tree):
+    write(os.path.join(tree, 'docs', 'sub', 'g.txt'), 3)
+    os.remove(os.path.join(tree, 'music', 'd.mp3'))
+    write(os.path.join(tree, 'new', 'h.txt'), 4)
+    index.reconcile()
+    entries = paths(index)
+    assert 'docs/sub/g.txt' in entries
+    assert 'music/d.mp3' not in entries
+    assert entries['new'] == 1 and 'new/h.txt' in entries
+    assert index.get_file_stats()['total_size'] == 1115 + 3 - 5 + 4
+
+
+def test_add_path_keeps_ancestor_mtime(index, tree):
+    """增量更新不覆盖父目录记录的修改时间，之前绕过服务器的修改仍能在对账时发现"""
+    docs = os.path.join(tree, 'docs')
+    indexed_mtime = index._connect().execute("SELECT mtime FROM entries WHERE path = 'docs'").fetchone()[0]
+    # 绕过服务器在 docs 下新建文件，随后通过路由在 docs/sub 下上传
+    write(os.path.join(docs, 'oob.txt'), 9)
+    touch_dir(docs, indexed_mtime + 10)
+    write(os.path.join(docs, 'sub', 'uploaded.txt'), 1)
+    index.add_path(os.path.join(docs, 'sub', 'uploaded.txt'))
+    assert index._connect().execute("SELECT mtime FROM entries WHERE path = 'docs'").fetchone()[0] == indexed_mtime
+
+    index.reconcile()
+    entries = paths(index)
+    assert 'docs/oob.txt' in entries
+    assert 'docs/sub/uploaded.txt' in entries
@@ -0,0 +1,183 @@
+"""存储配额：用量账本的增量更新、检查、对账，以及上传、删除、恢复、复制路由中的配额"""
+import io
+import os
+import time
+
+import pytest
+
+from quota import QuotaLedger, QuotaExceeded
+from utils import FileUtils
+from conftest import login
+
+KB = 1024
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / 'uploads'
+    (root / 'team').mkdir(parents=True)
+    (root / 'other').mkdir()
+    (root / FileUtils.INTERNAL_DIR).mkdir()
+    return str(root)
+
+
+def write(root, rel, size):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return rel, size
+
+
+@pytest.fixture
+def ledger(root, tmp_path):
+    def measure(rel, from_disk=False):
+        path = os.path.join(root, rel)
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        return sum(os.path.getsize(os.path.join(dirpath, name))
+                   for dirpath, _, names in os.walk(path) for name in names)
+
+    ledger = QuotaLedger(root, str(tmp_path / 'quota.db'), {'user': 10 * KB}, {'team': 8 * KB}, measure,
+                         reconcile_interval=0)
+    # 新配置的文件夹先统计一次
+    ledger._recount_folders(set(ledger._dirty))
+    ledger._dirty.clear()
+    return ledger
+
+
+def usage(ledger, scope, name):
+    return ledger._get_usage(scope, name)
+
+
+def test_add_and_check(ledger, root):
+    ledger.add_files('user', [write(root, 'team/a.bin', 4 * KB), write(root, 'other/b.bin', 3 * KB)])
+    assert usage(ledger, 'user', 'user') == 7 * KB
+    assert usage(ledger, 'folder', 'team') == 4 * KB
+
+    ledger.check('user', 'other', 3 * KB)
+    with pytest.raises(QuotaExceeded) as info:
+        ledger.check('user', 'other', 3 * KB + 1)
+    assert info.value.status_code == 507
+    with pytest.raises(QuotaExceeded, match='team'):
+        ledger.check('admin', 'team/sub', 4 * KB + 1)
+    # 没有配额的用户不检查用户配额
+    ledger.check('admin', 'other', 100 * KB)
+
+    # 覆盖同一路径时替换原所有者的用量
+    ledger.add_files('admin', [write(root, 'other/b.bin', 1 * KB)])
+    assert usage(ledger, 'user', 'user') == 4 * KB
+    assert usage(ledger, 'user', 'admin') == 1 * KB
+
+    usage_info = ledger.get_usage('user')
+    assert list(usage_info['users']) == ['user']
+    assert usage_info['folders']['team']['used'] == 4 * KB
+    assert set(ledger.get_usage('admin', is_admin=True)['users']) == {'user'}
+
+
+def test_remove(ledger, root):
+    ledger.add_files('user', [write(root, 'team/dir/a.bin', 2 * KB), write(root, 'team/dir/b.bin', 2 * KB)])
+    os.remove(os.path.join(root, 'team', 'dir', 'a.bin'))
+    ledger.remove('team/dir/a.bin', 2 * KB)
+    assert usage(ledger, 'user', 'user') == 2 * KB
+    assert usage(ledger, 'folder', 'team') == 2 * KB
+
+    # 大小未知时把文件夹标记为待重新统计
+    os.remove(os.path.join(root, 'team', 'dir', 'b.bin'))
+    ledger.remove('team/dir')
+    assert usage(ledger, 'user', 'user') == 0
+    assert ledger._dirty == {'team'}
+    ledger._recount_folders(ledger._dirty)
+    assert usage(ledger, 'folder', 'team') == 0
+
+
+def test_move_into_and_out_of_internal_dir(ledger, root):
+    ledger.add_files('user', [write(root, 'team/a.bin', 5 * KB)])
+    trash_rel = f'{FileUtils.INTERNAL_DIR}/trash/x/data'
+    ledger.move('team/a.bin', trash_rel, 5 * KB)
+    assert usage(ledger, 'user', 'user') == 0
+    assert usage(ledger, 'folder', 'team') == 0
+    ledger.move(trash_rel, 'other/a.bin', 5 * KB)
+    assert usage(ledger, 'user', 'user') == 5 * KB
+    assert usage(ledger, 'folder', 'team') == 0
+
+    # 移动不改变所有者，只检查新进入的文件夹
+    write(root, 'other/a.bin', 5 * KB)
+    ledger.check_move('other/a.bin', 'team')
+    ledger.add_files('user', [write(root, 'team/b.bin', 4 * KB)])
+    with pytest.raises(QuotaExceeded):
+        ledger.check_move('other/a.bin', 'team')
+    ledger.check_move('team/b.bin', 'team/sub')
+
+
+def test_reconcile_fixes_out_of_band_changes(ledger, root):
+    ledger.add_files('user', [write(root, 'team/a.bin', 2 * KB), write(root, 'other/b.bin', 3 * KB)])
+    os.remove(os.path.join(root, 'other', 'b.bin'))
+    write(root, 'team/a.bin', 1 * KB)
+    write(root, 'team/untracked.bin', 6 * KB)
+    assert ledger.reconcile() == {'removed': 1, 'updated': 1}
+    assert usage(ledger, 'user', 'user') == 1 * KB
+    assert usage(ledger, 'folder', 'team') == 7 * KB
+
+
+def test_background_recount(ledger, root):
+    ledger.start()
+    try:
+        write(root, 'team/a.bin', 3 * KB)
+        ledger.remove('team/missing')
+        deadline = time.monotonic() + 10
+        while usage(ledger, 'folder', 'team') != 3 * KB:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        ledger.stop()
+
+
+def upload(client, name, size, current_path=''):
+    return client.post('/upload', data={'file': (io.BytesIO(b'x' * size), name), 'current_path': current_path},
+                       buffered=True)
+
+
+def test_routes_enforce_quotas(make_app):
+    app = make_app({'quotas': {'users': {'user': '10KB'}, 'folders': {'team': '6KB'}}, 'trash': {'enabled': True}})
+    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'team'))
+    client = login(app.test_client())
+
+    assert upload(client, 'a.txt', 5 * KB).status_code == 200
+    assert upload(client, 'b.txt', 4 * KB, 'team').status_code == 200
+    response = upload(client, 'c.txt', 2 * KB, 'team')
+    assert response.status_code == 507
+    assert response.get_json()['details']
+    assert upload(client, 'c.txt', 2 * KB).status_code == 507
+
+    quota = client.get('/api/quota').get_json()['quota']
+    assert quota['users']['user']['used'] == 9 * KB
+    assert quota['folders']['team']['used'] == 4 * KB
+
+    # 移入回收站释放用量，恢复时重新检查并计入
+    entry_id = client.delete('/delete/a.txt').get_json()['entry']['entry_id']
+    assert client.get('/api/quota').get_json()['quota']['users']['user']['used'] == 4 * KB
+    assert upload(client, 'd.txt', 5 * KB).status_code == 200
+    assert client.post(f'/api/trash/{entry_id}/restore').status_code == 507
+    client.delete('/delete/d.txt')
+    assert client.post(f'/api/trash/{entry_id}/restore').status_code == 200
+    assert client.get('/api/quota').get_json()['quota']['users']['user']['used'] == 9 * KB
+
+    # 复制任务在开始前检查配额
+    response = client.post('/api/copy', json={'paths': ['a.txt'], 'destination': 'team'})
+    job_id = response.get_json()['job']['job_id']
+    jobs = app.extensions['fileserver'].jobs
+    deadline = time.monotonic() + 10
+    while jobs.get(job_id, 'user')['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.02)
+    job = jobs.get(job_id, 'user')
+    assert job['status'] == 'failed'
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'team', 'a.txt'))
+
+    admin = login(app.test_client(), 'admin', 'admin123')
+    assert upload(admin, 'big.txt', 20 * KB).status_code == 200
+
+
+def test_quotas_disabled(make_app):
+    client = login(make_app().test_client())
+    assert client.get('/api/quota').get_json() == {'success': True, 'enabled': False}
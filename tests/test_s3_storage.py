@@ -0,0 +1,488 @@
+"""
+s3_storage.S3Storage：对照进程内的模拟S3服务
+
+模拟服务独立校验每个请求的 SigV4 签名和 x-amz-content-sha256，实现条件写入（If-None-Match: *）、
+分片上传和取消、带 If-Match 的 Range GET、服务端复制、批量删除和分页的 ListObjectsV2。
+"""
+import io
+import os
+import re
+import hmac
+import uuid
+import base64
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, quote, unquote
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import pytest
+
+from s3_storage import S3Storage
+from storage import StorageError
+from conftest import login
+
+ACCESS_KEY = 'test-access'
+SECRET_KEY = 'test-secret'
+REGION = 'test-region'
+BUCKET = 'bkt'
+MB = 1024 * 1024
+
+
+class FakeS3:
+    """模拟服务的状态：对象、进行中的分片上传和收到的请求"""
+
+    def __init__(self):
+        self.objects = {}  # 键 -> (数据, ETag)
+        self.uploads = {}  # 上传ID -> {'key': 键, 'parts': {分片号: 数据}}
+        self.requests = []  # (方法, 键, 查询参数, 请求头)
+        self.page_size = 1000
+        self.lock = threading.Lock()
+
+    def put(self, key, data):
+        self.objects[key] = (data, '"%s"' % hashlib.md5(data).hexdigest())
+
+    def data(self, key):
+        return self.objects[key][0]
+
+
+def canonical_query(query):
+    return '&'.join(f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+                    for name, value in sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+def expected_signature(handler, path, query):
+    """按服务端收到的请求重新计算签名，返回 (Authorization中的签名, 期望的签名)"""
+    match = re.fullmatch(r'AWS4-HMAC-SHA256 Credential=([^/]+)/(\d{8})/([^/]+)/s3/aws4_request, '
+                         r'SignedHeaders=([a-z0-9;-]+), Signature=([0-9a-f]{64})',
+                         handler.headers.get('Authorization', ''))
+    if not match or match.group(1) != ACCESS_KEY or match.group(3) != REGION:
+        return None, ''
+    date, signed_headers, signature = match.group(2), match.group(4), match.group(5)
+    names = signed_headers.split(';')
+    if not {'host', 'x-amz-date', 'x-amz-content-sha256'} <= set(names):
+        return None, ''
+    amz_date = handler.headers['x-amz-date']
+    if amz_date[:8] != date:
+        return None, ''
+    canonical_headers = ''.join(f"{name}:{' '.join(handler.headers.get(name, '').split())}\n" for name in names)
+    canonical_request = '\n'.join([handler.command, path, canonical_query(query), canonical_headers,
+                                   signed_headers, handler.headers['x-amz-content-sha256']])
+    scope = f'{date}/{REGION}/s3/aws4_request'
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode()).hexdigest()])
+    key = ('AWS4' + SECRET_KEY).encode()
+    for part in (date, REGION, 's3', 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return signature, hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    s3 = None
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def error(self, status, code):
+        self.reply(status, f'<Error><Code>{code}</Code><Message>{code}</Message></Error>'.encode())
+
+    def parse(self):
+        """校验请求，返回 (键, 查询参数, 请求体)，校验失败时已经回复错误并返回None"""
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if hashlib.sha256(body).hexdigest() != self.headers.get('x-amz-content-sha256'):
+            self.error(400, 'XAmzContentSHA256Mismatch')
+            return None
+        signature, expected = expected_signature(self, url.path, url.query)
+        if signature is None or not hmac.compare_digest(signature, expected):
+            self.error(403, 'SignatureDoesNotMatch')
+            return None
+        _, bucket, key = (unquote(url.path) + '/').split('/', 2)
+        if bucket != BUCKET:
+            self.error(404, 'NoSuchBucket')
+            return None
+        key = key[:-1]
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        with self.s3.lock:
+            self.s3.requests.append((self.command, key, query, {k.lower(): v for k, v in self.headers.items()}))
+        return key, query, body
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        parsed = self.parse()
+        if parsed is None:
+            return
+        key, query, _ = parsed
+        if not key:
+            return self.list_objects(query)
+        with self.s3.lock:
+            found = self.s3.objects.get(key)
+        if found is None:
+            return self.error(404, 'NoSuchKey')
+        data, etag = found
+        if self.headers.get('If-Match') not in (None, etag):
+            return self.error(412, 'PreconditionFailed')
+        headers = {'ETag': etag, 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match and self.command == 'GET':
+            start, end = int(match.group(1)), min(int(match.group(2)), len(data) - 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+            return self.reply(206, data[start:end + 1], headers)
+        if self.command == 'HEAD':
+            self.send_response(200)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            return
+        self.reply(200, data, headers)
+
+    def list_objects(self, query):
+        assert query.get('list-type') == '2'
+        prefix, delimiter = query.get('prefix', ''), query.get('delimiter', '')
+        max_keys = min(int(query.get('max-keys', 1000)), self.s3.page_size)
+        marker = query.get('continuation-token', '')
+        with self.s3.lock:
+            objects = dict(self.s3.objects)
+        contents, prefixes, last = [], [], None
+        truncated = False
+        for key in sorted(objects):
+            if not key.startswith(prefix) or (marker and (key <= marker or key.startswith(marker))):
+                continue
+            index = key.find(delimiter, len(prefix)) if delimiter else -1
+            item = key[:index + 1] if index >= 0 else key
+            if item == last:
+                continue
+            if len(contents) + len(prefixes) >= max_keys:
+                truncated = True
+                break
+            (prefixes if index >= 0 else contents).append(item)
+            last = item
+        xml = [f'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+               f'<IsTruncated>{"true" if truncated else "false"}</IsTruncated>']
+        if truncated:
+            xml.append(f'<NextContinuationToken>{escape(last)}</NextContinuationToken>')
+        for key in contents:
+            data, etag = objects[key]
+            xml.append(f'<Contents><Key>{escape(key)}</Key><Size>{len(data)}</Size>'
+                       f'<LastModified>2024-01-01T00:00:00.000Z</LastModified><ETag>{escape(etag)}</ETag></Contents>')
+        xml.extend(f'<CommonPrefixes><Prefix>{escape(item)}</Prefix></CommonPrefixes>' for item in prefixes)
+        xml.append('</ListBucketResult>')
+        self.reply(200, ''.join(xml).encode())
+
+    def do_PUT(self):
+        parsed = self.parse()
+        if parsed is None:
+            return
+        key, query, body = parsed
+        source = self.headers.get('x-amz-copy-source')
+        if source:
+            _, source_bucket, source_key = unquote(source).split('/', 2)
+            with self.s3.lock:
+                found = self.s3.objects.get(source_key)
+            if source_bucket != BUCKET or found is None:
+                return self.error(404, 'NoSuchKey')
+            body = found[0]
+            match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('x-amz-copy-source-range', ''))
+            if match:
+                body = body[int(match.group(1)):int(match.group(2)) + 1]
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if 'uploadId' in query:
+            with self.s3.lock:
+                upload = self.s3.uploads.get(query['uploadId'])
+                if upload is None or upload['key'] != key:
+                    return self.error(404, 'NoSuchUpload')
+                upload['parts'][int(query['partNumber'])] = (body, etag)
+            if source:
+                return self.reply(200, f'<CopyPartResult><ETag>{escape(etag)}</ETag></CopyPartResult>'.encode())
+            return self.reply(200, headers={'ETag': etag})
+        with self.s3.lock:
+            if self.headers.get('If-None-Match') == '*' and key in self.s3.objects:
+                return self.error(412, 'PreconditionFailed')
+            self.s3.put(key, body)
+        if source:
+            return self.reply(200, f'<CopyObjectResult><ETag>{escape(etag)}</ETag></CopyObjectResult>'.encode())
+        self.reply(200, headers={'ETag': etag})
+
+    def do_POST(self):
+        parsed = self.parse()
+        if parsed is None:
+            return
+        key, query, body = parsed
+        if 'delete' in query:
+            if self.headers.get('Content-MD5') != base64.b64encode(hashlib.md5(body).digest()).decode():
+                return self.error(400, 'BadDigest')
+            with self.s3.lock:
+                for element in ElementTree.fromstring(body).iter('Key'):
+                    self.s3.objects.pop(element.text, None)
+            return self.reply(200, b'<DeleteResult></DeleteResult>')
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with self.s3.lock:
+                self.s3.uploads[upload_id] = {'key': key, 'parts': {}}
+            return self.reply(200, f'<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>'
+                                   f'</InitiateMultipartUploadResult>'.encode())
+        if 'uploadId' in query:
+            with self.s3.lock:
+                upload = self.s3.uploads.get(query['uploadId'])
+                if upload is None:
+                    return self.error(404, 'NoSuchUpload')
+                parts = [(int(part.find('PartNumber').text), part.find('ETag').text)
+                         for part in ElementTree.fromstring(body).iter('Part')]
+                if [number for number, _ in parts] != list(range(1, len(upload['parts']) + 1)) or \
+                        any(upload['parts'][number][1] != etag for number, etag in parts):
+                    return self.error(400, 'InvalidPart')
+                if self.headers.get('If-None-Match') == '*' and key in self.s3.objects:
+                    return self.error(412, 'PreconditionFailed')
+                self.s3.put(key, b''.join(upload['parts'][number][0] for number, _ in parts))
+                del self.s3.uploads[query['uploadId']]
+                etag = self.s3.objects[key][1]
+            return self.reply(200, f'<CompleteMultipartUploadResult><ETag>{escape(etag)}</ETag>'
+                                   f'</CompleteMultipartUploadResult>'.encode())
+        self.error(400, 'InvalidRequest')
+
+    def do_DELETE(self):
+        parsed = self.parse()
+        if parsed is None:
+            return
+        key, query, _ = parsed
+        with self.s3.lock:
+            if 'uploadId' in query:
+                if self.s3.uploads.pop(query['uploadId'], None) is None:
+                    return self.error(404, 'NoSuchUpload')
+            else:
+                self.s3.objects.pop(key, None)
+        self.reply(204)
+
+
+@pytest.fixture
+def fake_s3():
+    s3 = FakeS3()
+    handler = type('BoundHandler', (Handler,), {'s3': s3})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True)
+    thread.start()
+    s3.endpoint = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield s3
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / 'uploads')
+
+
+@pytest.fixture
+def storage(fake_s3, root):
+    backend = S3Storage(root, fake_s3.endpoint, BUCKET, REGION, ACCESS_KEY, SECRET_KEY, prefix='data',
+                        part_size=5 * MB, range_size=64 * 1024, max_connections=4,
+                        upload_concurrency=2, download_concurrency=2, timeout=10)
+    yield backend
+    backend.close()
+
+
+def test_requests_are_signed(fake_s3, storage, root):
+    storage.write(os.path.join(root, 'a.txt'), io.BytesIO(b'hello'))
+    assert storage.stat(os.path.join(root, 'a.txt')).st_size == 5
+    assert fake_s3.data('data/a.txt') == b'hello'
+    method, key, _, headers = fake_s3.requests[-1]
+    assert (method, key) == ('HEAD', 'data/a.txt')
+    assert re.fullmatch(r'\d{8}T\d{6}Z', headers['x-amz-date'])
+    assert f'Credential={ACCESS_KEY}/{headers["x-amz-date"][:8]}/{REGION}/s3/aws4_request' in \
+        headers['authorization']
+
+    # 键中的特殊字符和查询参数都参与签名
+    name = os.path.join(root, 'dir with space', '中文 +&=.txt')
+    storage.write(name, io.BytesIO(b'x'))
+    assert [entry.name for entry in storage.scandir(os.path.dirname(name))] == ['中文 +&=.txt']
+
+
+def test_wrong_secret_is_rejected(fake_s3, root):
+    backend = S3Storage(root, fake_s3.endpoint, BUCKET, REGION, ACCESS_KEY, 'wrong-secret', timeout=10)
+    with pytest.raises(StorageError, match='SignatureDoesNotMatch'):
+        backend.write(os.path.join(root, 'a.txt'), io.BytesIO(b'hello'))
+    backend.close()
+    assert fake_s3.objects == {}
+
+
+def test_exclusive_put(fake_s3, storage, root, tmp_path, monkeypatch):
+    path = os.path.join(root, 'a.txt')
+    storage.write(path, io.BytesIO(b'first'))
+    with pytest.raises(FileExistsError):
+        storage.write(path, io.BytesIO(b'second'))
+
+    # 存在检查之后对象才出现（并发写入）：由 If-None-Match: * 拒绝
+    monkeypatch.setattr(storage, '_check_absent', lambda path: None)
+    with pytest.raises(FileExistsError):
+        storage.write(path, io.BytesIO(b'second'))
+    local = tmp_path / 'local.bin'
+    local.write_bytes(b'third')
+    with pytest.raises(FileExistsError):
+        storage.put_file(str(local), path)
+    assert fake_s3.data('data/a.txt') == b'first'
+    assert [headers.get('if-none-match') for method, _, _, headers in fake_s3.requests if method == 'PUT'] == \
+        ['*'] * 3
+
+
+def test_multipart_upload(fake_s3, storage, root, tmp_path):
+    content = os.urandom(12 * MB + 123)
+    assert storage.write(os.path.join(root, 'big.bin'), io.BytesIO(content)) == len(content)
+    assert fake_s3.data('data/big.bin') == content
+    parts = [query['partNumber'] for method, _, query, _ in fake_s3.requests
+             if method == 'PUT' and 'partNumber' in query]
+    assert sorted(parts) == ['1', '2', '3']
+    assert fake_s3.uploads == {}
+
+    local = tmp_path / 'local.bin'
+    local.write_bytes(content)
+    storage.put_file(str(local), os.path.join(root, 'big2.bin'))
+    assert fake_s3.data('data/big2.bin') == content
+    assert not local.exists()
+
+
+def test_multipart_upload_aborted_on_error(fake_s3, storage, root, monkeypatch):
+    class FailingStream(io.RawIOBase):
+        def __init__(self):
+            self.sent = 0
+
+        def read(self, size=-1):
+            if self.sent >= 6 * MB:
+                raise IOError('client disconnected')
+            self.sent += size
+            return b'x' * size
+
+    with pytest.raises(IOError, match='client disconnected'):
+        storage.write(os.path.join(root, 'broken.bin'), FailingStream())
+    assert fake_s3.uploads == {}
+    assert 'data/broken.bin' not in fake_s3.objects
+    assert any(method == 'DELETE' and 'uploadId' in query for method, _, query, _ in fake_s3.requests)
+
+    # 合并时目标已被其他写入占用：抛出 FileExistsError，分片上传被取消，已有对象不变
+    monkeypatch.setattr(storage, '_check_absent', lambda path: None)
+    fake_s3.put('data/taken.bin', b'other')
+    with pytest.raises(FileExistsError):
+        storage.write(os.path.join(root, 'taken.bin'), io.BytesIO(b'y' * (6 * MB)))
+    assert fake_s3.uploads == {}
+    assert fake_s3.data('data/taken.bin') == b'other'
+
+
+def test_ranged_read_with_if_match(fake_s3, storage, root):
+    content = os.urandom(300 * 1024)
+    fake_s3.put('data/r.bin', content)
+    path = os.path.join(root, 'r.bin')
+    assert b''.join(storage.open_range(path, 1000, 200000)) == content[1000:201000]
+
+    # 预读的分段并行下载，到达顺序不固定，按起始偏移排序后比较
+    gets = sorted((headers for method, _, _, headers in fake_s3.requests if method == 'GET'),
+                  key=lambda headers: int(headers['range'][6:].split('-')[0]))
+    assert [headers['range'] for headers in gets] == [
+        f'bytes={start}-{min(start + 65536, 201000) - 1}' for start in range(1000, 201000, 65536)]
+    assert 'if-match' not in gets[0]
+    assert all(headers['if-match'] == fake_s3.objects['data/r.bin'][1] for headers in gets[1:])
+
+    with storage.open(path) as f:
+        assert f.read() == content
+
+
+def test_ranged_read_stops_when_object_replaced(fake_s3, storage, root):
+    fake_s3.put('data/r.bin', os.urandom(600 * 1024))
+    chunks = storage.open_range(os.path.join(root, 'r.bin'), 0, 600 * 1024)
+    next(chunks)
+    fake_s3.put('data/r.bin', os.urandom(600 * 1024))
+    with pytest.raises(StorageError) as info:
+        for _ in chunks:
+            pass
+    assert info.value.status_code == 409
+
+
+def test_copy_move_and_delete(fake_s3, storage, root):
+    for name in ('src/a.txt', 'src/sub/b.txt', 'other.txt'):
+        fake_s3.put(f'data/{name}', name.encode())
+    storage.makedirs(os.path.join(root, 'src', 'empty'))
+
+    storage.copy(os.path.join(root, 'src'), os.path.join(root, 'copy'))
+    assert fake_s3.data('data/copy/sub/b.txt') == b'src/sub/b.txt'
+    assert 'data/copy/empty/' in fake_s3.objects
+    # 复制时数据不经过服务器
+    assert any(headers.get('x-amz-copy-source') == f'/{BUCKET}/data/src/a.txt'
+               for method, _, _, headers in fake_s3.requests if method == 'PUT')
+    with pytest.raises(FileExistsError):
+        storage.copy(os.path.join(root, 'other.txt'), os.path.join(root, 'copy', 'a.txt'))
+
+    storage.move(os.path.join(root, 'src'), os.path.join(root, 'moved'))
+    assert not any(key.startswith('data/src/') for key in fake_s3.objects)
+    assert fake_s3.data('data/moved/a.txt') == b'src/a.txt'
+    storage.move(os.path.join(root, 'other.txt'), os.path.join(root, 'moved', 'other.txt'))
+    assert 'data/other.txt' not in fake_s3.objects
+
+    storage.delete(os.path.join(root, 'copy'))
+    assert not any(key.startswith('data/copy/') for key in fake_s3.objects)
+    storage.delete(os.path.join(root, 'moved', 'other.txt'))
+    assert sorted(fake_s3.objects) == ['data/moved/', 'data/moved/a.txt', 'data/moved/empty/',
+                                       'data/moved/sub/b.txt']
+    with pytest.raises(FileNotFoundError):
+        storage.delete(os.path.join(root, 'missing'))
+
+
+def test_listing_pagination(fake_s3, storage, root):
+    fake_s3.page_size = 2
+    names = [f'f{i:02d}.txt' for i in range(7)]
+    for name in names:
+        fake_s3.put(f'data/dir/{name}', name.encode())
+    for sub in ('s1', 's2', 's3'):
+        for i in range(3):
+            fake_s3.put(f'data/dir/{sub}/{i}.txt', b'x' * i)
+    fake_s3.put('data/dirx/outside.txt', b'')
+
+    entries = storage.scandir(os.path.join(root, 'dir'))
+    assert sorted(entry.name for entry in entries) == sorted(names + ['s1', 's2', 's3'])
+    assert all(entry.is_dir() == entry.name.startswith('s') for entry in entries)
+    walked = sorted(os.path.relpath(path, root) for path, _ in storage.walk(os.path.join(root, 'dir')))
+    assert len(walked) == 16
+    assert storage.count([os.path.join(root, 'dir')]) == (1 + 16 + 3, sum(len(n) for n in names) + 3 * 3)
+    lists = [query for method, key, query, _ in fake_s3.requests if method == 'GET' and not key]
+    assert any('continuation-token' in query for query in lists)
+
+    assert storage.isdir(os.path.join(root, 'dir', 's2'))
+    with pytest.raises(FileNotFoundError):
+        storage.scandir(os.path.join(root, 'missing'))
+
+
+def test_quotas_survive_reconcile(fake_s3, make_app):
+    """对象存储上对账通过存储后端获取文件大小，不会清空用户用量"""
+    app = make_app({'storage': {'backend': 's3', 's3': {
+        'endpoint': fake_s3.endpoint, 'bucket': BUCKET, 'region': REGION, 'access_key': ACCESS_KEY,
+        'secret_key': SECRET_KEY, 'prefix': 'data', 'part_size': '5MB', 'range_size': '64KB'}},
+        'quotas': {'users': {'user': '3MB'}}})
+    client = login(app.test_client())
+    response = client.post('/upload', data={'file': (io.BytesIO(b'x' * (2 * MB)), 'a.txt'), 'current_path': ''},
+                           buffered=True)
+    assert response.status_code == 200
+    assert 'data/a.txt' in fake_s3.objects
+
+    quota = app.extensions['fileserver'].quota
+    assert quota.reconcile() == {'removed': 0, 'updated': 0}
+    assert client.get('/api/quota').get_json()['quota']['users']['user']['used'] == 2 * MB
+    response = client.post('/upload', data={'file': (io.BytesIO(b'x' * (2 * MB)), 'b.txt'), 'current_path': ''},
+                           buffered=True)
+    assert response.status_code == 507
+
+    # 绕过服务器删除的对象在对账时移除记录
+    fake_s3.objects.pop('data/a.txt')
+    assert quota.reconcile() == {'removed': 1, 'updated': 0}
+    assert client.get('/api/quota').get_json()['quota']['users']['user']['used'] == 0
@@ -0,0 +1,154 @@
+"""文件搜索：trigram索引与遍历目录两种实现的结果一致，索引随增量更新同步，以及 /api/search 的参数校验"""
+import io
+import os
+import time
+
+import pytest
+
+from utils import FileUtils
+from metadata_index import MetadataIndex
+from conftest import login
+
+FILES = {
+    'Report-2024.pdf': (300, 1000),
+    'docs/report_draft.docx': (200, 2000),
+    'docs/notes.txt': (10, 3000),
+    'docs/old/report.txt': (50, 4000),
+    'media/holiday.mp4': (5000, 5000),
+    'media/Holiday.JPG': (800, 6000),
+    'media/sub/clip.mp4': (70, 7000),
+}
+
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / 'uploads'
+    for rel, (size, mtime) in FILES.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x' * size)
+        os.utime(path, (mtime, mtime))
+    (root / FileUtils.INTERNAL_DIR).mkdir()
+    (root / FileUtils.INTERNAL_DIR / 'report.txt').write_bytes(b'x')
+    return str(root)
+
+
+@pytest.fixture
+def index(folder, tmp_path):
+    index = MetadataIndex(folder, db_path=str(tmp_path / 'index.db'), reconcile_interval=0)
+    index.build()
+    return index
+
+
+def paths(result):
+    return [item['relative_path'] for item in result['items']]
+
+
+CASES = [
+    dict(query='report', sort='path', order='asc'),
+    dict(query='REPORT', sort='name', order='desc'),
+    dict(query='ho', sort='path', order='asc'),
+    dict(glob='*.mp4', sort='size', order='desc'),
+    dict(query='holiday', glob='*.JPG', sort='path', order='asc'),
+    dict(under='docs', file_type='file', sort='mtime', order='asc'),
+    dict(file_type='dir', sort='path', order='asc'),
+    dict(min_size=60, max_size=800, sort='size', order='asc'),
+    dict(modified_after=2000, modified_before=5000, sort='mtime', order='desc'),
+    dict(file_type=FileUtils.classify_file_type('.mp4'), sort='path', order='asc'),
+]
+
+
+@pytest.mark.parametrize('options', CASES)
+def test_index_matches_scan(index, folder, options):
+    expected = FileUtils.search_files(folder, **options)
+    assert paths(index.search(**options)) == paths(expected)
+    assert expected['items']
+
+
+def test_results(index, folder):
+    for search in (index.search, lambda **options: FileUtils.search_files(folder, **options)):
+        assert paths(search(query='report', sort='path', order='asc')) == [
+            'Report-2024.pdf', 'docs/old/report.txt', 'docs/report_draft.docx']
+        assert paths(search(glob='*.mp4', sort='size', order='desc')) == ['media/holiday.mp4', 'media/sub/clip.mp4']
+        assert paths(search(under='docs', file_type='dir', sort='path', order='asc')) == ['docs/old']
+
+
+@pytest.mark.parametrize('sort', ['name', 'size', 'mtime', 'path'])
+def test_pagination(index, folder, sort):
+    for search in (index.search, lambda **options: FileUtils.search_files(folder, **options)):
+        full = paths(search(file_type='file', sort=sort, order='asc', limit=100))
+        collected = []
+        cursor = None
+        while True:
+            page = search(file_type='file', sort=sort, order='asc', limit=2, cursor=cursor)
+            collected.extend(paths(page))
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert collected == full
+        assert len(full) == len(FILES)
+
+
+def test_index_follows_incremental_updates(index, folder):
+    new = os.path.join(folder, 'docs', 'report-final.txt')
+    with open(new, 'wb') as f:
+        f.write(b'x')
+    index.add_path(new)
+    assert 'docs/report-final.txt' in paths(index.search(query='report-final'))
+
+    os.rename(os.path.join(folder, 'media'), os.path.join(folder, 'videos'))
+    index.move_path(os.path.join(folder, 'media'), os.path.join(folder, 'videos'))
+    assert paths(index.search(glob='*.mp4', sort='path', order='asc')) == ['videos/holiday.mp4',
+                                                                          'videos/sub/clip.mp4']
+    index.remove_path(new)
+    os.remove(new)
+    assert paths(index.search(query='report-final')) == []
+
+    # 全量重建后全文索引与entries表一致
+    index.build()
+    assert paths(index.search(query='holiday', sort='path', order='asc')) == ['videos/Holiday.JPG',
+                                                                              'videos/holiday.mp4']
+
+
+def test_special_characters_in_query(index):
+    assert index.search(query='"report') == {'items': [], 'next_cursor': None}
+    assert index.search(query='%') == {'items': [], 'next_cursor': None}
+    assert paths(index.search(query='t_d')) == ['docs/report_draft.docx']
+
+
+def test_fts_uses_trigram_table(index):
+    if not index.fts_enabled:
+        pytest.skip('SQLite 不支持 trigram 分词')
+    count = index._connect().execute('SELECT COUNT(*) FROM entries_fts').fetchone()[0]
+    assert count == index._connect().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+@pytest.mark.parametrize('index_enabled', [False, True])
+def test_api_search(make_app, index_enabled):
+    app = make_app({'index': {'enabled': index_enabled}})
+    index = app.extensions['fileserver'].metadata_index
+    deadline = time.monotonic() + 10
+    while index is not None and not index.ready and time.monotonic() < deadline:
+        time.sleep(0.05)
+    client = login(app.test_client())
+    # 通过路由上传，索引随之增量更新
+    assert client.post('/create_folder', json={'folder_name': 'docs', 'current_path': ''}).status_code == 200
+    for current_path, name in (('docs', 'report.txt'), ('', 'report.pdf'), ('', 'other.txt')):
+        response = client.post('/upload', data={'file': (io.BytesIO(b'x' * 100), name), 'current_path': current_path},
+                               buffered=True)
+        assert response.status_code == 200
+
+    response = client.get('/api/search', query_string={'q': 'report', 'sort': 'path', 'order': 'asc'})
+    assert response.status_code == 200
+    assert paths(response.get_json()['data']) == ['docs/report.txt', 'report.pdf']
+    response = client.get('/api/search', query_string={'q': 'report', 'path': 'docs', 'min_size': '100B'})
+    assert paths(response.get_json()['data']) == ['docs/report.txt']
+    response = client.get('/api/search', query_string={'modified_after': '2000-01-01', 'type': 'file'})
+    assert len(response.get_json()['data']['items']) == 3
+
+    assert client.get('/api/search').status_code == 400
+    assert client.get('/api/search?q=a&sort=bogus').status_code == 400
+    assert client.get('/api/search?q=a&order=up').status_code == 400
+    assert client.get('/api/search?min_size=lots').status_code == 400
+    assert client.get('/api/search?modified_after=yesterday').status_code == 400
+    assert client.get('/api/search?q=a&path=../..').status_code == 403
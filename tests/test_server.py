@@ -0,0 +1,36 @@
+"""预fork启动器：工作进程重新导入主进程已经导入的项目模块"""
+import sys
+import subprocess
+
+from conftest import ROOT
+
+SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import json
+import server
+from config import config
+import utils
+server.forget_project_modules()
+import config as reloaded
+print(json.dumps({{
+    'config': 'config' in sys.modules and reloaded.config is not config,
+    'utils': 'utils' in sys.modules,
+    'metrics': 'metrics' in sys.modules,
+    'json': 'json' in sys.modules,
+    'server': sys.modules.get('server') is server,
+}}))
+"""
+
+
+def test_worker_reimports_project_modules():
+    output = subprocess.run([sys.executable, '-c', SCRIPT.format(root=ROOT)], capture_output=True, text=True,
+                            check=True).stdout
+    assert output.splitlines()[-1] == ('{"config": true, "utils": false, "metrics": false, "json": true, '
+                              '"server": true}')
+
+
+def test_importing_server_does_not_load_the_app():
+    script = f"import sys; sys.path.insert(0, {ROOT!r}); import server; print('config' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    assert output.splitlines()[-1] == 'False'
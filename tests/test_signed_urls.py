@@ -0,0 +1,123 @@
+"""签名下载链接：签名校验、有效期、IP和区间范围，以及 /api/sign 与 /signed 的端到端行为"""
+import os
+import time
+
+import pytest
+
+import signed_url
+from signed_url import UrlSigner, SignedUrlError, parse_range_scope, parse_ip_scope
+from conftest import login
+
+CONTENT = bytes(range(256)) * 40
+
+
+def test_sign_and_verify():
+    signer = UrlSigner('secret', max_ttl=3600)
+    params = signer.sign('docs/a.txt', 60, ip='10.1.2.3/8', range_scope=' 0-99 ')
+    assert params['ip'] == '10.0.0.0/8' and params['range'] == '0-99'
+    scope = signer.verify('docs/a.txt', params, '10.9.9.9')
+    assert scope['ip'] == '10.0.0.0/8' and scope['range'] == (0, 99)
+    assert scope['expires'] == int(params['expires'])
+
+    # 路径、参数或密钥任何一处不同都无法通过校验
+    for path, changed, key in [('docs/b.txt', {}, 'secret'), ('docs/a.txt', {'range': '0-999'}, 'secret'),
+                               ('docs/a.txt', {'ip': '0.0.0.0/0'}, 'secret'), ('docs/a.txt', {}, 'other')]:
+        with pytest.raises(SignedUrlError) as info:
+            UrlSigner(key, 3600).verify(path, dict(params, **changed), '10.9.9.9')
+        assert info.value.status_code == 403
+
+    with pytest.raises(SignedUrlError):
+        signer.verify('docs/a.txt', params, '192.168.0.1')
+    with pytest.raises(SignedUrlError):
+        signer.verify('docs/a.txt', params, None)
+    with pytest.raises(SignedUrlError):
+        signer.verify('docs/a.txt', {'expires': 'soon', 'sig': params['sig']}, '10.9.9.9')
+
+
+def test_expiry_and_ttl_limits(monkeypatch):
+    signer = UrlSigner('secret', max_ttl=3600)
+    with pytest.raises(ValueError):
+        signer.sign('a.txt', 0)
+    with pytest.raises(ValueError):
+        signer.sign('a.txt', 3601)
+    params = signer.sign('a.txt', 10)
+    assert signer.verify('a.txt', params, '127.0.0.1')['range'] is None
+    now = time.time()
+    monkeypatch.setattr(signed_url.time, 'time', lambda: now + 11)
+    with pytest.raises(SignedUrlError, match='过期'):
+        signer.verify('a.txt', params, '127.0.0.1')
+
+
+def test_scope_parsing():
+    assert parse_range_scope('100-') == (100, None)
+    assert parse_range_scope('5-5') == (5, 5)
+    for value in ('', '-5', '5', '9-1', 'a-b'):
+        with pytest.raises(ValueError):
+            parse_range_scope(value)
+    assert parse_ip_scope('::1') == '::1/128'
+    with pytest.raises(ValueError):
+        parse_ip_scope('not-an-ip')
+
+
+@pytest.fixture
+def signed_app(make_app):
+    app = make_app({'signed_urls': {'secret': 'test-secret', 'default_ttl': 600, 'max_ttl': 3600}})
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'a.txt'), 'wb') as f:
+        f.write(CONTENT)
+    return app
+
+
+def sign(app, **options):
+    client = login(app.test_client())
+    response = client.post('/api/sign', json=dict({'filepath': 'a.txt'}, **options))
+    return response
+
+
+def test_signed_download_without_session(signed_app):
+    response = sign(signed_app)
+    assert response.status_code == 200
+    url = response.get_json()['url']
+    assert url.startswith('http://localhost/signed/a.txt?')
+
+    anonymous = signed_app.test_client()
+    response = anonymous.get(url)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert 'Set-Cookie' not in response.headers
+    assert 'Cookie' not in response.headers.get('Vary', '')
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+    assert int(response.headers['Cache-Control'].rsplit('=', 1)[1]) <= 600
+
+    assert anonymous.get(url.replace('sig=', 'sig=x')).status_code == 403
+    assert anonymous.get('/signed/a.txt').status_code == 403
+    assert anonymous.get(url, headers={'Range': 'bytes=0-9'}).status_code == 206
+
+
+def test_signed_range_scope(signed_app):
+    url = sign(signed_app, range='100-199').get_json()['url']
+    client = signed_app.test_client()
+    response = client.get(url)
+    assert response.status_code == 206
+    assert response.data == CONTENT[100:200]
+    response = client.get(url, headers={'Range': 'bytes=150-159'})
+    assert response.status_code == 206 and response.data == CONTENT[150:160]
+    assert client.get(url, headers={'Range': 'bytes=0-9'}).status_code == 403
+
+
+def test_signed_ip_scope(signed_app):
+    url = sign(signed_app, ip='10.0.0.0/8').get_json()['url']
+    client = signed_app.test_client()
+    response = client.get(url, environ_base={'REMOTE_ADDR': '10.1.1.1'})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'].startswith('private')
+    assert client.get(url, environ_base={'REMOTE_ADDR': '192.168.1.1'}).status_code == 403
+
+
+def test_api_sign_validation(signed_app):
+    assert sign(signed_app, filepath='').status_code == 400
+    assert sign(signed_app, filepath='missing.txt').status_code == 404
+    assert sign(signed_app, filepath='../secret.txt').status_code == 403
+    assert sign(signed_app, expires_in=7200).status_code == 400
+    assert sign(signed_app, ip='bogus').status_code == 400
+    assert sign(signed_app, range='9-1').status_code == 400
+    assert signed_app.test_client().post('/api/sign', json={'filepath': 'a.txt'}).status_code == 302
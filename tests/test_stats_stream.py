@@ -0,0 +1,40 @@
+"""统计信息推送：连接数上限按线程数推算，超出上限时页面退回为轮询"""
+import pytest
+
+from conftest import login
+
+
+@pytest.mark.parametrize('threads, expected', [(8, 5), (16, 11), (2, 1)])
+def test_stream_limit_follows_server_threads(make_app, threads, expected):
+    app = make_app({'server': {'threads': threads}})
+    assert app.extensions['fileserver'].stats_stream.max_subscribers == expected
+
+
+def test_configured_stream_limit(make_app):
+    app = make_app({'dashboard': {'max_stream_clients': 12}})
+    assert app.extensions['fileserver'].stats_stream.max_subscribers == 12
+
+
+def test_full_stream_returns_503_and_stats_stay_available(make_app):
+    app = make_app()
+    broadcaster = app.extensions['fileserver'].stats_stream
+    subscriptions = [broadcaster.subscribe() for _ in range(broadcaster.max_subscribers)]
+    client = login(app.test_client())
+    try:
+        response = client.get('/api/stats/stream', buffered=True)
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+        # 页面退回为轮询的统计接口
+        response = client.get('/api/stats', buffered=True)
+        assert response.status_code == 200
+        assert 'file_stats' in response.get_json()
+    finally:
+        for subscription in subscriptions:
+            subscription.close()
+
+
+def test_dashboard_polls_at_refresh_interval(make_app):
+    client = login(make_app({'dashboard': {'refresh_interval': 12345}}).test_client())
+    page = client.get('/', buffered=True).get_data(as_text=True)
+    assert 'const STATS_POLL_INTERVAL = 12345;' in page
+    assert 'pollStats(onUpdate)' in page
@@ -0,0 +1,36 @@
+"""流式上传（multipart 和原始字节流）"""
+import io
+import os
+
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def admin_client(make_app):
+    return login(make_app({'upload': {'max_file_size': '1MB'}}).test_client(), 'admin', 'admin123')
+
+
+def test_multipart_and_raw_upload(admin_client):
+    folder = admin_client.application.config['UPLOAD_FOLDER']
+    response = admin_client.post('/upload', data={'file': (io.BytesIO(b'form'), 'a.txt'), 'current_path': ''},
+                                 buffered=True)
+    assert response.status_code == 200
+    response = admin_client.put('/api/upload/stream?filename=b.txt&current_path=', data=b'raw', buffered=True)
+    assert response.status_code == 200
+    with open(os.path.join(folder, 'a.txt'), 'rb') as f:
+        assert f.read() == b'form'
+    with open(os.path.join(folder, 'b.txt'), 'rb') as f:
+        assert f.read() == b'raw'
+
+
+def test_body_over_max_content_length_returns_413(admin_client):
+    folder = admin_client.application.config['UPLOAD_FOLDER']
+    data = b'x' * (2 * 1024 * 1024)
+    response = admin_client.put('/api/upload/stream?filename=big.txt&current_path=', data=data, buffered=True)
+    assert response.status_code == 413
+    response = admin_client.post('/upload', data={'file': (io.BytesIO(data), 'big.txt'), 'current_path': ''},
+                                 buffered=True)
+    assert response.status_code == 413
+    assert not os.path.exists(os.path.join(folder, 'big.txt'))
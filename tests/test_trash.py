@@ -0,0 +1,138 @@
+"""回收站：移入、列出、恢复、彻底删除、过期回收，以及 /api/trash 接口"""
+import os
+import time
+
+import pytest
+
+from trash import TrashManager, TrashError, PURGE_SUFFIX
+from utils import FileUtils
+from conftest import login
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / 'uploads'
+    (root / 'docs' / 'sub').mkdir(parents=True)
+    (root / 'docs' / 'sub' / 'a.txt').write_bytes(b'a' * 10)
+    (root / 'docs' / 'b.txt').write_bytes(b'b' * 20)
+    return str(root)
+
+
+@pytest.fixture
+def trash(root):
+    return TrashManager(root, os.path.join(FileUtils.get_internal_dir(root), 'trash'), retention=3600,
+                        bytes_per_second=0, items_per_second=0)
+
+
+def test_put_list_and_restore(trash, root):
+    entry = trash.put(os.path.join(root, 'docs'), 'docs', 'user', items=4, size=30)
+    assert not os.path.exists(os.path.join(root, 'docs'))
+    assert entry['is_dir'] and entry['name'] == 'docs' and entry['size'] == 30
+    assert entry['expires_at'] == entry['deleted_at'] + 3600
+    assert [e['entry_id'] for e in trash.list('user')] == [entry['entry_id']]
+    assert trash.list('other') == []
+    assert len(trash.list('other', is_admin=True)) == 1
+
+    path = trash.restore(entry['entry_id'], 'user')
+    assert path == os.path.join(root, 'docs')
+    assert open(os.path.join(path, 'sub', 'a.txt'), 'rb').read() == b'a' * 10
+    assert trash.list('user') == []
+    with pytest.raises(TrashError) as info:
+        trash.restore(entry['entry_id'], 'user')
+    assert info.value.status_code == 404
+
+
+def test_restore_to_occupied_or_missing_location(trash, root):
+    first = trash.put(os.path.join(root, 'docs', 'b.txt'), 'docs/b.txt', 'user')
+    with open(os.path.join(root, 'docs', 'b.txt'), 'wb') as f:
+        f.write(b'new')
+    restored = trash.restore(first['entry_id'], 'user')
+    assert restored != os.path.join(root, 'docs', 'b.txt')
+    assert open(restored, 'rb').read() == b'b' * 20
+    assert open(os.path.join(root, 'docs', 'b.txt'), 'rb').read() == b'new'
+
+    second = trash.put(os.path.join(root, 'docs', 'sub', 'a.txt'), 'docs/sub/a.txt', 'user')
+    os.rmdir(os.path.join(root, 'docs', 'sub'))
+    assert trash.restore(second['entry_id'], 'user') == os.path.join(root, 'docs', 'sub', 'a.txt')
+
+
+def test_access_control(trash, root):
+    entry = trash.put(os.path.join(root, 'docs', 'b.txt'), 'docs/b.txt', 'user')
+    for action in (trash.get, trash.restore, trash.purge):
+        with pytest.raises(TrashError) as info:
+            action(entry['entry_id'], 'other')
+        assert info.value.status_code == 403
+    for entry_id in ('../../docs', 'missing', '0' * 32):
+        with pytest.raises(TrashError) as info:
+            trash.get(entry_id, 'user')
+        assert info.value.status_code == 404
+    assert trash.get(entry['entry_id'], 'other', is_admin=True)['path'] == 'docs/b.txt'
+
+
+def test_purge_and_collect(trash, root):
+    purged = trash.put(os.path.join(root, 'docs', 'sub'), 'docs/sub', 'user')
+    kept = trash.put(os.path.join(root, 'docs', 'b.txt'), 'docs/b.txt', 'user')
+    trash.purge(purged['entry_id'], 'user')
+    # 彻底删除后立即从回收站消失，空间由回收线程释放
+    assert [e['entry_id'] for e in trash.list('user')] == [kept['entry_id']]
+    assert os.path.isdir(os.path.join(trash.trash_dir, purged['entry_id'] + PURGE_SUFFIX))
+    assert trash.collect() == 1
+    assert not os.path.exists(os.path.join(trash.trash_dir, purged['entry_id'] + PURGE_SUFFIX))
+    assert trash.get(kept['entry_id'], 'user')
+
+    # 超过保留期的条目被回收
+    trash.retention = -1
+    assert trash.collect() == 1
+    assert trash.list('user') == []
+    assert [name for name in os.listdir(trash.trash_dir) if name != 'gc.lock'] == []
+
+
+def test_background_collector(trash, root):
+    entry = trash.put(os.path.join(root, 'docs'), 'docs', 'user')
+    trash.start()
+    try:
+        trash.purge(entry['entry_id'], 'user')
+        deadline = time.monotonic() + 10
+        while os.path.exists(os.path.join(trash.trash_dir, entry['entry_id'] + PURGE_SUFFIX)):
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        trash.stop()
+
+
+def test_api_trash(make_app):
+    app = make_app({'trash': {'enabled': True}})
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(folder, 'docs'))
+    with open(os.path.join(folder, 'docs', 'a.txt'), 'wb') as f:
+        f.write(b'hello')
+    client = login(app.test_client())
+
+    response = client.delete('/delete/docs')
+    assert response.status_code == 200
+    entry_id = response.get_json()['entry']['entry_id']
+    assert not os.path.exists(os.path.join(folder, 'docs'))
+    assert [item['name'] for item in client.get('/api/list').get_json()['data']['items']] == []
+
+    entries = client.get('/api/trash').get_json()['entries']
+    assert [entry['entry_id'] for entry in entries] == [entry_id]
+    admin = login(app.test_client(), 'admin', 'admin123')
+    assert admin.get('/api/trash').get_json()['entries'][0]['user_id'] == 'user'
+
+    response = client.post(f'/api/trash/{entry_id}/restore')
+    assert response.status_code == 200 and response.get_json()['path'] == 'docs'
+    assert open(os.path.join(folder, 'docs', 'a.txt'), 'rb').read() == b'hello'
+    assert client.post(f'/api/trash/{entry_id}/restore').status_code == 404
+
+    response = client.post('/api/jobs', json={'action': 'delete', 'paths': ['docs']})
+    assert response.status_code == 200
+    entry_id = response.get_json()['entries'][0]['entry_id']
+    assert client.delete(f'/api/trash/{entry_id}').status_code == 200
+    assert client.get('/api/trash').get_json()['entries'] == []
+    assert client.delete(f'/api/trash/{entry_id}').status_code == 404
+
+
+def test_api_trash_disabled(make_app):
+    app = make_app({'trash': {'enabled': False}})
+    client = login(app.test_client())
+    assert client.get('/api/trash').status_code == 404
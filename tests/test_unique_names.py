@@ -0,0 +1,236 @@
+"""
+同名上传的并发安全：FileUtils.claim_unique_path 与 SuffixCache
+
+多个线程、多个预fork工作进程同时上传同一个文件名时，每个上传都得到不同的文件，内容完整、没有异常；
+后缀缓存过期（文件被删除或被其他进程占用）时仍然不会覆盖已有文件。
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import threading
+import subprocess
+import http.client
+import multiprocessing
+from urllib.parse import urlencode
+
+import pytest
+
+from utils import FileUtils, SuffixCache
+from conftest import ROOT, login, write_config
+
+N = 16
+
+
+def write_exclusive(content):
+    def create(path):
+        with open(path, 'xb') as f:
+            f.write(content)
+    return create
+
+
+def run_concurrently(target, count):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(index):
+        try:
+            barrier.wait()
+            target(index)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return errors
+
+
+def assert_distinct_files(folder, contents):
+    """目录中恰好是 contents 对应的文件，每个内容出现一次"""
+    found = {}
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                found[name] = f.read()
+    assert len(found) == len(contents)
+    assert sorted(found.values()) == sorted(contents)
+    assert 'same.txt' in found
+
+
+def test_claim_unique_path_threads(tmp_path):
+    folder = str(tmp_path)
+    contents = [f'content-{i}'.encode() * 100 for i in range(N)]
+    results = []
+
+    def claim(index):
+        results.append(FileUtils.claim_unique_path(folder, 'same.txt', write_exclusive(contents[index])))
+
+    assert run_concurrently(claim, N) == []
+    assert len({path for path, _ in results}) == N
+    assert_distinct_files(folder, contents)
+
+
+def _claim_in_child(folder, index, start, queue):
+    try:
+        start.wait(10)
+        content = f'content-{index}'.encode() * 100
+        queue.put(FileUtils.claim_unique_path(folder, 'same.txt', write_exclusive(content))[1])
+    except BaseException as e:
+        queue.put(e)
+
+
+def test_claim_unique_path_processes(tmp_path):
+    """每个fork出的进程有自己的后缀缓存，互相看不到对方预留的后缀"""
+    folder = str(tmp_path)
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    queue = context.Queue()
+    processes = [context.Process(target=_claim_in_child, args=(folder, i, start, queue)) for i in range(N)]
+    for process in processes:
+        process.start()
+    start.set()
+    results = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(10)
+    assert [r for r in results if isinstance(r, BaseException)] == []
+    assert len(set(results)) == N
+    assert_distinct_files(folder, [f'content-{i}'.encode() * 100 for i in range(N)])
+
+
+def test_app_uploads_same_name_concurrently(make_app):
+    app = make_app()
+    contents = [os.urandom(64 * 1024) + bytes([i]) for i in range(N)]
+    statuses = []
+
+    def upload(index):
+        client = login(app.test_client())
+        response = client.post('/upload', data={'file': (io.BytesIO(contents[index]), 'same.txt'),
+                                                'current_path': ''}, buffered=True)
+        statuses.append(response.status_code)
+
+    assert run_concurrently(upload, N) == []
+    assert statuses == [200] * N
+    assert_distinct_files(app.config['UPLOAD_FOLDER'], contents)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def prefork_server(tmp_path):
+    """以预fork模式启动 server.py（4个工作进程，每个2个线程），返回端口"""
+    port = free_port()
+    write_config(tmp_path, {'server': {'host': '127.0.0.1', 'port': port, 'workers': 4, 'threads': 2,
+                                       'engine': 'threaded'}})
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py')], cwd=str(tmp_path),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail('server.py 启动失败')
+            time.sleep(0.1)
+    yield port
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def test_prefork_uploads_same_name_concurrently(tmp_path, prefork_server):
+    conn = http.client.HTTPConnection('127.0.0.1', prefork_server, timeout=30)
+    conn.request('POST', '/login', urlencode({'username': 'user', 'password': 'user123'}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 302
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    conn.close()
+
+    contents = [os.urandom(256 * 1024) + bytes([i]) for i in range(N)]
+    results = []
+
+    def upload(index):
+        boundary = f'boundary{index}'
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="current_path"\r\n\r\n\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="same.txt"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode() + contents[index] + \
+               f'\r\n--{boundary}--\r\n'.encode()
+        # 并发连接数（16）多于所有工作线程（4x2），请求必然分散到多个进程
+        conn = http.client.HTTPConnection('127.0.0.1', prefork_server, timeout=30)
+        conn.request('POST', '/upload', body, {'Content-Type': f'multipart/form-data; boundary={boundary}',
+                                               'Cookie': cookie})
+        response = conn.getresponse()
+        results.append((response.status, json.loads(response.read())))
+        conn.close()
+
+    assert run_concurrently(upload, N) == []
+    assert [status for status, _ in results] == [200] * N, results
+    assert_distinct_files(str(tmp_path / 'uploads'), contents)
+
+
+def test_suffix_deleted_between_probes(tmp_path):
+    """探测过程中较小的后缀被删除：返回的候选可以独占创建，已有文件不被覆盖"""
+    folder = str(tmp_path)
+    for counter in range(1, 9):
+        (tmp_path / f'a_{counter}.txt').write_bytes(b'old')
+    calls = []
+
+    def exists(path):
+        calls.append(path)
+        if len(calls) == 2:
+            os.remove(os.path.join(folder, 'a_1.txt'))
+        return os.path.lexists(path)
+
+    counter = SuffixCache()._probe(folder, 'a', '.txt', exists)
+    path = os.path.join(folder, f'a_{counter}.txt')
+    with open(path, 'xb') as f:
+        f.write(b'new')
+    for counter in range(2, 9):
+        assert (tmp_path / f'a_{counter}.txt').read_bytes() == b'old'
+
+
+def test_stale_suffix_cache(tmp_path, monkeypatch):
+    """缓存的后缀被其他进程占用，或已有文件被删除：继续分配不冲突的名字，不覆盖也不丢失文件"""
+    import utils
+
+    folder = str(tmp_path)
+    monkeypatch.setattr(utils, 'suffix_cache', SuffixCache())
+    (tmp_path / 'a.txt').write_bytes(b'0')
+    for counter in range(1, 4):
+        (tmp_path / f'a_{counter}.txt').write_bytes(str(counter).encode())
+    assert FileUtils.claim_unique_path(folder, 'a.txt', write_exclusive(b'4'))[1] == 'a_4.txt'
+
+    # 其他进程占用了缓存中的下一个后缀
+    (tmp_path / 'a_5.txt').write_bytes(b'other')
+    (tmp_path / 'a_6.txt').write_bytes(b'other')
+    assert FileUtils.claim_unique_path(folder, 'a.txt', write_exclusive(b'7'))[1] == 'a_7.txt'
+
+    # 删除中间的文件：较小的后缀不再复用，新文件仍然得到空闲的名字
+    os.remove(tmp_path / 'a_2.txt')
+    os.remove(tmp_path / 'a_7.txt')
+    name = FileUtils.claim_unique_path(folder, 'a.txt', write_exclusive(b'8'))[1]
+    assert name == 'a_8.txt'
+
+    # 缓存被淘汰后重新探测：后缀有空洞时返回的名字也必须是空闲的
+    monkeypatch.setattr(utils, 'suffix_cache', SuffixCache())
+    existing = {name: (tmp_path / name).read_bytes() for name in os.listdir(folder)}
+    name = FileUtils.claim_unique_path(folder, 'a.txt', write_exclusive(b'new'))[1]
+    assert name not in existing
+    for other, content in existing.items():
+        assert (tmp_path / other).read_bytes() == content
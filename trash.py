@@ -0,0 +1,310 @@
+"""
+回收站
+
+删除文件或文件夹时只把它 rename 到 .fileserver/trash/<entry_id>/data（同一文件系统内的原子操作，
+与文件夹大小无关），列表、搜索和统计立即不再包含它；实际的磁盘空间由后台回收线程按限定的速率释放，
+避免大量删除时的磁盘I/O影响正在进行的下载。
+
+- 每个条目目录中的 entry.json 记录原路径、删除时间和删除者，可以在保留期内恢复到原位置
+- 超过保留期或被手动清除的条目先 rename 为 <entry_id>.purge（立即从回收站消失），再由回收线程逐个删除
+- 多个工作进程通过文件锁协调，同一时间只有一个进程执行回收
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+from typing import Dict, Any, List, Optional
+
+import file_ops
+from utils import FileUtils
+
+ENTRY_FILE = 'entry.json'
+DATA_NAME = 'data'
+PURGE_SUFFIX = '.purge'
+
+
+class TrashError(Exception):
+    """回收站操作错误，附带HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class _CollectorStopped(Exception):
+    """回收线程正在停止"""
+    pass
+
+
+class _ThrottledProgress:
+    """
+    供 file_ops.delete_tree 使用的进度对象：按字节数和条目数限速
+
+    每处理一个条目检查累计的字节数和条目数是否超过了限定速率允许的量，超过时等待；
+    进程退出时中断等待，未删除完的部分下一次回收时继续。
+    """
+
+    def __init__(self, stop_event: threading.Event, bytes_per_second: int, items_per_second: int):
+        self.stop_event = stop_event
+        self.bytes_per_second = bytes_per_second
+        self.items_per_second = items_per_second
+        self.started = time.monotonic()
+        self.items = 0
+        self.bytes = 0
+
+    def advance(self, items: int = 1, size: int = 0, current: Optional[str] = None):
+        self.items += items
+        self.bytes += size
+        due = 0.0
+        if self.bytes_per_second > 0:
+            due = self.bytes / self.bytes_per_second
+        if self.items_per_second > 0:
+            due = max(due, self.items / self.items_per_second)
+        delay = self.started + due - time.monotonic()
+        if delay > 0 and self.stop_event.wait(delay):
+            raise _CollectorStopped()
+        self.checkpoint()
+
+    def record_error(self, path: str, error: Exception):
+        print(f"回收站清理失败: {path}: {error}")
+
+    def checkpoint(self, force: bool = False):
+        if self.stop_event.is_set():
+            raise _CollectorStopped()
+
+
+class TrashManager:
+    """回收站：移入、列出、恢复、清除，以及后台限速回收"""
+
+    def __init__(self, root: str, trash_dir: str, retention: int = 7 * 24 * 3600, interval: int = 600,
+                 bytes_per_second: int = 64 * 1024 * 1024, items_per_second: int = 2000, blob_store=None):
+        """
+        Args:
+            root (str): 上传目录（恢复时的基准目录）
+            trash_dir (str): 回收站目录，必须与上传目录位于同一文件系统
+            retention (int): 条目在回收站中的保留时间（秒）
+            interval (int): 后台回收的间隔（秒）
+            bytes_per_second (int): 回收时每秒最多删除的字节数，0表示不限制
+            items_per_second (int): 回收时每秒最多删除的条目数，0表示不限制
+            blob_store: 去重存储，回收时释放不再被引用的blob
+        """
+        self.root = root
+        self.trash_dir = trash_dir
+        self.retention = retention
+        self.interval = max(1, interval)
+        self.bytes_per_second = bytes_per_second
+        self.items_per_second = items_per_second
+        self.blob_store = blob_store
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        os.makedirs(self.trash_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 条目
+    # ------------------------------------------------------------------
+    def _entry_dir(self, entry_id: str) -> str:
+        # entry_id 来自URL，只接受uuid格式，防止路径穿越
+        try:
+            entry_id = uuid.UUID(entry_id).hex
+        except (ValueError, AttributeError):
+            raise TrashError('回收站中没有该条目', 404)
+        return os.path.join(self.trash_dir, entry_id)
+
+    def _read_entry(self, entry_id: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self._entry_dir(entry_id), ENTRY_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            raise TrashError('回收站中没有该条目', 404)
+
+    @staticmethod
+    def _check_owner(entry: Dict[str, Any], user_id: str, is_admin: bool):
+        if not is_admin and entry.get('user_id') != user_id:
+            raise TrashError('无权访问该条目', 403)
+
+    def put(self, path: str, rel_path: str, user_id: str, items: Optional[int] = None,
+            size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        把文件或文件夹移入回收站（rename，不复制数据）
+
+        Args:
+            path (str): 绝对路径
+            rel_path (str): 相对于上传目录的路径（恢复时使用）
+            user_id (str): 删除者
+            items (int): 包含的条目数（未知时为None）
+            size (int): 文件总字节数（未知时为None）
+
+        Raises:
+            OSError: rename失败（如路径位于另一个文件系统，errno为EXDEV）
+        """
+        entry = {
+            'entry_id': uuid.uuid4().hex,
+            'path': rel_path,
+            'name': os.path.basename(rel_path),
+            'is_dir': os.path.isdir(path) and not os.path.islink(path),
+            'items': items,
+            'size': size,
+            'user_id': user_id,
+            'deleted_at': time.time()
+        }
+        entry_dir = os.path.join(self.trash_dir, entry['entry_id'])
+        os.mkdir(entry_dir)
+        try:
+            with open(os.path.join(entry_dir, ENTRY_FILE), 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.rename(path, os.path.join(entry_dir, DATA_NAME))
+        except BaseException:
+            try:
+                os.remove(os.path.join(entry_dir, ENTRY_FILE))
+                os.rmdir(entry_dir)
+            except OSError:
+                pass
+            raise
+        return self.describe(entry)
+
+    def get(self, entry_id: str, user_id: str, is_admin: bool = False) -> Dict[str, Any]:
+        """
+        获取条目信息
+
+        Raises:
+            TrashError: 条目不存在或无权访问
+        """
+        entry = self._read_entry(entry_id)
+        self._check_owner(entry, user_id, is_admin)
+        return self.describe(entry)
+
+    def data_path(self, entry_id: str) -> str:
+        """条目中被删除的文件或文件夹的当前路径"""
+        return os.path.join(self._entry_dir(entry_id), DATA_NAME)
+
+    def describe(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """对外返回的条目信息"""
+        result = dict(entry)
+        result['expires_at'] = entry['deleted_at'] + self.retention
+        return result
+
+    def list(self, user_id: str, is_admin: bool = False) -> List[Dict[str, Any]]:
+        """列出用户删除的条目（管理员可以看到所有条目），最近删除的在前"""
+        entries = []
+        for dir_entry in os.scandir(self.trash_dir):
+            if dir_entry.name.endswith(PURGE_SUFFIX) or not dir_entry.is_dir():
+                continue
+            try:
+                entry = self._read_entry(dir_entry.name)
+            except TrashError:
+                continue
+            if is_admin or entry.get('user_id') == user_id:
+                entries.append(self.describe(entry))
+        entries.sort(key=lambda entry: entry['deleted_at'], reverse=True)
+        return entries
+
+    def restore(self, entry_id: str, user_id: str, is_admin: bool = False) -> str:
+        """
+        恢复条目到原位置（原位置已被占用时自动改名，原父目录不存在时重新创建）
+
+        Returns:
+            str: 恢复后的绝对路径
+
+        Raises:
+            TrashError: 条目不存在或无权访问
+        """
+        entry = self._read_entry(entry_id)
+        self._check_owner(entry, user_id, is_admin)
+        entry_dir = self._entry_dir(entry_id)
+        data_path = os.path.join(entry_dir, DATA_NAME)
+        target = os.path.normpath(os.path.join(self.root, entry['path']))
+        parent = os.path.dirname(target)
+        os.makedirs(parent, exist_ok=True)
+        try:
+            target, _ = FileUtils.claim_unique_path(parent, os.path.basename(target),
+                                                    lambda path: FileUtils.rename_noreplace(data_path, path))
+        except FileNotFoundError:
+            # 同时被其他请求恢复或清除
+            raise TrashError('回收站中没有该条目', 404)
+        try:
+            os.remove(os.path.join(entry_dir, ENTRY_FILE))
+            os.rmdir(entry_dir)
+        except OSError:
+            pass
+        return target
+
+    def purge(self, entry_id: str, user_id: str, is_admin: bool = False):
+        """
+        彻底删除条目：立即从回收站移除，磁盘空间由后台回收线程释放
+
+        Raises:
+            TrashError: 条目不存在或无权访问
+        """
+        entry = self._read_entry(entry_id)
+        self._check_owner(entry, user_id, is_admin)
+        entry_dir = self._entry_dir(entry_id)
+        try:
+            os.rename(entry_dir, entry_dir + PURGE_SUFFIX)
+        except FileNotFoundError:
+            raise TrashError('回收站中没有该条目', 404)
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # 后台回收
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动后台回收线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trash-gc', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台回收（正在删除的条目下一次回收时继续）"""
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except _CollectorStopped:
+                return
+            except Exception as e:
+                print(f"回收站清理失败: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def collect(self) -> int:
+        """
+        清除超过保留期的条目并回收所有待删除条目的空间（其他进程正在回收时跳过）
+
+        Returns:
+            int: 本次回收的条目数
+        """
+        with open(os.path.join(self.trash_dir, 'gc.lock'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            deadline = time.time() - self.retention
+            pending = []
+            for dir_entry in os.scandir(self.trash_dir):
+                if not dir_entry.is_dir(follow_symlinks=False):
+                    continue
+                if dir_entry.name.endswith(PURGE_SUFFIX):
+                    pending.append(dir_entry.path)
+                    continue
+                try:
+                    expired = self._read_entry(dir_entry.name)['deleted_at'] < deadline
+                except TrashError:
+                    # 没有 entry.json 的残留目录（如移入过程中进程退出）
+                    expired = dir_entry.stat().st_mtime < deadline
+                if expired:
+                    try:
+                        os.rename(dir_entry.path, dir_entry.path + PURGE_SUFFIX)
+                        pending.append(dir_entry.path + PURGE_SUFFIX)
+                    except OSError:
+                        continue
+            progress = _ThrottledProgress(self._stop, self.bytes_per_second, self.items_per_second)
+            for path in pending:
+                file_ops.delete_tree(path, progress, self.blob_store)
+            return len(pending)
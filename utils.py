@@ -2,15 +2,63 @@
 工具函数模块
 """
 import os
+import re
+import json
+import errno
+import base64
+import fnmatch
 import socket
 import shutil
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from metrics import timed
+
+
+def _storage(storage):
+    """未指定存储后端时使用本地文件系统（storage 模块依赖本模块，因此在使用时导入）"""
+    if storage is not None:
+        return storage
+    from storage import local_storage
+    return local_storage
 
 
 class FileUtils:
     """文件操作工具类"""
     
+    # 上传目录下的内部数据目录（索引、暂存等），不对用户展示也不计入统计
+    INTERNAL_DIR = '.fileserver'
+    
+    # 文件扩展名到文件类型的映射
+    FILE_TYPE_EXTENSIONS = {
+        '图片': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'],
+        '视频': ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm'],
+        '音频': ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma'],
+        '文档': ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt'],
+        '压缩包': ['.zip', '.rar', '.7z', '.tar', '.gz'],
+        '应用程序': ['.exe', '.dmg', '.pkg', '.deb', '.rpm'],
+        '代码文件': ['.py', '.js', '.java', '.cpp', '.c', '.html', '.css', '.php'],
+    }
+    
+    @staticmethod
+    def get_internal_dir(base_path: str, *parts: str) -> str:
+        """获取（并创建）上传目录下的内部数据目录"""
+        path = os.path.join(base_path, FileUtils.INTERNAL_DIR, *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    @staticmethod
+    def classify_file_type(ext: str) -> str:
+        """根据扩展名（小写，带点）判断文件类型"""
+        for file_type, extensions in FileUtils.FILE_TYPE_EXTENSIONS.items():
+            if ext in extensions:
+                return file_type
+        return '其他'
+    
     @staticmethod
     def get_local_ip() -> str:
         """获取本地IP地址"""
@@ -63,91 +111,33 @@ class FileUtils:
             }
     
     @staticmethod
-    def get_file_stats(path: str) -> Dict[str, Any]:
+    @timed('get_file_stats')
+    def get_file_stats(path: str, storage=None) -> Dict[str, Any]:
         """获取文件统计信息"""
-        file_count = 0
-        dir_count = 0
-        total_size = 0
-        
-        try:
-            for root, dirs, files in os.walk(path):
-                dir_count += len(dirs)
-                file_count += len(files)
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        total_size += os.path.getsize(file_path)
-                    except OSError:
-                        continue
-        except OSError:
-            pass
+        summary = stats_engine.scan(path, storage)
         
         return {
-            "file_count": file_count,
-            "dir_count": dir_count,
-            "total_size": total_size,
-            "total_size_formatted": FileUtils.format_size(total_size)
+            "file_count": summary['file_count'],
+            "dir_count": summary['dir_count'],
+            "total_size": summary['total_size'],
+            "total_size_formatted": FileUtils.format_size(summary['total_size'])
         }
     
     @staticmethod
-    def get_file_type_stats(path: str) -> Dict[str, Any]:
+    @timed('get_file_type_stats')
+    def get_file_type_stats(path: str, storage=None) -> Dict[str, Any]:
         """获取文件类型统计信息"""
+        summary = stats_engine.scan(path, storage)
+        total_size = summary['total_size']
         file_type_stats = {}
-        total_size = 0
         
-        try:
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        total_size += file_size
-                        
-                        # 获取文件扩展名
-                        _, ext = os.path.splitext(file)
-                        ext = ext.lower() if ext else '无扩展名'
-                        
-                        # 分类文件类型
-                        file_type = '其他'
-                        if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg']:
-                            file_type = '图片'
-                        elif ext in ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']:
-                            file_type = '视频'
-                        elif ext in ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma']:
-                            file_type = '音频'
-                        elif ext in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt']:
-                            file_type = '文档'
-                        elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
-                            file_type = '压缩包'
-                        elif ext in ['.exe', '.dmg', '.pkg', '.deb', '.rpm']:
-                            file_type = '应用程序'
-                        elif ext in ['.py', '.js', '.java', '.cpp', '.c', '.html', '.css', '.php']:
-                            file_type = '代码文件'
-                        
-                        # 统计文件类型
-                        if file_type not in file_type_stats:
-                            file_type_stats[file_type] = {
-                                'count': 0,
-                                'size': 0,
-                                'size_formatted': '0 B'
-                            }
-                        
-                        file_type_stats[file_type]['count'] += 1
-                        file_type_stats[file_type]['size'] += file_size
-                        file_type_stats[file_type]['size_formatted'] = FileUtils.format_size(file_type_stats[file_type]['size'])
-                        
-                    except OSError:
-                        continue
-        except OSError:
-            pass
-        
-        # 计算百分比
-        for file_type in file_type_stats:
-            if total_size > 0:
-                percentage = round((file_type_stats[file_type]['size'] / total_size) * 100, 2)
-            else:
-                percentage = 0
-            file_type_stats[file_type]['percentage'] = percentage
+        for file_type, (count, size) in summary['types'].items():
+            file_type_stats[file_type] = {
+                'count': count,
+                'size': size,
+                'size_formatted': FileUtils.format_size(size),
+                'percentage': round((size / total_size) * 100, 2) if total_size > 0 else 0
+            }
         
         return {
             'file_type_stats': file_type_stats,
@@ -156,34 +146,17 @@ class FileUtils:
         }
     
     @staticmethod
-    def get_folder_size_stats(path: str) -> Dict[str, Any]:
+    @timed('get_folder_size_stats')
+    def get_folder_size_stats(path: str, storage=None) -> Dict[str, Any]:
         """获取文件夹大小统计信息"""
-        folder_stats = {}
-        
-        try:
-            # 获取直接子目录
-            for item in os.listdir(path):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    # 计算文件夹大小
-                    folder_size = 0
-                    try:
-                        for root, dirs, files in os.walk(item_path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                try:
-                                    folder_size += os.path.getsize(file_path)
-                                except OSError:
-                                    continue
-                    except OSError:
-                        continue
-                    
-                    folder_stats[item] = {
-                        'size': folder_size,
-                        'size_formatted': FileUtils.format_size(folder_size)
-                    }
-        except OSError:
-            pass
+        summary = stats_engine.scan(path, storage)
+        folder_stats = {
+            name: {
+                'size': size,
+                'size_formatted': FileUtils.format_size(size)
+            }
+            for name, size in summary['children'].items()
+        }
         
         # 按大小排序
         sorted_folders = sorted(folder_stats.items(), key=lambda x: x[1]['size'], reverse=True)
@@ -194,16 +167,23 @@ class FileUtils:
         }
     
     @staticmethod
-    def get_files_and_dirs(path: str, base_path: str = "") -> List[Dict[str, Any]]:
+    @timed('get_files_and_dirs')
+    def get_files_and_dirs(path: str, base_path: str = "", storage=None) -> List[Dict[str, Any]]:
         """获取目录下的文件和文件夹列表"""
+        storage = _storage(storage)
         items = []
+        is_root = bool(base_path) and os.path.normpath(path) == os.path.normpath(base_path)
         
         try:
-            for item in os.listdir(path):
+            with storage.scandir(path) as it:
+                names = [entry.name for entry in it]
+            for item in names:
+                if is_root and item == FileUtils.INTERNAL_DIR:
+                    continue
                 item_path = os.path.join(path, item)
                 
                 try:
-                    item_type = "file" if os.path.isfile(item_path) else "dir"
+                    item_type = "file" if storage.isfile(item_path) else "dir"
                     
                     # 计算相对于base_path的相对路径
                     relative_path = ""
@@ -237,7 +217,7 @@ class FileUtils:
                     item_size = None
                     if item_type == "file":
                         try:
-                            file_size = os.path.getsize(item_path)
+                            file_size = storage.stat(item_path).st_size
                             item_size = FileUtils.format_size(file_size)
                         except (OSError, ValueError):
                             # 如果无法获取文件大小，设置为未知
@@ -245,13 +225,16 @@ class FileUtils:
                     
                     # 权限和时间信息也增加错误处理
                     try:
-                        item_permissions = oct(os.stat(item_path).st_mode)[-3:]
-                        item_create_time = FileUtils.format_time(os.path.getctime(item_path))
-                        item_modify_time = FileUtils.format_time(os.path.getmtime(item_path))
+                        item_stat = storage.stat(item_path)
+                        item_permissions = oct(item_stat.st_mode)[-3:]
+                        item_create_time = FileUtils.format_time(item_stat.st_ctime)
+                        item_mtime = item_stat.st_mtime
+                        item_modify_time = FileUtils.format_time(item_mtime)
                     except (OSError, ValueError):
                         item_permissions = "---"
                         item_create_time = "未知"
                         item_modify_time = "未知"
+                        item_mtime = 0
                     
                     items.append({
                         "name": item,
@@ -260,29 +243,383 @@ class FileUtils:
                         "permissions": item_permissions,
                         "create_time": item_create_time,
                         "modify_time": item_modify_time,
+                        "mtime": item_mtime,
                         "relative_path": relative_path,
                     })
                 except OSError:
                     # 跳过无法访问的文件
                     continue
             
-            # 按修改时间排序
-            return sorted(items, key=lambda x: x["modify_time"], reverse=True)
+            # 按修改时间排序（使用原始时间戳，而不是格式化后的字符串）
+            return sorted(items, key=lambda x: x["mtime"], reverse=True)
         except OSError:
             return []
     
     @staticmethod
-    def safe_delete(path: str) -> bool:
-        """安全删除文件或目录"""
+    def build_list_item(name: str, relative_path: str, is_dir: bool, st: Optional[os.stat_result]) -> Dict[str, Any]:
+        """构建目录列表中的单个条目（包含格式化字段和用于排序的原始数值，时间为0表示未知，如对象存储中的目录）"""
+        if st is None:
+            return {
+                "name": name,
+                "type": "dir" if is_dir else "file",
+                "size": None if is_dir else "未知",
+                "size_bytes": 0,
+                "permissions": "---",
+                "create_time": "未知",
+                "modify_time": "未知",
+                "mtime": 0,
+                "relative_path": relative_path,
+            }
+        return {
+            "name": name,
+            "type": "dir" if is_dir else "file",
+            "size": None if is_dir else FileUtils.format_size(st.st_size),
+            "size_bytes": 0 if is_dir else st.st_size,
+            "permissions": oct(st.st_mode)[-3:],
+            "create_time": FileUtils.format_time(st.st_ctime) if st.st_ctime else "未知",
+            "modify_time": FileUtils.format_time(st.st_mtime) if st.st_mtime else "未知",
+            "mtime": st.st_mtime,
+            "relative_path": relative_path,
+        }
+    
+    @staticmethod
+    def list_sort_key(sort: str, name: str, is_dir: bool, size: int, mtime: float) -> list:
+        """目录列表的排序键，名称作为最后的排序依据保证顺序稳定"""
+        if sort == 'name':
+            return [name]
+        if sort == 'size':
+            return [0 if is_dir else size, name]
+        if sort == 'type':
+            # 文件夹在前，文件按扩展名分组
+            ext = '' if is_dir else os.path.splitext(name)[1].lower()
+            return [0 if is_dir else 1, ext, name]
+        return [mtime, name]
+    
+    @staticmethod
+    def encode_cursor(key: list) -> str:
+        """把最后一个条目的排序键编码为分页游标"""
+        return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor: str, template: Optional[list] = None) -> Optional[list]:
+        """
+        解析分页游标，无效时返回None
+        
+        Args:
+            cursor (str): 分页游标
+            template (list): 当前排序方式下的任意一个排序键；给出时游标的长度和每一项的类型（字符串或数字）
+                必须与之一致，否则视为无效（如切换了排序方式，或被篡改的游标）
+        """
+        if not cursor:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (ValueError, UnicodeError):
+            return None
+        if not isinstance(key, list):
+            return None
+        if template is not None:
+            def kind(value):
+                if isinstance(value, str):
+                    return str
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    return float
+                return None
+            if len(key) != len(template) or any(kind(value) is None or kind(value) != kind(expected)
+                                                for value, expected in zip(key, template)):
+                return None
+        return key
+    
+    @staticmethod
+    def type_filter_extensions(file_type: str) -> Optional[List[str]]:
+        """文件类型过滤对应的扩展名列表；'其他'返回全部已知扩展名（用于排除）"""
+        if file_type == '其他':
+            return [ext for extensions in FileUtils.FILE_TYPE_EXTENSIONS.values() for ext in extensions]
+        return FileUtils.FILE_TYPE_EXTENSIONS.get(file_type)
+    
+    @staticmethod
+    def match_list_filter(name: str, is_dir: bool, prefix: str, file_type: str) -> bool:
+        """检查条目是否满足名称前缀和类型过滤条件"""
+        if prefix and not name.lower().startswith(prefix.lower()):
+            return False
+        if not file_type:
+            return True
+        if file_type == 'dir':
+            return is_dir
+        if is_dir:
+            return False
+        if file_type == 'file':
+            return True
+        return FileUtils.classify_file_type(os.path.splitext(name)[1].lower()) == file_type
+    
+    @staticmethod
+    @timed('list_directory')
+    def list_directory(path: str, base_path: str, sort: str = 'mtime', order: str = 'desc',
+                       prefix: str = '', file_type: str = '', cursor: Optional[str] = None,
+                       limit: int = 100, storage=None) -> Dict[str, Any]:
+        """
+        分页获取目录列表（基于存储后端的 scandir，不使用索引时的实现）
+        
+        Args:
+            path (str): 目录绝对路径
+            base_path (str): 上传根目录，用于计算相对路径
+            sort (str): 排序字段 name/size/mtime/type
+            order (str): asc 或 desc
+            prefix (str): 名称前缀过滤（不区分大小写）
+            file_type (str): 类型过滤 file/dir 或文件类型名称（如"图片"）
+            cursor (str): 上一页返回的游标
+            limit (int): 每页条目数
+            storage: 存储后端，默认为本地文件系统
+            
+        Returns:
+            Dict[str, Any]: items、next_cursor 以及过滤后的 total、file_count、dir_count
+        """
+        storage = _storage(storage)
+        is_root = os.path.normpath(path) == os.path.normpath(base_path)
+        rel_dir = '' if is_root else os.path.relpath(path, base_path).replace(os.sep, '/')
+        # 按名称或类型排序时不需要stat，只对当前页的条目stat
+        need_stat = sort in ('size', 'mtime')
+        
+        entries = []
+        file_count = 0
+        dir_count = 0
+        with storage.scandir(path) as it:
+            for entry in it:
+                if is_root and entry.name == FileUtils.INTERNAL_DIR:
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat() if need_stat else None
+                except OSError:
+                    continue
+                if not FileUtils.match_list_filter(entry.name, is_dir, prefix, file_type):
+                    continue
+                if is_dir:
+                    dir_count += 1
+                else:
+                    file_count += 1
+                size = st.st_size if st is not None else 0
+                mtime = st.st_mtime if st is not None else 0
+                entries.append((FileUtils.list_sort_key(sort, entry.name, is_dir, size, mtime),
+                                entry, is_dir))
+        
+        reverse = order == 'desc'
+        entries.sort(key=lambda e: e[0], reverse=reverse)
+        
+        cursor_key = FileUtils.decode_cursor(cursor, FileUtils.list_sort_key(sort, '', False, 0, 0.0))
+        if cursor_key is not None:
+            if reverse:
+                entries = [e for e in entries if e[0] < cursor_key]
+            else:
+                entries = [e for e in entries if e[0] > cursor_key]
+        
+        page = entries[:limit]
+        items = []
+        for _, entry, is_dir in page:
+            relative_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+            try:
+                st = entry.stat()
+            except OSError:
+                st = None
+            items.append(FileUtils.build_list_item(entry.name, relative_path, is_dir, st))
+        
+        return {
+            'items': items,
+            'next_cursor': FileUtils.encode_cursor(page[-1][0]) if len(entries) > limit else None,
+            'total': file_count + dir_count,
+            'file_count': file_count,
+            'dir_count': dir_count
+        }
+    
+    @staticmethod
+    def search_sort_key(sort: str, path: str, name: str, size: int, mtime: float) -> list:
+        """搜索结果的排序键，相对路径作为最后的排序依据（唯一）"""
+        if sort == 'path':
+            return [path]
+        if sort == 'name':
+            return [name, path]
+        if sort == 'size':
+            return [size, path]
+        return [mtime, path]
+    
+    @staticmethod
+    @timed('search_files')
+    def search_files(base_path: str, query: str = '', glob: str = '', under: str = '', file_type: str = '',
+                     min_size: Optional[int] = None, max_size: Optional[int] = None,
+                     modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+                     sort: str = 'mtime', order: str = 'desc', cursor: Optional[str] = None,
+                     limit: int = 50, storage=None) -> Dict[str, Any]:
+        """
+        搜索文件和文件夹（不使用索引时的实现，需要遍历目录树）
+        
+        参数含义与 MetadataIndex.search 相同，storage 为存储后端（默认为本地文件系统）。
+        
+        Returns:
+            Dict[str, Any]: items 和 next_cursor
+        """
+        storage = _storage(storage)
+        query = query.lower()
+        start = os.path.join(base_path, under) if under else base_path
+        matches = []
+        stack = [(start, under)]
+        while stack:
+            current, rel_dir = stack.pop()
+            try:
+                with storage.scandir(current) as it:
+                    for entry in it:
+                        if not rel_dir and entry.name == FileUtils.INTERNAL_DIR:
+                            continue
+                        rel = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if is_dir:
+                            stack.append((entry.path, rel))
+                        size = 0 if is_dir else st.st_size
+                        if query and query not in rel.lower():
+                            continue
+                        if glob and not fnmatch.fnmatchcase(entry.name, glob):
+                            continue
+                        if not FileUtils.match_list_filter(entry.name, is_dir, '', file_type):
+                            continue
+                        if (min_size is not None and size < min_size) or (max_size is not None and size > max_size):
+                            continue
+                        if (modified_after is not None and st.st_mtime < modified_after) or \
+                                (modified_before is not None and st.st_mtime >= modified_before):
+                            continue
+                        matches.append((FileUtils.search_sort_key(sort, rel, entry.name, size, st.st_mtime),
+                                        rel, entry.name, is_dir, st))
+            except OSError:
+                continue
+        
+        reverse = order == 'desc'
+        matches.sort(key=lambda m: m[0], reverse=reverse)
+        cursor_key = FileUtils.decode_cursor(cursor, FileUtils.search_sort_key(sort, '', '', 0, 0.0))
+        if cursor_key is not None:
+            if reverse:
+                matches = [m for m in matches if m[0] < cursor_key]
+            else:
+                matches = [m for m in matches if m[0] > cursor_key]
+        
+        page = matches[:limit]
+        return {
+            'items': [FileUtils.build_list_item(name, rel, is_dir, st) for _, rel, name, is_dir, st in page],
+            'next_cursor': FileUtils.encode_cursor(page[-1][0]) if len(matches) > limit else None
+        }
+    
+    @staticmethod
+    def safe_delete(path: str, blob_store=None) -> bool:
+        """安全删除文件或目录（开启去重存储时同时释放不再被引用的blob）"""
         try:
-            if os.path.isfile(path):
+            digests = blob_store.collect_digests(path) if blob_store is not None else []
+            if os.path.islink(path) or os.path.isfile(path):
                 os.remove(path)
             elif os.path.isdir(path):
                 shutil.rmtree(path)
+            if digests:
+                blob_store.release(digests)
             return True
         except Exception:
             return False
     
+    @staticmethod
+    def safe_filename(original_filename: str) -> str:
+        """对上传文件名进行安全处理，保留中文文件名"""
+        # 检查是否为中文文件名，如果是则进行特殊处理
+        try:
+            # 尝试使用UTF-8编码
+            original_filename.encode('utf-8')
+            # 如果文件名包含非ASCII字符，保留原始文件名但进行安全处理
+            if any(ord(char) > 127 for char in original_filename):
+                # 中文文件名：保留原始文件名，但替换危险字符
+                safe_filename = re.sub(r'[\\/:"*?<>|]', '_', original_filename)
+            else:
+                # 英文文件名：使用secure_filename
+                safe_filename = secure_filename(original_filename)
+        except UnicodeEncodeError:
+            # 如果UTF-8编码失败，使用安全文件名
+            safe_filename = secure_filename(original_filename)
+        
+        # 如果安全处理后文件名为空，使用原始文件名（进行基本清理）
+        if not safe_filename:
+            safe_filename = re.sub(r'[^\w\d\.\-]', '_', original_filename)
+        
+        return safe_filename
+    
+    @staticmethod
+    def claim_unique_path(folder: str, filename: str, create: Callable[[str], Any],
+                          exists: Callable[[str], bool] = os.path.lexists) -> Tuple[str, str]:
+        """
+        在目录中以原子方式占用不冲突的文件名，返回(文件路径, 文件名)
+        
+        文件名已存在时依次尝试 name_1、name_2……：create(path) 负责独占地创建目标，
+        目标已存在时必须抛出 FileExistsError（os.mkdir、os.link、os.symlink、open(path, 'xb')
+        以及 create_exclusive、rename_noreplace 都满足），此时换下一个后缀重试，
+        因此并发请求不会拿到同一个名字，也不会互相覆盖。下一个可用后缀按目录缓存，
+        热门文件名（如 IMG_0001.jpg）不必每次从 _1 开始逐个尝试。exists 用于查找已占用的后缀
+        （目标不在本地文件系统时传入存储后端的 lexists）。
+        
+        Raises:
+            OSError: create 抛出的其他错误
+        """
+        file_path = os.path.join(folder, filename)
+        try:
+            create(file_path)
+            return file_path, filename
+        except FileExistsError:
+            pass
+        name, ext = os.path.splitext(filename)
+        while True:
+            counter = suffix_cache.allocate(folder, name, ext, exists)
+            candidate = f"{name}_{counter}{ext}"
+            file_path = os.path.join(folder, candidate)
+            try:
+                create(file_path)
+                return file_path, candidate
+            except FileExistsError:
+                continue
+    
+    @staticmethod
+    def create_exclusive(path: str):
+        """独占地创建空文件（作为占位），文件已存在时抛出 FileExistsError"""
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+    
+    @staticmethod
+    def rename_noreplace(src: str, dest: str):
+        """
+        重命名，目标已存在时抛出 FileExistsError 而不是覆盖
+        
+        文件（含符号链接）先硬链接到目标再删除源路径；不支持硬链接的文件系统改为先独占创建占位文件再替换。
+        目录先创建空的占位目录，再用rename原子地替换它。
+        
+        Raises:
+            FileExistsError: 目标已存在
+            OSError: 其他错误（跨文件系统时 errno 为 EXDEV）
+        """
+        if os.path.isdir(src) and not os.path.islink(src):
+            os.mkdir(dest)
+            try:
+                os.rename(src, dest)
+            except BaseException:
+                os.rmdir(dest)
+                raise
+            return
+        try:
+            os.link(src, dest, follow_symlinks=False)
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.EMLINK):
+                raise
+            FileUtils.create_exclusive(dest)
+            try:
+                os.replace(src, dest)
+            except BaseException:
+                os.remove(dest)
+                raise
+            return
+        os.unlink(src)
+    
     @staticmethod
     def is_safe_path(base_path: str, target_path: str) -> bool:
         """检查路径是否安全（防止目录遍历攻击）"""
@@ -307,6 +644,185 @@ class FileUtils:
             return False
 
 
+class StatsEngine:
+    """
+    目录统计引擎
+    
+    一次 scandir 遍历同时得到文件数、目录数、总大小、文件类型分布和各子目录的子树大小。
+    每个目录直接包含的文件汇总按该目录的修改时间缓存：目录修改时间不变时只需一次stat，
+    直接复用缓存并继续检查其子目录，因此重复统计的开销约等于一次目录stat加上发生变化目录的扫描。
+    
+    注意：原地改写文件内容不会改变目录修改时间，这类大小变化在目录本身变化前不会被感知。
+    对象存储中的目录没有修改时间，每次都重新列出。
+    """
+    
+    def __init__(self):
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def scan(self, path: str, storage=None) -> Dict[str, Any]:
+        """
+        统计目录树（storage 为存储后端，默认为本地文件系统）
+        
+        Returns:
+            Dict[str, Any]: file_count、dir_count、total_size、
+            types（文件类型 -> [数量, 大小]）以及 children（直接子目录名 -> 子树大小）
+        """
+        storage = _storage(storage)
+        root = os.path.abspath(path)
+        with self._lock:
+            visited = set()
+            try:
+                summary = self._scan_dir(root, visited, storage, is_root=True)
+            except OSError:
+                summary = self._empty_summary()
+            
+            # 清理已经不存在的目录的缓存
+            prefix = root.rstrip(os.sep) + os.sep
+            stale = [key for key in self._cache
+                     if (key == root or key.startswith(prefix)) and key not in visited]
+            for key in stale:
+                del self._cache[key]
+            return summary
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+    
+    @staticmethod
+    def _empty_summary() -> Dict[str, Any]:
+        return {'file_count': 0, 'dir_count': 0, 'total_size': 0, 'types': {}, 'children': {}}
+    
+    def _list_dir(self, path: str, mtime_ns: Optional[int], is_root: bool, storage) -> Dict[str, Any]:
+        """扫描目录的直接子项，汇总其中的文件并记录子目录"""
+        file_count = 0
+        file_size = 0
+        types: Dict[str, List[int]] = {}
+        subdirs = []
+        
+        with storage.scandir(path) as it:
+            for entry in it:
+                if is_root and entry.name == FileUtils.INTERNAL_DIR:
+                    continue
+                try:
+                    if entry.is_dir():
+                        subdirs.append((entry.name, entry.is_symlink()))
+                        continue
+                    file_count += 1
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
+                file_size += size
+                
+                _, ext = os.path.splitext(entry.name)
+                file_type = FileUtils.classify_file_type(ext.lower())
+                bucket = types.setdefault(file_type, [0, 0])
+                bucket[0] += 1
+                bucket[1] += size
+        
+        return {
+            'mtime_ns': mtime_ns,
+            'file_count': file_count,
+            'file_size': file_size,
+            'types': types,
+            'subdirs': subdirs
+        }
+    
+    def _scan_dir(self, path: str, visited: set, storage, is_root: bool = False) -> Dict[str, Any]:
+        st = storage.stat(path)
+        listing = self._cache.get(path)
+        if listing is None or st.st_mtime_ns is None or listing['mtime_ns'] != st.st_mtime_ns:
+            listing = self._list_dir(path, st.st_mtime_ns, is_root, storage)
+            self._cache[path] = listing
+        visited.add(path)
+        
+        summary = {
+            'file_count': listing['file_count'],
+            'dir_count': len(listing['subdirs']),
+            'total_size': listing['file_size'],
+            'types': {file_type: list(bucket) for file_type, bucket in listing['types'].items()},
+            'children': {}
+        }
+        
+        for name, is_symlink in listing['subdirs']:
+            # 与 os.walk 一致：符号链接目录计入目录数，但不进入其中统计
+            if is_symlink:
+                summary['children'][name] = 0
+                continue
+            try:
+                child = self._scan_dir(os.path.join(path, name), visited, storage)
+            except OSError:
+                summary['children'][name] = 0
+                continue
+            summary['children'][name] = child['total_size']
+            summary['file_count'] += child['file_count']
+            summary['dir_count'] += child['dir_count']
+            summary['total_size'] += child['total_size']
+            for file_type, (count, size) in child['types'].items():
+                bucket = summary['types'].setdefault(file_type, [0, 0])
+                bucket[0] += count
+                bucket[1] += size
+        
+        return summary
+
+
+# 全局统计引擎实例，FileUtils 的统计方法共享其缓存
+stats_engine = StatsEngine()
+
+
+class SuffixCache:
+    """
+    同名文件的下一个可用后缀（按目录和文件名缓存，LRU淘汰）
+    
+    缓存未命中时用倍增加二分查找已有的 name_1..name_k（后缀连续时只需 O(log k) 次stat），
+    之后每次分配都是 O(1)。分配时立即预留后缀，同一进程内的并发请求不会尝试同一个名字；
+    缓存只是提示，名字最终由 FileUtils.claim_unique_path 的独占创建保证不冲突
+    （其他进程占用了该名字时换下一个后缀即可）。被删除文件空出的较小后缀不会再被复用。
+    """
+    
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._next: 'OrderedDict[Tuple[str, str, str], int]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _probe(folder: str, name: str, ext: str, lexists: Callable[[str], bool]) -> int:
+        """查找一个空闲后缀：已有后缀连续时返回 k+1"""
+        def exists(counter: int) -> bool:
+            return lexists(os.path.join(folder, f"{name}_{counter}{ext}"))
+        
+        high = 1
+        while exists(high):
+            high *= 2
+        # low 已存在（或为0），high 空闲
+        low = high // 2
+        while low + 1 < high:
+            middle = (low + high) // 2
+            if exists(middle):
+                low = middle
+            else:
+                high = middle
+        return high
+    
+    def allocate(self, folder: str, name: str, ext: str,
+                 exists: Callable[[str], bool] = os.path.lexists) -> int:
+        """分配一个后缀（仅是候选，调用方需要独占创建）"""
+        key = (folder, name, ext)
+        with self._lock:
+            counter = self._next.pop(key, None)
+            if counter is None:
+                counter = self._probe(folder, name, ext, exists)
+            self._next[key] = counter + 1
+            if len(self._next) > self.max_entries:
+                self._next.popitem(last=False)
+            return counter
+
+
+# 全局后缀缓存实例
+suffix_cache = SuffixCache()
+
+
 class QRCodeUtils:
     """二维码工具类"""
     
@@ -0,0 +1,371 @@
+"""
+流式ZIP打包模块
+
+为文件夹和多选文件的打包下载边生成边输出ZIP数据：
+- 不写临时压缩包，每个条目使用数据描述符（data descriptor）在数据之后写入CRC和大小
+- 已压缩的媒体和压缩包使用存储模式，其他文件使用deflate压缩
+- 压缩在线程池中进行，前面的条目在输出时后面的条目已在压缩；每个条目的输出队列有上限，内存占用固定
+- 单个文件超过4GB、整个压缩包超过4GB或条目超过65535个时使用ZIP64扩展
+"""
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+
+from storage import local_storage
+from utils import FileUtils
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# deflate输出可能略大于原文件，原文件接近4GB时就使用ZIP64
+ZIP64_SIZE_THRESHOLD = ZIP64_LIMIT - 64 * 1024 * 1024
+
+# 这些格式本身已经压缩，再deflate只会浪费CPU
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp4', '.mkv', '.mov', '.avi', '.wmv', '.flv', '.webm', '.m4v',
+    '.mp3', '.aac', '.ogg', '.flac', '.m4a', '.wma', '.opus',
+    '.zip', '.rar', '.7z', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.lz4',
+    '.docx', '.xlsx', '.pptx', '.apk', '.jar', '.dmg', '.pkg', '.deb', '.rpm',
+}
+
+METHOD_STORED = 0
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# 高字节3表示Unix，外部属性中保存文件权限
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64
+
+
+class ZipEntry:
+    """压缩包中的一个条目"""
+
+    __slots__ = ('path', 'arcname', 'is_dir', 'size', 'mtime', 'mode', 'method', 'zip64',
+                 'crc', 'compressed_size', 'file_size', 'offset')
+
+    def __init__(self, path: str, arcname: str, st: os.stat_result, is_dir: bool):
+        self.path = path
+        self.arcname = arcname + '/' if is_dir and not arcname.endswith('/') else arcname
+        self.is_dir = is_dir
+        self.size = 0 if is_dir else st.st_size
+        self.mtime = st.st_mtime
+        self.mode = st.st_mode
+        if is_dir or os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+            self.method = METHOD_STORED
+        else:
+            self.method = zlib.DEFLATED
+        self.zip64 = self.size >= ZIP64_SIZE_THRESHOLD
+        self.crc = 0
+        self.compressed_size = 0
+        self.file_size = 0
+        self.offset = 0
+
+
+class _EntryDone:
+    """生产者读取完一个文件后放入队列的结束标记"""
+
+    def __init__(self, crc: int, size: int):
+        self.crc = crc
+        self.size = size
+
+
+class _EntryFailed:
+    """生产者读取文件失败"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def collect_entries(base_path: str, rel_paths: List[str], storage=None) -> List[ZipEntry]:
+    """
+    展开要打包的路径列表
+
+    选中的文件夹连同其子树一起打包，压缩包内的路径以选中项自身的名字开头；
+    不打包符号链接和内部数据目录，多个选中项同名时自动加序号。
+
+    Args:
+        base_path (str): 上传根目录
+        rel_paths (List[str]): 选中的相对路径
+        storage: 存储后端，默认为本地文件系统
+
+    Returns:
+        List[ZipEntry]: 条目列表
+    """
+    storage = storage or local_storage
+    entries = []
+    used_names = set()
+    for rel_path in rel_paths:
+        abs_path = os.path.normpath(os.path.join(base_path, rel_path))
+        if abs_path == os.path.normpath(base_path):
+            top_name = ''
+        else:
+            top_name = os.path.basename(abs_path)
+            stem, ext = os.path.splitext(top_name)
+            counter = 1
+            while top_name in used_names:
+                top_name = f'{stem} ({counter}){ext}'
+                counter += 1
+            used_names.add(top_name)
+
+        st = storage.lstat(abs_path)
+        if not storage.isdir(abs_path):
+            entries.append(ZipEntry(abs_path, top_name, st, False))
+            continue
+        if top_name:
+            entries.append(ZipEntry(abs_path, top_name, st, True))
+
+        stack = [(abs_path, top_name)]
+        while stack:
+            current, arc_dir = stack.pop()
+            try:
+                with storage.scandir(current) as it:
+                    children = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            for child in children:
+                if not arc_dir and child.name == FileUtils.INTERNAL_DIR:
+                    continue
+                if child.is_symlink():
+                    continue
+                arcname = f'{arc_dir}/{child.name}' if arc_dir else child.name
+                try:
+                    child_st = child.stat(follow_symlinks=False)
+                    is_dir = child.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append(ZipEntry(child.path, arcname, child_st, is_dir))
+                if is_dir:
+                    stack.append((child.path, arcname))
+    return entries
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        # DOS时间无法表示1980年以前，统一记为1980-01-01
+        return 0, (1 << 5) | 1
+    year = min(t.tm_year, 2107)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipStreamer:
+    """流式ZIP生成器，所有下载共享一个压缩线程池"""
+
+    READ_SIZE = 256 * 1024
+    # 每个条目最多缓存的数据块数
+    QUEUE_SIZE = 8
+    # 攒够这么多数据再交给服务器写出，减少小块写
+    OUTPUT_SIZE = 64 * 1024
+
+    def __init__(self, workers: int = 4, compress_level: int = 6):
+        """
+        初始化流式ZIP生成器
+
+        Args:
+            workers (int): 压缩线程数，也是每个下载最多提前压缩的条目数
+            compress_level (int): deflate压缩级别（1-9）
+        """
+        self.workers = max(1, workers)
+        self.compress_level = compress_level
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='zip-stream')
+
+    def _produce(self, entry: ZipEntry, out: queue.Queue, cancel: threading.Event, storage):
+        """在线程池中读取（并压缩）一个文件，按顺序把数据块放入队列"""
+
+        def put(item) -> bool:
+            while not cancel.is_set():
+                try:
+                    out.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            compressor = None
+            if entry.method == zlib.DEFLATED:
+                compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+            crc = 0
+            size = 0
+            with storage.open(entry.path) as f:
+                while not cancel.is_set():
+                    data = f.read(self.READ_SIZE)
+                    if not data:
+                        break
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    if compressor is not None:
+                        data = compressor.compress(data)
+                    if data and not put(data):
+                        return
+            if compressor is not None:
+                tail = compressor.flush()
+                if tail and not put(tail):
+                    return
+            put(_EntryDone(crc, size))
+        except BaseException as e:
+            put(_EntryFailed(e))
+
+    @staticmethod
+    def _local_header(entry: ZipEntry) -> bytes:
+        name = entry.arcname.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        if entry.is_dir:
+            return struct.pack('<IHHHHHIIIHH', 0x04034b50, VERSION_DEFAULT, FLAG_UTF8, 0,
+                               dos_time, dos_date, 0, 0, 0, len(name), 0) + name
+        flags = FLAG_UTF8 | FLAG_DATA_DESCRIPTOR
+        if entry.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            return struct.pack('<IHHHHHIIIHH', 0x04034b50, VERSION_ZIP64, flags, entry.method,
+                               dos_time, dos_date, 0, ZIP64_LIMIT, ZIP64_LIMIT,
+                               len(name), len(extra)) + name + extra
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, VERSION_DEFAULT, flags, entry.method,
+                           dos_time, dos_date, 0, 0, 0, len(name), 0) + name
+
+    @staticmethod
+    def _data_descriptor(entry: ZipEntry) -> bytes:
+        if entry.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, entry.crc, entry.compressed_size, entry.file_size)
+        return struct.pack('<IIII', 0x08074b50, entry.crc, entry.compressed_size, entry.file_size)
+
+    @staticmethod
+    def _central_header(entry: ZipEntry) -> bytes:
+        name = entry.arcname.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        # ZIP64扩展字段只包含超出32位的值，顺序固定为：原始大小、压缩后大小、本地头偏移
+        zip64_fields = []
+        file_size, compressed_size, offset = entry.file_size, entry.compressed_size, entry.offset
+        if file_size >= ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compressed_size >= ZIP64_LIMIT:
+            zip64_fields.append(compressed_size)
+            compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = b''
+        if zip64_fields:
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields)
+
+        flags = FLAG_UTF8 if entry.is_dir else FLAG_UTF8 | FLAG_DATA_DESCRIPTOR
+        version = VERSION_ZIP64 if entry.zip64 or zip64_fields else VERSION_DEFAULT
+        external_attr = (entry.mode & 0xFFFF) << 16
+        if entry.is_dir:
+            external_attr |= 0x10
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, VERSION_MADE_BY, version, flags,
+                           entry.method, dos_time, dos_date, entry.crc, compressed_size, file_size,
+                           len(name), len(extra), 0, 0, 0, external_attr, offset) + name + extra
+
+    @staticmethod
+    def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+        records = b''
+        if count >= ZIP64_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            zip64_end_offset = cd_offset + cd_size
+            records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, VERSION_MADE_BY, VERSION_ZIP64,
+                                   0, 0, count, count, cd_size, cd_offset)
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+        records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0,
+                               min(count, ZIP64_COUNT_LIMIT), min(count, ZIP64_COUNT_LIMIT),
+                               min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0)
+        return records
+
+    def stream(self, entries: List[ZipEntry], storage=None) -> Iterator[bytes]:
+        """
+        生成ZIP数据
+
+        Args:
+            entries (List[ZipEntry]): collect_entries 返回的条目
+            storage: 读取文件的存储后端，默认为本地文件系统
+
+        Yields:
+            bytes: ZIP数据块
+        """
+        storage = storage or local_storage
+        cancel = threading.Event()
+        # 已提交给线程池的文件条目：(条目下标, 输出队列)
+        pending: deque = deque()
+        file_indexes = [i for i, entry in enumerate(entries) if not entry.is_dir]
+        next_submit = 0
+
+        def fill_pipeline():
+            nonlocal next_submit
+            while next_submit < len(file_indexes) and len(pending) < self.workers:
+                index = file_indexes[next_submit]
+                out: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+                self._executor.submit(self._produce, entries[index], out, cancel, storage)
+                pending.append((index, out))
+                next_submit += 1
+
+        written: List[ZipEntry] = []
+        offset = 0
+        buffer = bytearray()
+        try:
+            fill_pipeline()
+            for index, entry in enumerate(entries):
+                if entry.is_dir:
+                    entry.offset = offset
+                    header = self._local_header(entry)
+                    buffer += header
+                    offset += len(header)
+                    written.append(entry)
+                    continue
+
+                _, out = pending.popleft()
+                fill_pipeline()
+                item = out.get()
+                if isinstance(item, _EntryFailed):
+                    # 还没有输出任何数据，跳过打包期间消失或无法读取的文件
+                    print(f"打包时跳过无法读取的文件 {entry.path}: {item.error}")
+                    continue
+
+                entry.offset = offset
+                header = self._local_header(entry)
+                buffer += header
+                offset += len(header)
+                compressed_size = 0
+                while not isinstance(item, _EntryDone):
+                    if isinstance(item, _EntryFailed):
+                        # 数据已经部分输出，无法生成完整的压缩包
+                        raise item.error
+                    buffer += item
+                    compressed_size += len(item)
+                    if len(buffer) >= self.OUTPUT_SIZE:
+                        yield bytes(buffer)
+                        buffer.clear()
+                    item = out.get()
+
+                entry.crc = item.crc
+                entry.file_size = item.size
+                entry.compressed_size = compressed_size
+                offset += compressed_size
+                descriptor = self._data_descriptor(entry)
+                buffer += descriptor
+                offset += len(descriptor)
+                written.append(entry)
+
+            cd_offset = offset
+            for entry in written:
+                header = self._central_header(entry)
+                buffer += header
+                offset += len(header)
+                if len(buffer) >= self.OUTPUT_SIZE:
+                    yield bytes(buffer)
+                    buffer.clear()
+            buffer += self._end_records(len(written), cd_offset, offset - cd_offset)
+            yield bytes(buffer)
+        finally:
+            # 客户端断开或出错时通知仍在运行的生产者退出
+            cancel.set()
+
+    def shutdown(self):
+        """关闭压缩线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)